@@ -47,6 +47,14 @@ if os.name == "posix":
 
 
 def main():
+    cmdserver_path = os.environ.get('BRZ_CMDSERVER')
+    if cmdserver_path and 'cmd-server' not in sys.argv[1:]:
+        # Let a running command server do the work, see breezy.cmdserver.
+        import breezy.cmdserver
+        exit_val = breezy.cmdserver.run_client(cmdserver_path, sys.argv[1:])
+        if exit_val is not None:
+            os._exit(exit_val)
+
     import breezy.breakin
     breezy.breakin.hook_debugger_to_signal()
 
@@ -404,6 +404,24 @@ class Branch(controldir.ControlComponent):
         with self.lock_read():
             return self._do_revision_id_to_dotted_revno(revision_id)
 
+    def revision_ids_to_dotted_revnos(self, revision_ids):
+        """Given revision ids, return their dotted revnos.
+
+        Returns: A dictionary mapping revision ids to tuples like (1,) or
+            (400,1,3).  Revisions that are not in the branch or that have
+            ghosts in their ancestry are left out.
+        """
+        result = {}
+        with self.lock_read():
+            for revision_id in revision_ids:
+                try:
+                    result[revision_id] = self.revision_id_to_dotted_revno(
+                        revision_id)
+                except (errors.NoSuchRevision,
+                        errors.GhostRevisionsHaveNoRevno):
+                    pass
+        return result
+
     def _do_revision_id_to_dotted_revno(self, revision_id):
         """Worker function for revision_id_to_revno."""
         # Try the caches if they are loaded
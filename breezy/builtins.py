@@ -4314,6 +4314,7 @@ class cmd_version(Command):
     __doc__ = """Show version of brz."""
 
     encoding_type = 'replace'
+    needs_plugins = False
     takes_options = [
         Option("short", help="Print just the version number."),
         ]
@@ -4331,6 +4332,7 @@ class cmd_rocks(Command):
     __doc__ = """Statement of optimism."""
 
     hidden = True
+    needs_plugins = False
 
     @display_command
     def run(self):
@@ -5650,6 +5652,65 @@ class cmd_serve(Command):
         protocol(t, listen, port, inet, client_timeout)
 
 
+class cmd_fsmonitor_daemon(Command):
+    __doc__ = """Watch a working tree so that status does not need to scan it.
+
+    Runs until interrupted, keeping track of the files that change in the
+    tree.  While it runs and the bzr.workingtree.fsmonitor option is set,
+    status and commit only look at those files rather than examining every
+    file in the tree.
+
+    This uses inotify, through the pyinotify module.
+    """
+
+    takes_options = ['directory']
+
+    def run(self, directory=u'.'):
+        from .fsmonitor import FSMonitorDaemon
+        tree = WorkingTree.open_containing(directory)[0]
+        try:
+            FSMonitorDaemon(tree).serve()
+        except KeyboardInterrupt:
+            pass
+
+
+class cmd_cmd_server(Command):
+    __doc__ = """Run brz commands sent by other brz processes.
+
+    Runs until interrupted, listening on a unix socket.  When the BRZ_CMDSERVER
+    environment variable is set to the path of that socket, brz has the
+    server run its command rather than starting up (importing breezy,
+    loading plugins and opening repositories) itself, which makes short
+    commands like "brz revno" much faster.
+
+    Commands are run one at a time.  The plugins and any other settings
+    only read when brz starts are those of the server.
+    """
+
+    hidden = True
+    takes_options = [
+        Option('socket', type=str,
+               help='Path of the socket to listen on (default: '
+                    '$BRZ_CMDSERVER).'),
+        ]
+
+    def run(self, socket=None):
+        from .cmdserver import CommandServer, ENV_VARIABLE, available
+        if not available():
+            raise errors.CommandError(gettext(
+                'The command server needs unix sockets, which are not '
+                'available on this platform.'))
+        if socket is None:
+            socket = os.environ.get(ENV_VARIABLE)
+            if not socket:
+                raise errors.CommandError(gettext(
+                    'No socket given and BRZ_CMDSERVER is not set.'))
+        try:
+            CommandServer(socket).serve()
+        except KeyboardInterrupt:
+            pass
+
+
 class cmd_join(Command):
     __doc__ = """Combine a tree into its containing tree.
 
@@ -6127,17 +6188,19 @@ class cmd_tags(Command):
         sort(branch, tags)
         if not show_ids:
             # [ (tag, revid), ... ] -> [ (tag, dotted_revno), ... ]
+            try:
+                revnos = branch.revision_ids_to_dotted_revnos(
+                    set(revid for tag, revid in tags))
+            except errors.UnsupportedOperation:
+                revnos = {}
             for index, (tag, revid) in enumerate(tags):
-                try:
-                    revno = branch.revision_id_to_dotted_revno(revid)
-                    if isinstance(revno, tuple):
-                        revno = '.'.join(map(str, revno))
-                except (errors.NoSuchRevision,
-                        errors.GhostRevisionsHaveNoRevno,
-                        errors.UnsupportedOperation):
+                revno = revnos.get(revid)
+                if revno is None:
                     # Bad tag data/merges can lead to tagged revisions
                     # which are not in this branch. Fail gracefully ...
                     revno = '?'
+                elif isinstance(revno, tuple):
+                    revno = '.'.join(map(str, revno))
                 tags[index] = (tag, revno)
         else:
             tags = [(tag, revid.decode('utf-8')) for (tag, revid) in tags]
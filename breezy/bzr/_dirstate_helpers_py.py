@@ -207,6 +207,33 @@ def _lt_path_by_dirblock(path1, path2):
     return key1 < key2
 
 
+def _share_details(trees, revision_ids):
+    """Share the objects of parent tree details where possible.
+
+    The details of a parent tree are often the same as those of the tree
+    before it, and parent trees name few revision ids, so reusing the
+    objects rather than keeping copies saves a lot of memory for large trees
+    with several parents.
+
+    :param trees: The list of details of an entry, updated in place.
+    :param revision_ids: A dict used to intern revision ids.
+    """
+    previous = trees[0]
+    for i in range(1, len(trees)):
+        details = trees[i]
+        if details == previous:
+            trees[i] = previous
+            continue
+        minikind, fingerprint, size, executable, revision_id = details
+        if fingerprint == previous[1]:
+            fingerprint = previous[1]
+        if size == previous[2]:
+            size = previous[2]
+        revision_id = revision_ids.setdefault(revision_id, revision_id)
+        previous = trees[i] = (
+            minikind, fingerprint, size, executable, revision_id)
+
+
 def _read_dirblocks(state):
     """Read in the dirblocks for the given DirState object.
 
@@ -268,6 +295,7 @@ def _read_dirblocks(state):
         # The two blocks here are deliberate: the root block and the
         # contents-of-root block.
         state._dirblocks = [(b'', []), (b'', [])]
+        revision_ids = {}
         current_block = state._dirblocks[0][1]
         current_dirname = b''
         append_entry = current_block.append
@@ -302,6 +330,7 @@ def _read_dirblocks(state):
             trailing = next()
             if trailing != b'\n':
                 raise ValueError("trailing garbage in dirstate: %r" % trailing)
+            _share_details(entry[1], revision_ids)
             # append the entry to the current block
             append_entry(entry)
         state._split_root_dirblock_into_contents()
@@ -309,6 +338,9 @@ def _read_dirblocks(state):
         fields_to_entry = state._get_fields_to_entry()
         entries = [fields_to_entry(fields[pos:pos + entry_size])
                    for pos in range(cur, field_count, entry_size)]
+        revision_ids = {}
+        for entry in entries:
+            _share_details(entry[1], revision_ids)
         state._entries_to_current_state(entries)
     # To convert from format 2  => format 3
     # state._dirblocks = sorted(state._dirblocks,
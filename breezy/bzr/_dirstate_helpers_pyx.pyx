@@ -526,9 +526,11 @@ cdef class Reader:
     cdef char *end_cstr # End of text
     cdef char *cur_cstr # Pointer to the current record
     cdef char *next # Pointer to the end of this record
+    cdef object revision_ids # Interned revision ids of parent trees
 
     def __init__(self, text, state):
         self.state = state
+        self.revision_ids = {}
         self.text = text
         self.text_cstr = PyBytes_AsString(text)
         self.text_size = PyBytes_Size(text)
@@ -614,7 +616,10 @@ cdef class Reader:
         cdef int i
         cdef object minikind
         cdef object fingerprint
+        cdef object size
         cdef object info
+        cdef StaticTuple details
+        cdef StaticTuple previous
 
         # Read the 'key' information (dirname, name, file_id)
         dirname_cstr = self.get_next(&cur_size)
@@ -671,15 +676,32 @@ cdef class Reader:
         #       work with, and it will be rare that we have a file >2GB.
         #       Especially since this code is pretty much fixed at a max of
         #       4GB.
+        # The details of a parent tree are often the same as those of the tree
+        # before it, and parent trees name few revision ids, so share those
+        # objects rather than keeping copies of them.
         trees = []
+        previous = None
         for i from 0 <= i < num_trees:
             minikind = self.get_next_str()
             fingerprint = self.get_next_str()
             entry_size_cstr = self.get_next(&cur_size)
             entry_size = strtoul(entry_size_cstr, NULL, 10)
+            size = entry_size
             executable_cstr = self.get_next(&cur_size)
             is_executable = (executable_cstr[0] == b'y')
             info = self.get_next_str()
+            if previous is not None:
+                if fingerprint == previous[1]:
+                    fingerprint = previous[1]
+                if size == previous[2]:
+                    size = previous[2]
+                info = self.revision_ids.setdefault(info, info)
+                if (minikind == previous[0] and fingerprint is previous[1]
+                    and size is previous[2]
+                    and is_executable == previous[3]
+                    and info is previous[4]):
+                    PyList_Append(trees, previous)
+                    continue
             # TODO: If we want to use StaticTuple_New here we need to be pretty
             #       careful. We are relying on a bit of Pyrex
             #       automatic-conversion from 'int' to PyInt, and that doesn't
@@ -693,13 +715,15 @@ cdef class Reader:
             # Py_INCREF(is_executable); StaticTuple_SET_ITEM(tmp, 3, is_executable)
             # Py_INCREF(info); StaticTuple_SET_ITEM(tmp, 4, info)
             # PyList_Append(trees, tmp)
-            PyList_Append(trees, StaticTuple(
+            details = StaticTuple(
                 minikind,     # minikind
                 fingerprint,  # fingerprint
-                entry_size,   # size
+                size,         # size
                 is_executable,# executable
                 info,         # packed_stat or revision_id
-            ))
+            )
+            PyList_Append(trees, details)
+            previous = details
 
         # The returned tuple is (key, [trees])
         ret = (path_name_file_id_key, trees)
@@ -1582,8 +1606,8 @@ cdef class ProcessEntryC:
             if self.root_dir_info and self.root_dir_info[2] == 'tree-reference':
                 self.current_dir_info = None
             else:
-                self.dir_iterator = osutils._walkdirs_utf8(self.root_abspath,
-                    prefix=self.current_root)
+                self.dir_iterator = self.state._walkdirs_utf8(
+                    self.root_abspath, prefix=self.current_root)
                 self.path_index = 0
                 try:
                     self.current_dir_info = next(self.dir_iterator)
@@ -21,15 +21,22 @@ from io import BytesIO
 
 from ..lazy_import import lazy_import
 lazy_import(globals(), """
+import array
 import bisect
+import hashlib
 import math
+import mmap
+import struct
 import tempfile
 import zlib
 """)
 
+import sys
+
 from .. import (
     chunk_writer,
     debug,
+    errors,
     fifo_cache,
     lru_cache,
     osutils,
@@ -52,9 +59,26 @@ _INTERNAL_OFFSET = b"offset="
 _RESERVED_HEADER_BYTES = 120
 _PAGE_SIZE = 4096
 
+# A bloom filter over the keys can follow the last page of the tree.  Each of
+# its pages starts with a compressed empty leaf node, so that readers which do
+# not know about the filter, and treat every page of the file as a node, see
+# empty leaves; zlib ignores the filter data that follows.
+_BLOOM_SIGNATURE = b"B+Tree Graph Index Bloom Filter 1\n"
+_OPTION_BLOOM_HASHES = b"hashes="
+# 10 bits per key and 7 hashes give a false positive rate just under 1%.
+_BLOOM_BITS_PER_KEY = 10
+_BLOOM_HASHES = 7
+
 # 4K per page: 4MB - 1000 entries
 _NODE_CACHE_SIZE = 1000
 
+# Indices on the local filesystem at least this big are read through an mmap
+# rather than with readv.  Each mapping keeps a file descriptor open, so small
+# indices (which are usually read in one go anyway) are not mapped.  Windows
+# does not allow renaming mapped files, which packing relies on.
+_MMAP_MIN_SIZE = 1024 * 1024
+_use_mmap = (sys.platform != 'win32')
+
 
 class _BuilderRow(object):
     """The stored state accumulated while writing out a row in the index.
@@ -107,6 +131,77 @@ class _LeafBuilderRow(_BuilderRow):
     """The stored state accumulated while writing out a leaf rows."""
 
 
+class _BloomFilter(object):
+    """A bloom filter over the serialised keys of an index.
+
+    The bit positions for a key are derived from the md5 of the key by double
+    hashing, so they are the same in every process.
+    """
+
+    def __init__(self, bits, num_hashes=_BLOOM_HASHES):
+        """Create a _BloomFilter.
+
+        :param bits: A bytearray with the bits of the filter.
+        :param num_hashes: The number of bits set for each key.
+        """
+        self._bits = bits
+        self._num_bits = len(bits) * 8
+        self._num_hashes = num_hashes
+
+    @classmethod
+    def for_key_count(cls, key_count):
+        """Create an empty filter sized for key_count keys."""
+        # Small filters would still take up a page, so make them big enough
+        # for a low false positive rate.
+        num_bytes = max((key_count * _BLOOM_BITS_PER_KEY + 7) // 8, 256)
+        return cls(bytearray(num_bytes))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse the output of to_bytes.
+
+        :return: A _BloomFilter, or None if data is not a filter in a known
+            format.
+        """
+        if not data.startswith(_BLOOM_SIGNATURE):
+            return None
+        pos = len(_BLOOM_SIGNATURE)
+        end = data.find(b'\n', pos)
+        options_line = data[pos:end]
+        if end == -1 or not options_line.startswith(_OPTION_BLOOM_HASHES):
+            return None
+        try:
+            num_hashes = int(options_line[len(_OPTION_BLOOM_HASHES):])
+        except ValueError:
+            return None
+        bits = data[end + 1:]
+        if not bits or num_hashes < 1:
+            return None
+        return cls(bits, num_hashes)
+
+    def to_bytes(self):
+        return b''.join([_BLOOM_SIGNATURE,
+                         b'%s%d\n' % (_OPTION_BLOOM_HASHES, self._num_hashes),
+                         bytes(self._bits)])
+
+    def _positions(self, string_key):
+        h1, h2 = struct.unpack('>QQ', hashlib.md5(string_key).digest())
+        num_bits = self._num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self._num_hashes)]
+
+    def add(self, string_key):
+        bits = self._bits
+        for pos in self._positions(string_key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, string_key):
+        bits = self._bits
+        for pos in self._positions(string_key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
 class BTreeBuilder(index.GraphIndexBuilder):
     """A Builder for B+Tree based Graph indices.
 
@@ -363,7 +458,7 @@ class BTreeBuilder(index.GraphIndexBuilder):
             self._add_key(string_key, line, rows,
                           allow_optimize=allow_optimize)
 
-    def _write_nodes(self, node_iterator, allow_optimize=True):
+    def _write_nodes(self, node_iterator, allow_optimize=True, bloom=None):
         """Write node_iterator out as a B+Tree.
 
         :param node_iterator: An iterator of sorted nodes. Each node should
@@ -371,6 +466,8 @@ class BTreeBuilder(index.GraphIndexBuilder):
         :param allow_optimize: If set to False, prevent setting the optimize
             flag when writing out. This is used by the _spill_mem_keys_to_disk
             functionality.
+        :param bloom: An empty _BloomFilter to add the keys to and write out
+            after the nodes, or None.
         :return: A file handle for a temporary file containing a B+Tree for
             the nodes.
         """
@@ -397,8 +494,15 @@ class BTreeBuilder(index.GraphIndexBuilder):
                 node, self.reference_lists)
             self._add_key(string_key, line, rows,
                           allow_optimize=allow_optimize)
+            if bloom is not None:
+                bloom.add(string_key)
+        if not rows or (len(rows) == 1 and rows[0].nodes == 0):
+            # A single page is read in one go anyway, a filter would only
+            # make the index bigger.
+            bloom = None
         for row in reversed(rows):
-            pad = (not isinstance(row, _LeafBuilderRow))
+            # The bloom filter has to start on a page boundary.
+            pad = (not isinstance(row, _LeafBuilderRow)) or bloom is not None
             row.finish_node(pad=pad)
         lines = [_BTSIGNATURE]
         lines.append(b'%s%d\n' % (_OPTION_NODE_REFS, self.reference_lists))
@@ -436,6 +540,13 @@ class BTreeBuilder(index.GraphIndexBuilder):
                                          " expected: %d, got: %d"
                                          % ((row.nodes - 1) * _PAGE_SIZE,
                                             copied_len))
+        if bloom is not None:
+            empty_leaf = zlib.compress(_LEAF_FLAG)
+            data = bloom.to_bytes()
+            chunk_size = _PAGE_SIZE - len(empty_leaf)
+            for start in range(0, len(data), chunk_size):
+                result.write(empty_leaf)
+                result.write(data[start:start + chunk_size])
         result.flush()
         size = result.tell()
         result.seek(0)
@@ -447,7 +558,11 @@ class BTreeBuilder(index.GraphIndexBuilder):
         :return: A file handle for a temporary file containing the nodes added
             to the index.
         """
-        return self._write_nodes(self.iter_all_entries())[0]
+        if self._bloom_filter:
+            bloom = _BloomFilter.for_key_count(self.key_count())
+        else:
+            bloom = None
+        return self._write_nodes(self.iter_all_entries(), bloom=bloom)[0]
 
     def iter_all_entries(self):
         """Iterate over all keys within the index
@@ -620,6 +735,117 @@ class _LeafNode(dict):
         return keys
 
 
+class _CompactLeafNode(object):
+    """A leaf node that keeps its entries serialised until they are needed.
+
+    The decompressed page is kept as is, along with an array of the offsets
+    at which its lines start.  Lookups bisect on the serialised keys, which
+    sort the same way as the key tuples because key elements never contain
+    '\\0'.  Only the entries that are asked for are parsed, with the same
+    _parse_leaf_lines as _LeafNode, so this works with both the Python and
+    the compiled serializer.
+
+    This uses much less memory than _LeafNode, at the cost of parsing an
+    entry each time it is looked up.  Pack repositories use it for their
+    revision, inventory and text indices when repository.compact_index_leaves
+    is set.
+    """
+
+    __slots__ = ('_data', '_offsets', '_key_length', '_ref_list_length',
+                 'min_key', 'max_key', '_last_key', '_last_pos')
+
+    def __init__(self, bytes, key_length, ref_list_length):
+        """Index the lines of bytes to create a leaf node object."""
+        self._key_length = key_length
+        self._ref_list_length = ref_list_length
+        lines = bytes.split(b'\n')
+        offsets = array.array('I')
+        pos = len(lines[0]) + 1
+        for line in lines[1:]:
+            if not line:
+                break
+            offsets.append(pos)
+            pos += len(line) + 1
+        # The end of the last line.
+        offsets.append(pos)
+        self._data = bytes
+        self._offsets = offsets
+        # Callers usually check 'key in node' before 'node[key]', so remember
+        # the last key looked up.
+        self._last_key = None
+        self._last_pos = -1
+        if len(offsets) > 1:
+            self.min_key = self._parse_entry(0)[0]
+            self.max_key = self._parse_entry(len(offsets) - 2)[0]
+        else:
+            self.min_key = self.max_key = None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + self._data.__sizeof__() +
+                self._offsets.__sizeof__())
+
+    def _parse_entry(self, pos):
+        line = self._data[self._offsets[pos]:self._offsets[pos + 1]]
+        return _btree_serializer._parse_leaf_lines(
+            _LEAF_FLAG + line, self._key_length, self._ref_list_length)[0]
+
+    def _find(self, key):
+        """Return the position of the line for key, or -1."""
+        if key == self._last_key:
+            return self._last_pos
+        pos = self._bisect(key)
+        self._last_key = key
+        self._last_pos = pos
+        return pos
+
+    def _bisect(self, key):
+        if len(key) != self._key_length:
+            return -1
+        try:
+            target = b'\0'.join(key) + b'\0'
+        except TypeError:
+            return -1
+        target_len = len(target)
+        data = self._data
+        offsets = self._offsets
+        lo = 0
+        hi = len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offsets[mid]
+            # The key is followed by '\0' on the line too.
+            probe = data[start:start + target_len]
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def __contains__(self, key):
+        return self._find(key) != -1
+
+    def __getitem__(self, key):
+        pos = self._find(key)
+        if pos == -1:
+            raise KeyError(key)
+        return self._parse_entry(pos)[1]
+
+    def all_items(self):
+        """Return a sorted list of (key, (value, refs)) items"""
+        return _btree_serializer._parse_leaf_lines(
+            self._data[:self._offsets[-1]], self._key_length,
+            self._ref_list_length)
+
+    def all_keys(self):
+        """Return a sorted list of all keys."""
+        return [key for key, value in self.all_items()]
+
+
 class _InternalNode(object):
     """An internal node for a serialised B+Tree index."""
 
@@ -671,6 +897,10 @@ class BTreeGraphIndex(object):
         self._name = name
         self._size = size
         self._file = None
+        # None until we have tried to map the file, then an mmap or False.
+        self._mmap = None
+        # None until we have looked for it, then a _BloomFilter or False.
+        self._bloom_filter = None
         self._recommended_pages = self._compute_recommended_pages()
         self._root_node = None
         self._base_offset = offset
@@ -1464,6 +1694,109 @@ class BTreeGraphIndex(object):
         header_end = (len(signature) + sum(map(len, lines[0:4])) + 4)
         return header_end, bytes[header_end:]
 
+    def _get_mmap(self):
+        """Return a read-only mmap of the index file, or None.
+
+        Only big enough files on the local filesystem are mapped; for other
+        transports the nodes are read with readv.
+        """
+        if self._mmap is None:
+            self._mmap = False
+            if (not _use_mmap or self._size is None
+                    or self._size < _MMAP_MIN_SIZE):
+                return None
+            try:
+                path = self._transport.local_abspath(self._name)
+            except errors.NotLocalUrl:
+                return None
+            try:
+                with open(path, 'rb') as f:
+                    self._mmap = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                trace.mutter('not mapping %s: %s', path, e)
+        return self._mmap or None
+
+    def _close_mmap(self):
+        """Unmap the index file, if it is mapped.
+
+        The file is mapped again if more nodes need to be read later.
+        """
+        if self._mmap:
+            self._mmap.close()
+        self._mmap = None
+
+    def _read_ranges(self, ranges):
+        """Read (offset, size) ranges of the file, as readv does."""
+        if self._file is None:
+            mapped = self._get_mmap()
+            if mapped is None:
+                return self._transport.readv(self._name, ranges)
+            data_ranges = []
+            for start, size in ranges:
+                data = mapped[start:start + size]
+                if len(data) < size:
+                    raise errors.ShortReadvError(
+                        self._name, start, size, actual=len(data))
+                data_ranges.append((start, data))
+            return data_ranges
+        data_ranges = []
+        for offset, size in ranges:
+            self._file.seek(offset)
+            data_ranges.append((offset, self._file.read(size)))
+        return data_ranges
+
+    def _get_bloom_filter(self):
+        """Return the bloom filter of the keys in the index, or None.
+
+        The filter is read the first time it is asked for, along with the
+        root node if that has not been read yet.
+        """
+        if self._bloom_filter is None:
+            self._bloom_filter = False
+            if not self.key_count():
+                return None
+            start = self._row_offsets[-1] * _PAGE_SIZE
+            if self._size <= start:
+                return None
+            data = b''.join(
+                data for offset, data in self._read_ranges(
+                    [(self._base_offset + start, self._size - start)]))
+            self._parse_bloom_filter(
+                [data[pos:pos + _PAGE_SIZE]
+                 for pos in range(0, len(data), _PAGE_SIZE)])
+        return self._bloom_filter or None
+
+    def _parse_bloom_filter(self, pages):
+        """Set self._bloom_filter from the pages after the end of the tree."""
+        chunks = []
+        for page in pages:
+            decompressor = zlib.decompressobj()
+            if decompressor.decompress(page) != _LEAF_FLAG:
+                raise index.BadIndexData(self)
+            chunks.append(decompressor.unused_data)
+        bloom = _BloomFilter.from_bytes(b''.join(chunks))
+        if bloom is None:
+            trace.mutter('ignoring unknown bloom filter in %s', self._name)
+            self._bloom_filter = False
+        else:
+            self._bloom_filter = bloom
+
+    def _maybe_present_keys(self, keys):
+        """Return the keys of keys that may be in the index.
+
+        Keys ruled out by the bloom filter of the index are dropped; without a
+        filter all of keys are returned.  Once the filter has been read this
+        does no I/O.
+
+        :param keys: A set of keys.
+        :return: A set of keys.
+        """
+        bloom = self._get_bloom_filter()
+        if bloom is None:
+            return keys
+        return set(key for key in keys if b'\x00'.join(key) in bloom)
+
     def _read_nodes(self, nodes):
         """Read some nodes from disk into the LRU cache.
 
@@ -1512,13 +1845,11 @@ class BTreeGraphIndex(object):
             # already have the whole file
             data_ranges = [(start, bytes[start:start + size])
                            for start, size in ranges]
-        elif self._file is None:
-            data_ranges = self._transport.readv(self._name, ranges)
         else:
-            data_ranges = []
-            for offset, size in ranges:
-                self._file.seek(offset)
-                data_ranges.append((offset, self._file.read(size)))
+            data_ranges = self._read_ranges(ranges)
+        # The pages of the bloom filter, when they are read along with the
+        # nodes.
+        bloom_pages = {}
         for offset, data in data_ranges:
             offset -= base_offset
             if offset == 0:
@@ -1526,6 +1857,10 @@ class BTreeGraphIndex(object):
                 offset, data = self._parse_header_from_bytes(data)
                 if len(data) == 0:
                     continue
+            elif (self._row_offsets is not None
+                  and offset >= self._row_offsets[-1] * _PAGE_SIZE):
+                bloom_pages[offset] = data
+                continue
             bytes = zlib.decompress(data)
             if bytes.startswith(_LEAF_FLAG):
                 node = self._leaf_factory(bytes, self._key_length,
@@ -1535,6 +1870,11 @@ class BTreeGraphIndex(object):
             else:
                 raise AssertionError("Unknown node type for %r" % bytes)
             yield offset // _PAGE_SIZE, node
+        if (bloom_pages and self._bloom_filter is None
+                and len(bloom_pages) * _PAGE_SIZE
+                >= self._size - self._row_offsets[-1] * _PAGE_SIZE):
+            self._parse_bloom_filter(
+                [bloom_pages[offset] for offset in sorted(bloom_pages)])
 
     def _signature(self):
         """The file signature for this index type."""
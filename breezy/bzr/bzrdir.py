@@ -26,6 +26,7 @@ objects returned.
 """
 
 import contextlib
+import os
 import sys
 from typing import Set
 
@@ -34,6 +35,7 @@ lazy_import(globals(), """
 from breezy import (
     branch as _mod_branch,
     lockable_files,
+    lru_cache,
     osutils,
     repository,
     revision as _mod_revision,
@@ -802,6 +804,72 @@ class BzrDir(controldir.ControlDir):
             self.control_files.unlock()
 
 
+class RepositoryCache(object):
+    """Repositories opened earlier, for long running processes to reuse.
+
+    Reusing a repository saves reading its format and pack-names files and
+    keeps the pages of its indices that were read cached.  Only local
+    repositories are cached, and they are only handed out again while they
+    are not locked, have no fallback repositories and their format,
+    pack-names and lock files are unchanged.
+
+    A repository is handed out at most once until release() is called, so
+    that separate opens within one operation still get separate objects.
+    """
+
+    _STAMP_FILES = ['format', 'pack-names', 'lock/held/info']
+
+    def __init__(self, max_cache=20):
+        self._repositories = lru_cache.LRUCache(max_cache)
+        self._in_use = set()
+
+    def _stamp(self, controldir):
+        """Return the key and stamp of the repository in controldir.
+
+        :return: (path, stamp), or (None, None) if it is not local.
+        """
+        try:
+            path = controldir.transport.local_abspath('repository')
+        except errors.NotLocalUrl:
+            return None, None
+        stamp = []
+        for relpath in self._STAMP_FILES:
+            try:
+                st = os.stat(osutils.pathjoin(path, relpath))
+            except (FileNotFoundError, NotADirectoryError):
+                stamp.append(None)
+            else:
+                stamp.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        return path, tuple(stamp)
+
+    def get(self, controldir):
+        """Return the cached repository of controldir, or None."""
+        path, stamp = self._stamp(controldir)
+        if path is None or path in self._in_use:
+            return None
+        try:
+            repository, cached_stamp = self._repositories[path]
+        except KeyError:
+            return None
+        # A stale repository is replaced when its successor is added.
+        if (cached_stamp != stamp or repository.is_locked()
+                or repository._fallback_repositories):
+            return None
+        self._in_use.add(path)
+        return repository
+
+    def add(self, controldir, repository):
+        """Remember repository as the repository of controldir."""
+        path, stamp = self._stamp(controldir)
+        if path is not None:
+            self._repositories[path] = (repository, stamp)
+            self._in_use.add(path)
+
+    def release(self):
+        """Allow the repositories handed out so far to be reused."""
+        self._in_use.clear()
+
+
 class BzrDirMeta1(BzrDir):
     """A .bzr meta version 1 control object.
 
@@ -809,8 +877,13 @@ class BzrDirMeta1(BzrDir):
     individual aspects are really split out: there are separate repository,
     workingtree and branch subdirectories and any subset of the three can be
     present within a BzrDir.
+
+    :cvar repository_cache: None, or a RepositoryCache that open_repository
+        reuses repositories from.
     """
 
+    repository_cache = None
+
     def _get_branch_path(self, name):
         """Obtain the branch path to use.
 
@@ -1105,9 +1178,17 @@ class BzrDirMeta1(BzrDir):
     def open_repository(self, unsupported=False):
         """See BzrDir.open_repository."""
         from .repository import RepositoryFormatMetaDir
+        cache = self.repository_cache
+        if cache is not None:
+            repository = cache.get(self)
+            if repository is not None:
+                return repository
         format = RepositoryFormatMetaDir.find_format(self)
         format.check_support_status(unsupported)
-        return format.open(self, _found=True)
+        repository = format.open(self, _found=True)
+        if cache is not None:
+            cache.add(self, repository)
+        return repository
 
     def open_workingtree(self, unsupported=False,
                          recommend_upgrade=True):
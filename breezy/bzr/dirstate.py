@@ -220,6 +220,8 @@ desired.
 
 import bisect
 import codecs
+import collections
+from concurrent import futures
 import contextlib
 import errno
 import operator
@@ -286,6 +288,13 @@ class SHA1Provider(object):
         """
         raise NotImplementedError(self.stat_and_sha1)
 
+    def hashes_raw_content(self, abspath):
+        """Return whether the sha1 of a file is that of its contents on disk.
+
+        If so, DefaultSHA1Provider gives the same sha1 for it.
+        """
+        return False
+
 
 class DefaultSHA1Provider(SHA1Provider):
     """A SHA1Provider that reads directly from the filesystem."""
@@ -301,6 +310,138 @@ class DefaultSHA1Provider(SHA1Provider):
             sha1 = osutils.sha_file(file_obj)
         return statvalue, sha1
 
+    def hashes_raw_content(self, abspath):
+        """See SHA1Provider.hashes_raw_content()."""
+        return True
+
+
+class _HashingAheadSHA1Provider(SHA1Provider):
+    """A SHA1Provider that hashes files in worker threads ahead of use.
+
+    While iter_changes walks the working tree, each directory listing is
+    passed to hash_stale_files, which queues the files of that directory
+    whose stat no longer matches the dirstate. Up to a window of them is
+    being hashed by the worker threads at any time. sha1 and stat_and_sha1
+    then return those results in whatever order iter_changes asks for them,
+    so the changes are reported exactly as they would be without it.
+
+    The worker threads only hash the raw contents of files, with a
+    DefaultSHA1Provider.  Files for which the provider given hashes something
+    else (such as content filtered files) are left to it, on the thread that
+    asks for them.
+    """
+
+    def __init__(self, provider, workers):
+        self._provider = provider
+        self._raw_provider = DefaultSHA1Provider()
+        self._executor = futures.ThreadPoolExecutor(workers)
+        self._window = workers * 4
+        self._queued = collections.OrderedDict()
+        self._pending = collections.OrderedDict()
+
+    def hash_stale_files(self, state, dir_info):
+        """Start hashing the stale files of a directory listing.
+
+        :param state: The DirState the directory is compared against.
+        :param dir_info: A directory listing as returned by
+            osutils._walkdirs_utf8.
+        """
+        self._discard(None)
+        block_index, present = state._find_block_index_from_key(
+            (dir_info[0][0], b'', b''))
+        if block_index == 0:
+            # The first block only holds the root entry, its contents are in
+            # the second.
+            block_index = 1
+            present = len(state._dirblocks) > 1
+        if not present:
+            return
+        entries = {}
+        for entry in state._dirblocks[block_index][1]:
+            # Only files that are files in the basis too get hashed, see
+            # update_entry and ProcessEntryPython._process_entry.
+            if (entry[1][0][0] == b'f' and len(entry[1]) > 1
+                    and entry[1][1][0] == b'f'):
+                entries[entry[0][1]] = entry[1][0]
+        if not entries:
+            return
+        if state._cutoff_time is None:
+            state._sha_cutoff_time()
+        cutoff_time = state._cutoff_time
+        for relpath, basename, kind, stat_value, abspath in dir_info[1]:
+            if kind != 'file':
+                continue
+            try:
+                details = entries[basename]
+            except KeyError:
+                continue
+            # update_entry does not hash files changed within the cutoff
+            # window, as their hashes can not be cached.
+            if (stat_value.st_mtime >= cutoff_time
+                    or stat_value.st_ctime >= cutoff_time):
+                continue
+            if ((details[2] != stat_value.st_size
+                    or details[4] != pack_stat(stat_value))
+                    and self._provider.hashes_raw_content(abspath)):
+                self._queued[abspath] = None
+        self._fill()
+
+    def _fill(self):
+        while self._queued and len(self._pending) < self._window:
+            abspath = self._queued.popitem(last=False)[0]
+            self._pending[abspath] = self._executor.submit(
+                self._raw_provider.stat_and_sha1, abspath)
+
+    def _discard(self, abspath):
+        """Forget the files queued before abspath, or all of them if None."""
+        while self._pending:
+            pending_abspath, future = self._pending.popitem(last=False)
+            if pending_abspath == abspath:
+                return future
+            future.cancel()
+        while self._queued:
+            if self._queued.popitem(last=False)[0] == abspath:
+                break
+        return None
+
+    def stat_and_sha1(self, abspath):
+        """See SHA1Provider.stat_and_sha1()."""
+        if abspath in self._pending or abspath in self._queued:
+            future = self._discard(abspath)
+            self._fill()
+            if future is not None:
+                return future.result()
+        return self._provider.stat_and_sha1(abspath)
+
+    def sha1(self, abspath):
+        """See SHA1Provider.sha1()."""
+        if abspath in self._pending or abspath in self._queued:
+            return self.stat_and_sha1(abspath)[1]
+        return self._provider.sha1(abspath)
+
+    def hashes_raw_content(self, abspath):
+        """See SHA1Provider.hashes_raw_content()."""
+        return self._provider.hashes_raw_content(abspath)
+
+    def close(self):
+        """Stop the worker threads."""
+        self._discard(None)
+        self._executor.shutdown()
+
+
+def _parent_dirnames(path):
+    """Return the names of the dirblocks containing path and its parents."""
+    dirnames = []
+    while path:
+        path = path.rpartition(b'/')[0]
+        dirnames.append(path)
+    return dirnames or [b'']
+
+
+def _split_dirname(dirname):
+    """Return the key directory names are sorted by in a dirstate."""
+    return dirname.split(b'/')
+
 
 class DirState(object):
     """Record directory and metadata state for fast access.
@@ -360,6 +501,12 @@ class DirState(object):
 
     HEADER_FORMAT_2 = b'#bazaar dirstate flat format 2\n'
     HEADER_FORMAT_3 = b'#bazaar dirstate flat format 3\n'
+    JOURNAL_HEADER = b'#bazaar dirstate journal 1\n'
+
+    # Hash cache updates are appended to a journal next to the dirstate file
+    # until it grows beyond this fraction of the dirstate file, at which point
+    # the dirstate is rewritten.
+    JOURNAL_FRACTION = 0.1
 
     def __init__(self, path, sha1_provider, worth_saving_limit=0,
                  use_filesystem_for_exec=True):
@@ -387,6 +534,10 @@ class DirState(object):
         # modified states.
         self._header_state = DirState.NOT_IN_MEMORY
         self._dirblock_state = DirState.NOT_IN_MEMORY
+        # If true, only the dirblocks of the directories in _partial_dirs have
+        # been read from disk.
+        self._dirblocks_partial = False
+        self._partial_dirs = set()
         # If true, an error has been detected while updating the dirstate, and
         # for safety we're not going to commit to disk.
         self._changes_aborted = False
@@ -395,6 +546,11 @@ class DirState(object):
         self._parents = []
         self._state_file = None
         self._filename = path
+        self._journal_filename = path + '.journal'
+        # The length of the valid part of the journal, 0 if there is none.
+        self._journal_size = 0
+        # The records of the journal, once read while the dirstate is locked.
+        self._journal_records = None
         self._lock_token = None
         self._lock_state = None
         self._id_index = None
@@ -409,6 +565,8 @@ class DirState(object):
             self._sha1_file = self._sha1_file_and_mutter
         else:
             self._sha1_file = self._sha1_provider.sha1
+        # How many threads _walkdirs_utf8 reads directories with.
+        self._walk_workers = 1
         # These two attributes provide a simple cache for lookups into the
         # dirstate in-memory vectors. By probing respectively for the last
         # block, and for the next entry, we save nearly 2 bisections per path
@@ -448,6 +606,9 @@ class DirState(object):
             # TODO: Since we now have a IN_MEMORY_HASH_MODIFIED state, we
             #       should fail noisily if someone tries to set
             #       IN_MEMORY_MODIFIED but we don't have a write-lock!
+            if self._dirblocks_partial:
+                raise AssertionError(
+                    'modifying a partially read dirstate: %r' % (self,))
             # We don't know exactly what changed so disable smart saving
             self._dirblock_state = DirState.IN_MEMORY_MODIFIED
         if header_modified:
@@ -612,7 +773,8 @@ class DirState(object):
         # If _dirblock_state was in memory, we should just return info from
         # there, this function is only meant to handle when we want to read
         # part of the disk.
-        if self._dirblock_state != DirState.NOT_IN_MEMORY:
+        if (self._dirblock_state != DirState.NOT_IN_MEMORY
+                and not self._dirblocks_partial):
             raise AssertionError("bad dirblock state %r" %
                                  self._dirblock_state)
 
@@ -793,7 +955,7 @@ class DirState(object):
         _bisect_dirblocks is meant to find the contents of directories, which
         differs from _bisect, which only finds individual entries.
 
-        :param dir_list: A sorted list of directory names ['', 'dir', 'foo'].
+        :param dir_list: A list of directory names ['', 'dir', 'foo'].
         :return: A map from dir => entries_for_dir
         """
         # TODO: jam 20070223 A lot of the bisecting logic could be shared
@@ -806,7 +968,8 @@ class DirState(object):
         # If _dirblock_state was in memory, we should just return info from
         # there, this function is only meant to handle when we want to read
         # part of the disk.
-        if self._dirblock_state != DirState.NOT_IN_MEMORY:
+        if (self._dirblock_state != DirState.NOT_IN_MEMORY
+                and not self._dirblocks_partial):
             raise AssertionError("bad dirblock state %r" %
                                  self._dirblock_state)
         # The disk representation is generally info + '\0\n\0' at the end. But
@@ -833,7 +996,9 @@ class DirState(object):
         #   high -> the last byte offset (inclusive)
         #   dirs -> The list of directories that should be found in
         #                the [low, high] range
-        pending = [(low, high, dir_list)]
+        # Directories are compared component by component, as they are
+        # sorted in the file.
+        pending = [(low, high, sorted(dir_list, key=_split_dirname))]
 
         page_size = self._bisect_page_size
 
@@ -893,7 +1058,9 @@ class DirState(object):
                 # after this first record.
                 after = start
                 first_dir = first_fields[1]
-                first_loc = bisect.bisect_left(cur_dirs, first_dir)
+                first_loc = bisect.bisect_left(
+                    [_split_dirname(d) for d in cur_dirs],
+                    _split_dirname(first_dir))
 
                 # These exist before the current location
                 pre = cur_dirs[:first_loc]
@@ -917,7 +1084,8 @@ class DirState(object):
                     after = mid + len(block)
 
                 last_dir = last_fields[1]
-                last_loc = bisect.bisect_right(post, last_dir)
+                last_loc = bisect.bisect_right(
+                    [_split_dirname(d) for d in post], _split_dirname(last_dir))
 
                 middle_files = post[:last_loc]
                 post = post[last_loc:]
@@ -1105,11 +1273,11 @@ class DirState(object):
             if not dirname.endswith(
                     self._dirblocks[parent_block_index][1][parent_row_index][0][1]):
                 raise AssertionError("bad dirname %r" % dirname)
+        if self._dirblocks_partial:
+            self._read_partial_dirblocks({dirname}, set())
         block_index, present = self._find_block_index_from_key(
             (dirname, b'', b''))
         if not present:
-            # In future, when doing partial parsing, this should load and
-            # populate the entire block.
             self._dirblocks.insert(block_index, (dirname, []))
         return block_index
 
@@ -1189,17 +1357,11 @@ class DirState(object):
         :param entry: An entry_tuple as defined in the module docstring.
         """
         entire_entry = list(entry[0])
-        for tree_number, tree_data in enumerate(entry[1]):
-            # (minikind, fingerprint, size, executable, tree_specific_string)
-            entire_entry.extend(tree_data)
-            # 3 for the key, 5 for the fields per tree.
-            tree_offset = 3 + tree_number * 5
-            # minikind
-            entire_entry[tree_offset + 0] = tree_data[0]
-            # size
-            entire_entry[tree_offset + 2] = b'%d' % tree_data[2]
-            # executable
-            entire_entry[tree_offset + 3] = DirState._to_yesno[tree_data[3]]
+        to_yesno = DirState._to_yesno
+        for minikind, fingerprint, size, executable, info in entry[1]:
+            entire_entry.extend(
+                (minikind, fingerprint, b'%d' % size, to_yesno[executable],
+                 info))
         return b'\0'.join(entire_entry)
 
     def _fields_per_entry(self):
@@ -1937,6 +2099,59 @@ class DirState(object):
         """Return the os.lstat value for this path."""
         return os.lstat(abspath)
 
+    @contextlib.contextmanager
+    def _hashing_ahead(self, workers):
+        """Hash stale files with workers threads while in this context.
+
+        See _HashingAheadSHA1Provider; the directories walked with
+        _walkdirs_utf8 are hashed ahead.
+        """
+        provider = self._sha1_provider
+        sha1_file = self._sha1_file
+        self._sha1_provider = _HashingAheadSHA1Provider(provider, workers)
+        if sha1_file == provider.sha1:
+            self._sha1_file = self._sha1_provider.sha1
+        try:
+            yield
+        finally:
+            self._sha1_provider.close()
+            self._sha1_provider = provider
+            self._sha1_file = sha1_file
+
+    @contextlib.contextmanager
+    def _walking_concurrently(self, workers):
+        """Read directories with workers threads while in this context.
+
+        See osutils._walkdirs_utf8_concurrent.
+        """
+        self._walk_workers = workers
+        try:
+            yield
+        finally:
+            self._walk_workers = 1
+
+    def _walkdirs_utf8(self, top, prefix=""):
+        """Walk the working tree like osutils._walkdirs_utf8.
+
+        When walking concurrently, the directories are read by worker
+        threads. When hashing ahead, the stale files of each directory start
+        being hashed as soon as it has been listed.
+        """
+        if self._walk_workers > 1:
+            dir_iterator = osutils._walkdirs_utf8_concurrent(
+                top, prefix=prefix, workers=self._walk_workers)
+        else:
+            dir_iterator = osutils._walkdirs_utf8(top, prefix=prefix)
+        provider = self._sha1_provider
+        if not isinstance(provider, _HashingAheadSHA1Provider):
+            return dir_iterator
+        return self._iter_hashing_ahead(provider, dir_iterator)
+
+    def _iter_hashing_ahead(self, provider, dir_iterator):
+        for dir_info in dir_iterator:
+            provider.hash_stale_files(self, dir_info)
+            yield dir_info
+
     def _sha1_file_and_mutter(self, abspath):
         # when -Dhashcache is turned on, this is monkey-patched in to log
         # file reads
@@ -1976,7 +2191,8 @@ class DirState(object):
     def get_lines(self):
         """Serialise the entire dirstate to a sequence of lines."""
         if (self._header_state == DirState.IN_MEMORY_UNMODIFIED and
-                self._dirblock_state == DirState.IN_MEMORY_UNMODIFIED):
+                self._dirblock_state == DirState.IN_MEMORY_UNMODIFIED and
+                not self._journal_size):
             # read what's on disk.
             self._state_file.seek(0)
             return self._state_file.readlines()
@@ -2104,7 +2320,11 @@ class DirState(object):
             rather it indicates that there are at least some files in some
             tree present there.
         """
-        self._read_dirblocks_if_needed()
+        if self._dirblocks_partial:
+            self._read_partial_dirblocks(set(_parent_dirnames(
+                osutils.pathjoin(dirname, basename))), set())
+        else:
+            self._read_dirblocks_if_needed()
         key = dirname, basename, b''
         block_index, present = self._find_block_index_from_key(key)
         if not present:
@@ -2141,7 +2361,12 @@ class DirState(object):
             (absent) paths.
         :return: The dirstate entry tuple for path, or (None, None)
         """
-        self._read_dirblocks_if_needed()
+        if path_utf8 is not None:
+            # Only read the dirblocks needed for the path if nothing has been
+            # read yet.
+            self._read_dirblocks_for_paths([path_utf8], recursive=False)
+        else:
+            self._read_dirblocks_if_needed()
         if path_utf8 is not None:
             if not isinstance(path_utf8, bytes):
                 raise errors.BzrError('path_utf8 is not bytes: %s %r'
@@ -2423,8 +2648,103 @@ class DirState(object):
         loading.
         """
         self._read_header_if_needed()
+        if self._dirblocks_partial:
+            # Start over, forgetting any hash cache updates.
+            self._dirblocks_partial = False
+            self._partial_dirs = set()
+            self._dirblock_state = DirState.NOT_IN_MEMORY
+            self._dirblocks = []
+            self._known_hash_changes = set()
+            self._id_index = None
+            self._packed_stat_index = None
+            self._last_block_index = None
+            self._last_entry_index = None
         if self._dirblock_state == DirState.NOT_IN_MEMORY:
             _read_dirblocks(self)
+            self._apply_journal()
+
+    def _read_dirblocks_for_paths(self, paths, recursive=True):
+        """Read in the dirblocks needed to look at paths.
+
+        When the dirstate is read locked and its dirblocks are not in memory
+        yet, only the dirblocks of the directories containing paths and their
+        parents are read, bisecting the file rather than parsing all of it.
+        If recursive is True, so are the dirblocks of the directories below
+        paths, and of the paths their entries are renamed to or from.
+
+        This leaves the dirstate partially in memory until something needs
+        all of it, at which point _read_dirblocks_if_needed reads it in full.
+        Only hash cache updates of a partially read dirstate can be saved.
+
+        :param paths: A list of utf8 paths.
+        """
+        self._read_header_if_needed()
+        if not self._dirblocks_partial:
+            if (self._lock_state != 'r'
+                    or self._dirblock_state != DirState.NOT_IN_MEMORY):
+                self._read_dirblocks_if_needed()
+                return
+            self._dirblocks = [(b'', []), (b'', [])]
+            self._dirblocks_partial = True
+            self._partial_dirs = set()
+            self._dirblock_state = DirState.IN_MEMORY_UNMODIFIED
+        dirs = set()
+        subtrees = set()
+        for path in paths:
+            dirs.update(_parent_dirnames(path))
+            if recursive:
+                dirs.add(path)
+                subtrees.add(path)
+        self._read_partial_dirblocks(dirs, subtrees)
+
+    def _read_partial_dirblocks(self, dirs, subtrees):
+        """Read the dirblocks of dirs into a partially read dirstate.
+
+        :param dirs: A set of utf8 directory names.
+        :param subtrees: The utf8 paths of the directories whose dirblocks
+            should be read recursively.
+        """
+        new_keys = set()
+        while True:
+            dirs.difference_update(self._partial_dirs)
+            if not dirs:
+                break
+            found = self._bisect_dirblocks(list(dirs))
+            self._partial_dirs.update(dirs)
+            dirs = set()
+            for dirname, entries in found.items():
+                self._add_partial_dirblock(dirname, entries)
+                in_subtree = osutils.is_inside_any(subtrees, dirname)
+                for entry in entries:
+                    new_keys.add(entry[0])
+                    path = osutils.pathjoin(entry[0][0], entry[0][1])
+                    for details in entry[1]:
+                        if details[0] == b'd' and in_subtree and path:
+                            dirs.add(path)
+                        elif details[0] == b'r' and (
+                                in_subtree or path in subtrees):
+                            dirs.update(_parent_dirnames(details[1]))
+                            dirs.add(details[1])
+                            subtrees.add(details[1])
+        if new_keys:
+            self._last_block_index = None
+            self._last_entry_index = None
+            self._apply_journal(new_keys)
+
+    def _add_partial_dirblock(self, dirname, entries):
+        """Add the entries of a directory read by _read_dirblocks_for_paths."""
+        # Bisecting returns the entries in the order they were read.
+        entries.sort(key=operator.itemgetter(0))
+        if dirname == b'':
+            for entry in entries:
+                if entry[0][1]:
+                    self._dirblocks[1][1].append(entry)
+                else:
+                    self._dirblocks[0][1].append(entry)
+            return
+        block_index = bisect_dirblock(self._dirblocks, dirname, 2,
+                                      cache=self._split_path_cache)
+        self._dirblocks.insert(block_index, (dirname, entries))
 
     def _read_header(self):
         """This reads in the metadata header, and the parent ids.
@@ -2530,12 +2850,17 @@ class DirState(object):
                 # We couldn't grab a write lock, so we switch back to a read one
                 return
         try:
-            lines = self.get_lines()
-            self._state_file.seek(0)
-            self._state_file.writelines(lines)
-            self._state_file.truncate()
-            self._state_file.flush()
-            self._maybe_fdatasync()
+            if not self._append_to_journal():
+                if self._dirblocks_partial:
+                    self._read_dirblocks_keeping_hash_changes()
+                lines = self.get_lines()
+                self._state_file.seek(0)
+                self._state_file.writelines(lines)
+                self._state_file.truncate()
+                self._state_file.flush()
+                self._maybe_fdatasync(self._state_file)
+                self.crc_expected = int(lines[1][len(b'crc32: '):-1])
+                self._remove_journal()
             self._mark_unmodified()
         finally:
             if grabbed_write_lock:
@@ -2545,10 +2870,156 @@ class DirState(object):
                 #       not changed contents. Since restore_read_lock may
                 #       not be an atomic operation.
 
-    def _maybe_fdatasync(self):
+    def _maybe_fdatasync(self, f):
         """Flush to disk if possible and if not configured off."""
         if self._config_stack.get('dirstate.fdatasync'):
-            osutils.fdatasync(self._state_file.fileno())
+            osutils.fdatasync(f.fileno())
+
+    def _read_journal(self):
+        """Read the journal of hash cache updates to the dirstate file.
+
+        The journal starts with a header naming the crc32 of the dirstate file
+        it applies to, followed by batches of records, each preceded by its
+        length and crc32. A journal written for another version of the
+        dirstate file is ignored, as is anything after a damaged batch.
+
+        :return: The length of the valid part of the journal, and a list of
+            (key, tree 0 details) records in the order they were written.
+        """
+        try:
+            with open(self._journal_filename, 'rb') as f:
+                data = f.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return 0, []
+            raise
+        header = self.JOURNAL_HEADER + b'crc32: %d\n' % (self.crc_expected,)
+        if not data.startswith(header):
+            return 0, []
+        records = []
+        pos = len(header)
+        while True:
+            end_of_line = data.find(b'\n', pos)
+            if end_of_line == -1:
+                break
+            try:
+                length, crc = map(int, data[pos:end_of_line].split(b' '))
+            except ValueError:
+                break
+            start = end_of_line + 1
+            payload = data[start:start + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                break
+            fields = payload.split(b'\0')
+            for i in range(0, len(fields) - 7, 8):
+                records.append(
+                    ((fields[i], fields[i + 1], fields[i + 2]),
+                     (fields[i + 3], fields[i + 4], int(fields[i + 5]),
+                      fields[i + 6] == b'y', fields[i + 7])))
+            pos = start + length
+        return pos, records
+
+    def _apply_journal(self, keys=None):
+        """Apply the journal to the dirblocks just read from disk.
+
+        The journal is only read once while the dirstate is locked, however
+        many times dirblocks are read.
+
+        :param keys: If not None, only apply the journal to these entries.
+        """
+        if self._journal_records is None:
+            self._journal_size, self._journal_records = self._read_journal()
+        records = self._journal_records
+        if keys is not None:
+            records = [(key, details) for key, details in records
+                       if key in keys]
+        self._set_tree_0_details(records)
+
+    def _set_tree_0_details(self, records):
+        """Update the tree 0 details of entries whose kind is unchanged.
+
+        :param records: A list of (key, tree 0 details) tuples.
+        """
+        for key, details in records:
+            entry = self._find_entry_by_key(key)
+            if entry is not None and entry[1][0][0] == details[0]:
+                entry[1][0] = details
+
+    def _read_dirblocks_keeping_hash_changes(self):
+        """Read a partially read dirstate in full, keeping hash updates."""
+        records = []
+        for key in self._known_hash_changes:
+            entry = self._find_entry_by_key(key)
+            if entry is not None:
+                records.append((key, entry[1][0]))
+        self._read_dirblocks_if_needed()
+        self._set_tree_0_details(records)
+        if records:
+            self._mark_modified(records)
+
+    def _append_to_journal(self):
+        """Save the hash cache updates by appending them to the journal.
+
+        :return: False if the dirstate file has to be rewritten instead,
+            because more than the hash cache changed or the journal has grown
+            too large.
+        """
+        if (self._header_state == DirState.IN_MEMORY_MODIFIED
+                or self._dirblock_state != DirState.IN_MEMORY_HASH_MODIFIED):
+            return False
+        fields = []
+        for key in sorted(self._known_hash_changes):
+            entry = self._find_entry_by_key(key)
+            if entry is None:
+                continue
+            details = entry[1][0]
+            fields.extend(key)
+            fields.extend([details[0], details[1], b'%d' % (details[2],),
+                           self._to_yesno[details[3]], details[4]])
+        fields.append(b'')
+        payload = b'\0'.join(fields)
+        batch = b'%d %d\n%s' % (len(payload), zlib.crc32(payload), payload)
+        if self._journal_size:
+            journal_size = self._journal_size
+            mode = 'r+b'
+        else:
+            batch = (self.JOURNAL_HEADER + b'crc32: %d\n' % (self.crc_expected,)
+                     + batch)
+            journal_size = 0
+            mode = 'wb'
+        dirstate_size = os.fstat(self._state_file.fileno()).st_size
+        if journal_size + len(batch) > dirstate_size * self.JOURNAL_FRACTION:
+            return False
+        with open(self._journal_filename, mode) as f:
+            f.seek(journal_size)
+            f.write(batch)
+            f.truncate()
+            f.flush()
+            self._maybe_fdatasync(f)
+        self._journal_size = journal_size + len(batch)
+        self._journal_records = None
+        return True
+
+    def _find_entry_by_key(self, key):
+        """Return the entry for key, or None if it is not present."""
+        block_index, present = self._find_block_index_from_key(key)
+        if not present:
+            return None
+        block = self._dirblocks[block_index][1]
+        entry_index, present = self._find_entry_index(key, block)
+        if not present:
+            return None
+        return block[entry_index]
+
+    def _remove_journal(self):
+        """Remove the journal, once the dirstate file has been rewritten."""
+        self._journal_size = 0
+        self._journal_records = None
+        try:
+            os.unlink(self._journal_filename)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
 
     def _worth_saving(self):
         """Is it worth saving the dirstate or not?"""
@@ -3378,6 +3849,10 @@ class DirState(object):
         self._end_of_header = None
         self._cutoff_time = None
         self._split_path_cache = {}
+        self._journal_size = 0
+        self._journal_records = None
+        self._dirblocks_partial = False
+        self._partial_dirs = set()
 
     def lock_read(self):
         """Acquire a read lock on the dirstate."""
@@ -3980,7 +4455,7 @@ class ProcessEntryPython(object):
             if root_dir_info and root_dir_info[2] == 'tree-reference':
                 current_dir_info = None
             else:
-                dir_iterator = osutils._walkdirs_utf8(
+                dir_iterator = self.state._walkdirs_utf8(
                     root_abspath, prefix=current_root)
                 try:
                     current_dir_info = next(dir_iterator)
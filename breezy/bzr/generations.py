@@ -0,0 +1,309 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Generation numbers of the revisions in a repository.
+
+The generation of a revision is one more than the highest generation of its
+parents, or 1 if it has none, so it is greater than the generation of any of
+its ancestors.  Graph uses them to limit how far back it searches (see
+Graph.heads and Graph.is_ancestor).
+
+Looking up revisions missing from the index computes their generations,
+walking their ancestry back to revisions already in the index, and adds
+them to it.  So the first lookup in a repository walks its whole ancestry,
+and later ones only the revisions added since.  Revisions that are not in
+the repository have no known generation, and Graph falls back to searching
+without generations for them.
+
+Ghosts are treated as revisions without parents.  The ghosts that
+generations were computed with are recorded, and if any of them has since
+been added to the repository the generations are thrown away.
+
+The generations are kept in B+Tree indices (NAME.gix) mapping each revision
+id to its generation, each with the ghosts it was computed with listed in
+NAME.ghosts.  They are kept in the cache directory rather than in the
+repository (see cache_path), and index files are only ever added or
+replaced as a whole, so several processes can use them at the same time.
+"""
+
+from ..lazy_import import lazy_import
+lazy_import(globals(), """
+from breezy import (
+    bedding,
+    osutils,
+    trace,
+    tsort,
+    )
+from breezy.bzr.btree_index import (
+    BTreeBuilder,
+    BTreeGraphIndex,
+    )
+from breezy.bzr.index import CombinedGraphIndex
+""")
+from .. import (
+    errors,
+    revision as _mod_revision,
+    transport as _mod_transport,
+    )
+
+
+def cache_path(url):
+    """Return the path of the directory with the index of the repository."""
+    return osutils.pathjoin(
+        bedding.cache_dir(), 'generations',
+        osutils.sha_string(url.encode('utf-8')).decode('ascii'))
+
+
+class GenerationIndex(object):
+    """The generations of the revisions in a repository.
+
+    Each call to add_revisions writes a new index file.  Index files are
+    combined with those not much larger than them, so that there are only
+    a logarithmic number of them.
+    """
+
+    def __init__(self, transport, parents_provider):
+        """Create a GenerationIndex.
+
+        :param transport: The transport of the directory holding the index
+            files, which need not exist yet.
+        :param parents_provider: The parents provider of the repository.
+        """
+        self._transport = transport
+        self._parents_provider = parents_provider
+        self._index = None
+        self._index_ghosts = {}
+        self._generations = {}
+        self._ghosts = set()
+        self._stale_names = []
+
+    def get_generation_map(self, keys):
+        """Return the generations of the revisions in keys.
+
+        The generations of revisions missing from the index are computed and
+        added to it.
+
+        :return: A dict mapping each of keys in the repository to its
+            generation.
+        """
+        self._load()
+        keys = set(keys)
+        keys.discard(_mod_revision.NULL_REVISION)
+        result = {}
+        missing = self._lookup(keys, result)
+        if missing:
+            self.add_revisions(missing)
+            self._lookup(missing, result)
+        return result
+
+    def add_revisions(self, keys):
+        """Add the generations of revisions to the index.
+
+        Generations of ancestors of keys that are missing from the index are
+        computed and added too.
+
+        :param keys: Revisions in the repository.
+        """
+        self._load()
+        keys = set(keys)
+        keys.discard(_mod_revision.NULL_REVISION)
+        if keys.intersection(self._ghosts):
+            self._stale_names = list(self._index_ghosts)
+            self._reset({})
+        if self._stale_names:
+            trace.mutter(
+                'recomputing generations computed without revisions that '
+                'are now present')
+            # Descendants of the ghosts need new generations too.
+            for name in self._stale_names:
+                index = BTreeGraphIndex(self._transport, name + '.gix', None)
+                keys.update(entry[1][0] for entry in index.iter_all_entries())
+            self._delete_indices(self._stale_names)
+            self._stale_names = []
+        generations, ghosts = self._compute(self._lookup(keys, {}))
+        if not generations:
+            return
+        name = osutils.rand_chars(20)
+        try:
+            self._write_index(name, generations, ghosts)
+        except (errors.TransportNotPossible, errors.PermissionDenied) as e:
+            trace.mutter('not writing the generation index: %s', e)
+            return
+        self._index_ghosts[name] = ghosts
+        self._combine()
+
+    def _reset(self, index_ghosts):
+        self._index_ghosts = index_ghosts
+        self._index = CombinedGraphIndex([
+            BTreeGraphIndex(self._transport, name + '.gix', None)
+            for name in sorted(index_ghosts)])
+        self._ghosts = set()
+        for ghosts in index_ghosts.values():
+            self._ghosts.update(ghosts)
+        self._generations = {}
+
+    def _load(self):
+        if self._index is not None:
+            return
+        index_ghosts = {}
+        try:
+            for name in self._transport.list_dir('.'):
+                if not name.endswith('.gix'):
+                    continue
+                name = name[:-4]
+                try:
+                    index_ghosts[name] = set(self._transport.get_bytes(
+                        name + '.ghosts').splitlines())
+                except _mod_transport.NoSuchFile:
+                    index_ghosts[name] = set()
+        except _mod_transport.NoSuchFile:
+            pass
+        self._reset(index_ghosts)
+        if self._ghosts and self._parents_provider.get_parent_map(
+                self._ghosts):
+            # The index files are deleted by the next add_revisions.
+            self._stale_names = list(index_ghosts)
+            self._reset({})
+
+    def _lookup(self, keys, result):
+        """Find the known generations of keys.
+
+        :param result: A dict to add the generations found to.
+        :return: The set of keys whose generations are not known.
+        """
+        missing = set()
+        for key in keys:
+            generation = self._generations.get(key)
+            if generation is None:
+                missing.add(key)
+            else:
+                result[key] = generation
+        if missing and self._index_ghosts:
+            try:
+                for entry in self._index.iter_entries(
+                        [(key,) for key in missing]):
+                    key = entry[1][0]
+                    generation = int(entry[2])
+                    self._generations[key] = generation
+                    result[key] = generation
+                    missing.discard(key)
+            except _mod_transport.NoSuchFile:
+                # Combined into another index by someone else.
+                self._index = None
+                self._load()
+                return self._lookup(missing, result)
+        return missing
+
+    def _compute(self, keys):
+        """Compute the generations of keys from those of their ancestors.
+
+        :return: A dict with the generations computed, and the set of the
+            ghosts they were computed with.
+        """
+        parent_map = {}
+        pending = keys
+        while pending:
+            found = self._parents_provider.get_parent_map(pending)
+            parent_map.update(found)
+            parents = set()
+            for key_parents in found.values():
+                parents.update(key_parents)
+            parents.discard(_mod_revision.NULL_REVISION)
+            pending = self._lookup(
+                [key for key in parents
+                 if key not in parent_map and key not in self._ghosts], {})
+        generations = {}
+        ghosts = set()
+        if not parent_map:
+            return generations, ghosts
+        for key in tsort.topo_sort(parent_map):
+            try:
+                key_parents = parent_map[key]
+            except KeyError:
+                continue
+            generation = 0
+            for parent in key_parents:
+                if parent == _mod_revision.NULL_REVISION:
+                    continue
+                parent_generation = self._generations.get(parent)
+                if parent_generation is None:
+                    parent_generation = 0
+                    ghosts.add(parent)
+                generation = max(generation, parent_generation)
+            self._generations[key] = generations[key] = generation + 1
+        self._ghosts.update(ghosts)
+        return generations, ghosts
+
+    def _write_index(self, name, generations, ghosts):
+        builder = BTreeBuilder(reference_lists=0, key_elements=1)
+        for key, generation in generations.items():
+            builder.add_node((key,), b'%d' % (generation,))
+        try:
+            self._transport.ensure_base()
+        except _mod_transport.NoSuchFile:
+            self._transport.create_prefix()
+        # The ghosts are written first, so that there are none missing for
+        # any index found.
+        if ghosts:
+            self._transport.put_bytes(
+                name + '.ghosts', b''.join(
+                    ghost + b'\n' for ghost in sorted(ghosts)))
+        self._transport.put_file(name + '.gix', builder.finish())
+
+    def _combine(self):
+        """Combine the smallest index files if they are of similar size.
+
+        The smallest index is combined with the next smallest ones for as
+        long as each of those has at most twice the entries of the ones
+        before it together.
+        """
+        sizes = sorted(
+            (BTreeGraphIndex(self._transport, name + '.gix', None)
+             .key_count(), name) for name in self._index_ghosts)
+        total = sizes[0][0]
+        names = [sizes[0][1]]
+        for size, name in sizes[1:]:
+            if size > 2 * total:
+                break
+            total += size
+            names.append(name)
+        index_ghosts = dict(self._index_ghosts)
+        if len(names) > 1:
+            generations = {}
+            ghosts = set()
+            for name in names:
+                index = BTreeGraphIndex(self._transport, name + '.gix', None)
+                for entry in index.iter_all_entries():
+                    generations[entry[1][0]] = int(entry[2])
+                ghosts.update(index_ghosts.pop(name))
+            name = osutils.rand_chars(20)
+            self._write_index(name, generations, ghosts)
+            self._delete_indices(names)
+            index_ghosts[name] = ghosts
+        generations = self._generations
+        self._reset(index_ghosts)
+        self._generations = generations
+
+    def _delete_indices(self, names):
+        for name in names:
+            for suffix in ('.gix', '.ghosts'):
+                try:
+                    self._transport.delete(name + suffix)
+                except _mod_transport.NoSuchFile:
+                    pass
+                except (errors.TransportNotPossible,
+                        errors.PermissionDenied) as e:
+                    trace.mutter('not deleting %s: %s', name + suffix, e)
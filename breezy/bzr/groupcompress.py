@@ -16,6 +16,8 @@
 
 """Core compression logic for compressing streams of related files."""
 
+import collections
+from concurrent import futures
 import time
 from typing import Type
 import zlib
@@ -58,6 +60,14 @@ from .versionedfile import (
 # groupcompress blocks.
 BATCH_SIZE = 2**16
 
+# Number of bytes of fulltext to hand to a worker process at once when
+# compressing a stream in parallel.
+_PARALLEL_BATCH_SIZE = 8 * 1024 * 1024
+
+# Maximum number of bytes of compressed blocks to read ahead of the records
+# being returned by get_record_stream. 0 disables reading ahead.
+_PREFETCH_BYTES = 4 * 1024 * 1024
+
 # osutils.sha_string(b'')
 _null_sha1 = b'da39a3ee5e6b4b0d3255bfef95601890afd80709'
 
@@ -1122,6 +1132,114 @@ def cleanup_pack_group(versioned_files):
     versioned_files.stream.close()
 
 
+def _decompress_block(zdata, num_bytes):
+    """Parse the bytes of a block and expand the first num_bytes of it."""
+    block = GroupCompressBlock.from_bytes(zdata)
+    block._ensure_content(num_bytes)
+    return block
+
+
+class _BlockPrefetcher(object):
+    """Read group compress blocks ahead of the records that need them.
+
+    Blocks are read in batches of about BATCH_SIZE bytes, in the order they
+    will be asked for. The reads are done by the thread asking for the blocks,
+    as transports can not be shared between threads, but the blocks are
+    decompressed by a worker thread. So while the records of one block are
+    processed, the following blocks are being decompressed, and while those
+    are being decompressed the next batch is read.
+
+    At most max_bytes of compressed blocks are read before they are asked
+    for.
+    """
+
+    def __init__(self, gcvf, read_memos, max_bytes=None):
+        """Create a _BlockPrefetcher.
+
+        :param gcvf: The GroupCompressVersionedFiles to read blocks from.
+        :param read_memos: A list of (read_memo, num_bytes) tuples, in the
+            order the blocks will be asked for. num_bytes is the number of
+            bytes of the content of the block that will be used.
+        :param max_bytes: The maximum number of bytes to read ahead,
+            _PREFETCH_BYTES by default.
+        """
+        self.gcvf = gcvf
+        self._to_read = collections.OrderedDict(read_memos)
+        self._pending = collections.OrderedDict()
+        self._pending_bytes = 0
+        if max_bytes is None:
+            max_bytes = _PREFETCH_BYTES
+        self._max_bytes = max_bytes
+        self._executor = None
+
+    def _read_batch(self):
+        """Read the next batch of blocks and start decompressing them."""
+        cache = self.gcvf._group_cache
+        batch = []
+        batch_bytes = 0
+        while self._to_read and batch_bytes < BATCH_SIZE:
+            read_memo, num_bytes = self._to_read.popitem(last=False)
+            if read_memo in cache:
+                continue
+            batch.append((read_memo, num_bytes))
+            batch_bytes += read_memo[2]
+        if not batch:
+            return
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(1)
+        raw_records = self.gcvf._access.get_raw_records(
+            [read_memo for read_memo, _ in batch])
+        for (read_memo, num_bytes), zdata in zip(batch, raw_records):
+            self._pending[read_memo] = self._executor.submit(
+                _decompress_block, zdata, num_bytes)
+        self._pending_bytes += batch_bytes
+
+    def _get_block(self, read_memo):
+        """Return the block for read_memo, or None if it was not read ahead.
+
+        Blocks read ahead of read_memo that were not asked for are dropped.
+        """
+        while read_memo in self._to_read:
+            self._read_batch()
+        if self._to_read and self._pending_bytes < self._max_bytes:
+            # Read the next batch while the worker decompresses this one.
+            self._read_batch()
+        if read_memo not in self._pending:
+            return None
+        while True:
+            pending_memo, future = self._pending.popitem(last=False)
+            self._pending_bytes -= pending_memo[2]
+            if pending_memo == read_memo:
+                return future.result()
+            future.cancel()
+
+    def get_blocks(self, read_memos):
+        """Get GroupCompressBlocks for the given read_memos.
+
+        See GroupCompressVersionedFiles._get_blocks.
+        """
+        for read_memo in read_memos:
+            block = self._get_block(read_memo)
+            if block is None:
+                # Cached when the batch was read, but it may have been
+                # evicted since.
+                for read_memo, block in self.gcvf._get_blocks([read_memo]):
+                    yield read_memo, block
+                continue
+            self.gcvf._group_cache[read_memo] = block
+            yield read_memo, block
+
+    def close(self):
+        """Stop the worker thread."""
+        if self._executor is not None:
+            for future in self._pending.values():
+                future.cancel()
+            self._executor.shutdown()
+            self._executor = None
+        self._pending.clear()
+        self._to_read.clear()
+
+
 class _BatchingBlockFetcher(object):
     """Fetch group compress blocks in batches.
 
@@ -1129,9 +1247,11 @@ class _BatchingBlockFetcher(object):
         currently pending batch.
     """
 
-    def __init__(self, gcvf, locations, get_compressor_settings=None):
+    def __init__(self, gcvf, locations, get_compressor_settings=None,
+                 prefetcher=None):
         self.gcvf = gcvf
         self.locations = locations
+        self.prefetcher = prefetcher
         self.keys = []
         self.batch_memos = {}
         self.memos_to_get = []
@@ -1192,7 +1312,10 @@ class _BatchingBlockFetcher(object):
         if self.manager is None and not self.keys:
             return
         # Fetch all memos in this batch.
-        blocks = self.gcvf._get_blocks(self.memos_to_get)
+        if self.prefetcher is not None:
+            blocks = self.prefetcher.get_blocks(self.memos_to_get)
+        else:
+            blocks = self.gcvf._get_blocks(self.memos_to_get)
         # Turn blocks into factories and yield them.
         memos_to_get_stack = list(self.memos_to_get)
         memos_to_get_stack.reverse()
@@ -1232,6 +1355,79 @@ class _BatchingBlockFetcher(object):
         self.total_bytes = 0
 
 
+def _should_start_new_block(prefix, last_prefix, max_fulltext_prefix,
+                            max_fulltext_len, end_point):
+    """Should the text just added to a group go into a new group instead?
+
+    :param prefix: The key prefix of the text, or None for unprefixed keys.
+    :param last_prefix: The key prefix of the previous text.
+    :param max_fulltext_prefix: The key prefix of the largest text so far.
+    :param max_fulltext_len: The length of the largest text so far.
+    :param end_point: The length of the group including the text.
+    """
+    if (prefix == max_fulltext_prefix
+            and end_point < 2 * max_fulltext_len):
+        # As long as we are on the same file_id, we will fill at least
+        # 2 * max_fulltext_len
+        return False
+    elif end_point > 4 * 1024 * 1024:
+        return True
+    elif (prefix is not None and prefix != last_prefix
+          and end_point > 2 * 1024 * 1024):
+        return True
+    return False
+
+
+def _compress_texts(settings, texts):
+    """Compress texts into groups, the way _insert_record_stream does.
+
+    This is run in worker processes by
+    GroupCompressVersionedFiles._insert_record_stream_in_parallel.
+
+    :param settings: The settings for the GroupCompressor.
+    :param texts: A list of (key, sha1, bytes) tuples.
+    :return: A list of (block_bytes, entries) tuples, one for each group.
+        entries has a (key, sha1, start, end) tuple for each text in the
+        group.
+    """
+    groups = []
+    compressor = GroupCompressor(settings)
+    entries = []
+    last_prefix = None
+    max_fulltext_len = 0
+    max_fulltext_prefix = None
+    for key, sha1, text in texts:
+        length = len(text)
+        if len(key) > 1:
+            prefix = key[0]
+            soft = (prefix == last_prefix)
+        else:
+            prefix = None
+            soft = False
+        if max_fulltext_len < length:
+            max_fulltext_len = length
+            max_fulltext_prefix = prefix
+        found_sha1, start_point, end_point, _ = compressor.compress(
+            key, [text], length, sha1, soft=soft)
+        start_new_block = _should_start_new_block(
+            prefix, last_prefix, max_fulltext_prefix, max_fulltext_len,
+            end_point)
+        last_prefix = prefix
+        if start_new_block:
+            compressor.pop_last()
+            groups.append((b''.join(compressor.flush().to_chunks()[1]),
+                           entries))
+            compressor = GroupCompressor(settings)
+            entries = []
+            max_fulltext_len = length
+            found_sha1, start_point, end_point, _ = compressor.compress(
+                key, [text], length, sha1)
+        entries.append((key, found_sha1, start_point, end_point))
+    if entries:
+        groups.append((b''.join(compressor.flush().to_chunks()[1]), entries))
+    return groups
+
+
 class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
     """A group-compress based VersionedFiles implementation."""
 
@@ -1648,32 +1844,68 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
         #  - we encounter an unadded ref, or
         #  - we run out of keys, or
         #  - the total bytes to retrieve for this batch > BATCH_SIZE
+        prefetcher = self._make_block_prefetcher(source_keys, locations)
         batcher = _BatchingBlockFetcher(self, locations,
-                                        get_compressor_settings=self._get_compressor_settings)
+                                        get_compressor_settings=self._get_compressor_settings,
+                                        prefetcher=prefetcher)
+        try:
+            for source, keys in source_keys:
+                if source is self:
+                    for key in keys:
+                        if key in self._unadded_refs:
+                            # Flush batch, then yield unadded ref from
+                            # self._compressor.
+                            for factory in batcher.yield_factories(full_flush=True):
+                                yield factory
+                            chunks, sha1 = self._compressor.extract(key)
+                            parents = self._unadded_refs[key]
+                            yield ChunkedContentFactory(key, parents, sha1, chunks)
+                            continue
+                        if batcher.add_key(key) > BATCH_SIZE:
+                            # Ok, this batch is big enough.  Yield some results.
+                            for factory in batcher.yield_factories():
+                                yield factory
+                else:
+                    for factory in batcher.yield_factories(full_flush=True):
+                        yield factory
+                    for record in source.get_record_stream(keys, ordering,
+                                                           include_delta_closure):
+                        yield record
+            for factory in batcher.yield_factories(full_flush=True):
+                yield factory
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+    def _make_block_prefetcher(self, source_keys, locations):
+        """Create a _BlockPrefetcher for the blocks of source_keys.
+
+        :return: A _BlockPrefetcher, or None if the blocks fit in a single
+            batch so there is nothing to read ahead.
+        """
+        if not _PREFETCH_BYTES:
+            return None
+        last_bytes = {}
+        total_bytes = 0
         for source, keys in source_keys:
-            if source is self:
-                for key in keys:
-                    if key in self._unadded_refs:
-                        # Flush batch, then yield unadded ref from
-                        # self._compressor.
-                        for factory in batcher.yield_factories(full_flush=True):
-                            yield factory
-                        chunks, sha1 = self._compressor.extract(key)
-                        parents = self._unadded_refs[key]
-                        yield ChunkedContentFactory(key, parents, sha1, chunks)
-                        continue
-                    if batcher.add_key(key) > BATCH_SIZE:
-                        # Ok, this batch is big enough.  Yield some results.
-                        for factory in batcher.yield_factories():
-                            yield factory
-            else:
-                for factory in batcher.yield_factories(full_flush=True):
-                    yield factory
-                for record in source.get_record_stream(keys, ordering,
-                                                       include_delta_closure):
-                    yield record
-        for factory in batcher.yield_factories(full_flush=True):
-            yield factory
+            if source is not self:
+                continue
+            for key in keys:
+                if key in self._unadded_refs:
+                    continue
+                index_memo = locations[key][0]
+                read_memo = index_memo[0:3]
+                end = index_memo[4]
+                try:
+                    if end > last_bytes[read_memo]:
+                        last_bytes[read_memo] = end
+                except KeyError:
+                    last_bytes[read_memo] = end
+                    if read_memo not in self._group_cache:
+                        total_bytes += read_memo[2]
+        if total_bytes <= BATCH_SIZE:
+            return None
+        return _BlockPrefetcher(self, list(last_bytes.items()))
 
     def get_sha1s(self, keys):
         """See VersionedFiles.get_sha1s()."""
@@ -1860,18 +2092,9 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
                  nostore_sha=nostore_sha)
             # delta_ratio = float(chunks_len) / (end_point - start_point)
             # Check if we want to continue to include that text
-            if (prefix == max_fulltext_prefix
-                    and end_point < 2 * max_fulltext_len):
-                # As long as we are on the same file_id, we will fill at least
-                # 2 * max_fulltext_len
-                start_new_block = False
-            elif end_point > 4 * 1024 * 1024:
-                start_new_block = True
-            elif (prefix is not None and prefix != last_prefix
-                  and end_point > 2 * 1024 * 1024):
-                start_new_block = True
-            else:
-                start_new_block = False
+            start_new_block = _should_start_new_block(
+                prefix, last_prefix, max_fulltext_prefix, max_fulltext_len,
+                end_point)
             last_prefix = prefix
             if start_new_block:
                 self._compressor.pop_last()
@@ -1898,6 +2121,94 @@ class GroupCompressVersionedFiles(VersionedFilesWithFallbacks):
             flush()
         self._compressor = None
 
+    def _insert_record_stream_in_parallel(self, stream, executor,
+                                          max_pending, random_id=False):
+        """Insert a record stream, compressing the texts in other processes.
+
+        The stream is cut into batches of about _PARALLEL_BATCH_SIZE bytes of
+        text, where possible where the key prefix changes.  The batches are
+        compressed into groups by _compress_texts in executor, and the groups
+        are written in the order of the stream, so the result does not depend
+        on the number of workers.  Unlike _insert_record_stream, existing
+        groups are never reused.
+
+        :param stream: A stream of records to insert.
+        :param executor: A concurrent.futures.Executor.
+        :param max_pending: The maximum number of batches being compressed at
+            once.
+        :return: An iterator over (sha1, length) of the inserted records.
+        """
+        settings = self._get_compressor_settings()
+        pending = collections.deque()
+        as_st = static_tuple.StaticTuple.from_sequence
+
+        def write_groups(batch, future):
+            parents_and_lengths = dict(
+                (key, (record_parents, len(text)))
+                for key, record_parents, sha1, text in batch)
+            for block_bytes, entries in future.result():
+                index, start, length = self._access.add_raw_record(
+                    None, len(block_bytes), [block_bytes])
+                nodes = []
+                results = []
+                for key, found_sha1, start_point, end_point in entries:
+                    record_parents, text_length = parents_and_lengths[key]
+                    results.append((found_sha1, text_length))
+                    if key[-1] is None:
+                        key = key[:-1] + (b'sha1:' + found_sha1,)
+                    if record_parents is not None:
+                        record_parents = as_st(
+                            [as_st(p) for p in record_parents])
+                    nodes.append((key, b"%d %d %d %d" % (
+                        start, length, start_point, end_point),
+                        static_tuple.StaticTuple(record_parents)))
+                self._index.add_records(nodes, random_id=random_id)
+                for result in results:
+                    yield result
+
+        def submit(batch):
+            future = executor.submit(
+                _compress_texts, settings,
+                [(key, sha1, text) for key, parents, sha1, text in batch])
+            pending.append((batch, future))
+
+        inserted_keys = set()
+        batch = []
+        batch_bytes = 0
+        last_prefix = None
+        for record in stream:
+            if record.storage_kind == 'absent':
+                raise errors.RevisionNotPresent(record.key, self)
+            if random_id:
+                if record.key in inserted_keys:
+                    trace.note(gettext('Insert claimed random_id=True,'
+                                       ' but then inserted %r two times'),
+                               record.key)
+                    continue
+                inserted_keys.add(record.key)
+            if len(record.key) > 1:
+                prefix = record.key[0]
+            else:
+                prefix = None
+            if batch_bytes >= _PARALLEL_BATCH_SIZE and (
+                    prefix is None or prefix != last_prefix
+                    or batch_bytes >= 4 * _PARALLEL_BATCH_SIZE):
+                submit(batch)
+                batch = []
+                batch_bytes = 0
+                while len(pending) >= max_pending:
+                    for result in write_groups(*pending.popleft()):
+                        yield result
+            last_prefix = prefix
+            text = record.get_bytes_as('fulltext')
+            batch.append((record.key, record.parents, record.sha1, text))
+            batch_bytes += len(text)
+        if batch:
+            submit(batch)
+        while pending:
+            for result in write_groups(*pending.popleft()):
+                yield result
+
     def iter_lines_added_or_present_in_keys(self, keys, pb=None):
         """Iterate over the lines in the versioned files from keys.
 
@@ -16,9 +16,12 @@
 
 """Repository formats using CHK inventories and groupcompress compression."""
 
+from concurrent import futures
+import os
 import time
 
 from .. import (
+    config as _mod_config,
     controldir,
     debug,
     errors,
@@ -101,6 +104,7 @@ class GCPack(NewPack):
                       # CHK based storage - just blobs, no compression or parents.
                       chk_index=chk_index
                       )
+        self._enable_bloom_filters()
         self._pack_collection = pack_collection
         # When we make readonly indices, we need this.
         self.index_class = pack_collection._index_class
@@ -207,6 +211,13 @@ class GCCHKPacker(Packer):
         self._text_refs = None
         # set by .pack() if self.revision_ids is not None
         self.revision_keys = None
+        self._workers = _mod_config.LocationStack(
+            pack_collection.repo.user_url).get('repository.pack_workers')
+        if self._workers == 0:
+            self._workers = os.cpu_count() or 1
+        # Compresses texts in worker processes while packing, if there is
+        # more than one worker.
+        self._executor = None
 
     def _get_progress_stream(self, source_vf, keys, message, pb):
         def pb_stream():
@@ -406,9 +417,18 @@ class GCCHKPacker(Packer):
         self.pb.update('repacking %s' % (message,), pb_offset)
         with ui.ui_factory.nested_progress_bar() as child_pb:
             stream = vf_to_stream(source_vf, keys, message, child_pb)
-            for _, _ in target_vf._insert_record_stream(
-                    stream, random_id=True, reuse_blocks=False):
-                pass
+            self._insert_stream(target_vf, stream)
+
+    def _insert_stream(self, target_vf, stream):
+        """Recompress the records of stream into target_vf."""
+        if self._executor is None:
+            inserted = target_vf._insert_record_stream(
+                stream, random_id=True, reuse_blocks=False)
+        else:
+            inserted = target_vf._insert_record_stream_in_parallel(
+                stream, self._executor, 2 * self._workers, random_id=True)
+        for _, _ in inserted:
+            pass
 
     def _copy_revision_texts(self):
         source_vf, target_vf = self._build_vfs('revision', True, False)
@@ -460,9 +480,7 @@ class GCCHKPacker(Packer):
         with ui.ui_factory.nested_progress_bar() as child_pb:
             for stream in self._get_chk_streams(source_vf, total_keys,
                                                 pb=child_pb):
-                for _, _ in target_vf._insert_record_stream(
-                        stream, random_id=True, reuse_blocks=False):
-                    pass
+                self._insert_stream(target_vf, stream)
 
     def _copy_text_texts(self):
         source_vf, target_vf = self._build_vfs('text', True, True)
@@ -487,11 +505,18 @@ class GCCHKPacker(Packer):
         self.new_pack = self.open_pack()
         # Is this necessary for GC ?
         self.new_pack.set_write_cache_size(1024 * 1024)
-        self._copy_revision_texts()
-        self._copy_inventory_texts()
-        self._copy_chk_texts()
-        self._copy_text_texts()
-        self._copy_signature_texts()
+        if self._workers > 1:
+            self._executor = futures.ProcessPoolExecutor(self._workers)
+        try:
+            self._copy_revision_texts()
+            self._copy_inventory_texts()
+            self._copy_chk_texts()
+            self._copy_text_texts()
+            self._copy_signature_texts()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
         self.new_pack._check_references()
         if not self._use_pack(self.new_pack):
             self.new_pack.abort()
@@ -158,6 +158,7 @@ class GraphIndexBuilder(object):
         self._key_length = key_elements
         self._optimize_for_size = False
         self._combine_backing_indices = True
+        self._bloom_filter = False
 
     def _check_key(self, key):
         """Raise BadIndexKey if key is not a valid key for this index."""
@@ -393,7 +394,8 @@ class GraphIndexBuilder(object):
                                   (len(result.getvalue()), expected_bytes))
         return result
 
-    def set_optimize(self, for_size=None, combine_backing_indices=None):
+    def set_optimize(self, for_size=None, combine_backing_indices=None,
+                     bloom_filter=None):
         """Change how the builder tries to optimize the result.
 
         :param for_size: Tell the builder to try and make the index as small as
@@ -402,14 +404,18 @@ class GraphIndexBuilder(object):
             memory, should the on-disk indices be combined. Set to True if you
             are going to be probing the index, but to False if you are not. (If
             you are not querying, then the time spent combining is wasted.)
+        :param bloom_filter: Store a bloom filter of the keys in the index, so
+            that readers can skip the index for most keys that are not in it.
         :return: None
         """
-        # GraphIndexBuilder itself doesn't pay attention to the flag yet, but
+        # GraphIndexBuilder itself doesn't pay attention to the flags yet, but
         # other builders do.
         if for_size is not None:
             self._optimize_for_size = for_size
         if combine_backing_indices is not None:
             self._combine_backing_indices = combine_backing_indices
+        if bloom_filter is not None:
+            self._bloom_filter = bloom_filter
 
     def find_ancestry(self, keys, ref_list_num):
         """See CombinedGraphIndex.find_ancestry()"""
@@ -1396,8 +1402,11 @@ class CombinedGraphIndex(object):
                 for index in self._indices:
                     if not keys:
                         break
+                    search_keys = self._keys_to_search(index, keys)
+                    if not search_keys:
+                        continue
                     index_hit = False
-                    for node in index.iter_entries(keys):
+                    for node in index.iter_entries(search_keys):
                         keys.remove(node[1])
                         yield node
                         index_hit = True
@@ -1452,6 +1461,23 @@ class CombinedGraphIndex(object):
                     raise
         self._move_to_front(hit_indices)
 
+    def _keys_to_search(self, index, keys):
+        """Return the keys of keys that may be present in index.
+
+        Indices with a bloom filter can rule out most of the keys they do not
+        contain without reading any of their nodes.  With a single index
+        there is nothing to skip, so its filter is not read.
+
+        :param keys: A set of keys.
+        :return: A set of keys.
+        """
+        if len(self._indices) < 2:
+            return keys
+        maybe_present_keys = getattr(index, '_maybe_present_keys', None)
+        if maybe_present_keys is None:
+            return keys
+        return maybe_present_keys(keys)
+
     def _move_to_front(self, hit_indices):
         """Rearrange self._indices so that hit_indices are first.
 
@@ -1551,7 +1577,8 @@ class CombinedGraphIndex(object):
                 # Find all of the ancestry we can from this index
                 # keep looking until the search_keys set is empty, which means
                 # things we didn't find should be in index_missing_keys
-                search_keys = keys_to_lookup
+                search_keys = self._keys_to_search(index, keys_to_lookup)
+                index_missing_keys.update(keys_to_lookup - search_keys)
                 sub_generation = 0
                 # print '    \t%2d\t\t%4d\t%5d\t%5d' % (
                 #     index_idx, len(search_keys),
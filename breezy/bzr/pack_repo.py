@@ -32,6 +32,7 @@ from breezy import (
     ui,
     )
 from breezy.bzr import (
+    generations,
     pack,
     )
 from breezy.bzr.index import (
@@ -216,6 +217,13 @@ class Pack(object):
                 "items not in its repository:\n%s"
                 % (self, pformat(missing_items)))
 
+    def _close_mmaps(self):
+        """Unmap the index files of the pack that are mapped into memory."""
+        for index_type in self.index_definitions:
+            index = getattr(self, index_type + '_index')
+            if isinstance(index, btree_index.BTreeGraphIndex):
+                index._close_mmap()
+
     def file_name(self):
         """Get the file name for the pack on disk."""
         return self.name + '.pack'
@@ -256,8 +264,7 @@ class Pack(object):
                                  self.index_sizes[self.index_offset(
                                      index_type)],
                                  unlimited_cache=unlimited_cache)
-        if index_type == 'chk':
-            index._leaf_factory = btree_index._gcchk_factory
+        self._pack_collection._set_leaf_factory(index, index_type)
         setattr(self, index_type + '_index', index)
 
     def __lt__(self, other):
@@ -407,6 +414,7 @@ class NewPack(Pack):
                       # CHK based storage - just blobs, no compression or parents.
                       chk_index=chk_index
                       )
+        self._enable_bloom_filters()
         self._pack_collection = pack_collection
         # When we make readonly indices, we need this.
         self.index_class = pack_collection._index_class
@@ -469,6 +477,17 @@ class NewPack(Pack):
         # no name until we finish writing the content
         self.name = None
 
+    def _enable_bloom_filters(self):
+        """Have the indices store bloom filters of their keys.
+
+        This lets readers skip the indices of this pack when looking up keys
+        that are in other packs of the repository.
+        """
+        for index in (self.revision_index, self.inventory_index,
+                      self.text_index, self.signature_index, self.chk_index):
+            if index is not None:
+                index.set_optimize(bloom_filter=True)
+
     def abort(self):
         """Cancel creating this pack."""
         self._state = 'aborted'
@@ -844,6 +863,9 @@ class RepositoryPackCollection(object):
         self._index_class = index_class
         self._suffix_offsets = {'.rix': 0, '.iix': 1, '.tix': 2, '.six': 3,
                                 '.cix': 4}
+        self._index_types = {'.rix': 'revision', '.iix': 'inventory',
+                             '.tix': 'text', '.six': 'signature',
+                             '.cix': 'chk'}
         self.packs = []
         # name:Pack mapping
         self._names = None
@@ -1228,10 +1250,19 @@ class RepositoryPackCollection(object):
             index_size = self._names[name][size_offset]
         index = self._index_class(transport, index_name, index_size,
                                   unlimited_cache=is_chk)
-        if is_chk and self._index_class is btree_index.BTreeGraphIndex:
-            index._leaf_factory = btree_index._gcchk_factory
+        self._set_leaf_factory(index, self._index_types[suffix])
         return index
 
+    def _set_leaf_factory(self, index, index_type):
+        """Choose how the leaf pages of a B+Tree index are kept in memory."""
+        if self._index_class is not btree_index.BTreeGraphIndex:
+            return
+        if index_type == 'chk':
+            index._leaf_factory = btree_index._gcchk_factory
+        elif (index_type in ('revision', 'inventory', 'text') and
+                self.config_stack.get('repository.compact_index_leaves')):
+            index._leaf_factory = btree_index._CompactLeafNode
+
     def _max_pack_count(self, total_revisions):
         """Return the maximum number of packs to use for total revisions.
 
@@ -1324,6 +1355,7 @@ class RepositoryPackCollection(object):
         self._packs_by_name.pop(pack.name)
         self._remove_pack_indices(pack)
         self.packs.remove(pack)
+        pack._close_mmaps()
 
     def _remove_pack_indices(self, pack, ignore_missing=False):
         """Remove the indices for pack from the aggregated indices.
@@ -1359,6 +1391,8 @@ class RepositoryPackCollection(object):
         self._new_pack = None
         # information about packs.
         self._names = None
+        for pack in self.packs:
+            pack._close_mmaps()
         self.packs = []
         self._packs_by_name = {}
         self._packs_at_load = None
@@ -1739,6 +1773,7 @@ class PackRepository(MetaDirVersionedFileRepository):
         else:
             self._unstacked_provider = graph.CachingParentsProvider(self)
         self._unstacked_provider.disable_cache()
+        self._generation_index = None
 
     def _all_revision_ids(self):
         """See Repository.all_revision_ids()."""
@@ -1748,6 +1783,7 @@ class PackRepository(MetaDirVersionedFileRepository):
     def _abort_write_group(self):
         self.revisions._index._key_dependencies.clear()
         self._pack_collection._abort_write_group()
+        self._generation_index = None
 
     def _make_parents_provider(self):
         if not self._format.supports_external_lookups:
@@ -1755,12 +1791,32 @@ class PackRepository(MetaDirVersionedFileRepository):
         return graph.StackedParentsProvider(_LazyListJoin(
             [self._unstacked_provider], self._fallback_repositories))
 
+    def _make_generations_provider(self):
+        """See Repository._make_generations_provider.
+
+        The generations are only used if the repository.generation_index
+        option is set, and while the repository is locked.
+        """
+        if not self.is_locked():
+            return None
+        if self._generation_index is None:
+            if not self._pack_collection.config_stack.get(
+                    'repository.generation_index'):
+                return None
+            self._generation_index = generations.GenerationIndex(
+                _mod_transport.get_transport_from_path(
+                    generations.cache_path(self.user_url)),
+                self._make_parents_provider())
+        return self._generation_index
+
     def _refresh_data(self):
         if not self.is_locked():
             return
         self._pack_collection.reload_pack_names()
         self._unstacked_provider.disable_cache()
         self._unstacked_provider.enable_cache()
+        # Revisions that were ghosts may have been added.
+        self._generation_index = None
 
     def _start_write_group(self):
         self._pack_collection._start_write_group()
@@ -1894,6 +1950,7 @@ class PackRepository(MetaDirVersionedFileRepository):
 
         if not self.is_locked():
             self._unstacked_provider.disable_cache()
+            self._generation_index = None
             for repo in self._fallback_repositories:
                 repo.unlock()
 
@@ -0,0 +1,214 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""An on-disk cache of the parent maps of remote repositories.
+
+The parents of a revision never change once it has been committed, so the
+parent maps fetched from a remote repository can be kept between
+invocations.  The only way for a cached entry to become wrong is for the
+revision to be removed from the repository, which can only happen when
+packs are removed.  Each cache file therefore records the pack names of the
+repository it was built from.  Once one of those packs has gone away, the
+revision indices of the remaining packs are searched for the cached
+revisions, and the entries of those that are no longer present are dropped.
+
+The cache file is a format marker, a line with the pack names and then one
+line per revision with the revision id followed by its parents, oldest
+entry first.
+"""
+
+import os
+
+from .. import (
+    atomicfile,
+    bedding,
+    osutils,
+    trace,
+    )
+from . import (
+    btree_index as _mod_btree_index,
+    index as _mod_index,
+    )
+from ..revision import NULL_REVISION
+from ..transport import memory
+
+
+FORMAT_MARKER = b'Breezy parent map cache 1\n'
+
+
+def cache_path(url):
+    """Return the path of the cache file for the repository at url."""
+    return osutils.pathjoin(
+        bedding.cache_dir(), 'parent-maps',
+        osutils.sha_string(url.encode('utf-8')).decode('ascii'))
+
+
+def read_pack_names(data):
+    """Read the bytes of a pack-names index.
+
+    :return: A tuple with the index class used by the packs and a dict mapping
+        the pack names to the sizes of their revision indices.
+    """
+    if data.startswith(_mod_btree_index._BTSIGNATURE):
+        index_class = _mod_btree_index.BTreeGraphIndex
+    else:
+        index_class = _mod_index.GraphIndex
+    t = memory.MemoryTransport()
+    t.put_bytes('pack-names', data)
+    return index_class, dict(
+        (entry[1][0], int(entry[2].split(b' ')[0])) for entry in
+        index_class(t, 'pack-names', len(data)).iter_all_entries())
+
+
+def parse_pack_names(data):
+    """Return the pack names listed in the bytes of a pack-names index."""
+    return frozenset(read_pack_names(data)[1])
+
+
+def find_present_revisions(index_transport, index_class, index_sizes, keys):
+    """Find the revisions that are in one of the packs of a repository.
+
+    :param index_transport: The transport of the indices directory.
+    :param index_class: The index class used by the packs.
+    :param index_sizes: A dict mapping the pack names to the sizes of their
+        revision indices, as returned by read_pack_names.
+    :param keys: The revision ids to look for.
+    :return: The set of revision ids that are present.
+    """
+    present = set()
+    missing = set((key,) for key in keys)
+    for name, size in index_sizes.items():
+        if not missing:
+            break
+        index = index_class(index_transport, name.decode('ascii') + '.rix',
+                            size)
+        for entry in index.iter_entries(missing):
+            present.add(entry[1][0])
+        missing.difference_update((key,) for key in present)
+    return present
+
+
+class ParentMapCache(object):
+    """The parent map of a single remote repository, kept on disk.
+
+    Entries are only ever added; once there are more than max_entries the
+    oldest ones are dropped when the cache is saved.
+    """
+
+    def __init__(self, path, pack_names, max_entries):
+        """Create a ParentMapCache.
+
+        :param path: The path of the cache file.
+        :param pack_names: The names of the packs currently in the repository.
+        :param max_entries: The maximum number of entries to keep on disk.
+        """
+        self._path = path
+        self._pack_names = frozenset(pack_names)
+        self._max_entries = max_entries
+        self._parent_map = {}
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._parent_map)
+
+    def load(self, find_present_revisions):
+        """Read the cache file.
+
+        Nothing is loaded if the file does not exist or is in an unknown
+        format.
+
+        :param find_present_revisions: A callable that returns which of the
+            revision ids passed to it are present in the repository.  It is
+            only called if packs have been removed since the cache was saved.
+        """
+        try:
+            f = open(self._path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if f.readline() != FORMAT_MARKER:
+                trace.mutter('ignoring parent map cache %s: unknown format',
+                             self._path)
+                return
+            pack_names = frozenset(f.readline().split())
+            parent_map = {}
+            for line in f:
+                key_and_parents = line.split()
+                parent_map[key_and_parents[0]] = tuple(key_and_parents[1:])
+        self._parent_map = parent_map
+        current_pack_names = self._pack_names
+        self._pack_names = pack_names
+        self.set_pack_names(current_pack_names, find_present_revisions)
+
+    def set_pack_names(self, pack_names, find_present_revisions):
+        """Update the names of the packs in the repository.
+
+        The entries of revisions that were removed along with packs that are
+        gone are dropped.
+
+        :param find_present_revisions: See load().
+        """
+        pack_names = frozenset(pack_names)
+        if pack_names == self._pack_names:
+            return
+        packs_removed = not self._pack_names.issubset(pack_names)
+        self._pack_names = pack_names
+        self._dirty = True
+        if not packs_removed:
+            return
+        parent_map = self._parent_map
+        present = find_present_revisions(
+            [key for key in parent_map if key != NULL_REVISION])
+        removed = [key for key in parent_map
+                   if key not in present and key != NULL_REVISION]
+        for key in removed:
+            del parent_map[key]
+        trace.mutter('dropped %d entries of removed revisions from parent '
+                     'map cache %s', len(removed), self._path)
+
+    def get_parent_map(self, keys):
+        """Return the cached parents of keys, see Graph.get_parent_map."""
+        parent_map = self._parent_map
+        return dict((key, parent_map[key]) for key in keys
+                    if key in parent_map)
+
+    def update(self, parent_map):
+        """Add the entries of parent_map to the cache."""
+        cached = self._parent_map
+        for key, parents in parent_map.items():
+            if key not in cached:
+                cached[key] = tuple(parents)
+                self._dirty = True
+
+    def save(self):
+        """Write the cache to disk, if it has changed since it was loaded."""
+        if not self._dirty:
+            return
+        parent_map = self._parent_map
+        excess = len(parent_map) - self._max_entries
+        if excess > 0:
+            # Dicts keep insertion order, so the oldest entries come first.
+            for key in list(parent_map)[:excess]:
+                del parent_map[key]
+        dirname = os.path.dirname(self._path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        lines = [FORMAT_MARKER, b' '.join(sorted(self._pack_names)) + b'\n']
+        lines.extend(b' '.join((key,) + parents) + b'\n'
+                     for key, parents in parent_map.items())
+        with atomicfile.AtomicFile(self._path) as f:
+            f.write(b''.join(lines))
+        self._dirty = False
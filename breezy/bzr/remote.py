@@ -43,7 +43,9 @@ from .. import (
 from . import (
     branch as bzrbranch,
     bzrdir as _mod_bzrdir,
+    index as _mod_index,
     inventory_delta,
+    parent_map_cache,
     testament as _mod_testament,
     vf_repository,
     vf_search,
@@ -127,6 +129,21 @@ class _RpcHelper(object):
         except errors.ErrorFromSmartServer as err:
             self._translate_error(err, **err_context)
 
+    def _call_pipelined(self, calls, expect_body=False, **err_context):
+        """Make several independent calls, see _SmartClient.call_pipelined.
+
+        Errors from the server are translated, and returned in place of the
+        result of the call that failed.
+        """
+        results = self._client.call_pipelined(calls, expect_body=expect_body)
+        for i, result in enumerate(results):
+            if isinstance(result, errors.ErrorFromSmartServer):
+                try:
+                    self._translate_error(result, **err_context)
+                except Exception as err:
+                    results[i] = err
+        return results
+
 
 def response_tuple_to_repo_format(response):
     """Convert a response tuple describing a repository format to a format."""
@@ -1284,8 +1301,11 @@ class RemoteRepository(_mod_repository.Repository, _RpcHelper,
         # Cache of revision parents; misses are cached during read locks, and
         # write locks when no _real_repository has been set.
         self._unstacked_provider = graph.CachingParentsProvider(
-            get_parent_map=self._get_parent_map_rpc)
+            get_parent_map=self._get_parent_map_with_disk_cache)
         self._unstacked_provider.disable_cache()
+        # The on-disk cache of parent maps, see _get_disk_parents_cache.
+        self._disk_parents_cache = None
+        self._disk_parents_cache_checked = False
         # For tests:
         # These depend on the actual remote format, so force them off for
         # maximum compatibility. XXX: In future these should depend on the
@@ -1845,6 +1865,9 @@ class RemoteRepository(_mod_repository.Repository, _RpcHelper,
             return
         self._unstacked_provider.disable_cache()
         old_mode = self._lock_mode
+        if old_mode == 'r':
+            self._save_disk_parents_cache()
+        self._disk_parents_cache_checked = False
         self._lock_mode = None
         try:
             # The real repository is responsible at present for raising an
@@ -2224,6 +2247,7 @@ class RemoteRepository(_mod_repository.Repository, _RpcHelper,
         # Refresh the parents cache for this object
         self._unstacked_provider.disable_cache()
         self._unstacked_provider.enable_cache()
+        self._disk_parents_cache_checked = False
 
     def revision_ids_to_search_result(self, result_set):
         """Convert a set of revision ids to a graph SearchResult."""
@@ -2385,6 +2409,73 @@ class RemoteRepository(_mod_repository.Repository, _RpcHelper,
         """See breezy.Graph.get_parent_map()."""
         return self._make_parents_provider().get_parent_map(revision_ids)
 
+    def _get_disk_parents_cache(self):
+        """Return the on-disk parent map cache, or None.
+
+        The cache is only used while the repository is read locked, and only
+        if the repository.parents_cache option is set.  It is loaded the
+        first time it is needed, and checked against the packs in the
+        repository again after each unlock or refresh_data.
+        """
+        if self._lock_mode != 'r':
+            return None
+        if self._disk_parents_cache_checked:
+            return self._disk_parents_cache
+        self._disk_parents_cache_checked = True
+        cache = self._disk_parents_cache
+        if cache is None:
+            stack = _mod_config.LocationStack(self.user_url)
+            if not stack.get('repository.parents_cache'):
+                return None
+        repo_transport = self.controldir.transport.clone('repository')
+        try:
+            index_class, index_sizes = parent_map_cache.read_pack_names(
+                repo_transport.get_bytes('pack-names'))
+        except (_mod_transport.NoSuchFile, _mod_index.BadIndexFormatSignature):
+            # Not a pack based repository, so there is nothing to validate
+            # the cache against.
+            mutter('not using parent map cache for %s', self.user_url)
+            self._disk_parents_cache = None
+            return None
+
+        def find_present_revisions(keys):
+            return parent_map_cache.find_present_revisions(
+                repo_transport.clone('indices'), index_class, index_sizes,
+                keys)
+        if cache is None:
+            cache = parent_map_cache.ParentMapCache(
+                parent_map_cache.cache_path(self.user_url), index_sizes,
+                stack.get('repository.parents_cache.max_entries'))
+            cache.load(find_present_revisions)
+            self._disk_parents_cache = cache
+        else:
+            cache.set_pack_names(index_sizes, find_present_revisions)
+        return cache
+
+    def _save_disk_parents_cache(self):
+        cache = self._disk_parents_cache
+        if cache is None:
+            return
+        try:
+            cache.save()
+        except OSError as e:
+            # The cache is only an optimisation.
+            mutter('failed to save parent map cache for %s: %s',
+                   self.user_url, e)
+
+    def _get_parent_map_with_disk_cache(self, keys):
+        """Helper for get_parent_map that consults the on-disk cache."""
+        cache = self._get_disk_parents_cache()
+        if cache is None:
+            return self._get_parent_map_rpc(keys)
+        found_parents = cache.get_parent_map(keys)
+        missing_keys = set(keys).difference(found_parents)
+        if missing_keys:
+            parent_map = self._get_parent_map_rpc(missing_keys)
+            cache.update(parent_map)
+            found_parents.update(parent_map)
+        return found_parents
+
     def _get_parent_map_rpc(self, keys):
         """Helper for get_parent_map that performs the RPC."""
         medium = self._client._medium
@@ -2831,19 +2922,106 @@ class RemoteRepository(_mod_repository.Repository, _RpcHelper,
                 return True
         return False
 
+    def _has_signatures_for_revision_ids(self, revision_ids):
+        """Return the set of revision_ids that have a signature.
+
+        The lookups are pipelined if the server supports it.
+        """
+        path = self.controldir._path_for_remote_call(self._client)
+        try:
+            responses = self._call_pipelined(
+                [(b'Repository.has_signature_for_revision_id',
+                  (path, revision_id)) for revision_id in revision_ids])
+        except errors.UnknownSmartMethod:
+            self._ensure_real()
+            return set(
+                revision_id for revision_id in revision_ids
+                if self._real_repository.has_signature_for_revision_id(
+                    revision_id))
+        signed = set()
+        for revision_id, response in zip(revision_ids, responses):
+            if isinstance(response, Exception):
+                raise response
+            if response[0] not in (b'yes', b'no'):
+                raise SmartProtocolError(
+                    'unexpected response code %s' % (response,))
+            if response[0] == b'yes':
+                signed.add(revision_id)
+                continue
+            for fallback in self._fallback_repositories:
+                if fallback.has_signature_for_revision_id(revision_id):
+                    signed.add(revision_id)
+                    break
+        return signed
+
+    def _get_signature_texts(self, revision_ids):
+        """Return a dict mapping revision_ids to their signature texts.
+
+        The lookups are pipelined if the server supports it.
+        """
+        path = self.controldir._path_for_remote_call(self._client)
+        try:
+            responses = self._call_pipelined(
+                [(b'Repository.get_revision_signature_text',
+                  (path, revision_id)) for revision_id in revision_ids],
+                expect_body=True)
+        except errors.UnknownSmartMethod:
+            self._ensure_real()
+            return dict(
+                (revision_id,
+                 self._real_repository.get_signature_text(revision_id))
+                for revision_id in revision_ids)
+        texts = {}
+        for revision_id, response in zip(revision_ids, responses):
+            if isinstance(response, errors.NoSuchRevision):
+                for fallback in self._fallback_repositories:
+                    try:
+                        texts[revision_id] = fallback.get_signature_text(
+                            revision_id)
+                    except errors.NoSuchRevision:
+                        pass
+                    else:
+                        break
+                else:
+                    raise response
+                continue
+            if isinstance(response, Exception):
+                raise response
+            response_tuple, body = response
+            if response_tuple[0] != b'ok':
+                raise errors.UnexpectedSmartServerResponse(response_tuple)
+            texts[revision_id] = body
+        return texts
+
+    def _verify_signature_text(self, revision_id, signature, gpg_strategy):
+        testament = _mod_testament.Testament.from_revision(self, revision_id)
+        (status, key, signed_plaintext) = gpg_strategy.verify(signature)
+        if testament.as_short_text() != signed_plaintext:
+            return gpg.SIGNATURE_NOT_VALID, None
+        return (status, key)
+
     def verify_revision_signature(self, revision_id, gpg_strategy):
         with self.lock_read():
             if not self.has_signature_for_revision_id(revision_id):
                 return gpg.SIGNATURE_NOT_SIGNED, None
             signature = self.get_signature_text(revision_id)
+            return self._verify_signature_text(
+                revision_id, signature, gpg_strategy)
 
-            testament = _mod_testament.Testament.from_revision(
-                self, revision_id)
-
-            (status, key, signed_plaintext) = gpg_strategy.verify(signature)
-            if testament.as_short_text() != signed_plaintext:
-                return gpg.SIGNATURE_NOT_VALID, None
-            return (status, key)
+    def verify_revision_signatures(self, revision_ids, gpg_strategy):
+        with self.lock_read():
+            revision_ids = list(revision_ids)
+            signed = self._has_signatures_for_revision_ids(revision_ids)
+            signatures = self._get_signature_texts(
+                [revision_id for revision_id in revision_ids
+                 if revision_id in signed])
+            for revision_id in revision_ids:
+                if revision_id not in signed:
+                    yield revision_id, gpg.SIGNATURE_NOT_SIGNED, None
+                    continue
+                (result, key) = self._verify_signature_text(
+                    revision_id, signatures[revision_id], gpg_strategy)
+                yield revision_id, result, key
 
     def item_keys_introduced_by(self, revision_ids, _files_pb=None):
         self._ensure_real()
@@ -4069,6 +4247,40 @@ class RemoteBranch(branch.Branch, _RpcHelper, lock._RelockDebugMixin):
             else:
                 raise errors.UnexpectedSmartServerResponse(response)
 
+    def revision_ids_to_dotted_revnos(self, revision_ids):
+        """See Branch.revision_ids_to_dotted_revnos.
+
+        The lookups are pipelined if the server supports it.
+        """
+        with self.lock_read():
+            revision_ids = list(revision_ids)
+            try:
+                responses = self._call_pipelined(
+                    [(b'Branch.revision_id_to_revno',
+                      (self._remote_path(), revision_id))
+                     for revision_id in revision_ids])
+            except errors.UnknownSmartMethod:
+                self._ensure_real()
+                return self._real_branch.revision_ids_to_dotted_revnos(
+                    revision_ids)
+            result = {}
+            for revision_id, response in zip(revision_ids, responses):
+                if isinstance(response, (errors.NoSuchRevision,
+                                         errors.GhostRevisionsHaveNoRevno)):
+                    continue
+                if (isinstance(response, UnknownErrorFromSmartServer) and
+                        response.error_tuple[1] ==
+                        b'GhostRevisionsHaveNoRevno'):
+                    # Older versions of bzr/brz didn't explicitly wrap
+                    # GhostRevisionsHaveNoRevno.
+                    continue
+                if isinstance(response, Exception):
+                    raise response
+                if response[0] != b'ok':
+                    raise errors.UnexpectedSmartServerResponse(response)
+                result[revision_id] = tuple([int(x) for x in response[1:]])
+            return result
+
     def revision_id_to_revno(self, revision_id):
         """Given a revision id on the branch mainline, return its revno.
 
@@ -0,0 +1,402 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""asyncio based server for the smart protocol.
+
+The threaded SmartTCPServer dedicates a thread to every connected client, even
+while the client is idle.  The classes in this module instead multiplex all
+connections on a single asyncio event loop.  Only the decoding and execution
+of a request happens on a (bounded) pool of worker threads, because the
+request handlers do blocking I/O on the backing transport.
+
+Responses are written back through the event loop, and a worker that is
+streaming a response body waits until the client has drained the previous
+write, so slow clients apply backpressure rather than growing buffers.
+"""
+
+import asyncio
+import concurrent.futures
+import socket
+import sys
+import threading
+
+from ... import (
+    errors,
+    osutils,
+    trace,
+    )
+from ...i18n import gettext
+from . import (
+    medium,
+    server,
+    signals,
+    )
+
+
+class AsyncioSmartServerStreamMedium(medium.SmartMedium):
+    """Serves smart requests coming over an asyncio stream.
+
+    One instance is created for each connected client.  Waiting for requests
+    happens on the event loop; requests themselves are decoded and dispatched
+    in the executor.
+    """
+
+    _WRITE_POLL_TIMEOUT = 1.0
+    _WRITE_BUFFER_LIMIT = 1024 * 1024
+
+    def __init__(self, reader, writer, backing_transport, executor,
+                 root_client_path='/', timeout=None):
+        """Construct a new medium.
+
+        :param reader: asyncio.StreamReader for the client connection.
+        :param writer: asyncio.StreamWriter for the client connection.
+        :param backing_transport: Transport for the directory served.
+        :param executor: concurrent.futures.Executor used to run requests.
+        :param timeout: Seconds to wait for the next request of an idle
+            client before hanging up.
+        """
+        medium.SmartMedium.__init__(self)
+        if timeout is None:
+            raise AssertionError('You must supply a timeout.')
+        self._reader = reader
+        self._writer = writer
+        self.backing_transport = backing_transport
+        self.root_client_path = root_client_path
+        self._executor = executor
+        self._client_timeout = timeout
+        self._loop = asyncio.get_running_loop()
+        self._idle = False
+        self.finished = False
+        # Bytes passed to _write_out that the event loop has not written to
+        # the transport yet.
+        self._unsent = 0
+        self._unsent_lock = threading.Lock()
+        self._client_info = writer.get_extra_info('peername', '<unknown>')
+
+    def __str__(self):
+        return '%s(client=%s)' % (self.__class__.__name__, self._client_info)
+
+    def __repr__(self):
+        return '%s.%s(client=%s)' % (self.__module__, self.__class__.__name__,
+                                     self._client_info)
+
+    async def serve(self):
+        """Serve requests until the client disconnects."""
+        try:
+            while not self.finished:
+                self._idle = True
+                try:
+                    line = await asyncio.wait_for(
+                        self._read_line(), self._client_timeout)
+                except asyncio.TimeoutError:
+                    trace.note('%s' % errors.ConnectionTimeout(
+                        'disconnecting client after %.1f seconds'
+                        % (self._client_timeout,)))
+                    break
+                finally:
+                    self._idle = False
+                if self.finished or not line:
+                    break
+                try:
+                    await self._serve_one_request(line)
+                except (ConnectionError, OSError):
+                    trace.log_exception_quietly()
+                    break
+        finally:
+            self.finished = True
+            self._writer.close()
+
+    def _stop_gracefully(self):
+        """When we finish this message, stop looking for more.
+
+        Must be called from the event loop thread.
+        """
+        trace.mutter('Stopping %s' % (self,))
+        self.finished = True
+        if self._idle:
+            # Not in the middle of a request, so hang up straight away.
+            self._writer.close()
+
+    async def _read(self, count):
+        if self._push_back_buffer is not None:
+            return self._get_push_back_buffer()
+        data = await self._reader.read(count)
+        self._report_activity(len(data), 'read')
+        return data
+
+    async def _read_line(self):
+        data = b''
+        if self._push_back_buffer is not None:
+            data = self._get_push_back_buffer()
+        while b'\n' not in data:
+            try:
+                more = await self._reader.readline()
+            except (ConnectionError, OSError):
+                return b''
+            except ValueError:
+                # Line longer than the stream limit; the request is bogus.
+                return b''
+            if not more:
+                break
+            self._report_activity(len(more), 'read')
+            data += more
+        newline_pos = data.find(b'\n')
+        if newline_pos != -1:
+            self._push_back(data[newline_pos + 1:])
+            data = data[:newline_pos + 1]
+        return data
+
+    async def _serve_one_request(self, first_line):
+        protocol_factory, unused_bytes = (
+            medium._get_protocol_factory_for_bytes(first_line))
+        server_protocol = protocol_factory(
+            self.backing_transport, self._write_out, self.root_client_path)
+        loop = self._loop
+        data = unused_bytes
+        while True:
+            if data:
+                await loop.run_in_executor(
+                    self._executor, server_protocol.accept_bytes, data)
+            if not server_protocol.next_read_size():
+                break
+            data = await self._read(osutils.MAX_SOCKET_CHUNK)
+            if data == b'':
+                self.finished = True
+                return
+        self._push_back(server_protocol.unused_data)
+
+    def _write(self, data):
+        with self._unsent_lock:
+            self._unsent -= len(data)
+        if not self._writer.is_closing():
+            self._writer.write(data)
+            self._report_activity(len(data), 'write')
+
+    async def _write_and_drain(self, data):
+        self._write(data)
+        await self._writer.drain()
+
+    def _write_out(self, data):
+        # Called from the executor.  Small writes are just handed to the
+        # event loop; once more than _WRITE_BUFFER_LIMIT bytes are waiting to
+        # be sent, block until the transport has drained below its high water
+        # mark.
+        with self._unsent_lock:
+            self._unsent += len(data)
+            buffered = (self._unsent +
+                        self._writer.transport.get_write_buffer_size())
+        if buffered < self._WRITE_BUFFER_LIMIT:
+            self._loop.call_soon_threadsafe(self._write, data)
+            return
+        future = asyncio.run_coroutine_threadsafe(
+            self._write_and_drain(data), self._loop)
+        while True:
+            try:
+                return future.result(self._WRITE_POLL_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                if self._loop.is_closed():
+                    # The server was stopped without waiting for us.
+                    future.cancel()
+                    raise errors.ConnectionReset(
+                        'server stopped while writing response')
+
+
+class AsyncioSmartTCPServer(object):
+    """Serves smart clients over TCP from a single asyncio event loop.
+
+    This is a drop-in alternative to server.SmartTCPServer: it runs the same
+    hooks and has the same start_server, serve, start_background_thread and
+    stop_background_thread methods.
+
+    :ivar max_workers: The number of requests that can be executed at the
+        same time.  The number of connected clients is not limited.
+    """
+
+    _SHUTDOWN_POLL_TIMEOUT = 1.0
+
+    def __init__(self, backing_transport, root_client_path='/',
+                 client_timeout=None, max_workers=None):
+        """Construct a new server.
+
+        :param backing_transport: The transport to serve.
+        :param root_client_path: The client path that will correspond to root
+            of backing_transport.
+        :param client_timeout: See AsyncioSmartServerStreamMedium's timeout
+            parameter.
+        :param max_workers: Number of threads used to run requests, or None
+            to use the concurrent.futures default.
+        """
+        self.backing_transport = backing_transport
+        self.root_client_path = root_client_path
+        self._client_timeout = client_timeout
+        self.max_workers = max_workers
+        self._active_connections = set()
+        self._gracefully_stopping = False
+        self._loop = None
+        self._stop_event = None
+
+    def start_server(self, host, port):
+        """Create the server listening socket.
+
+        :param host: Name of the interface to listen on.
+        :param port: TCP port to listen on, or 0 to allocate a transient port.
+        """
+        addrs = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                                   socket.SOCK_STREAM, 0, socket.AI_PASSIVE)[0]
+        (family, socktype, proto, canonname, sockaddr) = addrs
+        self._server_socket = socket.socket(family, socktype, proto)
+        if sys.platform != 'win32':
+            self._server_socket.setsockopt(socket.SOL_SOCKET,
+                                           socket.SO_REUSEADDR, 1)
+        try:
+            self._server_socket.bind(sockaddr)
+        except socket.error as message:
+            raise errors.CannotBindAddress(host, port, message)
+        self._sockname = self._server_socket.getsockname()
+        self.port = self._sockname[1]
+        self._server_socket.listen(128)
+        self._server_socket.setblocking(False)
+        self._started = threading.Event()
+        self._stopped = threading.Event()
+        self._fully_stopped = threading.Event()
+
+    def get_url(self):
+        """Return the url of the server"""
+        return "bzr://%s:%s/" % (self._sockname[0], self._sockname[1])
+
+    _backing_urls = server.SmartTCPServer._backing_urls
+    run_server_started_hooks = server.SmartTCPServer.run_server_started_hooks
+    run_server_stopped_hooks = server.SmartTCPServer.run_server_stopped_hooks
+
+    def _stop_gracefully(self):
+        """Stop accepting connections and let running requests finish.
+
+        This can be called from any thread.
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._stop_in_loop, True)
+        except RuntimeError:
+            # The loop has closed already.
+            pass
+
+    def _stop_in_loop(self, gracefully):
+        if gracefully:
+            trace.note(gettext('Requested to stop gracefully'))
+            self._gracefully_stopping = True
+            for handler in list(self._active_connections):
+                handler._stop_gracefully()
+        self._stop_event.set()
+
+    async def _handle_client(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (
+                socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        handler = AsyncioSmartServerStreamMedium(
+            reader, writer, self.backing_transport, self._executor,
+            root_client_path=self.root_client_path,
+            timeout=self._client_timeout)
+        self._active_connections.add(handler)
+        try:
+            await handler.serve()
+        except asyncio.CancelledError:
+            # The server stopped without waiting for the request to finish.
+            pass
+        except Exception:
+            trace.log_exception_quietly()
+        finally:
+            self._active_connections.discard(handler)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        aio_server = await asyncio.start_server(
+            self._handle_client, sock=self._server_socket,
+            limit=osutils.MAX_SOCKET_CHUNK)
+        self.run_server_started_hooks()
+        self._started.set()
+        try:
+            await self._stop_event.wait()
+        finally:
+            aio_server.close()
+            await aio_server.wait_closed()
+            self._stopped.set()
+            self.run_server_stopped_hooks()
+        if self._gracefully_stopping and self._active_connections:
+            trace.note(gettext('Waiting for %d client(s) to finish')
+                       % (len(self._active_connections),))
+            while self._active_connections:
+                await asyncio.sleep(self._SHUTDOWN_POLL_TIMEOUT / 10)
+        else:
+            for handler in list(self._active_connections):
+                handler.finished = True
+                handler._writer.close()
+
+    def serve(self, thread_name_suffix=''):
+        stop_gracefully = self._stop_gracefully
+        signals.register_on_hangup(id(self), stop_gracefully)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='smart-server-worker' + thread_name_suffix)
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._loop = None
+            signals.unregister_on_hangup(id(self))
+            self._executor.shutdown(wait=True)
+            self._stopped.set()
+            self._fully_stopped.set()
+
+    def start_background_thread(self, thread_name_suffix=''):
+        self._started.clear()
+        self._stop_event = None
+        self._server_thread = threading.Thread(
+            None, self.serve, args=(thread_name_suffix,),
+            name='server-' + self.get_url(),
+            daemon=True)
+        self._server_thread.start()
+        self._started.wait()
+
+    def stop_background_thread(self):
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop_in_loop, False)
+            except RuntimeError:
+                # The loop has closed already.
+                pass
+        self._fully_stopped.wait()
+        self._server_thread.join()
+
+
+class AsyncioBzrServerFactory(server.BzrServerFactory):
+    """BzrServerFactory that serves TCP clients from an asyncio event loop."""
+
+    def _make_tcp_server(self, timeout):
+        from breezy import config
+        return AsyncioSmartTCPServer(
+            self.transport, client_timeout=timeout,
+            max_workers=config.GlobalStack().get('serve.max_workers'))
+
+
+def serve_bzr_asyncio(transport, host=None, port=None, inet=False,
+                      timeout=None):
+    """Like server.serve_bzr, but multiplex TCP clients with asyncio."""
+    server._serve_with_factory(
+        AsyncioBzrServerFactory(), transport, host, port, inet, timeout)
@@ -31,6 +31,9 @@ from ... import (
 
 class _SmartClient(object):
 
+    # The maximum number of requests call_pipelined has outstanding at once.
+    _max_pipelined_requests = 100
+
     def __init__(self, medium, headers=None):
         """Constructor.
 
@@ -107,6 +110,92 @@ class _SmartClient(object):
             expect_response_body=False)
         return (response, response_handler)
 
+    def call_pipelined(self, calls, expect_body=False):
+        """Make several independent calls, pipelining them if possible.
+
+        If the server supports it, all requests are sent before any of the
+        responses are read, so the calls cost a single round trip.  Otherwise
+        the calls are made one after the other.
+
+        :param calls: A list of (method, args) tuples.
+        :param expect_body: If True, each result is a (response_tuple,
+            body_bytes) tuple, otherwise it is just the response tuple.
+        :return: A list with one result per call, in the order of calls.  A
+            call that failed is represented by the ErrorFromSmartServer it
+            raised; UnknownSmartMethod is raised rather than returned.
+        """
+        if len(calls) > 1 and self._medium_supports_pipelining():
+            return self._call_pipelined(calls, expect_body)
+        results = []
+        for method, args in calls:
+            try:
+                if expect_body:
+                    response, handler = self.call_expecting_body(method, *args)
+                    result = (response, handler.read_body_bytes())
+                else:
+                    result = self.call(method, *args)
+            except errors.ErrorFromSmartServer as err:
+                result = err
+            results.append(result)
+        return results
+
+    def _medium_supports_pipelining(self):
+        medium = self._medium
+        if getattr(medium, 'get_pipelined_requests', None) is None:
+            return False
+        if medium._supports_pipelining is None:
+            try:
+                response = self.call(b'Medium.supports_pipelining')
+            except errors.UnknownSmartMethod:
+                medium._supports_pipelining = False
+            else:
+                medium._supports_pipelining = (response == (b'yes',))
+        return medium._supports_pipelining and medium._protocol_version == 3
+
+    def _call_pipelined(self, calls, expect_body):
+        results = []
+        # Bound the number of outstanding requests, so that neither end
+        # blocks writing while the other is not reading.
+        batch_size = self._max_pipelined_requests
+        for start in range(0, len(calls), batch_size):
+            results.extend(self._call_pipelined_batch(
+                calls[start:start + batch_size], expect_body))
+        for result in results:
+            if isinstance(result, errors.UnknownSmartMethod):
+                raise result
+        return results
+
+    def _call_pipelined_batch(self, calls, expect_body):
+        requests = self._medium.get_pipelined_requests(len(calls))
+        response_handlers = []
+        try:
+            for medium_request, (method, args) in zip(requests, calls):
+                request = _SmartClientRequest(self, method, args)
+                request._run_call_hooks()
+                encoder, response_handler = request._construct_protocol(
+                    3, medium_request)
+                request._send_no_retry(encoder)
+                response_handlers.append(response_handler)
+            results = []
+            for response_handler in response_handlers:
+                try:
+                    response = response_handler.read_response_tuple(
+                        expect_body=expect_body)
+                    if expect_body:
+                        response = (
+                            response, response_handler.read_body_bytes())
+                except (errors.ErrorFromSmartServer,
+                        errors.UnknownSmartMethod) as err:
+                    # Keep reading, the later responses are already on
+                    # their way.
+                    response = err
+                results.append(response)
+        except errors.ConnectionReset:
+            # The responses still in flight are lost with the connection.
+            self._medium.reset()
+            raise
+        return results
+
     def remote_path_from_transport(self, transport):
         """Convert transport into a path suitable for using in a request.
 
@@ -237,9 +326,10 @@ class _SmartClientRequest(object):
         raise errors.SmartProtocolError(
             'Server is not a Bazaar server: ' + str(last_err))
 
-    def _construct_protocol(self, version):
+    def _construct_protocol(self, version, request=None):
         """Build the encoding stack for a given protocol version."""
-        request = self.client._medium.get_request()
+        if request is None:
+            request = self.client._medium.get_request()
         if version == 3:
             request_encoder = protocol.ProtocolThreeRequester(request)
             response_handler = message.ConventionalResponseHandler()
@@ -24,6 +24,7 @@ over SSH), and pass them to and from the protocol logic.  See the overview in
 breezy/transport/smart/__init__.py.
 """
 
+import collections
 import errno
 import io
 import os
@@ -291,7 +292,10 @@ class SmartServerStreamMedium(SmartMedium):
 
         :returns: a SmartServerRequestProtocol.
         """
-        self._wait_for_bytes_with_timeout(self._client_timeout)
+        if self._push_back_buffer is None:
+            # A pipelining client may already have sent the next request, in
+            # which case there is no need to wait for more bytes.
+            self._wait_for_bytes_with_timeout(self._client_timeout)
         if self.finished:
             # We're stopping, so don't try to do any more work
             return None
@@ -757,6 +761,9 @@ class SmartClientMedium(SmartMedium):
         # _remote_version_is_before tracks the bzr version the remote side
         # can be based on what we've seen so far.
         self._remote_version_is_before = None
+        # Whether the remote end accepts pipelined requests, or None if we
+        # have not asked yet.
+        self._supports_pipelining = None
         # Install debug hook function if debug flag is set.
         if 'hpss' in debug.debug_flags:
             global _debug_counter
@@ -878,6 +885,7 @@ class SmartClientStreamMedium(SmartClientMedium):
     def __init__(self, base):
         SmartClientMedium.__init__(self, base)
         self._current_request = None
+        self._pipelined_requests = collections.deque()
 
     def accept_bytes(self, bytes):
         self._accept_bytes(bytes)
@@ -904,6 +912,20 @@ class SmartClientStreamMedium(SmartClientMedium):
         """
         return SmartClientStreamMediumRequest(self)
 
+    def get_pipelined_requests(self, count):
+        """Return count requests that can all be written before any is read.
+
+        The requests must be written in the order they are returned, and their
+        responses must be read in that same order.  The remote end must
+        support pipelining, see _SmartClient.call_pipelined.
+        """
+        if self._current_request is not None or self._pipelined_requests:
+            raise TooManyConcurrentRequests(self)
+        requests = [SmartClientStreamMediumPipelinedRequest(self)
+                    for i in range(count)]
+        self._pipelined_requests.extend(requests)
+        return requests
+
     def reset(self):
         """We have been disconnected, reset current state.
 
@@ -911,6 +933,7 @@ class SmartClientStreamMedium(SmartClientMedium):
         """
         self.disconnect()
         self._current_request = None
+        self._pipelined_requests.clear()
 
 
 class SmartSimplePipesClientMedium(SmartClientStreamMedium):
@@ -1196,7 +1219,8 @@ class SmartClientStreamMediumRequest(SmartClientMediumRequest):
         # assert should be moved to SmartClientStreamMedium.get_request,
         # and the setting/unsetting of _current_request likewise moved into
         # that class : but its unneeded overhead for now. RBC 20060922
-        if self._medium._current_request is not None:
+        if (self._medium._current_request is not None or
+                self._medium._pipelined_requests):
             raise TooManyConcurrentRequests(self._medium)
         self._medium._current_request = self
 
@@ -1224,3 +1248,30 @@ class SmartClientStreamMediumRequest(SmartClientMediumRequest):
         This invokes self._medium._flush to ensure all bytes are transmitted.
         """
         self._medium._flush()
+
+
+class SmartClientStreamMediumPipelinedRequest(SmartClientStreamMediumRequest):
+    """A request that may be outstanding alongside other requests.
+
+    Instances are created by SmartClientStreamMedium.get_pipelined_requests,
+    which keeps them in order in the medium's _pipelined_requests.  Only the
+    oldest outstanding request may read its response.
+    """
+
+    def __init__(self, medium):
+        SmartClientMediumRequest.__init__(self, medium)
+
+    def _read_bytes(self, count):
+        if self._medium._pipelined_requests[0] is not self:
+            raise AssertionError(
+                'pipelined responses must be read in order')
+        return SmartClientStreamMediumRequest._read_bytes(self, count)
+
+    def _finished_reading(self):
+        """See SmartClientMediumRequest._finished_reading.
+
+        This removes the request from the front of the medium's pipeline.
+        """
+        if self._medium._pipelined_requests[0] is not self:
+            raise AssertionError()
+        self._medium._pipelined_requests.popleft()
@@ -279,6 +279,10 @@ class ConventionalResponseHandler(MessageHandler, ResponseHandler):
         if next_read_size == 0:
             # a complete request has been read.
             self.finished_reading = True
+            unused_data = self._protocol_decoder.unused_data
+            if unused_data:
+                # The start of the response to a pipelined request.
+                self._medium_request._medium._push_back(unused_data)
             self._medium_request.finished_reading()
             return
         data = self._medium_request.read_bytes(next_read_size)
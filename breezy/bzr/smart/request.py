@@ -518,6 +518,19 @@ class SmartServerIsReadonly(SmartServerRequest):
         return SuccessfulSmartServerResponse((answer,))
 
 
+class SupportsPipeliningRequest(SmartServerRequest):
+    """Tell the client it may send requests before reading earlier responses.
+
+    Servers without this verb wait for the client after each response, so
+    clients only pipeline requests once this verb has succeeded.
+
+    New in 3.3.
+    """
+
+    def do(self):
+        return SuccessfulSmartServerResponse((b'yes',))
+
+
 # In the 'info' attribute, we store whether this request is 'safe' to retry if
 # we get a disconnect while reading the response. It can have the values:
 #   read    This is purely a read request, so retrying it is perfectly ok.
@@ -680,6 +693,9 @@ request_handlers.register_lazy(
     info='read')
 request_handlers.register_lazy(
     b'list_dir', 'breezy.bzr.smart.vfs', 'ListDirRequest', info='read')
+request_handlers.register_lazy(
+    b'Medium.supports_pipelining', 'breezy.bzr.smart.request',
+    'SupportsPipeliningRequest', info='read')
 request_handlers.register_lazy(
     b'mkdir', 'breezy.bzr.smart.vfs', 'MkdirRequest', info='semivfs')
 request_handlers.register_lazy(
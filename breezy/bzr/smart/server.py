@@ -16,6 +16,7 @@
 
 """Server for smart-server protocol."""
 
+import collections
 import errno
 import os.path
 import socket
@@ -51,7 +52,10 @@ class SmartTCPServer(object):
     """Listens on a TCP socket and accepts connections from smart clients.
 
     Each connection will be served by a SmartServerSocketStreamMedium running in
-    a thread.
+    a thread. If max_connections is set, at most that many connections are
+    served concurrently; further connections are queued (up to max_queued of
+    them) and picked up by the worker threads as they become free. Connections
+    that arrive when the queue is full are rejected.
 
     hooks: An instance of SmartServerHooks.
     """
@@ -66,7 +70,7 @@ class SmartTCPServer(object):
     _timer = time.time
 
     def __init__(self, backing_transport, root_client_path='/',
-                 client_timeout=None):
+                 client_timeout=None, max_connections=None, max_queued=None):
         """Construct a new server.
 
         To actually start it running, call either start_background_thread or
@@ -76,12 +80,27 @@ class SmartTCPServer(object):
         :param root_client_path: The client path that will correspond to root
             of backing_transport.
         :param client_timeout: See SmartServerSocketStreamMedium's timeout
-            parameter.
+            parameter. Connections that have been queued for longer than this
+            are dropped as well.
+        :param max_connections: The maximum number of connections to serve
+            concurrently, or None for no limit.
+        :param max_queued: The maximum number of connections to hold while
+            waiting for a free worker, or None for no limit. Only used when
+            max_connections is set.
         """
         self.backing_transport = backing_transport
         self.root_client_path = root_client_path
         self._client_timeout = client_timeout
+        self._max_connections = max_connections
+        self._max_queued = max_queued
+        # Protects _active_connections and _queued_connections, which are
+        # updated both by the accept loop and by the worker threads.
+        self._connections_lock = threading.Lock()
         self._active_connections = []
+        # (conn, thread_name_suffix, time queued) for connections that are
+        # waiting for a free worker.
+        self._queued_connections = collections.deque()
+        self._rejected_count = 0
         # This is set to indicate we want to wait for clients to finish before
         # we disconnect.
         self._gracefully_stopping = False
@@ -167,7 +186,14 @@ class SmartTCPServer(object):
         trace.note(gettext('Requested to stop gracefully'))
         self._should_terminate = True
         self._gracefully_stopping = True
-        for handler, _ in self._active_connections:
+        with self._connections_lock:
+            active_connections = list(self._active_connections)
+            queued_connections = list(self._queued_connections)
+            self._queued_connections.clear()
+        # Connections that never got a worker are simply hung up on.
+        for conn, _, _ in queued_connections:
+            self._close_conn(conn)
+        for handler, _ in active_connections:
             handler._stop_gracefully()
 
     def _wait_for_clients_to_disconnect(self):
@@ -256,32 +282,145 @@ class SmartTCPServer(object):
         """Check to see if any active connections have finished.
 
         This will iterate through self._active_connections, and update any
-        connections that are finished.
+        connections that are finished. Queued connections that have been
+        waiting for longer than the client timeout are dropped, and queued
+        connections are started if there are free slots.
 
         :param timeout: The timeout to pass to thread.join(). By default, we
             set it to 0, so that we don't hang if threads are not done yet.
         :return: None
         """
-        still_active = []
-        for handler, thread in self._active_connections:
+        with self._connections_lock:
+            active_connections = list(self._active_connections)
+        for handler, thread in active_connections:
             thread.join(timeout)
-            if thread.is_alive():
-                still_active.append((handler, thread))
-        self._active_connections = still_active
+        expired = []
+        with self._connections_lock:
+            # Worker threads may have switched to a new handler while we were
+            # joining, so filter the current list rather than our copy.
+            still_active = [
+                (handler, thread)
+                for (handler, thread) in self._active_connections
+                if thread.is_alive()]
+            changed = len(still_active) != len(self._active_connections)
+            self._active_connections = still_active
+            if self._client_timeout is not None:
+                too_old = self._timer() - self._client_timeout
+                while (self._queued_connections and
+                       self._queued_connections[0][2] < too_old):
+                    expired.append(self._queued_connections.popleft()[0])
+            while (self._queued_connections and not self._gracefully_stopping
+                   and self._has_free_slot()):
+                conn, thread_name_suffix, _ = self._queued_connections.popleft()
+                self._start_connection_thread(conn, thread_name_suffix)
+                changed = True
+        for conn in expired:
+            trace.mutter('dropping connection that was queued for too long')
+            self._close_conn(conn)
+        if changed or expired:
+            self._run_connections_changed_hooks()
+
+    def _has_free_slot(self):
+        return (self._max_connections is None or
+                len(self._active_connections) < self._max_connections)
+
+    def _close_conn(self, conn):
+        try:
+            conn.close()
+        except socket.error:
+            # ignore errors on close
+            pass
+
+    def connection_stats(self):
+        """Return counters describing the connections of this server.
+
+        :return: A dict with the number of 'active' connections (being served
+            by a worker), 'queued' connections (waiting for a worker) and the
+            total number of 'rejected' connections.
+        """
+        with self._connections_lock:
+            return {
+                'active': len(self._active_connections),
+                'queued': len(self._queued_connections),
+                'rejected': self._rejected_count,
+                }
+
+    def _run_connections_changed_hooks(self):
+        hooks = SmartTCPServer.hooks['connections_changed']
+        if not hooks:
+            return
+        stats = self.connection_stats()
+        for hook in hooks:
+            hook(self, stats)
 
     def serve_conn(self, conn, thread_name_suffix):
+        """Serve conn, or queue it if all workers are busy.
+
+        :return: The thread serving the connection, or None if the connection
+            was queued or rejected.
+        """
         # For WIN32, where the timeout value from the listening socket
         # propagates to the newly accepted socket.
         conn.setblocking(True)
         conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        rejected = False
+        with self._connections_lock:
+            if self._has_free_slot():
+                connection_thread = self._start_connection_thread(
+                    conn, thread_name_suffix)
+            else:
+                connection_thread = None
+                if (self._max_queued is not None and
+                        len(self._queued_connections) >= self._max_queued):
+                    self._rejected_count += 1
+                    rejected = True
+                else:
+                    self._queued_connections.append(
+                        (conn, thread_name_suffix, self._timer()))
+        if rejected:
+            trace.mutter('rejecting connection: %d connections queued'
+                         % (self._max_queued,))
+            self._close_conn(conn)
+        self._run_connections_changed_hooks()
+        return connection_thread
+
+    def _start_connection_thread(self, conn, thread_name_suffix):
+        # Must be called with _connections_lock held.
         thread_name = 'smart-server-child' + thread_name_suffix
         handler = self._make_handler(conn)
         connection_thread = threading.Thread(
-            None, handler.serve, name=thread_name, daemon=True)
+            None, self._serve_connections, args=(handler,),
+            name=thread_name, daemon=True)
         self._active_connections.append((handler, connection_thread))
         connection_thread.start()
         return connection_thread
 
+    def _serve_connections(self, handler):
+        """Serve handler, then any connections that were queued meanwhile."""
+        while handler is not None:
+            handler.serve()
+            handler = self._next_queued_handler(handler)
+
+    def _next_queued_handler(self, finished_handler):
+        """Take over the next queued connection in the current thread.
+
+        :return: The handler for the queued connection, or None if there is
+            nothing left to do for this worker.
+        """
+        with self._connections_lock:
+            if not self._queued_connections or self._gracefully_stopping:
+                return None
+            conn, _, _ = self._queued_connections.popleft()
+            handler = self._make_handler(conn)
+            current = threading.current_thread()
+            for i, (old_handler, thread) in enumerate(
+                    self._active_connections):
+                if thread is current:
+                    self._active_connections[i] = (handler, thread)
+                    break
+        self._run_connections_changed_hooks()
+        return handler
+
     def start_background_thread(self, thread_name_suffix=''):
         self._started.clear()
         self._server_thread = threading.Thread(
@@ -346,6 +485,13 @@ class SmartServerHooks(Hooks):
                       "server_exception is called with the sys.exc_info() tuple "
                       "return true for the hook if the exception has been handled, "
                       "in which case the server will exit normally.", (2, 4))
+        self.add_hook('connections_changed',
+                      "Called by the bzr server when a connection is started, "
+                      "queued, rejected or finishes. connections_changed is "
+                      "called with (server_obj, stats), where stats is a dict "
+                      "with the number of 'active', 'queued' and 'rejected' "
+                      "connections. It may be called from any of the server "
+                      "threads.", (3, 3))
 
 
 SmartTCPServer.hooks = SmartServerHooks()  # type: ignore
@@ -446,13 +592,20 @@ class BzrServerFactory(object):
                 host = medium.BZR_DEFAULT_INTERFACE
             if port is None:
                 port = medium.BZR_DEFAULT_PORT
-            smart_server = SmartTCPServer(self.transport,
-                                          client_timeout=timeout)
+            smart_server = self._make_tcp_server(timeout)
             smart_server.start_server(host, port)
             trace.note(gettext('listening on port: %s'),
                        str(smart_server.port))
         self.smart_server = smart_server
 
+    def _make_tcp_server(self, timeout):
+        """Create the server for TCP clients, before it starts listening."""
+        c = config.GlobalStack()
+        return SmartTCPServer(
+            self.transport, client_timeout=timeout,
+            max_connections=c.get('serve.max_connections'),
+            max_queued=c.get('serve.max_queued_connections'))
+
     def _change_globals(self):
         from breezy import lockdir, ui
         # For the duration of this server, no UI output is permitted. note
@@ -491,7 +644,12 @@ def serve_bzr(transport, host=None, port=None, inet=False, timeout=None):
     transport will be decorated with a chroot and pathfilter (using
     os.path.expanduser).
     """
-    bzr_server = BzrServerFactory()
+    _serve_with_factory(
+        BzrServerFactory(), transport, host, port, inet, timeout)
+
+
+def _serve_with_factory(bzr_server, transport, host, port, inet, timeout):
+    """Set up and run the smart server created by bzr_server."""
     try:
         bzr_server.set_up(transport, host, port, inet, timeout)
         bzr_server.smart_server.serve()
@@ -66,6 +66,7 @@ def load_tests(loader, basic_tests, pattern):
         'test_chk_serializer',
         'test_conflicts',
         'test_generate_ids',
+        'test_generations',
         'test_groupcompress',
         'test_hashcache',
         'test_index',
@@ -74,11 +75,13 @@ def load_tests(loader, basic_tests, pattern):
         'test_knit',
         'test_matchers',
         'test_pack',
+        'test_parent_map_cache',
         'test_read_bundle',
         'test_remote',
         'test_repository',
         'test_rio',
         'test_smart',
+        'test_smart_aio',
         'test_smart_request',
         'test_smart_signals',
         'test_smart_transport',
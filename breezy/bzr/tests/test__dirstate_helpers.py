@@ -730,6 +730,34 @@ class TestReadDirblocks(test_dirstate.TestCaseWithDirState):
         # Make sure we mention the bogus characters in the error
         self.assertContainsRe(str(e), 'bogus')
 
+    def test_shares_parent_details(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/b', 'tree/c'])
+        tree.add(['a', 'b', 'c'], ids=[b'a-id', b'b-id', b'c-id'])
+        tree.commit('one')
+        other = tree.controldir.sprout('other').open_workingtree()
+        self.build_tree_contents([('tree/b', b'new content\n')])
+        rev2 = tree.commit('two')
+        self.build_tree_contents([('other/b', b'other content\n')])
+        rev3 = other.commit('three')
+        tree.merge_from_branch(other.branch)
+        state = dirstate.DirState.on_file('tree/.bzr/checkout/dirstate')
+        state.lock_read()
+        self.addCleanup(state.unlock)
+        state._read_header_if_needed()
+        self.assertEqual([rev2, rev3], state.get_parent_ids())
+        read_dirblocks = self.get_read_dirblocks()
+        read_dirblocks(state)
+        a_details = state._get_entry(0, path_utf8=b'a')[1]
+        b_details = state._get_entry(0, path_utf8=b'b')[1]
+        c_details = state._get_entry(0, path_utf8=b'c')[1]
+        # a is the same in both parents, b is not.
+        self.assertIs(a_details[1], a_details[2])
+        self.assertIsNot(b_details[1], b_details[2])
+        # The revision ids a and c were last changed in are the same object.
+        self.assertIsNot(a_details[1], c_details[1])
+        self.assertIs(a_details[1][4], c_details[1][4])
+
 
 class TestCompiledReadDirblocks(TestReadDirblocks):
     """Test the pyrex implementation of _read_dirblocks"""
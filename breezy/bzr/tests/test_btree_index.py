@@ -17,6 +17,7 @@
 
 """Tests for btree indices."""
 
+import math
 import pprint
 import zlib
 
@@ -1205,6 +1206,165 @@ class TestBTreeIndex(BTreeTestCase):
         entries = set(index.iter_entries([n[0] for n in nodes]))
         self.assertEqual(500, len(entries))
 
+    def make_local_index(self, nodes, offset=0):
+        builder = btree_index.BTreeBuilder(key_elements=1, reference_lists=0)
+        for key, value, references in nodes:
+            builder.add_node(key, value, references)
+        content = builder.finish().read()
+        trans = self.get_transport('')
+        trans.put_bytes('index', (b' ' * offset) + content)
+        return trans, len(content)
+
+    def test_local_index_uses_mmap(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        self.overrideAttr(btree_index, '_MMAP_MIN_SIZE', 0)
+        nodes = self.make_nodes(2000, 1, 0)
+        trans, size = self.make_local_index(nodes)
+        index = btree_index.BTreeGraphIndex(trans, 'index', size)
+        self.assertEqual(
+            sorted((key, value) for key, value, references in nodes),
+            sorted((key, value) for _, key, value in index.iter_entries(
+                [node[0] for node in nodes])))
+        self.assertIsNot(False, index._mmap)
+        self.assertEqual(len(nodes), len(list(index.iter_all_entries())))
+
+    def test_mmap_with_offset(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        self.overrideAttr(btree_index, '_MMAP_MIN_SIZE', 0)
+        nodes = self.make_nodes(2000, 1, 0)
+        trans, size = self.make_local_index(nodes, offset=1000)
+        index = btree_index.BTreeGraphIndex(trans, 'index', size, offset=1000)
+        self.assertEqual(
+            sorted((key, value) for key, value, references in nodes),
+            sorted((key, value) for _, key, value in index.iter_all_entries()))
+        self.assertIsNot(False, index._mmap)
+
+    def test_mmap_short_read(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        self.overrideAttr(btree_index, '_MMAP_MIN_SIZE', 0)
+        nodes = self.make_nodes(2000, 1, 0)
+        trans, size = self.make_local_index(nodes)
+        index = btree_index.BTreeGraphIndex(trans, 'index', size + 8192)
+        self.assertEqual([(0, b'B+Tree')], index._read_ranges([(0, 6)]))
+        self.assertRaises(errors.ShortReadvError,
+                          index._read_ranges, [(size - 10, 20)])
+
+    def test_close_mmap(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        self.overrideAttr(btree_index, '_MMAP_MIN_SIZE', 0)
+        nodes = self.make_nodes(2000, 1, 0)
+        trans, size = self.make_local_index(nodes)
+        index = btree_index.BTreeGraphIndex(trans, 'index', size)
+        index.key_count()
+        mapped = index._mmap
+        index._close_mmap()
+        self.assertTrue(mapped.closed)
+        self.assertIs(None, index._mmap)
+        # The file is mapped again when it is read from.
+        self.assertEqual(len(nodes), len(list(index.iter_all_entries())))
+        self.assertFalse(index._mmap.closed)
+
+    def test_small_index_not_mapped(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        nodes = self.make_nodes(10, 1, 0)
+        trans, size = self.make_local_index(nodes)
+        index = btree_index.BTreeGraphIndex(trans, 'index', size)
+        self.assertEqual(10, len(list(index.iter_all_entries())))
+        self.assertIs(False, index._mmap)
+
+    def test_non_local_transport_uses_readv(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        self.overrideAttr(btree_index, '_MMAP_MIN_SIZE', 0)
+        nodes = self.make_nodes(2000, 1, 0)
+        self.make_local_index(nodes)
+        trans = transport.get_transport_from_url('trace+' + self.get_url())
+        index = btree_index.BTreeGraphIndex(
+            trans, 'index', trans.stat('index').st_size)
+        self.assertEqual(len(nodes), len(list(index.iter_all_entries())))
+        self.assertIs(False, index._mmap)
+        self.assertTrue(
+            [call for call in trans._activity if call[0] == 'readv'])
+
+    def make_bloom_index(self, nodes, bloom_filter=True):
+        builder = btree_index.BTreeBuilder(key_elements=1, reference_lists=0)
+        builder.set_optimize(bloom_filter=bloom_filter)
+        for key, value, references in nodes:
+            builder.add_node(key, value, references)
+        stream = builder.finish()
+        trans = transport.get_transport_from_url('trace+' + self.get_url())
+        size = trans.put_file('index', stream)
+        return btree_index.BTreeGraphIndex(trans, 'index', size)
+
+    def test_bloom_filter_not_written_by_default(self):
+        index = self.make_bloom_index(self.make_nodes(200, 1, 0),
+                                      bloom_filter=False)
+        self.assertIs(None, index._get_bloom_filter())
+        keys = set([(b'missing',)])
+        self.assertEqual(keys, index._maybe_present_keys(keys))
+
+    def test_no_bloom_filter_for_single_page(self):
+        index = self.make_bloom_index(self.make_nodes(10, 1, 0))
+        self.assertEqual(10, index.key_count())
+        self.assertEqual([1], index._row_lengths)
+        self.assertIs(None, index._get_bloom_filter())
+
+    def test_bloom_filter_follows_the_nodes(self):
+        nodes = self.make_nodes(2000, 1, 0)
+        index = self.make_bloom_index(nodes)
+        self.assertEqual(2000, index.key_count())
+        self.assertTrue(
+            index._size > index._row_offsets[-1] * btree_index._PAGE_SIZE)
+        self.assertIsInstance(index._get_bloom_filter(),
+                              btree_index._BloomFilter)
+        self.assertEqual(
+            sorted((key, value) for key, value, references in nodes),
+            sorted((key, value) for _, key, value in index.iter_all_entries()))
+        index.validate()
+
+    def test_maybe_present_keys(self):
+        nodes = self.make_nodes(2000, 1, 0)
+        index = self.make_bloom_index(nodes)
+        keys = set(node[0] for node in nodes)
+        self.assertEqual(keys, index._maybe_present_keys(keys))
+        missing = set((b'missing-%d' % i,) for i in range(1000))
+        # About 1% of absent keys get through.
+        self.assertTrue(len(index._maybe_present_keys(missing)) < 50)
+        # The filter is only read once.
+        del index._transport._activity[:]
+        index._maybe_present_keys(missing)
+        self.assertEqual([], index._transport._activity)
+
+    def test_bloom_filter_pages_are_empty_leaves(self):
+        # Readers that do not know about bloom filters only ever see empty
+        # leaf nodes after the end of the tree.
+        index = self.make_bloom_index(self.make_nodes(2000, 1, 0))
+        index.key_count()
+        content = index._transport.get_bytes('index')
+        start = index._row_offsets[-1] * btree_index._PAGE_SIZE
+        self.assertTrue(len(content) > start)
+        for pos in range(start, len(content), btree_index._PAGE_SIZE):
+            self.assertEqual(btree_index._LEAF_FLAG, zlib.decompress(
+                content[pos:pos + btree_index._PAGE_SIZE]))
+
+    def test_bloom_filter_read_with_nodes(self):
+        # When the whole index is read at once, the filter comes for free.
+        index = self.make_bloom_index(self.make_nodes(2000, 1, 0))
+        index.key_count()
+        total_pages = int(math.ceil(index._size / btree_index._PAGE_SIZE))
+        nodes = list(index._read_nodes(list(range(1, total_pages))))
+        self.assertEqual(list(range(1, index._row_offsets[-1])),
+                         [pos for pos, node in nodes])
+        self.assertIsInstance(index._bloom_filter, btree_index._BloomFilter)
+
+    def test_unknown_bloom_filter_ignored(self):
+        self.overrideAttr(btree_index, '_BLOOM_SIGNATURE',
+                          b'B+Tree Graph Index Bloom Filter 99\n')
+        index = self.make_bloom_index(self.make_nodes(2000, 1, 0))
+        btree_index._BLOOM_SIGNATURE = (
+            b'B+Tree Graph Index Bloom Filter 1\n')
+        self.assertIs(None, index._get_bloom_filter())
+        self.assertEqual(2000, len(list(index.iter_all_entries())))
+
 
 class TestBTreeNodes(BTreeTestCase):
 
@@ -1252,6 +1412,63 @@ class TestBTreeNodes(BTreeTestCase):
             (b'11', b'44'): (b'value:4', ((), ((b'11', b'ref00'),)))
             }, dict(node.all_items()))
 
+    def test_CompactLeafNode_1_0(self):
+        node_bytes = (b"type=leaf\n"
+                      b"0000000000000000000000000000000000000000\x00\x00value:0\n"
+                      b"1111111111111111111111111111111111111111\x00\x00value:1\n"
+                      b"2222222222222222222222222222222222222222\x00\x00value:2\n")
+        node = btree_index._CompactLeafNode(node_bytes, 1, 0)
+        self.assertEqual(3, len(node))
+        self.assertEqual(
+            (b"0000000000000000000000000000000000000000",), node.min_key)
+        self.assertEqual(
+            (b"2222222222222222222222222222222222222222",), node.max_key)
+        self.assertEqual(
+            (b"value:1", ()),
+            node[(b"1111111111111111111111111111111111111111",)])
+        self.assertTrue(
+            (b"2222222222222222222222222222222222222222",) in node)
+        self.assertFalse((b"1",) in node)
+        self.assertFalse((b"3333333333333333333333333333333333333333",) in node)
+        self.assertRaises(KeyError, node.__getitem__, (b"0",))
+        self.assertEqual([
+            (b"0000000000000000000000000000000000000000",),
+            (b"1111111111111111111111111111111111111111",),
+            (b"2222222222222222222222222222222222222222",),
+            ], node.all_keys())
+
+    def test_CompactLeafNode_2_2(self):
+        node_bytes = (b"type=leaf\n"
+                      b"00\x0000\x00\t00\x00ref00\x00value:0\n"
+                      b"00\x0011\x0000\x00ref00\t00\x00ref00\r01\x00ref01\x00value:1\n"
+                      b"11\x0033\x0011\x00ref22\t11\x00ref22\r11\x00ref22\x00value:3\n"
+                      b"11\x0044\x00\t11\x00ref00\x00value:4\n"
+                      b""
+                      )
+        node = btree_index._CompactLeafNode(node_bytes, 2, 2)
+        expected = {
+            (b'00', b'00'): (b'value:0', ((), ((b'00', b'ref00'),))),
+            (b'00', b'11'): (b'value:1', (((b'00', b'ref00'),),
+                                          ((b'00', b'ref00'), (b'01', b'ref01')))),
+            (b'11', b'33'): (b'value:3', (((b'11', b'ref22'),),
+                                          ((b'11', b'ref22'), (b'11', b'ref22')))),
+            (b'11', b'44'): (b'value:4', ((), ((b'11', b'ref00'),)))
+            }
+        self.assertEqual(expected, dict(node.all_items()))
+        for key, value in expected.items():
+            self.assertEqual(value, node[key])
+        # A key element that is a prefix of one on the page.
+        self.assertFalse((b'00', b'1') in node)
+        self.assertFalse((b'00',) in node)
+        self.assertFalse((b'11', b'34') in node)
+
+    def test_CompactLeafNode_empty(self):
+        node = btree_index._CompactLeafNode(b"type=leaf\n", 1, 0)
+        self.assertEqual(0, len(node))
+        self.assertEqual(None, node.min_key)
+        self.assertFalse((b'a',) in node)
+        self.assertEqual([], node.all_items())
+
     def test_InternalNode_1(self):
         node_bytes = (b"type=internal\n"
                       b"offset=1\n"
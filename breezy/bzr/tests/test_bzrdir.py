@@ -1426,6 +1426,56 @@ class TestBzrDirHooks(TestCaseWithMemoryTransport):
         self.assertStartsWith(param_repr, '<RepoInitHookParams for ')
 
 
+class TestRepositoryCache(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestRepositoryCache, self).setUp()
+        self.cache = bzrdir.RepositoryCache()
+        self.overrideAttr(bzrdir.BzrDirMeta1, 'repository_cache', self.cache)
+
+    def open_repository(self, path='.'):
+        return controldir.ControlDir.open(path).open_repository()
+
+    def test_reused(self):
+        tree = self.make_branch_and_tree('.')
+        repo = self.open_repository()
+        # Not while it may still be in use.
+        self.assertIsNot(repo, self.open_repository())
+        self.cache.release()
+        repo = self.open_repository()
+        self.cache.release()
+        self.assertIs(repo, self.open_repository())
+        self.cache.release()
+        # Nor once the repository changed.
+        tree.commit('one')
+        self.assertIsNot(repo, self.open_repository())
+
+    def test_locked(self):
+        self.make_repository('.')
+        repo = self.open_repository()
+        self.cache.release()
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        self.assertIsNot(repo, self.open_repository())
+
+    def test_locked_elsewhere(self):
+        self.make_repository('.')
+        repo = self.open_repository()
+        self.cache.release()
+        other = repository.Repository.open('.')
+        other.lock_write()
+        self.addCleanup(other.unlock)
+        self.assertIsNot(repo, self.open_repository())
+
+    def test_not_local(self):
+        self.make_repository('repo')
+        repo = controldir.ControlDir.open_from_transport(
+            self.get_readonly_transport('repo')).open_repository()
+        self.cache.release()
+        self.assertIsNot(repo, controldir.ControlDir.open_from_transport(
+            self.get_readonly_transport('repo')).open_repository())
+
+
 class TestGenerateBackupName(TestCaseWithMemoryTransport):
     # FIXME: This may need to be unified with test_osutils.TestBackupNames or
     # moved to per_bzrdir or per_transport for better coverage ?
@@ -1414,6 +1414,138 @@ class TestDirStateHashUpdates(TestCaseWithDirState):
                          state._dirblock_state)
         self.assertEqual(0, len(state._known_hash_changes))
 
+    def make_journalled_state(self):
+        tree = self.make_branch_and_tree('.')
+        self.build_tree(['c', 'd'])
+        tree.add(['c', 'd'], ids=[b'c-id', b'd-id'])
+        tree.commit('add c and d')
+        self.overrideAttr(dirstate.DirState, 'JOURNAL_FRACTION', 10)
+        state = InstrumentedDirState.on_file(
+            tree.controldir.get_workingtree_transport(None).local_abspath(
+                'dirstate'))
+        state.lock_write()
+        self.addCleanup(state.unlock)
+        state._read_dirblocks_if_needed()
+        state.adjust_time(+20)  # Allow things to be cached
+        return state
+
+    def reread_entry(self, state, path):
+        state.unlock()
+        state.lock_write()
+        return state._get_entry(0, path_utf8=path)
+
+    def test_save_hash_changes_to_journal(self):
+        state = self.make_journalled_state()
+        content = self._read_state_content(state)
+        self.do_update_entry(state, b'c')
+        state.save()
+        self.assertEqual(dirstate.DirState.IN_MEMORY_UNMODIFIED,
+                         state._dirblock_state)
+        self.assertEqual(content, self._read_state_content(state))
+        self.assertPathExists(state._journal_filename)
+        entry = self.reread_entry(state, b'c')
+        self.assertEqual(self.get_sha1(b'c'), entry[1][0][1])
+        # The journal is applied when serialising.
+        state._mark_modified()
+        self.assertEqual(state.get_lines(), state._get_output_lines(
+            [state._get_parents_line(state.get_parent_ids()),
+             state._get_ghosts_line(state._ghosts)]
+            + list(state._iter_entry_lines())))
+        # Further updates are appended.
+        state._mark_unmodified()
+        journal_size = state._journal_size
+        self.do_update_entry(state, b'd')
+        state.save()
+        self.assertTrue(state._journal_size > journal_size)
+        self.assertEqual(content, self._read_state_content(state))
+        entry = self.reread_entry(state, b'd')
+        self.assertEqual(self.get_sha1(b'd'), entry[1][0][1])
+        self.assertEqual(self.get_sha1(b'c'),
+                         state._get_entry(0, path_utf8=b'c')[1][0][1])
+
+    def get_sha1(self, path):
+        with open(path, 'rb') as f:
+            return osutils.sha_string(f.read())
+
+    def test_journal_read_once_per_lock(self):
+        state = self.make_journalled_state()
+        self.do_update_entry(state, b'c')
+        state.save()
+        state.unlock()
+        state.lock_read()
+        reads = []
+
+        def read_journal():
+            reads.append(None)
+            return orig()
+        orig = self.overrideAttr(state, '_read_journal', read_journal)
+        state._get_entry(0, path_utf8=b'c')
+        self.assertTrue(state._dirblocks_partial)
+        state._read_dirblocks_if_needed()
+        self.assertFalse(state._dirblocks_partial)
+        self.assertEqual(self.get_sha1(b'c'),
+                         state._get_entry(0, path_utf8=b'c')[1][0][1])
+        self.assertEqual(1, len(reads))
+        # It is read again once the dirstate has been unlocked.
+        state.unlock()
+        state.lock_read()
+        state._read_dirblocks_if_needed()
+        self.assertEqual(2, len(reads))
+
+    def test_rewrite_removes_journal(self):
+        state = self.make_journalled_state()
+        self.do_update_entry(state, b'c')
+        state.save()
+        self.assertPathExists(state._journal_filename)
+        state._mark_modified()
+        state.save()
+        self.assertPathDoesNotExist(state._journal_filename)
+        entry = self.reread_entry(state, b'c')
+        self.assertEqual(self.get_sha1(b'c'), entry[1][0][1])
+
+    def test_large_journal_is_compacted(self):
+        state = self.make_journalled_state()
+        content = self._read_state_content(state)
+        self.overrideAttr(dirstate.DirState, 'JOURNAL_FRACTION', 0.1)
+        self.do_update_entry(state, b'c')
+        state.save()
+        self.assertPathDoesNotExist(state._journal_filename)
+        self.assertNotEqual(content, self._read_state_content(state))
+
+    def test_journal_for_other_dirstate_is_ignored(self):
+        state = self.make_journalled_state()
+        self.do_update_entry(state, b'c')
+        state.save()
+        with open(state._journal_filename, 'rb') as f:
+            journal = f.read()
+        state._mark_modified()
+        state.save()
+        with open(state._journal_filename, 'wb') as f:
+            f.write(journal)
+        entry = self.reread_entry(state, b'c')
+        self.assertEqual(0, state._journal_size)
+        self.assertEqual(self.get_sha1(b'c'), entry[1][0][1])
+        # A fresh journal replaces the stale one.
+        self.do_update_entry(state, b'd')
+        state.save()
+        self.assertEqual(self.get_sha1(b'd'),
+                         self.reread_entry(state, b'd')[1][0][1])
+
+    def test_damaged_journal_batch_is_ignored(self):
+        state = self.make_journalled_state()
+        self.do_update_entry(state, b'c')
+        state.save()
+        valid_size = state._journal_size
+        self.do_update_entry(state, b'd')
+        state.save()
+        with open(state._journal_filename, 'r+b') as f:
+            f.truncate(state._journal_size - 1)
+        entry = self.reread_entry(state, b'd')
+        self.assertEqual(valid_size, state._journal_size)
+        self.assertEqual(b'', entry[1][0][1])
+        self.assertEqual(self.get_sha1(b'c'),
+                         state._get_entry(0, path_utf8=b'c')[1][0][1])
+
 
 class TestGetLines(TestCaseWithDirState):
 
@@ -2176,6 +2308,71 @@ class TestBisect(TestCaseWithDirState):
                                    state, [b'b'])
 
 
+    def assertPartialDirblocks(self, expected, state):
+        """Assert that the partially read dirblocks hold the expected paths."""
+        self.assertTrue(state._dirblocks_partial)
+        dirnames = [dirname for dirname, block in state._dirblocks]
+        self.assertEqual(sorted(dirnames, key=lambda d: d.split(b'/')),
+                         dirnames)
+        self.assertEqual(
+            sorted(expected),
+            sorted(osutils.pathjoin(*entry[0][0:2])
+                   for dirname, block in state._dirblocks
+                   for entry in block))
+
+    def test_read_dirblocks_for_paths(self):
+        tree, state, expected = self.create_basic_dirstate()
+        state._read_dirblocks_for_paths([b'b/d'])
+        self.assertPartialDirblocks(
+            [b'', b'a', b'b', b'b-c', b'f', b'b/c', b'b/d', b'b/d/e'], state)
+
+    def test_read_dirblocks_for_paths_not_recursive(self):
+        tree, state, expected = self.create_basic_dirstate()
+        state._read_dirblocks_for_paths([b'b/c'], recursive=False)
+        self.assertPartialDirblocks(
+            [b'', b'a', b'b', b'b-c', b'f', b'b/c', b'b/d'], state)
+        # Looking up other paths reads the dirblocks they are in.
+        self.assertEqual(expected[b'b/d/e'],
+                         state._get_entry(0, path_utf8=b'b/d/e'))
+        self.assertPartialDirblocks(
+            [b'', b'a', b'b', b'b-c', b'f', b'b/c', b'b/d', b'b/d/e'], state)
+
+    def test_read_dirblocks_for_paths_renamed(self):
+        tree, state, expected = self.create_renamed_dirstate()
+        state._read_dirblocks_for_paths([b'h'])
+        self.assertPartialDirblocks(
+            [b'', b'a', b'b', b'b-c', b'f', b'h', b'b/c', b'b/d', b'b/g',
+             b'b/d/e', b'h/e'], state)
+
+    def test_read_dirblocks_for_paths_then_all(self):
+        tree, state, expected = self.create_basic_dirstate()
+        state._read_dirblocks_for_paths([b'a'])
+        state._read_dirblocks_if_needed()
+        self.assertFalse(state._dirblocks_partial)
+        self.assertEqual(sorted(expected.values()),
+                         sorted(state._iter_entries()))
+
+    def test_read_dirblocks_for_paths_write_locked(self):
+        tree, state, expected = self.create_basic_dirstate()
+        state.unlock()
+        state.lock_write()
+        state._read_dirblocks_for_paths([b'a'])
+        self.assertFalse(state._dirblocks_partial)
+        self.assertEqual(dirstate.DirState.IN_MEMORY_UNMODIFIED,
+                         state._dirblock_state)
+
+    def test_get_entry_reads_part_of_dirstate(self):
+        tree, state, expected = self.create_basic_dirstate()
+        self.assertEqual(expected[b'b/c'],
+                         state._get_entry(0, path_utf8=b'b/c'))
+        self.assertPartialDirblocks(
+            [b'', b'a', b'b', b'b-c', b'f', b'b/c', b'b/d'], state)
+        # Looking up a file id needs all of the dirstate.
+        self.assertEqual(expected[b'a'],
+                         state._get_entry(0, fileid_utf8=b'a-id'))
+        self.assertFalse(state._dirblocks_partial)
+
+
 class TestDirstateValidation(TestCaseWithDirState):
 
     def test_validate_correct_dirstate(self):
@@ -2447,6 +2644,11 @@ class TestSHA1Provider(tests.TestCaseInTempDir):
         p = dirstate.SHA1Provider()
         self.assertRaises(NotImplementedError, p.sha1, "foo")
         self.assertRaises(NotImplementedError, p.stat_and_sha1, "foo")
+        self.assertFalse(p.hashes_raw_content("foo"))
+
+    def test_defaultsha1provider_hashes_raw_content(self):
+        p = dirstate.DefaultSHA1Provider()
+        self.assertTrue(p.hashes_raw_content('foo'))
 
     def test_defaultsha1provider_sha1(self):
         text = b'test\r\nwith\nall\rpossible line endings\r\n'
@@ -2465,6 +2667,17 @@ class TestSHA1Provider(tests.TestCaseInTempDir):
         self.assertEqual(len(text), statvalue.st_size)
         self.assertEqual(expected_sha, sha1)
 
+    def test_hashing_ahead_provider_unknown_file(self):
+        text = b'test\n'
+        self.build_tree_contents([('foo', text)])
+        p = dirstate._HashingAheadSHA1Provider(
+            dirstate.DefaultSHA1Provider(), 2)
+        self.addCleanup(p.close)
+        self.assertEqual(osutils.sha_string(text), p.sha1('foo'))
+        statvalue, sha1 = p.stat_and_sha1('foo')
+        self.assertEqual(len(text), statvalue.st_size)
+        self.assertEqual(osutils.sha_string(text), sha1)
+
 
 class _Repo(object):
     """A minimal api to get InventoryRevisionTree to work."""
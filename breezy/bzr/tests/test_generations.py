@@ -0,0 +1,226 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for breezy.bzr.generations."""
+
+import os
+
+from ... import (
+    config,
+    graph as _mod_graph,
+    )
+from ...revision import NULL_REVISION
+from .. import generations
+from ...tests import (
+    TestCaseWithMemoryTransport,
+    TestCaseWithTransport,
+    )
+
+
+# NULL_REVISION
+#      |
+#      a
+#     / \
+#    b   c   ghost
+#    |   |  /
+#    d   e
+#     \ /
+#      f
+ancestry = {
+    b'a': (NULL_REVISION,),
+    b'b': (b'a',),
+    b'c': (b'a',),
+    b'd': (b'b',),
+    b'e': (b'c', b'ghost'),
+    b'f': (b'd', b'e'),
+    }
+
+
+class TestGenerationIndex(TestCaseWithMemoryTransport):
+
+    def make_index(self, ancestry, transport=None):
+        if transport is None:
+            transport = self.get_transport('generations')
+        return generations.GenerationIndex(
+            transport, _mod_graph.DictParentsProvider(ancestry))
+
+    def index_names(self, transport):
+        return sorted(transport.list_dir('.'))
+
+    def test_add_revisions(self):
+        transport = self.get_transport('generations')
+        index = self.make_index(ancestry, transport)
+        index.add_revisions([b'f'])
+        self.assertEqual({b'f': 4, b'e': 3, b'b': 2},
+                         index.get_generation_map([b'f', b'e', b'b']))
+        names = self.index_names(transport)
+        self.assertEqual(2, len(names))
+        self.assertEndsWith(names[0], '.ghosts')
+        self.assertEqual(b'ghost\n', transport.get_bytes(names[0]))
+        self.assertEndsWith(names[1], '.gix')
+        # The generations are read back without looking at the parents.
+        index = self.make_index({}, transport)
+        self.assertEqual({b'f': 4, b'a': 1},
+                         index.get_generation_map([b'f', b'a']))
+
+    def test_absent(self):
+        index = self.make_index(ancestry)
+        index.add_revisions([b'f', b'ghost', b'absent', NULL_REVISION])
+        self.assertEqual({}, index.get_generation_map(
+            [b'ghost', b'absent', NULL_REVISION]))
+        self.assertEqual({b'c': 2},
+                         index.get_generation_map([b'c', b'ghost']))
+
+    def test_computed_by_lookups(self):
+        transport = self.get_transport('generations')
+        index = self.make_index(ancestry, transport)
+        index.add_revisions([b'b'])
+        self.assertEqual({b'b': 2, b'd': 3},
+                         index.get_generation_map([b'b', b'd']))
+        self.assertEqual(['.gix'],
+                         [name[20:] for name in self.index_names(transport)])
+        # Only the missing generations are computed.
+        index = self.make_index({}, transport)
+        self.assertEqual({b'b': 2, b'd': 3},
+                         index.get_generation_map([b'b', b'd']))
+
+    def test_extended(self):
+        transport = self.get_transport('generations')
+        self.make_index(ancestry).add_revisions([b'd'])
+        # Only the generations of the new revisions and their ancestors
+        # missing from the index are computed.
+        new_ancestry = {b'g': (b'f',), b'f': (b'd', b'e'),
+                        b'e': (b'c', b'ghost'), b'c': (b'a',)}
+        index = self.make_index(new_ancestry, transport)
+        index.add_revisions([b'g'])
+        self.assertEqual({b'g': 5, b'a': 1},
+                         index.get_generation_map([b'g', b'a']))
+
+    def test_combined(self):
+        transport = self.get_transport('generations')
+        index = self.make_index(ancestry, transport)
+        index.add_revisions([b'a', b'b', b'c', b'd'])
+        self.assertEqual(1, len(self.index_names(transport)))
+        # A single new revision is not combined with four others.
+        index.add_revisions([b'e'])
+        self.assertEqual(['.ghosts', '.gix', '.gix'],
+                         sorted(name[20:] for name in
+                                self.index_names(transport)))
+        # But once there are two similar small indices, they are combined
+        # with each other and then with the larger one.
+        index.add_revisions([b'f'])
+        self.assertEqual(['.ghosts', '.gix'],
+                         sorted(name[20:] for name in
+                                self.index_names(transport)))
+        index = self.make_index({}, transport)
+        self.assertEqual({b'a': 1, b'b': 2, b'd': 3, b'e': 3, b'f': 4},
+                         index.get_generation_map(
+                             [b'a', b'b', b'd', b'e', b'f']))
+
+    def test_ghost_added(self):
+        transport = self.get_transport('generations')
+        self.make_index(ancestry).add_revisions([b'f'])
+        new_ancestry = dict(ancestry)
+        new_ancestry[b'ghost'] = (b'd',)
+        # Once the ghost is present, the old generations are computed again.
+        index = self.make_index(new_ancestry, transport)
+        self.assertEqual({b'ghost': 4, b'e': 5, b'f': 6},
+                         index.get_generation_map([b'ghost', b'e', b'f']))
+        self.assertEqual(['.gix'],
+                         [name[20:] for name in self.index_names(transport)])
+
+    def test_ghost_added_by_add_revisions(self):
+        transport = self.get_transport('generations')
+        index = self.make_index(ancestry, transport)
+        index.add_revisions([b'f'])
+        new_ancestry = dict(ancestry)
+        new_ancestry[b'ghost'] = (b'd',)
+        index._parents_provider = _mod_graph.DictParentsProvider(new_ancestry)
+        index.add_revisions([b'ghost'])
+        self.assertEqual({b'ghost': 4, b'e': 5, b'f': 6},
+                         index.get_generation_map([b'ghost', b'e', b'f']))
+        self.assertEqual(['.gix'],
+                         [name[20:] for name in self.index_names(transport)])
+
+    def test_read_only(self):
+        self.make_index(ancestry).add_revisions([b'd'])
+        transport = self.get_readonly_transport('generations')
+        index = self.make_index(ancestry, transport)
+        index.add_revisions([b'f'])
+        self.assertEqual(1, len(self.index_names(transport)))
+
+
+class TestPackRepositoryGenerations(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestPackRepositoryGenerations, self).setUp()
+        config.GlobalStack().set('repository.generation_index', True)
+
+    def test_disabled(self):
+        config.GlobalStack().set('repository.generation_index', False)
+        repo = self.make_repository('repo')
+        with repo.lock_read():
+            self.assertIs(None, repo.get_graph()._generations)
+
+    def test_get_graph(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot(None, [('add', ('', None, 'directory', None))],
+                               revision_id=b'a')
+        builder.build_snapshot([b'a'], [], revision_id=b'b')
+        builder.build_snapshot([b'a'], [], revision_id=b'c')
+        builder.build_snapshot([b'b', b'c'], [], revision_id=b'd')
+        builder.finish_series()
+        repo = builder.get_branch().repository
+        self.assertIs(None, repo._make_generations_provider())
+        with repo.lock_read():
+            graph = repo.get_graph()
+            self.assertIsNot(None, graph._generations)
+            self.assertEqual({b'a': 1, b'd': 3},
+                             graph._generations.get_generation_map(
+                                 [b'a', b'd']))
+            self.assertEqual({b'b', b'c'}, graph.heads([b'b', b'c', b'a']))
+            self.assertEqual({b'd'}, graph.heads([b'b', b'd']))
+            self.assertTrue(graph.is_ancestor(b'a', b'd'))
+            self.assertFalse(graph.is_ancestor(b'd', b'a'))
+        # The index is kept outside of the repository.
+        self.assertFalse(repo._transport.has('generations'))
+        self.assertTrue(os.listdir(generations.cache_path(repo.user_url)))
+
+    def test_not_written_by_commit(self):
+        tree = self.make_branch_and_tree('tree')
+        tree.commit('one', rev_id=b'one')
+        self.assertFalse(os.path.exists(
+            generations.cache_path(tree.branch.repository.user_url)))
+
+    def test_abort_write_group(self):
+        tree = self.make_branch_and_tree('tree')
+        tree.commit('one', rev_id=b'one')
+        repo = tree.branch.repository
+        with repo.lock_write():
+            index = repo._make_generations_provider()
+            self.assertEqual({b'one': 1}, index.get_generation_map([b'one']))
+            repo.start_write_group()
+            repo.abort_write_group()
+            self.assertIsNot(index, repo._make_generations_provider())
+
+    def test_other_repository(self):
+        repo = self.make_repository('repo')
+        other_repo = self.make_repository('other')
+        with repo.lock_read():
+            self.assertIsNot(None, repo.get_graph()._generations)
+            # Generations aren't used with other repositories' revisions.
+            self.assertIs(None, repo.get_graph(other_repo)._generations)
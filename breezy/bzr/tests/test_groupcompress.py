@@ -16,6 +16,7 @@
 
 """Tests for group compression."""
 
+from concurrent import futures
 import zlib
 
 from ... import (
@@ -710,6 +711,84 @@ class TestGroupCompressVersionedFiles(TestCaseWithGroupCompressVersionedFiles):
             else:
                 self.assertIs(block, record._manager._block)
 
+    def get_blocks_and_texts(self, vf, keys):
+        blocks = []
+        texts = {}
+        for record in vf.get_record_stream(keys, 'groupcompress', False):
+            block = record._manager._block
+            if not blocks or blocks[-1][0] is not block:
+                blocks.append((block, []))
+            blocks[-1][1].append(record.key)
+            texts[record.key] = record.get_bytes_as('fulltext')
+        return [block_keys for block, block_keys in blocks], texts
+
+    def copy_in_parallel(self, vf, keys, dir, max_pending):
+        target = self.make_test_vf(True, dir=dir)
+        with futures.ThreadPoolExecutor(2) as executor:
+            list(target._insert_record_stream_in_parallel(
+                vf.get_record_stream(keys, 'groupcompress', False),
+                executor, max_pending, random_id=True))
+        target.writer.end()
+        return target
+
+    def test__insert_record_stream_in_parallel(self):
+        vf = self.make_test_vf(True, dir='source')
+        vf.insert_record_stream(self.grouped_stream([b'a', b'b', b'c', b'd']))
+        vf.insert_record_stream(self.grouped_stream(
+            [b'e', b'f', b'g', b'h'], first_parents=((b'd',),)))
+        vf.writer.end()
+        keys = [(r.encode(),) for r in 'abcdefgh']
+        serial = self.make_test_vf(True, dir='serial')
+        list(serial._insert_record_stream(vf.get_record_stream(
+            keys, 'groupcompress', False), reuse_blocks=False))
+        serial.writer.end()
+        parallel = self.copy_in_parallel(vf, keys, 'parallel', 2)
+        # A single batch is compressed exactly as _insert_record_stream does.
+        self.assertEqual(self.get_blocks_and_texts(serial, keys),
+                         self.get_blocks_and_texts(parallel, keys))
+        self.assertEqual(serial.get_parent_map(keys),
+                         parallel.get_parent_map(keys))
+
+    def test__insert_record_stream_in_parallel_batches(self):
+        self.overrideAttr(groupcompress, '_PARALLEL_BATCH_SIZE', 100)
+        vf = self.make_test_vf(True, dir='source')
+        revision_ids = [b'rev-%d' % i for i in range(20)]
+        vf.insert_record_stream(self.grouped_stream(revision_ids))
+        vf.writer.end()
+        keys = [(revision_id,) for revision_id in revision_ids]
+        parallel1 = self.copy_in_parallel(vf, keys, 'parallel1', 1)
+        parallel4 = self.copy_in_parallel(vf, keys, 'parallel4', 4)
+        blocks, texts = self.get_blocks_and_texts(parallel1, keys)
+        # Each batch gets its own group, and the groups are written in the
+        # order of the stream whatever the number of batches in flight.
+        self.assertTrue(len(blocks) > 1)
+        self.assertEqual((blocks, texts),
+                         self.get_blocks_and_texts(parallel4, keys))
+        self.assertEqual(self.get_blocks_and_texts(vf, keys)[1], texts)
+
+    def test_get_record_stream_prefetches_blocks(self):
+        vf = self.make_test_vf(True, dir='source')
+        keys = []
+        for i in range(4):
+            revision_ids = [b'rev-%d-%d' % (i, j) for j in range(3)]
+            vf.insert_record_stream(self.grouped_stream(revision_ids))
+            keys.extend((revision_id,) for revision_id in revision_ids)
+        vf.writer.end()
+        self.overrideAttr(groupcompress, '_PREFETCH_BYTES', 0)
+        expected = self.get_blocks_and_texts(vf, keys)[1]
+        vf._group_cache.clear()
+        self.overrideAttr(groupcompress, '_PREFETCH_BYTES', 1024)
+        self.overrideAttr(groupcompress, 'BATCH_SIZE', 1)
+        decompressed = []
+
+        def decompress_block(zdata, num_bytes):
+            decompressed.append(num_bytes)
+            return orig_decompress_block(zdata, num_bytes)
+        orig_decompress_block = self.overrideAttr(
+            groupcompress, '_decompress_block', decompress_block)
+        self.assertEqual(expected, self.get_blocks_and_texts(vf, keys)[1])
+        self.assertLength(4, decompressed)
+
     def test_add_missing_noncompression_parent_unvalidated_index(self):
         unvalidated = self.make_g_index_missing_parent()
         combined = _mod_index.CombinedGraphIndex([unvalidated])
@@ -833,14 +912,26 @@ class TestGroupCompressConfig(tests.TestCaseWithTransport):
 
 
 class StubGCVF(object):
-    def __init__(self, canned_get_blocks=None):
+    def __init__(self, canned_get_blocks=None, raw_records=None):
         self._group_cache = {}
         self._canned_get_blocks = canned_get_blocks or []
+        self._access = StubAccess(raw_records or {})
 
     def _get_blocks(self, read_memos):
         return iter(self._canned_get_blocks)
 
 
+class StubAccess(object):
+    def __init__(self, raw_records):
+        self.raw_records = raw_records
+        self.calls = []
+
+    def get_raw_records(self, read_memos):
+        self.calls.append(read_memos)
+        for read_memo in read_memos:
+            yield self.raw_records[read_memo]
+
+
 class Test_BatchingBlockFetcher(TestCaseWithGroupCompressVersionedFiles):
     """Simple whitebox unit tests for _BatchingBlockFetcher."""
 
@@ -938,6 +1029,73 @@ class Test_BatchingBlockFetcher(TestCaseWithGroupCompressVersionedFiles):
         self.assertEqual('groupcompress-block', factories[0].storage_kind)
 
 
+class Test_BlockPrefetcher(tests.TestCase):
+    """Whitebox unit tests for _BlockPrefetcher."""
+
+    def setUp(self):
+        super(Test_BlockPrefetcher, self).setUp()
+        # One block per batch.
+        self.overrideAttr(groupcompress, 'BATCH_SIZE', 1)
+        raw_records = {}
+        self.read_memos = []
+        offset = 0
+        for i in range(3):
+            block = groupcompress.GroupCompressBlock()
+            block.set_content(b'content of block %d\n' % (i,))
+            zdata = block.to_bytes()
+            read_memo = ('fake index', offset, len(zdata))
+            raw_records[read_memo] = zdata
+            self.read_memos.append(read_memo)
+            offset += len(zdata)
+        self.gcvf = StubGCVF(raw_records=raw_records)
+
+    def make_prefetcher(self, max_bytes=None):
+        prefetcher = groupcompress._BlockPrefetcher(
+            self.gcvf, [(read_memo, 10) for read_memo in self.read_memos],
+            max_bytes=max_bytes)
+        self.addCleanup(prefetcher.close)
+        return prefetcher
+
+    def test_get_blocks(self):
+        prefetcher = self.make_prefetcher()
+        blocks = list(prefetcher.get_blocks(self.read_memos))
+        self.assertEqual(self.read_memos, [memo for memo, _ in blocks])
+        self.assertEqual([b'content of block %d\n' % (i,) for i in range(3)],
+                         [block._content for _, block in blocks])
+        self.assertEqual([[memo] for memo in self.read_memos],
+                         self.gcvf._access.calls)
+        self.assertEqual(dict(blocks), self.gcvf._group_cache)
+
+    def test_reads_next_batch_ahead(self):
+        prefetcher = self.make_prefetcher()
+        blocks = prefetcher.get_blocks(self.read_memos[:1])
+        self.assertEqual(self.read_memos[0], next(blocks)[0])
+        self.assertEqual([self.read_memos[:1], self.read_memos[1:2]],
+                         self.gcvf._access.calls)
+
+    def test_max_bytes(self):
+        prefetcher = self.make_prefetcher(max_bytes=0)
+        blocks = prefetcher.get_blocks(self.read_memos[:1])
+        self.assertEqual(self.read_memos[0], next(blocks)[0])
+        self.assertEqual([self.read_memos[:1]], self.gcvf._access.calls)
+
+    def test_drops_blocks_not_asked_for(self):
+        prefetcher = self.make_prefetcher()
+        list(prefetcher.get_blocks(self.read_memos[1:2]))
+        self.assertEqual([self.read_memos[2]], list(prefetcher._pending))
+        self.assertEqual(self.read_memos[2][2], prefetcher._pending_bytes)
+
+    def test_cached_blocks_are_not_read(self):
+        block = groupcompress.GroupCompressBlock()
+        self.gcvf._group_cache[self.read_memos[0]] = block
+        self.gcvf._canned_get_blocks = [(self.read_memos[0], block)]
+        prefetcher = self.make_prefetcher()
+        self.assertEqual([(self.read_memos[0], block)],
+                         list(prefetcher.get_blocks(self.read_memos[:1])))
+        self.assertEqual([self.read_memos[1:2], self.read_memos[2:3]],
+                         self.gcvf._access.calls)
+
+
 class TestLazyGroupCompress(tests.TestCaseWithTransport):
 
     _texts = {
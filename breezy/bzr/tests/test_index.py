@@ -22,6 +22,7 @@ from ... import (
     transport,
     )
 from .. import (
+    btree_index,
     index as _mod_index,
     )
 
@@ -1576,6 +1577,55 @@ class TestCombinedGraphIndex(tests.TestCaseWithMemoryTransport):
         self.assertEqual({}, parent_map)
         self.assertEqual({(b'one',), (b'two',)}, missing_keys)
 
+    def make_bloom_index(self, name, nodes):
+        builder = btree_index.BTreeBuilder(reference_lists=1)
+        builder.set_optimize(bloom_filter=True)
+        for key, value, references in nodes:
+            builder.add_node(key, value, references)
+        trans = transport.get_transport_from_url('trace+' + self.get_url())
+        size = trans.put_file(name, builder.finish())
+        index = btree_index.BTreeGraphIndex(trans, name, size)
+        # Read the filter now, so only the lookups show up in the log.
+        self.assertIsNot(None, index._get_bloom_filter())
+        del trans._activity[:]
+        return index
+
+    def make_bloom_indices(self):
+        index1 = self.make_bloom_index('1', [
+            ((b'key-1-%d' % i,), b'value', ([],)) for i in range(2000)])
+        index2 = self.make_bloom_index('2', [
+            ((b'key-2-%d' % i,), b'value', ([(b'key-1-%d' % i,)],))
+            for i in range(2000)])
+        return index1, index2
+
+    def test_iter_entries_skips_indices_by_bloom_filter(self):
+        index1, index2 = self.make_bloom_indices()
+        c_index = _mod_index.CombinedGraphIndex([index1, index2])
+        self.assertEqual([(index2, (b'key-2-5',), b'value',
+                           (((b'key-1-5',),),))],
+                         list(c_index.iter_entries([(b'key-2-5',)])))
+        self.assertEqual([], index1._transport._activity)
+        del index2._transport._activity[:]
+        self.assertEqual([], list(c_index.iter_entries([(b'missing',)])))
+        self.assertEqual([], index1._transport._activity)
+        self.assertEqual([], index2._transport._activity)
+
+    def test_find_ancestry_skips_indices_by_bloom_filter(self):
+        index1, index2 = self.make_bloom_indices()
+        c_index = _mod_index.CombinedGraphIndex([index2, index1])
+        parent_map, missing_keys = c_index.find_ancestry([(b'key-1-5',)], 0)
+        self.assertEqual({(b'key-1-5',): ()}, parent_map)
+        self.assertEqual(set(), missing_keys)
+        self.assertEqual([], index2._transport._activity)
+
+    def test_single_index_bloom_filter_not_read(self):
+        index1 = self.make_bloom_index('1', [
+            ((b'key-%d' % i,), b'value', ([],)) for i in range(2000)])
+        index1._bloom_filter = None
+        c_index = _mod_index.CombinedGraphIndex([index1])
+        self.assertEqual([], list(c_index.iter_entries([(b'missing',)])))
+        self.assertIs(None, index1._bloom_filter)
+
 
 class TestInMemoryGraphIndex(tests.TestCaseWithMemoryTransport):
 
@@ -0,0 +1,152 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the on-disk parent map cache."""
+
+from ... import tests
+from .. import (
+    btree_index,
+    index as _mod_index,
+    parent_map_cache,
+    )
+
+
+class TestParentMapCache(tests.TestCaseInTempDir):
+
+    def make_cache(self, pack_names=(b'pack1',), max_entries=100,
+                   present=None):
+        cache = parent_map_cache.ParentMapCache(
+            'cache/parents', pack_names, max_entries)
+
+        def find_present_revisions(keys):
+            self.assertIsNot(None, present)
+            return present
+        cache.load(find_present_revisions)
+        return cache
+
+    def test_missing_file(self):
+        cache = self.make_cache()
+        self.assertEqual({}, cache.get_parent_map([b'rev1']))
+
+    def test_save_and_load(self):
+        cache = self.make_cache()
+        cache.update({b'rev1': (b'null:',), b'rev2': (b'rev1', b'ghost'),
+                      b'null:': ()})
+        cache.save()
+        cache = self.make_cache()
+        self.assertEqual(
+            {b'rev1': (b'null:',), b'rev2': (b'rev1', b'ghost'), b'null:': ()},
+            cache.get_parent_map([b'rev1', b'rev2', b'rev3', b'null:']))
+
+    def test_new_packs_keep_cache(self):
+        cache = self.make_cache([b'pack1'])
+        cache.update({b'rev1': (b'null:',)})
+        cache.save()
+        cache = self.make_cache([b'pack1', b'pack2'])
+        self.assertEqual({b'rev1': (b'null:',)},
+                         cache.get_parent_map([b'rev1']))
+
+    def test_removed_packs_drop_removed_revisions(self):
+        cache = self.make_cache([b'pack1', b'pack2'])
+        cache.update({b'rev1': (b'null:',), b'rev2': (b'rev1',),
+                      b'null:': ()})
+        cache.save()
+        cache = self.make_cache([b'pack3'], present={b'rev1'})
+        self.assertEqual({b'rev1': (b'null:',), b'null:': ()},
+                         cache.get_parent_map([b'rev1', b'rev2', b'null:']))
+        # The stale file is replaced on the next save.
+        cache.save()
+        with open('cache/parents', 'rb') as f:
+            self.assertEqual(
+                parent_map_cache.FORMAT_MARKER + b'pack3\n'
+                b'rev1 null:\nnull:\n', f.read())
+
+    def test_set_pack_names(self):
+        cache = self.make_cache([b'pack1', b'pack2'])
+        cache.update({b'rev1': (b'null:',), b'rev2': (b'rev1',)})
+        # New packs don't need the revisions to be looked up.
+        cache.set_pack_names([b'pack1', b'pack2', b'pack3'], None)
+        self.assertLength(2, cache)
+        cache.set_pack_names([b'pack1', b'pack4'], lambda keys: {b'rev2'})
+        self.assertEqual({b'rev2': (b'rev1',)},
+                         cache.get_parent_map([b'rev1', b'rev2']))
+
+    def test_unknown_format(self):
+        self.build_tree_contents([('cache/',),
+                                  ('cache/parents', b'not a cache\n')])
+        cache = self.make_cache()
+        self.assertEqual(0, len(cache))
+
+    def test_save_drops_oldest_entries(self):
+        cache = self.make_cache(max_entries=2)
+        cache.update({b'rev1': (b'null:',)})
+        cache.update({b'rev2': (b'rev1',)})
+        cache.update({b'rev3': (b'rev2',)})
+        cache.save()
+        cache = self.make_cache(max_entries=2)
+        self.assertEqual({b'rev2': (b'rev1',), b'rev3': (b'rev2',)},
+                         cache.get_parent_map([b'rev1', b'rev2', b'rev3']))
+
+    def test_save_unchanged_does_not_write(self):
+        cache = self.make_cache()
+        cache.save()
+        self.assertPathDoesNotExist('cache/parents')
+
+
+class TestFindPresentRevisions(tests.TestCaseWithMemoryTransport):
+
+    def test_find_present_revisions(self):
+        t = self.get_transport()
+        index_sizes = {}
+        for name, revids in [(b'pack1', [b'rev1', b'rev2']),
+                             (b'pack2', [b'rev3'])]:
+            builder = btree_index.BTreeBuilder(key_elements=1,
+                                               reference_lists=1)
+            for revid in revids:
+                builder.add_node((revid,), b'', ([],))
+            index_sizes[name] = t.put_file(
+                name.decode('ascii') + '.rix', builder.finish())
+        self.assertEqual(
+            {b'rev1', b'rev3'},
+            parent_map_cache.find_present_revisions(
+                t, btree_index.BTreeGraphIndex, index_sizes,
+                [b'rev1', b'rev3', b'rev4']))
+
+
+class TestParsePackNames(tests.TestCase):
+
+    def test_btree(self):
+        builder = btree_index.BTreeBuilder(key_elements=1, reference_lists=0)
+        builder.add_node((b'pack1',), b'1 2 3 4')
+        builder.add_node((b'pack2',), b'5 6 7 8')
+        self.assertEqual(
+            {b'pack1', b'pack2'},
+            parent_map_cache.parse_pack_names(builder.finish().read()))
+
+    def test_graph_index(self):
+        builder = _mod_index.GraphIndexBuilder(key_elements=1)
+        builder.add_node((b'pack1',), b'1 2 3 4')
+        self.assertEqual(
+            {b'pack1'},
+            parent_map_cache.parse_pack_names(builder.finish().read()))
+
+    def test_read_pack_names(self):
+        builder = btree_index.BTreeBuilder(key_elements=1, reference_lists=0)
+        builder.add_node((b'pack1',), b'1 2 3 4')
+        builder.add_node((b'pack2',), b'5 6 7 8 9')
+        self.assertEqual(
+            (btree_index.BTreeGraphIndex, {b'pack1': 1, b'pack2': 5}),
+            parent_map_cache.read_pack_names(builder.finish().read()))
@@ -2233,6 +2233,50 @@ class TestBranchRevisionIdToRevno(RemoteBranchTestCase):
                           branch.revision_id_to_dotted_revno, b'revid')
         self.assertFinished(client)
 
+    def test_revision_ids_to_dotted_revnos(self):
+        transport = MemoryTransport()
+        client = FakeClient(transport.base)
+        client.add_expected_call(
+            b'Branch.get_stacked_on_url', (b'quack/',),
+            b'error', (b'NotStacked',),)
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'null:'),
+            b'success', (b'ok', b'0',),)
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'unknown'),
+            b'error', (b'NoSuchRevision', b'unknown',),)
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'ghosted'),
+            b'error', (b'GhostRevisionsHaveNoRevno', b'ghosted', b'ghost',))
+        client.add_expected_call(
+            b'Branch.revision_id_to_revno', (b'quack/', b'merged'),
+            b'success', (b'ok', b'1', b'1', b'2',),)
+        transport.mkdir('quack')
+        transport = transport.clone('quack')
+        branch = self.make_remote_branch(transport, client)
+        self.assertEqual(
+            {b'null:': (0,), b'merged': (1, 1, 2)},
+            branch.revision_ids_to_dotted_revnos(
+                [b'null:', b'unknown', b'ghosted', b'merged']))
+        self.assertFinished(client)
+
+    def test_revision_ids_to_dotted_revnos_pipelined(self):
+        self.setup_smart_server_with_call_log()
+        builder = self.make_branch_builder('.')
+        builder.build_commit(rev_id=b'rev1')
+        builder.build_commit(rev_id=b'rev2')
+        branch = Branch.open(self.get_url())
+        self.reset_smart_call_log()
+        self.assertEqual(
+            {b'rev1': (1,), b'rev2': (2,)},
+            branch.revision_ids_to_dotted_revnos(
+                [b'rev1', b'rev2', b'unknown']))
+        self.assertEqual(
+            [b'Medium.supports_pipelining'] +
+            [b'Branch.revision_id_to_revno'] * 3,
+            [call.call.method for call in self.hpss_calls])
+        self.assertTrue(branch._client._medium._supports_pipelining)
+
     def test_dotted_no_smart_verb(self):
         self.setup_smart_server_with_call_log()
         branch = self.make_branch('.')
@@ -2832,6 +2876,65 @@ class TestGetParentMapAllowsNew(tests.TestCaseWithTransport):
                          graph.get_parent_map([b'rev1']))
 
 
+class TestGetParentMapDiskCache(tests.TestCaseWithTransport):
+
+    def make_remote_repository(self):
+        self.setup_smart_server_with_call_log()
+        tree = self.make_branch_and_tree('.')
+        tree.commit('first', rev_id=b'rev1')
+        tree.commit('second', rev_id=b'rev2')
+        repo = repository.Repository.open(self.get_url())
+        self.reset_smart_call_log()
+        return repo
+
+    def get_parent_map_calls(self):
+        return [call for call in self.hpss_calls
+                if call.call.method == b'Repository.get_parent_map']
+
+    def test_reused_between_instances(self):
+        config.GlobalStack().set('repository.parents_cache', True)
+        repo = self.make_remote_repository()
+        with repo.lock_read():
+            self.assertEqual({b'rev2': (b'rev1',)},
+                             repo.get_parent_map([b'rev2']))
+        self.assertLength(1, self.get_parent_map_calls())
+        self.reset_smart_call_log()
+        repo = repository.Repository.open(self.get_url())
+        with repo.lock_read():
+            self.assertEqual({b'rev1': (b'null:',), b'rev2': (b'rev1',)},
+                             repo.get_parent_map([b'rev1', b'rev2']))
+        self.assertLength(0, self.get_parent_map_calls())
+
+    def test_checked_again_after_unlock(self):
+        config.GlobalStack().set('repository.parents_cache', True)
+        repo = self.make_remote_repository()
+        with repo.lock_read():
+            repo.get_parent_map([b'rev1', b'rev2'])
+        # Repack, so the packs the cache was built from are gone.
+        local_repo = repository.Repository.open('.')
+        local_repo.pack()
+        self.reset_smart_call_log()
+        with repo.lock_read():
+            self.assertEqual({b'rev1': (b'null:',), b'rev2': (b'rev1',)},
+                             repo.get_parent_map([b'rev1', b'rev2']))
+        # The revisions are found in the new pack, so the cache is kept.
+        self.assertLength(0, self.get_parent_map_calls())
+        self.assertEqual(
+            frozenset(name.encode('ascii')
+                      for name in local_repo._pack_collection.names()),
+            repo._disk_parents_cache._pack_names)
+
+    def test_disabled_by_default(self):
+        repo = self.make_remote_repository()
+        with repo.lock_read():
+            repo.get_parent_map([b'rev2'])
+        self.reset_smart_call_log()
+        repo = repository.Repository.open(self.get_url())
+        with repo.lock_read():
+            repo.get_parent_map([b'rev2'])
+        self.assertLength(1, self.get_parent_map_calls())
+
+
 class TestRepositoryGetRevisions(TestRemoteRepository):
 
     def test_hpss_missing_revision(self):
@@ -3083,6 +3186,41 @@ class TestRepositoryHasSignatureForRevisionId(TestRemoteRepository):
             client._calls)
         self.assertEqual(False, result)
 
+    def test_has_signatures_for_revision_ids(self):
+        transport_path = 'quack'
+        repo, client = self.setup_fake_client_and_repository(transport_path)
+        client.add_success_response(b'yes')
+        client.add_success_response(b'no')
+        result = repo._has_signatures_for_revision_ids([b'A', b'B'])
+        self.assertEqual(
+            [('call', b'Repository.has_signature_for_revision_id',
+              (b'quack/', b'A')),
+             ('call', b'Repository.has_signature_for_revision_id',
+              (b'quack/', b'B'))],
+            client._calls)
+        self.assertEqual({b'A'}, result)
+
+
+class TestRepositoryGetSignatureTexts(TestRemoteRepository):
+
+    def test_get_signature_texts(self):
+        transport_path = 'quack'
+        repo, client = self.setup_fake_client_and_repository(transport_path)
+        client.add_success_response_with_body(b'sig A', b'ok')
+        client.add_success_response_with_body(b'sig B', b'ok')
+        with repo.lock_read():
+            result = repo._get_signature_texts([b'A', b'B'])
+        self.assertEqual({b'A': b'sig A', b'B': b'sig B'}, result)
+
+    def test_get_signature_texts_missing(self):
+        transport_path = 'quack'
+        repo, client = self.setup_fake_client_and_repository(transport_path)
+        client.add_success_response_with_body(b'sig A', b'ok')
+        client.add_error_response(b'nosuchrevision', b'B')
+        with repo.lock_read():
+            self.assertRaises(
+                errors.NoSuchRevision, repo._get_signature_texts, [b'A', b'B'])
+
 
 class TestRepositoryPhysicalLockStatus(TestRemoteRepository):
 
@@ -29,6 +29,7 @@ from breezy.errors import (
     UnknownFormatError,
     )
 from breezy import (
+    config,
     tests,
     transport,
     )
@@ -563,6 +564,26 @@ class Test2a(tests.TestCaseWithMemoryTransport):
         index = repo.chk_bytes._index._graph_index._indices[0]
         self.assertEqual(btree_index._gcchk_factory, index._leaf_factory)
 
+    def test_compact_index_leaves(self):
+        config.GlobalStack().set('repository.compact_index_leaves', True)
+        mt = self.make_branch_and_memory_tree('test', format='2a')
+        mt.lock_write()
+        self.addCleanup(mt.unlock)
+        mt.add([''], [b'root-id'])
+        mt.commit('first', rev_id=b'first')
+        repo = mt.branch.repository.controldir.open_repository()
+        repo.lock_read()
+        self.addCleanup(repo.unlock)
+        for vf in [repo.revisions, repo.inventories, repo.texts]:
+            index = vf._index._graph_index._indices[0]
+            self.assertEqual(btree_index._CompactLeafNode,
+                             index._leaf_factory)
+        index = repo.signatures._index._graph_index._indices[0]
+        self.assertEqual(btree_index._LeafNode, index._leaf_factory)
+        index = repo.chk_bytes._index._graph_index._indices[0]
+        self.assertEqual(btree_index._gcchk_factory, index._leaf_factory)
+        self.assertEqual([b'first'], list(repo.get_parent_map([b'first'])))
+
     def test_fetch_combines_groups(self):
         builder = self.make_branch_builder('source', format='2a')
         builder.start_series()
@@ -641,6 +662,34 @@ class Test2a(tests.TestCaseWithMemoryTransport):
         self.assertFalse(combine[1] in final)
         self.assertSubset(to_keep, final)
 
+    def test_pack_with_workers(self):
+        builder = self.make_branch_builder('source', format='2a')
+        builder.start_series()
+        builder.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', '')),
+            ('add', ('file', b'file-id', 'file', b'content\n'))],
+            revision_id=b'1')
+        builder.build_snapshot([b'1'], [
+            ('modify', ('file', b'content-2\n'))],
+            revision_id=b'2')
+        builder.finish_series()
+        source = builder.get_branch().repository
+        pack_names = []
+        for workers in ['1', '2']:
+            config.GlobalStack().set('repository.pack_workers', workers)
+            target = self.make_repository('target-' + workers, format='2a')
+            target.fetch(source)
+            target.pack()
+            pack_names.append(target._pack_collection.names())
+            with target.lock_read():
+                record = next(target.texts.get_record_stream(
+                    [(b'file-id', b'2')], 'unordered', True))
+                self.assertEqual(b'content-2\n',
+                                 record.get_bytes_as('fulltext'))
+        # Small repositories give a single batch per stream, which is
+        # compressed exactly as it would be without workers.
+        self.assertEqual(pack_names[0], pack_names[1])
+
     def test_stream_source_to_gc(self):
         source = self.make_repository('source', format='2a')
         target = self.make_repository('target', format='2a')
@@ -1327,6 +1376,20 @@ class TestRepositoryPackCollection(TestCaseWithTransport):
         self.assertEqual(tree.branch.repository._pack_collection.names(),
                          packs.names())
 
+    def test_reset_closes_mmaps(self):
+        self.overrideAttr(btree_index, '_use_mmap', True)
+        self.overrideAttr(btree_index, '_MMAP_MIN_SIZE', 0)
+        tree = self.make_branch_and_tree('.', format='2a')
+        rev1 = tree.commit('one')
+        repo = repository.Repository.open('.')
+        with repo.lock_read():
+            self.assertEqual([rev1], list(repo.get_parent_map([rev1])))
+            index = repo._pack_collection.packs[0].revision_index
+            mapped = index._mmap
+            self.assertFalse(mapped.closed)
+        repo._pack_collection.reset()
+        self.assertTrue(mapped.closed)
+
     def test__save_pack_names(self):
         tree, r, packs, revs = self.make_packs_and_alt_repo(write_lock=True)
         names = packs.names()
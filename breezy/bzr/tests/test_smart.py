@@ -2348,6 +2348,15 @@ class TestSmartServerIsReadonly(tests.TestCaseWithMemoryTransport):
             smart_req.SmartServerResponse((b'yes',)), response)
 
 
+class TestSupportsPipeliningRequest(tests.TestCaseWithMemoryTransport):
+
+    def test_supports_pipelining(self):
+        backing = self.get_transport()
+        request = smart_req.SupportsPipeliningRequest(backing)
+        self.assertEqual(
+            smart_req.SmartServerResponse((b'yes',)), request.execute())
+
+
 class TestSmartServerRepositorySetMakeWorkingTrees(
         tests.TestCaseWithMemoryTransport):
 
@@ -2598,6 +2607,8 @@ class TestHandlers(tests.TestCase):
                                 smart_dir.SmartServerRequestOpenBranchV2)
         self.assertHandlerEqual(b'BzrDir.open_branchV3',
                                 smart_dir.SmartServerRequestOpenBranchV3)
+        self.assertHandlerEqual(b'Medium.supports_pipelining',
+                                smart_req.SupportsPipeliningRequest)
         self.assertHandlerEqual(b'PackRepository.autopack',
                                 smart_packrepo.SmartServerPackRepositoryAutopack)
         self.assertHandlerEqual(b'Repository.add_signature_text',
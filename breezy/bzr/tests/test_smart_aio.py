@@ -0,0 +1,168 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the asyncio smart server."""
+
+import socket
+import threading
+
+from ... import (
+    config,
+    controldir,
+    errors,
+    tests,
+    )
+from ...transport import (
+    NoSuchFile,
+    get_transport_from_url,
+    memory,
+    remote,
+    )
+from ..remote import RemoteRepository
+from ..smart import (
+    aio,
+    client,
+    medium,
+    )
+
+
+class AsyncioServerTestCase(tests.TestCase):
+
+    def start_server(self, **kwargs):
+        mem_server = memory.MemoryServer()
+        mem_server.start_server()
+        self.addCleanup(mem_server.stop_server)
+        self.permit_url(mem_server.get_url())
+        self.backing_transport = get_transport_from_url(mem_server.get_url())
+        kwargs.setdefault('client_timeout', 4.0)
+        self.server = aio.AsyncioSmartTCPServer(
+            self.backing_transport, **kwargs)
+        self.server.start_server('127.0.0.1', 0)
+        self.server.start_background_thread('-' + self.id())
+        self.addCleanup(self.server.stop_background_thread)
+        self.permit_url(self.server.get_url())
+
+    def connect(self):
+        sock = socket.create_connection(
+            self.server._server_socket.getsockname())
+        self.addCleanup(sock.close)
+        return sock
+
+
+class TestAsyncioSmartTCPServer(AsyncioServerTestCase):
+
+    def test_protocol_one_hello(self):
+        self.start_server()
+        sock = self.connect()
+        sock.sendall(b'hello\n')
+        self.assertEqual(b'ok\x012\n', sock.recv(5))
+
+    def test_threaded_client(self):
+        self.start_server()
+        self.backing_transport.put_bytes('foo', b'contents of foo\n')
+        t = remote.RemoteTCPTransport(self.server.get_url())
+        self.addCleanup(t.disconnect)
+        self.assertTrue(t.has('foo'))
+        self.assertFalse(t.has('bar'))
+        self.assertEqual(b'contents of foo\n', t.get_bytes('foo'))
+        t.put_bytes('bar', b'x' * 200000)
+        self.assertEqual(b'x' * 200000, self.backing_transport.get_bytes('bar'))
+        self.assertRaises(NoSuchFile, t.get_bytes, 'missing')
+
+    def test_idle_clients_do_not_use_threads(self):
+        self.start_server(max_workers=2)
+        before = threading.active_count()
+        socks = [self.connect() for i in range(20)]
+        for sock in socks:
+            sock.sendall(b'hello\n')
+        for sock in socks:
+            self.assertEqual(b'ok\x012\n', sock.recv(5))
+        self.assertEqual(20, len(self.server._active_connections))
+        self.assertTrue(threading.active_count() <= before + 2)
+
+    def test_idle_client_times_out(self):
+        self.start_server(client_timeout=0.1)
+        sock = self.connect()
+        self.assertEqual(b'', sock.recv(1))
+
+    def test_stop_gracefully_disconnects_idle_clients(self):
+        self.start_server()
+        sock = self.connect()
+        sock.sendall(b'hello\n')
+        self.assertEqual(b'ok\x012\n', sock.recv(5))
+        self.server._stop_gracefully()
+        self.assertEqual(b'', sock.recv(1))
+        self.server._fully_stopped.wait()
+        self.assertRaises(OSError, self.connect)
+
+
+class TestAsyncioSmartTCPServerClients(AsyncioServerTestCase):
+    """The client media of breezy talk to the asyncio server."""
+
+    def make_client(self):
+        host, port = self.server._server_socket.getsockname()
+        client_medium = medium.SmartTCPClientMedium(
+            host, port, self.server.get_url())
+        self.addCleanup(client_medium.disconnect)
+        return client._SmartClient(client_medium)
+
+    def test_streamed_body(self):
+        self.start_server()
+        self.backing_transport.put_bytes('foo', b'foo\n' * 100000)
+        smart_client = self.make_client()
+        response, handler = smart_client.call_expecting_body(b'get', b'foo')
+        self.assertEqual((b'ok',), response)
+        self.assertEqual(b'foo\n' * 100000,
+                         b''.join(handler.read_streamed_body()))
+        # The connection can be reused once the body has been read.
+        self.assertEqual((b'yes',), smart_client.call(b'has', b'foo'))
+
+    def test_error(self):
+        self.start_server()
+        smart_client = self.make_client()
+        e = self.assertRaises(errors.ErrorFromSmartServer,
+                              smart_client.call_expecting_body,
+                              b'get', b'missing')
+        self.assertEqual(b'NoSuchFile', e.error_tuple[0])
+        # The connection is still usable after an error response.
+        self.assertEqual((b'ok', b'2'), smart_client.call(b'hello'))
+
+    def test_remote_repository(self):
+        self.start_server()
+        a_dir = controldir.format_registry.make_controldir(
+            '2a').initialize_on_transport(self.backing_transport)
+        a_dir.create_repository()
+        repo = controldir.ControlDir.open(
+            self.server.get_url()).open_repository()
+        self.addCleanup(repo._client._medium.disconnect)
+        self.assertIsInstance(repo, RemoteRepository)
+        with repo.lock_read():
+            self.assertEqual([], list(repo.all_revision_ids()))
+
+
+class TestAsyncioBzrServerFactory(tests.TestCase):
+
+    def test_make_smart_server(self):
+        config.GlobalStack().set('serve.max_workers', 3)
+        factory = aio.AsyncioBzrServerFactory()
+        factory.transport = memory.MemoryTransport()
+        factory._make_smart_server('127.0.0.1', 0, False, 2.0)
+        smart_server = factory.smart_server
+        self.addCleanup(smart_server._server_socket.close)
+        self.assertIsInstance(smart_server, aio.AsyncioSmartTCPServer)
+        self.assertEqual(3, smart_server.max_workers)
+        self.assertEqual(2.0, smart_server._client_timeout)
+        self.assertNotEqual(0, smart_server.port)
@@ -780,6 +780,32 @@ class TestSmartClientStreamMediumRequest(tests.TestCase):
                 raise
         req = client_medium.get_request()
 
+    def test_get_pipelined_requests(self):
+        output = BytesIO()
+        client_medium = medium.SmartSimplePipesClientMedium(
+            None, output, 'base')
+        first, second = client_medium.get_pipelined_requests(2)
+        self.assertRaises(medium.TooManyConcurrentRequests,
+                          client_medium.get_request)
+        first.accept_bytes(b'1')
+        first.finished_writing()
+        second.accept_bytes(b'2')
+        second.finished_writing()
+        self.assertEqual(b'12', output.getvalue())
+        # Responses are read in the order the requests were sent.
+        self.assertRaises(AssertionError, second.read_bytes, 1)
+        first.finished_reading()
+        second.finished_reading()
+        client_medium.get_request()
+
+    def test_get_pipelined_requests_while_request_active(self):
+        output = BytesIO()
+        client_medium = medium.SmartSimplePipesClientMedium(
+            None, output, 'base')
+        client_medium.get_request()
+        self.assertRaises(medium.TooManyConcurrentRequests,
+                          client_medium.get_pipelined_requests, 2)
+
 
 class RemoteTransportTests(test_smart.TestCaseWithSmartMedium):
 
@@ -1390,6 +1416,89 @@ class TestSmartTCPServer(tests.TestCase):
         server._poll_active_connections(0.1)
         self.assertEqual(0, len(server._active_connections))
 
+    def test_serve_conn_queues_when_busy(self):
+        t = _mod_transport.get_transport_from_url('memory:///')
+        server = _mod_server.SmartTCPServer(
+            t, client_timeout=4.0, max_connections=1)
+        server_sock1, client_sock1 = portable_socket_pair()
+        server_sock2, client_sock2 = portable_socket_pair()
+        self.addCleanup(self.ensure_client_disconnected, client_sock2)
+        thread = server.serve_conn(server_sock1, '-%s' % (self.id(),))
+        self.assertIsNot(None, thread)
+        self.assertIs(None, server.serve_conn(server_sock2, '-%s' % (self.id(),)))
+        self.assertEqual({'active': 1, 'queued': 1, 'rejected': 0},
+                         server.connection_stats())
+        # When the first client goes away, its worker thread picks up the
+        # queued connection.
+        client_sock1.close()
+        self.say_hello(client_sock2)
+        self.assertEqual({'active': 1, 'queued': 0, 'rejected': 0},
+                         server.connection_stats())
+        [(handler, server_side_thread)] = server._active_connections
+        self.assertIs(thread, server_side_thread)
+        client_sock2.close()
+        thread.join()
+        server._poll_active_connections()
+        self.assertEqual({'active': 0, 'queued': 0, 'rejected': 0},
+                         server.connection_stats())
+
+    def test_serve_conn_rejects_when_queue_full(self):
+        server = _mod_server.SmartTCPServer(
+            None, client_timeout=4.0, max_connections=1, max_queued=0)
+        server_sock1, client_sock1 = portable_socket_pair()
+        server_sock2, client_sock2 = portable_socket_pair()
+        self.addCleanup(self.ensure_client_disconnected, client_sock2)
+        thread = server.serve_conn(server_sock1, '-%s' % (self.id(),))
+        self.assertIs(None, server.serve_conn(server_sock2, '-%s' % (self.id(),)))
+        # The server hung up on the rejected client.
+        self.assertEqual(b'', client_sock2.recv(1))
+        self.assertEqual({'active': 1, 'queued': 0, 'rejected': 1},
+                         server.connection_stats())
+        client_sock1.close()
+        thread.join()
+
+    def test_poll_drops_connections_queued_too_long(self):
+        server = _mod_server.SmartTCPServer(
+            None, client_timeout=4.0, max_connections=1)
+        now = [1000.0]
+        server._timer = lambda: now[0]
+        server_sock1, client_sock1 = portable_socket_pair()
+        server_sock2, client_sock2 = portable_socket_pair()
+        self.addCleanup(self.ensure_client_disconnected, client_sock1)
+        self.addCleanup(self.ensure_client_disconnected, client_sock2)
+        server.serve_conn(server_sock1, '-%s' % (self.id(),))
+        server.serve_conn(server_sock2, '-%s' % (self.id(),))
+        server._poll_active_connections()
+        self.assertEqual(1, len(server._queued_connections))
+        now[0] += 5.0
+        server._poll_active_connections()
+        self.assertEqual(0, len(server._queued_connections))
+        self.assertEqual(b'', client_sock2.recv(1))
+        client_sock1.close()
+        server._poll_active_connections(0.1)
+        self.assertEqual(0, len(server._active_connections))
+
+    def test_connections_changed_hook(self):
+        calls = []
+        _mod_server.SmartTCPServer.hooks.install_named_hook(
+            'connections_changed',
+            lambda server, stats: calls.append((server, stats)), None)
+        server = _mod_server.SmartTCPServer(
+            None, client_timeout=4.0, max_connections=1, max_queued=0)
+        server_sock1, client_sock1 = portable_socket_pair()
+        server_sock2, client_sock2 = portable_socket_pair()
+        self.addCleanup(self.ensure_client_disconnected, client_sock2)
+        server.serve_conn(server_sock1, '-%s' % (self.id(),))
+        server.serve_conn(server_sock2, '-%s' % (self.id(),))
+        self.assertEqual(
+            [(server, {'active': 1, 'queued': 0, 'rejected': 0}),
+             (server, {'active': 1, 'queued': 0, 'rejected': 1})],
+            calls)
+        client_sock1.close()
+        server._poll_active_connections(0.1)
+        self.assertEqual(
+            (server, {'active': 0, 'queued': 0, 'rejected': 1}), calls[-1])
+
     def test_serve_closes_out_finished_connections(self):
         server, server_thread = self.make_server()
         # The server is started, connect to it.
@@ -1541,9 +1650,56 @@ class SmartTCPTests(tests.TestCase):
             del self.transport
         if getattr(self, 'server', None):
             self.server.stop_background_thread()
+            # Wait for the connection threads, which finish once they notice
+            # that their client has disconnected.
+            for handler, thread in self.server._active_connections:
+                thread.join()
             del self.server
 
 
+class TestPipelinedRequests(SmartTCPTests):
+
+    def test_call_pipelined(self):
+        self.start_server()
+        self.backing_transport.put_bytes('foo', b'contents of foo')
+        client = self.transport._client
+        results = client.call_pipelined(
+            [(b'has', (b'foo',)), (b'has', (b'bar',)), (b'hello', ())])
+        self.assertEqual([(b'yes',), (b'no',), (b'ok', b'2')], results)
+        self.assertTrue(self.transport.get_smart_medium()._supports_pipelining)
+
+    def test_call_pipelined_expecting_body(self):
+        self.start_server()
+        self.backing_transport.put_bytes('foo', b'foo' * 10000)
+        self.backing_transport.put_bytes('bar', b'bar')
+        client = self.transport._client
+        results = client.call_pipelined(
+            [(b'get', (b'foo',)), (b'get', (b'missing',)),
+             (b'get', (b'bar',))], expect_body=True)
+        self.assertEqual(((b'ok',), b'foo' * 10000), results[0])
+        self.assertIsInstance(results[1], errors.ErrorFromSmartServer)
+        self.assertEqual(b'NoSuchFile', results[1].error_tuple[0])
+        self.assertEqual(((b'ok',), b'bar'), results[2])
+        # The medium is usable for normal requests afterwards.
+        self.assertEqual(b'bar', self.transport.get_bytes('bar'))
+
+    def test_call_pipelined_batches(self):
+        self.start_server()
+        client = self.transport._client
+        client._max_pipelined_requests = 2
+        results = client.call_pipelined([(b'hello', ())] * 5)
+        self.assertEqual([(b'ok', b'2')] * 5, results)
+
+    def test_unsupported_by_server(self):
+        self.disable_verb(b'Medium.supports_pipelining')
+        self.start_server()
+        client = self.transport._client
+        results = client.call_pipelined([(b'hello', ())] * 2)
+        self.assertEqual([(b'ok', b'2')] * 2, results)
+        self.assertFalse(
+            self.transport.get_smart_medium()._supports_pipelining)
+
+
 class TestServerSocketUsage(SmartTCPTests):
 
     def test_server_start_stop(self):
@@ -461,3 +461,31 @@ class TestBuildTree(TestCaseWithTransport):
         self.assertEqual(entry2_sha, target.get_file_sha1('dir/file2'))
         self.assertEqual(entry1_state, entry1[1][0])
         self.assertEqual(entry2_state, entry2[1][0])
+
+    def test_build_tree_workers(self):
+        source = self.make_branch_and_tree('source')
+        self.build_tree(['source/file%d' % i for i in range(20)]
+                        + ['source/dir/', 'source/dir/file'])
+        source.add(['file%d' % i for i in range(20)] + ['dir', 'dir/file'])
+        os.chmod('source/file1', 0o755)
+        source.commit('new files')
+        target = self.make_branch_and_tree('target')
+        target.get_config_stack().set('bzr.workingtree.build_workers', 3)
+        target.lock_write()
+        self.addCleanup(target.unlock)
+        state = target.current_dirstate()
+        state._cutoff_time = time.time() + 60
+        build_tree(source.basis_tree(), target)
+        for i in range(20):
+            with open('target/file%d' % i, 'rb') as f:
+                self.assertEqual(
+                    b'contents of source/file%d\n' % i, f.read())
+        self.assertFileEqual(b'contents of source/dir/file\n',
+                             'target/dir/file')
+        self.assertTrue(target.is_executable('file1'))
+        self.assertFalse(target.is_executable('file2'))
+        # The files written by the workers have their sha1 cached too.
+        entry = state._get_entry(0, path_utf8=b'dir/file')
+        self.assertEqual(osutils.sha_file_by_name('source/dir/file'),
+                         entry[1][0][1])
+        self.assertEqual([], list(target.iter_changes(source.basis_tree())))
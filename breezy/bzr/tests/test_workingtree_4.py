@@ -18,10 +18,13 @@
 """Tests for WorkingTreeFormat4"""
 
 import os
+import threading
 import time
 
 from ... import (
     errors,
+    filters,
+    fsmonitor,
     osutils,
     )
 from .. import (
@@ -32,6 +35,7 @@ from .. import (
     )
 from ...lockdir import LockDir
 from ...tests import TestCaseWithTransport, TestSkipped, features
+from ...tests.test_fsmonitor import FakeDaemon
 from ...tree import InterTree
 
 
@@ -667,6 +671,247 @@ class TestWorkingTreeFormat4(TestCaseWithTransport):
         self.assertEqual([], changes)
         self.assertEqual([b'', b'versioned', b'versioned2'], returned)
 
+    def test_iter_changes_hash_workers(self):
+        """With hash_workers, stale files are hashed by worker threads."""
+        tree = self.make_branch_and_tree('tree')
+        files = ['tree/a', 'tree/b'] + ['tree/dir/f%d' % i for i in range(10)]
+        self.build_tree(['tree/dir/'] + files)
+        tree.smart_add(['tree'])
+        tree.commit('one')
+        self.build_tree_contents([('tree/a', b'changed\n'),
+                                  ('tree/dir/f3', b'changed\n')])
+        for path in files:
+            os.utime(path, (1000000000, 1000000000))
+        hashed = self.record_hashing()
+
+        def changes():
+            with tree.lock_read():
+                return [(c.path, c.changed_content)
+                        for c in tree.iter_changes(tree.basis_tree())]
+        expected = changes()
+        self.assertEqual([(('a', 'a'), True), (('dir/f3', 'dir/f3'), True)],
+                         expected)
+        self.assertEqual([True] * len(files), list(hashed.values()))
+        hashed.clear()
+        tree.get_config_stack().set('bzr.workingtree.hash_workers', 2)
+        with tree.lock_read():
+            self.move_cutoff_time(tree)
+            self.assertEqual(expected, [
+                (c.path, c.changed_content)
+                for c in tree.iter_changes(tree.basis_tree())])
+        self.assertEqual([False] * len(files), list(hashed.values()))
+
+    def move_cutoff_time(self, tree):
+        """Hash files changed since the cutoff time was moved ahead.
+
+        The ctime of the files can not be set, so they would be changed too
+        recently to be hashed by update_entry.
+        """
+        state = tree.current_dirstate()
+        state._sha_cutoff_time()
+        state._cutoff_time += 10
+
+    def record_hashing(self):
+        """Record which files are hashed, and whether on the main thread.
+
+        :return: A dict mapping the names of the files hashed to whether
+            they were hashed on the main thread.
+        """
+        hashed = {}
+
+        def record(orig):
+            def hash(provider, abspath):
+                hashed[osutils.basename(osutils.safe_unicode(abspath))] = (
+                    threading.current_thread() is threading.main_thread())
+                return orig(provider, abspath)
+            return hash
+        for cls in [workingtree_4.ContentFilterAwareSHA1Provider,
+                    dirstate.DefaultSHA1Provider]:
+            for name in ['sha1', 'stat_and_sha1']:
+                self.overrideAttr(cls, name, record(getattr(cls, name)))
+        return hashed
+
+    def test_iter_changes_hash_workers_skipped(self):
+        """Content filtered and recently changed files are not hashed ahead."""
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/b', 'tree/c'])
+        tree.smart_add(['tree'])
+        tree.commit('one')
+        self.build_tree_contents([('tree/a', b'changed a\n'),
+                                  ('tree/b', b'changed b\n'),
+                                  ('tree/c', b'changed c\n')])
+        # Filters that don't change the contents.
+        tree._content_filter_stack = lambda path=None: (
+            [filters.ContentFilter(lambda chunks: chunks, None)]
+            if path == 'b' else [])
+        hashed = self.record_hashing()
+        tree.get_config_stack().set('bzr.workingtree.hash_workers', 2)
+        # All of the files were changed within the cutoff window.
+        with tree.lock_read():
+            self.assertEqual(['a', 'b', 'c'], [
+                c.path[1] for c in tree.iter_changes(tree.basis_tree())])
+        self.assertEqual({'a': True, 'b': True, 'c': True}, hashed)
+        hashed.clear()
+        with tree.lock_read():
+            self.move_cutoff_time(tree)
+            self.assertEqual(['a', 'b', 'c'], [
+                c.path[1] for c in tree.iter_changes(tree.basis_tree())])
+        self.assertEqual({'a': False, 'b': True, 'c': False}, hashed)
+
+    def test_iter_changes_walk_workers(self):
+        """With walk_workers, directories are read by worker threads."""
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/dir/', 'tree/dir/b', 'tree/dir/sub/',
+                         'tree/dir/sub/c', 'tree/other/', 'tree/other/d'])
+        tree.smart_add(['tree'])
+        tree.commit('one')
+        self.build_tree(['tree/dir/sub/unknown', 'tree/other/e/'])
+        self.build_tree_contents([('tree/dir/b', b'changed\n')])
+        tree.remove(['other/d'], keep_files=False)
+        walkers = []
+
+        def walkdirs(top, prefix=b'', workers=4):
+            walkers.append(workers)
+            return orig(top, prefix, workers)
+        orig = self.overrideAttr(osutils, '_walkdirs_utf8_concurrent',
+                                 walkdirs)
+
+        def changes():
+            with tree.lock_read():
+                return [c.path for c in tree.iter_changes(
+                    tree.basis_tree(), want_unversioned=True)]
+        expected = changes()
+        self.assertEqual(
+            [('dir/b', 'dir/b'), (None, 'dir/sub/unknown'),
+             ('other/d', None), (None, 'other/e')], sorted(
+                 expected, key=lambda p: p[0] or p[1]))
+        self.assertEqual([], walkers)
+        tree.get_config_stack().set('bzr.workingtree.walk_workers', 3)
+        self.assertEqual(expected, changes())
+        self.assertEqual([3], walkers)
+        # 0 means one per CPU.
+        self.overrideAttr(os, 'cpu_count', lambda: 2)
+        tree.get_config_stack().set('bzr.workingtree.walk_workers', 0)
+        self.assertEqual(expected, changes())
+        self.assertEqual([3, 2], walkers)
+
+    def test_iter_changes_specific_files_reads_part_of_dirstate(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/b/', 'tree/b/c', 'tree/d/',
+                         'tree/d/e'])
+        tree.add(['a', 'b', 'b/c', 'd', 'd/e'])
+        tree.commit('one')
+        tree.rename_one('d/e', 'b/e')
+        self.build_tree_contents([('tree/a', b'changed\n'),
+                                  ('tree/b/c', b'changed\n')])
+
+        def read_dirblocks(state):
+            self.fail('read all of the dirstate')
+        self.overrideAttr(dirstate, '_read_dirblocks', read_dirblocks)
+        with tree.lock_read():
+            self.assertEqual(
+                [('b/c', 'b/c'), ('d/e', 'b/e')],
+                sorted(c.path for c in tree.iter_changes(
+                    tree.basis_tree(), specific_files=['b'])))
+            self.assertIsNot(None, tree.path2id('a'))
+            self.assertTrue(tree.current_dirstate()._dirblocks_partial)
+
+    def test_path2id_reads_part_of_dirstate(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/b/', 'tree/b/c'])
+        tree.add(['a', 'b', 'b/c'], ids=[b'a-id', b'b-id', b'c-id'])
+        tree.commit('one')
+
+        def read_dirblocks(state):
+            self.fail('read all of the dirstate')
+        self.overrideAttr(dirstate, '_read_dirblocks', read_dirblocks)
+        with tree.lock_read():
+            self.assertEqual(b'c-id', tree.path2id('b/c'))
+            self.assertTrue(tree.is_versioned('a'))
+            self.assertFalse(tree.is_versioned('b/missing'))
+            self.assertTrue(tree.current_dirstate()._dirblocks_partial)
+
+    def make_monitored_tree(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree(['tree/a', 'tree/b', 'tree/dir/', 'tree/dir/c'])
+        tree.add(['a', 'b', 'dir', 'dir/c'])
+        tree.commit('one')
+        tree.get_config_stack().set('bzr.workingtree.fsmonitor', True)
+        daemon = FakeDaemon(self)
+        self.overrideAttr(fsmonitor, 'socket_path', lambda tree: daemon.path)
+        return tree, daemon
+
+    def changed_paths(self, tree):
+        with tree.lock_read():
+            return sorted(
+                c.path[1] or c.path[0] for c in
+                tree.iter_changes(tree.basis_tree(), want_unversioned=True))
+
+    def test_iter_changes_fsmonitor(self):
+        tree, daemon = self.make_monitored_tree()
+        self.assertEqual([], self.changed_paths(tree))
+        self.assertTrue(tree._transport.has('fsmonitor'))
+        # Changes the daemon does not report are not looked for.
+        self.build_tree_contents([('tree/b', b'changed\n')])
+        self.assertEqual([], self.changed_paths(tree))
+        self.build_tree_contents([('tree/a', b'changed\n'), ('tree/new/',),
+                                  ('tree/new/d', b'new\n')])
+        daemon.changes.record(b'a')
+        daemon.changes.record(b'new/d')
+        self.assertEqual(['a', 'new'], self.changed_paths(tree))
+        # The changes found last time are looked at again.
+        self.assertEqual(['a', 'new'], self.changed_paths(tree))
+        # Changing the dirstate makes the next comparison walk the tree.
+        tree.add(['new'])
+        self.assertFalse(tree._transport.has('fsmonitor'))
+        self.assertEqual(['a', 'b', 'new', 'new/d'], self.changed_paths(tree))
+        self.assertTrue(tree._transport.has('fsmonitor'))
+
+    def test_iter_changes_fsmonitor_hashes_kept(self):
+        tree, daemon = self.make_monitored_tree()
+        self.assertEqual([], self.changed_paths(tree))
+        # Updating the cached hashes does not throw the state away.
+        with tree.lock_write():
+            state = tree.current_dirstate()
+            state._read_dirblocks_if_needed()
+            state._mark_modified([state._get_entry(0, path_utf8=b'a')])
+        self.assertTrue(tree._transport.has('fsmonitor'))
+
+    def test_iter_changes_fsmonitor_disabled(self):
+        tree, daemon = self.make_monitored_tree()
+        tree.get_config_stack().set('bzr.workingtree.fsmonitor', False)
+        self.build_tree_contents([('tree/b', b'changed\n')])
+        self.assertEqual(['b'], self.changed_paths(tree))
+        self.assertFalse(tree._transport.has('fsmonitor'))
+
+    def test_iter_changes_fsmonitor_unavailable(self):
+        tree, daemon = self.make_monitored_tree()
+        self.overrideAttr(fsmonitor, 'available', lambda: False)
+        self.assertEqual([], self.changed_paths(tree))
+        self.assertFalse(tree._transport.has('fsmonitor'))
+
+    def test_iter_changes_fsmonitor_unwritable(self):
+        tree, daemon = self.make_monitored_tree()
+
+        def put_bytes(*args, **kwargs):
+            raise errors.PermissionDenied('fsmonitor')
+        self.overrideAttr(tree._transport, 'put_bytes', put_bytes)
+        self.assertEqual([], self.changed_paths(tree))
+
+    def test_iter_changes_fsmonitor_overflow(self):
+        tree, daemon = self.make_monitored_tree()
+        self.assertEqual([], self.changed_paths(tree))
+        self.build_tree_contents([('tree/b', b'changed\n')])
+        daemon.changes.overflow()
+        self.assertEqual(['b'], self.changed_paths(tree))
+
+    def test_iter_changes_fsmonitor_no_daemon(self):
+        tree, daemon = self.make_monitored_tree()
+        daemon.stop()
+        self.build_tree_contents([('tree/b', b'changed\n')])
+        self.assertEqual(['b'], self.changed_paths(tree))
+        self.assertFalse(tree._transport.has('fsmonitor'))
+
     def test_iter_changes_unversioned_error(self):
         """ Check if a PathsNotVersionedError is correctly raised and the
             paths list contains all unversioned entries only.
@@ -15,6 +15,8 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import collections
+from concurrent import futures
 import contextlib
 import errno
 import os
@@ -1272,6 +1274,51 @@ class DiskTreeTransform(TreeTransformBase):
         if sha1 is not None:
             self._observed_sha1s[trans_id] = (sha1, osutils.lstat(name))
 
+    def create_files(self, files, workers=1):
+        """Schedule creation of many new files.
+
+        This is like calling create_file for each file, but with more than
+        one worker the files are written by that many threads while the
+        contents of the next ones are produced.
+
+        :param files: An iterable of (trans_id, contents, sha1) tuples, with
+            the arguments to create_file for each file.
+        :param workers: The number of threads to write the files with.
+        """
+        if workers <= 1:
+            for trans_id, contents, sha1 in files:
+                self.create_file(contents, trans_id, sha1=sha1)
+            return
+        if self._creation_mtime is None:
+            self._creation_mtime = time.time()
+        # Limit the number of contents held in memory waiting to be written.
+        pending = collections.deque()
+        with futures.ThreadPoolExecutor(workers) as executor:
+            for trans_id, contents, sha1 in files:
+                name = self._limbo_name(trans_id)
+                unique_add(self._new_contents, trans_id, 'file')
+                pending.append((trans_id, sha1, executor.submit(
+                    self._write_file, trans_id, name, list(contents),
+                    sha1 is not None)))
+                if len(pending) > workers * 4:
+                    self._wrote_file(*pending.popleft())
+            while pending:
+                self._wrote_file(*pending.popleft())
+
+    def _write_file(self, trans_id, name, chunks, stat):
+        """Write a file in limbo for create_files, in a worker thread."""
+        with open(name, 'wb') as f:
+            f.writelines(chunks)
+        os.utime(name, (self._creation_mtime, self._creation_mtime))
+        self._set_mode(trans_id, None, S_ISREG)
+        if stat:
+            return osutils.lstat(name)
+
+    def _wrote_file(self, trans_id, sha1, future):
+        stat_value = future.result()
+        if sha1 is not None:
+            self._observed_sha1s[trans_id] = (sha1, stat_value)
+
     def _read_symlink_target(self, trans_id):
         return os.readlink(self._limbo_name(trans_id))
 
@@ -2464,11 +2511,18 @@ def _create_files(tt, tree, desired_files, pb, offset, accelerator_tree,
                     tt.create_file(chunks, trans_id, sha1=text_sha1)
             count += 1
         offset += count
-    for count, ((trans_id, tree_path, text_sha1), contents) in enumerate(
-            tree.iter_files_bytes(new_desired_files)):
-        if wt.supports_content_filtering():
-            filters = wt._content_filter_stack(tree_path)
-            contents = filtered_output_bytes(contents, filters,
-                                             ContentFilterContext(tree_path, tree))
-        tt.create_file(contents, trans_id, sha1=text_sha1)
-        pb.update(gettext('Adding file contents'), count + offset, total)
+
+    def iter_contents():
+        for count, ((trans_id, tree_path, text_sha1), contents) in enumerate(
+                tree.iter_files_bytes(new_desired_files)):
+            if wt.supports_content_filtering():
+                filters = wt._content_filter_stack(tree_path)
+                contents = filtered_output_bytes(
+                    contents, filters, ContentFilterContext(tree_path, tree))
+            yield trans_id, contents, text_sha1
+            pb.update(gettext('Adding file contents'), count + offset, total)
+
+    workers = wt.get_config_stack().get('bzr.workingtree.build_workers')
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    tt.create_files(iter_contents(), workers)
@@ -118,6 +118,9 @@ class VersionedFileCommitBuilder(CommitBuilder):
         except IndexError:
             basis_id = _mod_revision.NULL_REVISION
         self.basis_delta_revision = basis_id
+        # The inventory of basis_delta_revision, once record_iter_changes
+        # has read it.
+        self._basis_inv = None
         self._new_inventory = None
         self._basis_delta = []
         self.__heads = graph.HeadsCache(repository.get_graph()).heads
@@ -241,7 +244,7 @@ class VersionedFileCommitBuilder(CommitBuilder):
         basis_id = self.basis_delta_revision
         self.inv_sha1, self._new_inventory = self.repository.add_inventory_by_delta(
             basis_id, self._basis_delta, self._new_revision_id,
-            self.parents)
+            self.parents, basis_inv=self._basis_inv)
         return self._new_revision_id
 
     def _gen_revision_id(self):
@@ -444,13 +447,19 @@ class VersionedFileCommitBuilder(CommitBuilder):
                 file_id = change.file_id
                 entry = _entry_factory[kind](file_id, change.name[1],
                                              change.parent_id[1])
-                head_set = self._heads(change.file_id, set(head_candidates))
-                heads = []
-                # Preserve ordering.
-                for head_candidate in head_candidates:
-                    if head_candidate in head_set:
-                        heads.append(head_candidate)
-                        head_set.remove(head_candidate)
+                if len(head_candidates) < 2:
+                    # A single candidate is its own head, which is always the
+                    # case when there is only one parent.
+                    heads = list(head_candidates)
+                else:
+                    head_set = self._heads(
+                        change.file_id, set(head_candidates))
+                    heads = []
+                    # Preserve ordering.
+                    for head_candidate in head_candidates:
+                        if head_candidate in head_set:
+                            heads.append(head_candidate)
+                            head_set.remove(head_candidate)
                 carried_over = False
                 if len(heads) == 1:
                     # Could be a carry-over situation:
@@ -578,6 +587,10 @@ class VersionedFileCommitBuilder(CommitBuilder):
             # housekeeping root entry changes do not affect no-change commits.
             self._require_root_change(tree)
         self.basis_delta_revision = basis_revision_id
+        if basis_tree.get_revision_id() == basis_revision_id:
+            # Saves finish_inventory reading it again, and keeps the parts
+            # of it that were read above.
+            self._basis_inv = basis_inv
 
     def _add_file_to_weave(self, file_id, fileobj, parents, nostore_sha, size):
         parent_keys = tuple([(file_id, parent) for parent in parents])
@@ -37,6 +37,7 @@ from breezy import (
     controldir,
     debug,
     filters as _mod_filters,
+    fsmonitor,
     osutils,
     revisiontree,
     trace,
@@ -149,6 +150,19 @@ class DirStateWorkingTree(InventoryWorkingTree):
                 state.add(f, file_id, kind, None, b'')
             self._make_dirty(reset_inventory=True)
 
+    def _invalidate_fsmonitor(self):
+        """Forget the fsmonitor state if the dirstate was changed.
+
+        Only changes to the cached hashes are allowed for; see
+        _FSMonitorQuery.
+        """
+        state = self._dirstate
+        if state is None:
+            return
+        if (state._header_state == dirstate.DirState.IN_MEMORY_MODIFIED or
+                state._dirblock_state == dirstate.DirState.IN_MEMORY_MODIFIED):
+            _FSMonitorQuery.invalidate(self)
+
     def _get_check_refs(self):
         """Return the references needed to perform a check of this tree."""
         return [('trees', self.last_revision())]
@@ -312,6 +326,7 @@ class DirStateWorkingTree(InventoryWorkingTree):
         """Write all cached data to disk."""
         if self._control_files._lock_mode != 'w':
             raise errors.NotWriteLocked(self)
+        self._invalidate_fsmonitor()
         self.current_dirstate().save()
         self._inventory = None
         self._dirty = False
@@ -572,6 +587,29 @@ class DirStateWorkingTree(InventoryWorkingTree):
                     # path is missing on disk.
                     continue
 
+    def get_containing_nested_tree(self, path):
+        """See Tree.get_containing_nested_tree().
+
+        Only the directories containing path are looked up, so this does not
+        need all of the dirstate.
+        """
+        if not self._repo_supports_tree_reference:
+            return None, None
+        with self.lock_read():
+            parts = path.split('/')
+            for i in range(1, len(parts)):
+                nested_path = '/'.join(parts[:i])
+                if self._get_entry(path=nested_path) == (None, None):
+                    # Nothing below an unversioned directory is versioned.
+                    break
+                try:
+                    if self.kind(nested_path) == 'tree-reference':
+                        return (self.get_nested_tree(nested_path),
+                                '/'.join(parts[i:]))
+                except NoSuchFile:
+                    break
+            return None, None
+
     def _observed_sha1(self, path, sha_and_stat):
         """See MutableTree._observed_sha1."""
         state = self.current_dirstate()
@@ -1212,6 +1250,8 @@ class DirStateWorkingTree(InventoryWorkingTree):
                 if self._dirty:
                     self.flush()
             if self._dirstate is not None:
+                if self._control_files._lock_mode == 'w':
+                    self._invalidate_fsmonitor()
                 # This is a no-op if there are no modifications.
                 self._dirstate.save()
                 self._dirstate.unlock()
@@ -1410,6 +1450,11 @@ class ContentFilterAwareSHA1Provider(dirstate.SHA1Provider):
             sha1 = osutils.size_sha_file(file_obj)[1]
         return statvalue, sha1
 
+    def hashes_raw_content(self, abspath):
+        """See dirstate.SHA1Provider.hashes_raw_content()."""
+        return not self.tree._content_filter_stack(
+            self.tree.relpath(osutils.safe_unicode(abspath)))
+
 
 class ContentFilteringDirStateWorkingTree(DirStateWorkingTree):
     """Dirstate working tree that supports content filtering.
@@ -2178,6 +2223,109 @@ class DirStateRevisionTree(InventoryTree):
             pending.extend(reversed(subdirs))
 
 
+class _FSMonitorQuery(object):
+    """Narrow down iter_changes with the paths reported by an fsmonitor daemon.
+
+    When the whole tree is compared with its basis, the paths of the changes
+    and unknown files found are saved in .bzr/checkout/fsmonitor, along with
+    the daemon token from just before the comparison.  The next comparison
+    then only has to look at those paths and the paths the daemon reports as
+    touched since the token.  Changes to the dirstate other than cached
+    hashes (as made by add, remove, rename, commit and similar commands)
+    remove the file, so that the next comparison walks the whole tree.
+    """
+
+    _STATE_FILE = 'fsmonitor'
+    _FORMAT = b'Breezy fsmonitor state 1\n'
+
+    def __init__(self, tree):
+        self._tree = tree
+        self._token = None
+
+    def _load(self):
+        try:
+            data = self._tree._transport.get_bytes(self._STATE_FILE)
+        except NoSuchFile:
+            return None, []
+        if not data.startswith(self._FORMAT):
+            return None, []
+        token, _, paths = data[len(self._FORMAT):].partition(b'\n')
+        return token, paths.split(b'\0')[:-1]
+
+    def _save(self, token, paths):
+        # The file is replaced atomically, so it can be written while the
+        # tree is only read locked; give up if the control directory can
+        # not be written to.
+        try:
+            self._tree._transport.put_bytes(
+                self._STATE_FILE,
+                b''.join([self._FORMAT, token, b'\n']
+                         + [path + b'\0' for path in sorted(paths)]))
+        except (errors.LockError, errors.PermissionDenied,
+                errors.TransportNotPossible) as e:
+            trace.mutter('not saving fsmonitor state: %s', e)
+
+    @classmethod
+    def invalidate(cls, tree):
+        """Forget the saved state, after the dirstate changed."""
+        try:
+            tree._transport.delete(cls._STATE_FILE)
+        except NoSuchFile:
+            pass
+
+    def paths_to_check(self, state):
+        """Return the paths iter_changes has to look at.
+
+        :return: A set of utf8 paths, or None if the whole tree has to be
+            walked (because no daemon is running, or it can not tell what
+            changed).
+        """
+        token, dirty = self._load()
+        answer = fsmonitor.query(fsmonitor.socket_path(self._tree), token)
+        if answer is None:
+            return None
+        self._token, touched = answer
+        if token is None or touched is None:
+            return None
+        paths = set(dirty)
+        paths.update(self._unversioned_root(state, path) for path in touched)
+        return paths
+
+    def _unversioned_root(self, state, path):
+        """Return the topmost unversioned directory containing path.
+
+        New files can only be reported as unknown from there.
+        """
+        while True:
+            parent = path.rpartition(b'/')[0]
+            if not parent or state._get_entry(0, path_utf8=parent)[0]:
+                return path
+            path = parent
+
+    def record(self, changes, narrowed, want_unversioned):
+        """Yield changes, and save their paths once they have all been seen.
+
+        When the comparison was narrowed down, an unknown directory that was
+        asked for is walked into, so the unknowns inside it are dropped to
+        report the same changes as a walk of the whole tree.
+        """
+        dirty = set()
+        unknown_dirs = []
+        for change in changes:
+            if narrowed and change.versioned == (False, False):
+                path = change.path[1]
+                if unknown_dirs and osutils.is_inside_any(unknown_dirs, path):
+                    continue
+                if change.kind[1] == 'directory':
+                    unknown_dirs.append(path)
+            for path in change.path:
+                if path is not None:
+                    dirty.add(path.encode('utf-8'))
+            yield change
+        if self._token is not None and want_unversioned:
+            self._save(self._token, dirty)
+
+
 class InterDirStateTree(InterInventoryTree):
     """Fast path optimiser for changes_from with dirstate trees.
 
@@ -2275,12 +2423,31 @@ class InterDirStateTree(InterInventoryTree):
             source_index = 1 + parent_ids.index(self.source._revision_id)
             indices = (source_index, target_index)
 
+        whole_tree = specific_files is None
         if specific_files is None:
             specific_files = {''}
 
         # -- get the state object and prepare it.
         state = self.target.current_dirstate()
-        state._read_dirblocks_if_needed()
+        if whole_tree:
+            state._read_dirblocks_if_needed()
+        else:
+            # Only read the parts of the dirstate the paths are in.
+            state._read_dirblocks_for_paths(
+                [path.encode('utf8') for path in specific_files])
+        monitor = None
+        narrowed = False
+        config = self.target.get_config_stack()
+        if (whole_tree and not include_unchanged and source_index == 1
+                and fsmonitor.available()
+                and config.get('bzr.workingtree.fsmonitor')):
+            monitor = _FSMonitorQuery(self.target)
+            paths = monitor.paths_to_check(state)
+            if paths is not None:
+                narrowed = True
+                # Everything else is known to be unchanged.
+                specific_files = [path.decode('utf-8') for path in paths]
+                require_versioned = False
         if require_versioned:
             # -- check all supplied paths are versioned in a search tree. --
             not_versioned = []
@@ -2318,7 +2485,29 @@ class InterDirStateTree(InterInventoryTree):
             include_unchanged, self.target._supports_executable(),
             search_specific_files_utf8, state, source_index, target_index,
             want_unversioned, self.target)
-        return iter_changes.iter_changes()
+        changes = iter_changes.iter_changes()
+        if monitor is not None:
+            changes = monitor.record(changes, narrowed, want_unversioned)
+        hash_workers = config.get('bzr.workingtree.hash_workers')
+        if hash_workers == 0:
+            hash_workers = os.cpu_count() or 1
+        walk_workers = config.get('bzr.workingtree.walk_workers')
+        if walk_workers == 0:
+            walk_workers = os.cpu_count() or 1
+        if hash_workers > 1 or walk_workers > 1:
+            return self._iter_changes_in_threads(
+                state, hash_workers, walk_workers, changes)
+        return changes
+
+    @staticmethod
+    def _iter_changes_in_threads(state, hash_workers, walk_workers, changes):
+        with contextlib.ExitStack() as stack:
+            if hash_workers > 1:
+                stack.enter_context(state._hashing_ahead(hash_workers))
+            if walk_workers > 1:
+                stack.enter_context(state._walking_concurrently(walk_workers))
+            for change in changes:
+                yield change
 
     @staticmethod
     def is_compatible(source, target):
@@ -0,0 +1,298 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Run brz commands in a resident server process.
+
+Starting brz means importing breezy, loading plugins and reading the
+configuration, which takes much longer than short commands like ``brz revno``
+take to run.  A server (started with ``brz cmd-server``) does that once and
+then runs the commands it is sent over a unix socket, reusing the
+repositories that earlier commands opened.
+
+When BRZ_CMDSERVER is set to the path of the socket, brz sends its command
+line, working directory and environment to the server, passing along its
+standard input, output and error, and exits with the status of the command.
+When no server is listening there (or the platform has no unix sockets), brz
+runs the command itself.
+
+The request is a JSON object followed by a newline, sent together with the
+three file descriptors.  The server answers ``pid <pid>`` when it starts
+running the command (so that the client can pass on interrupts) and
+``exit <status>`` when the command is done, each followed by a newline.
+
+This module is imported before the rest of breezy by the client, so it only
+imports the modules used by the server lazily.
+"""
+
+import array
+import io
+import json
+import os
+import signal
+import socket
+import sys
+
+from .lazy_import import lazy_import
+lazy_import(globals(), """
+import breezy
+from breezy import (
+    commands,
+    debug,
+    osutils,
+    trace,
+    ui,
+    )
+from breezy.bzr import bzrdir
+""")
+
+
+ENV_VARIABLE = 'BRZ_CMDSERVER'
+
+
+def available():
+    """Can brz pass its command to a command server on this platform?
+
+    That needs unix sockets, which can carry file descriptors.
+    """
+    return (hasattr(socket, 'AF_UNIX') and hasattr(socket, 'SCM_RIGHTS') and
+            hasattr(socket.socket, 'sendmsg'))
+
+
+# socket.send_fds and socket.recv_fds are only available from Python 3.9.
+
+def _send_fds(sock, data, fds):
+    return sock.sendmsg(
+        [data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                  array.array('i', fds))])
+
+
+def _recv_fds(sock, bufsize, maxfds):
+    fds = array.array('i')
+    data, ancdata, flags, addr = sock.recvmsg(
+        bufsize, socket.CMSG_LEN(maxfds * fds.itemsize))
+    for level, type, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(
+                cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+    return data, list(fds)
+
+
+def _read_line(s):
+    line = b''
+    while not line.endswith(b'\n'):
+        chunk = s.recv(1)
+        if not chunk:
+            return None
+        line += chunk
+    return line[:-1]
+
+
+def run_client(path, argv, fds=(0, 1, 2)):
+    """Run the command in argv in the server listening on path.
+
+    :param fds: The standard input, output and error for the command.
+    :return: The exit status of the command, or None if no server is
+        listening on path (or command servers are not available).
+    """
+    if not available():
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            s.connect(path)
+            request = json.dumps({
+                'argv': argv,
+                'cwd': os.getcwd(),
+                'env': dict(os.environ),
+                }).encode('ascii') + b'\n'
+            sent = _send_fds(s, request, fds)
+            if sent < len(request):
+                s.sendall(request[sent:])
+        except OSError:
+            # The server only runs the command once it has all of the
+            # request, so run it here instead.
+            return None
+        pid = None
+        while True:
+            try:
+                line = _read_line(s)
+            except KeyboardInterrupt:
+                if pid is not None:
+                    os.kill(pid, signal.SIGINT)
+                continue
+            if line is None:
+                sys.stderr.write(
+                    'brz: ERROR: the command server closed the connection\n')
+                return 4
+            status, _, value = line.partition(b' ')
+            if status == b'pid':
+                pid = int(value)
+            elif status == b'exit':
+                return int(value)
+    finally:
+        s.close()
+
+
+def _no_plugins(*args, **kwargs):
+    # The plugins were loaded when the server started.
+    pass
+
+
+def _open_stream(fd, like):
+    """Open a text stream on fd, with the encoding of the stream like."""
+    encoding = getattr(like, 'encoding', None)
+    errors = getattr(like, 'errors', None)
+    if fd == 0:
+        return io.TextIOWrapper(
+            io.open(fd, 'rb', closefd=False),
+            encoding=encoding, errors=errors)
+    return io.TextIOWrapper(
+        io.open(fd, 'wb', closefd=False), encoding=encoding,
+        errors=errors, line_buffering=os.isatty(fd))
+
+
+class CommandServer(object):
+    """Run the commands sent over a unix socket, one at a time.
+
+    Each command runs with the standard streams, working directory and
+    environment of its client.  Settings only read when breezy starts (such
+    as the plugins loaded) are those of the server.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._repository_cache = bzrdir.RepositoryCache()
+
+    def serve(self):
+        """Answer requests until interrupted."""
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+        # Only the user running the server may connect to it.
+        old_umask = os.umask(0o077)
+        try:
+            listener.bind(self._path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(16)
+        old_cache = bzrdir.BzrDirMeta1.repository_cache
+        bzrdir.BzrDirMeta1.repository_cache = self._repository_cache
+        try:
+            while True:
+                conn = listener.accept()[0]
+                try:
+                    self._answer(conn)
+                except KeyboardInterrupt:
+                    # Sent by a client after its command finished.
+                    pass
+                finally:
+                    conn.close()
+        finally:
+            bzrdir.BzrDirMeta1.repository_cache = old_cache
+            listener.close()
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+
+    def _answer(self, conn):
+        conn.settimeout(5.0)
+        fds = []
+        try:
+            data, fds = _recv_fds(conn, 65536, 3)
+            while not data.endswith(b'\n'):
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                data += chunk
+            if len(fds) != 3:
+                trace.mutter('cmd-server: expected 3 descriptors, got %d',
+                             len(fds))
+                return
+            request = json.loads(data)
+            conn.sendall(b'pid %d\n' % (os.getpid(),))
+            conn.settimeout(None)
+            status = self.run_command(
+                request['argv'], request['cwd'], request['env'], fds)
+            conn.sendall(b'exit %d\n' % (status,))
+        except (OSError, ValueError, KeyError) as e:
+            trace.mutter('cmd-server: failed to answer request: %s', e)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def run_command(self, argv, cwd, env, fds):
+        """Run a brz command for a client.
+
+        :param argv: The command line, without the program name.
+        :param cwd: The directory to run the command in.
+        :param env: The environment to run the command in.
+        :param fds: The standard input, output and error to use.
+        :return: The exit status of the command.
+        """
+        trace.mutter('cmd-server: running %r in %s', argv, cwd)
+        trace._flush_stdout_stderr()
+        saved_fds = [os.dup(fd) for fd in range(3)]
+        saved_cwd = osutils.getcwd()
+        saved_env = dict(os.environ)
+        saved_debug_flags = set(debug.debug_flags)
+        saved_streams = sys.stdin, sys.stdout, sys.stderr
+        saved_ui = ui.ui_factory
+        try:
+            for fd, client_fd in enumerate(fds):
+                os.dup2(client_fd, fd)
+            os.environ.clear()
+            os.environ.update(env)
+            # Fresh streams neither keep input read ahead for one client
+            # around for the next nor buffer output like the server's do.
+            sys.stdin, sys.stdout, sys.stderr = [
+                _open_stream(fd, stream)
+                for fd, stream in enumerate(saved_streams)]
+            ui.ui_factory = ui.make_ui_for_terminal(
+                sys.stdin, sys.stdout, sys.stderr)
+            with ui.ui_factory:
+                return commands.exception_to_return_code(
+                    self._run, argv, cwd)
+        finally:
+            trace._flush_stdout_stderr()
+            for stream in saved_streams[1:]:
+                stream.flush()
+            # Let the next command see configuration changes made by others.
+            state = breezy.get_global_state()
+            for store in state.config_stores.values():
+                store.save_changes()
+            state.config_stores.clear()
+            self._repository_cache.release()
+            for fd, saved_fd in enumerate(saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+            sys.stdin, sys.stdout, sys.stderr = saved_streams
+            ui.ui_factory = saved_ui
+            os.environ.clear()
+            os.environ.update(saved_env)
+            os.chdir(saved_cwd)
+            debug.debug_flags.clear()
+            debug.debug_flags.update(saved_debug_flags)
+
+    def _run(self, argv, cwd):
+        os.chdir(cwd)
+        # As commands.main and run_bzr_catch_errors do.
+        commands._register_builtin_commands()
+        commands.install_bzr_command_hooks()
+        return commands.run_bzr(
+            argv, load_plugins=_no_plugins, disable_plugins=_no_plugins)
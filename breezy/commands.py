@@ -42,6 +42,7 @@ import breezy
 from breezy import (
     cmdline,
     debug,
+    plugin as _mod_plugin,
     ui,
     )
 """)
@@ -476,6 +477,10 @@ class Command(object):
         invoked, before expansion of aliases.
         (This may be None if the command was constructed and run in-process.)
 
+      needs_plugins: If false, this command does not depend on anything
+        plugins may provide, so they are not loaded to run it when the plugin
+        index shows that none of them replaces it or hooks into commands.
+
       hooks: An instance of CommandHooks.
 
       __doc__: The help shown by 'brz help command' for this command.
@@ -494,6 +499,7 @@ class Command(object):
     _see_also: List[str]
 
     hidden: bool = False
+    needs_plugins: bool = True
 
     hooks: Hooks
 
@@ -1183,7 +1189,11 @@ def run_bzr(argv, load_plugins=load_plugins, disable_plugins=disable_plugins):
         from breezy import config
         c = config.GlobalConfig()
         warn_load_problems = not c.suppress_warning('plugin_load_failure')
-        load_plugins(warn_load_problems=warn_load_problems)
+        if load_plugins is _mod_plugin.load_plugins:
+            _load_plugins_for_command(argv_copy, opt_no_aliases,
+                                      warn_load_problems)
+        else:
+            load_plugins(warn_load_problems=warn_load_problems)
     else:
         disable_plugins()
 
@@ -1241,6 +1251,68 @@ def run_bzr(argv, load_plugins=load_plugins, disable_plugins=disable_plugins):
         cmdline_overrides._reset()
 
 
+def _count_command_hooks():
+    return sum(len(Command.hooks[name]) for name in Command.hooks)
+
+
+def _command_needs_plugins(argv, no_aliases, index):
+    """Return whether plugins must be loaded to run the command in argv.
+
+    Args:
+      argv: The command line arguments, after the global options.
+      no_aliases: Whether aliases are ignored.
+      index: The plugin index, as returned by plugin.read_plugin_index.
+    """
+    if index['command_hooks'] or not argv:
+        return True
+    cmd_name = argv[0]
+    if cmd_name == '--version':
+        cmd_name = 'version'
+    elif not no_aliases:
+        alias_argv = get_alias(cmd_name)
+        if alias_argv:
+            cmd_name = alias_argv[0]
+    if cmd_name in index['commands']:
+        return True
+    _register_builtin_commands()
+    try:
+        cmd_class = builtin_command_registry.get(cmd_name)
+    except KeyError:
+        return True
+    return cmd_class.needs_plugins
+
+
+def _load_plugins_for_command(argv, no_aliases, warn_load_problems):
+    """Load the plugins, unless the command in argv can run without them.
+
+    The plugin index records which commands the plugins provide, so that it
+    can be known without loading the plugins whether one of them replaces
+    the command. It is rebuilt whenever the plugins change.
+    """
+    state = breezy.get_global_state()
+    if (getattr(state, 'plugins', None) is not None
+            or 'no_plugin_index' in debug.debug_flags):
+        _mod_plugin.load_plugins(warn_load_problems=warn_load_problems)
+        return
+    key = _mod_plugin.plugin_index_key()
+    index = _mod_plugin.read_plugin_index(key)
+    if index is not None and not _command_needs_plugins(
+            argv, no_aliases, index):
+        trace.mutter('running %s without loading plugins', argv[0])
+        return
+    hook_count = _count_command_hooks()
+    _mod_plugin.load_plugins(warn_load_problems=warn_load_problems)
+    if index is None and key is not None:
+        commands = {}
+        for name in plugin_cmds.keys():
+            plugin = plugin_name(plugin_cmds._get_module(name))
+            commands[name] = plugin
+            for alias in plugin_cmds.get_info(name).aliases:
+                commands[alias] = plugin
+        _mod_plugin.save_plugin_index(
+            key, commands, _count_command_hooks() != hook_count)
+
+
 def display_command(func):
     """Decorator that suppresses pipe/interrupt errors."""
     def ignore_pipe(*args, **kwargs):
@@ -2473,6 +2473,51 @@ the dirstate file if a file is added/removed/renamed/etc. This flag only
 affects the behavior of updating the dirstate file after we notice that
 a file has been touched.
 '''))
+option_registry.register(
+    Option('bzr.workingtree.fsmonitor', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Ask a running fsmonitor daemon which files changed.
+
+When true and a daemon started with 'brz fsmonitor-daemon' is watching the
+working tree, status and commit only look at the files it reports as
+changed rather than examining every file in the tree.
+'''))
+option_registry.register(
+    Option('bzr.workingtree.hash_workers', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads compute the SHA-1 of files whose stat has changed.
+
+When comparing the working tree with its basis (as status and commit do),
+files whose size or timestamps no longer match the cached values have to be
+read to find out if they really changed.  With more than one, the stale files
+of each directory are hashed by that many threads.  0 means one per CPU.
+'''))
+option_registry.register(
+    Option('bzr.workingtree.walk_workers', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads read directories when walking the working tree.
+
+When comparing the working tree with its basis (as status and commit do),
+every directory is listed and every entry in it stat'ed.  With more than one,
+the directories ahead of the walk are read by that many threads, which helps
+on file systems where each stat takes long, such as NFS.  0 means one per
+CPU.
+'''))
+option_registry.register(
+    Option('bzr.workingtree.build_workers', default=1,
+           from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads write files when building a working tree.
+
+When a working tree is created (as checkout and branch do), the contents of
+every file are extracted from the repository and written out.  With more than
+one, the files are written by that many threads while the contents of the
+next ones are extracted, which helps when creating each file takes long.
+0 means one per CPU.
+'''))
 option_registry.register(
     Option('bugtracker', default=None,
            help='''\
@@ -2636,6 +2681,57 @@ If true (default), repository changes are flushed through the OS buffers
 to physical disk.  This is somewhat slower, but means data should not be
 lost if the machine crashes.  See also dirstate.fdatasync.
 '''))
+option_registry.register(
+    Option('repository.compact_index_leaves', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Keep cached index pages of pack repositories in a compact form?
+
+If true, the pages of the revision, inventory and text indices that are
+cached in memory are kept serialised, and entries are only parsed when they
+are looked up.  This takes about a third of the memory, but makes repeated
+lookups slower.
+'''))
+option_registry.register(
+    Option('repository.generation_index', default=False,
+           from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Keep the generation numbers of revisions to speed up finding heads?
+
+If true, Graph.heads and is_ancestor use the generation numbers of the
+revisions of pack repositories to stop searching early.  They are computed
+the first time they are needed, which walks the whole ancestry of the
+revisions, and kept in the cache directory for later commands.
+'''))
+option_registry.register(
+    Option('repository.pack_workers', default=1,
+           from_unicode=int_from_store,
+           help='''\
+Number of processes used to compress texts when packing a repository.
+
+With more than one, the texts of 2a repositories are cut into batches that
+are compressed in parallel by that many worker processes.  0 means one per
+CPU.  The default of 1 compresses everything in the brz process itself.
+'''))
+option_registry.register(
+    Option('repository.parents_cache', default=False,
+           from_unicode=bool_from_store,
+           help='''\
+Keep the revision graph of remote repositories in a local cache?
+
+If true, the parents of revisions fetched from a smart server are kept in
+the cache directory and reused by later commands, as long as no packs have
+been removed from the remote repository since.
+'''))
+option_registry.register(
+    Option('repository.parents_cache.max_entries', default=500000,
+           from_unicode=int_from_store,
+           help='''\
+Maximum number of revisions kept in the cache of a remote repository.
+
+Once the cache grows beyond this, the entries that were added first are
+dropped.  See also repository.parents_cache.
+'''))
 option_registry.register_lazy('smtp_server',
                               'breezy.smtp_connection', 'smtp_server')
 option_registry.register_lazy('smtp_password',
@@ -2664,6 +2760,36 @@ option_registry.register(
            default=300.0, from_unicode=float_from_store,
            help="If we wait for a new request from a client for more than"
                 " X seconds, consider the client idle, and hangup."))
+option_registry.register(
+    Option('serve.max_connections',
+           default=None, from_unicode=int_from_store,
+           help="""\
+Maximum number of clients 'brz serve' handles at the same time.
+
+Further clients are queued until a running connection finishes. If not
+set, every client is served by its own thread.
+"""))
+option_registry.register(
+    Option('serve.max_workers',
+           default=None, from_unicode=int_from_store,
+           help="""\
+Number of threads the bzr-asyncio server executes requests with.
+
+The bzr-asyncio protocol serves all clients from a single event loop, so
+the number of clients is not limited; this only limits how many requests
+are executed at the same time. If not set, the concurrent.futures default
+is used.
+"""))
+option_registry.register(
+    Option('serve.max_queued_connections',
+           default=None, from_unicode=int_from_store,
+           help="""\
+Maximum number of clients 'brz serve' queues while waiting for a free slot.
+
+Clients that connect when the queue is full are disconnected immediately.
+Only used when serve.max_connections is set. If not set, the queue is
+unbounded.
+"""))
 option_registry.register(
     Option('ssh',
            default=None, override_from_env=['BRZ_SSH'],
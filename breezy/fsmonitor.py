@@ -0,0 +1,235 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Report the paths changed in a working tree, as seen by a watching daemon.
+
+A daemon (started with ``brz fsmonitor-daemon``) watches a working tree with
+inotify and numbers the changes it sees.  Clients ask it for the paths that
+changed since a token returned by an earlier query, so that they only need to
+look at those paths rather than walking the whole tree.
+
+The daemon listens on a unix socket in the control directory of the tree.  A
+query is ``since <token>`` (or just ``since`` to get a token) followed by a
+newline.  The answer is ``ok <token>`` followed by the changed paths, or
+``reset <token>`` when the daemon can not tell what changed since the token
+(because it was restarted or the kernel event queue overflowed), each
+terminated by a NUL byte.
+"""
+
+import errno
+import os
+import select
+import socket
+
+from . import (
+    osutils,
+    trace,
+    )
+
+
+SOCKET_NAME = 'fsmonitor.sock'
+
+
+class ChangeLog(object):
+    """The paths changed in a tree, numbered in the order they changed."""
+
+    def __init__(self, instance=None):
+        if instance is None:
+            instance = osutils.rand_chars(16).encode('ascii')
+        self._instance = instance
+        self._seq = 0
+        self._reset_seq = 0
+        self._changes = {}
+
+    def token(self):
+        """Return a token for the changes recorded so far."""
+        return b'%s:%d' % (self._instance, self._seq)
+
+    def record(self, path):
+        """Record that path (relative to the tree root) changed."""
+        self._seq += 1
+        self._changes[path] = self._seq
+
+    def overflow(self):
+        """Record that changes were lost, so earlier tokens are useless."""
+        self._seq += 1
+        self._reset_seq = self._seq
+        self._changes.clear()
+
+    def changed_since(self, token):
+        """Return the paths changed since token was handed out.
+
+        :return: A sorted list of paths, or None if the changes since token
+            are not known.
+        """
+        try:
+            instance, seq = token.rsplit(b':', 1)
+            seq = int(seq)
+        except ValueError:
+            return None
+        if (instance != self._instance or seq < self._reset_seq
+                or seq > self._seq):
+            return None
+        return sorted(path for path, path_seq in self._changes.items()
+                      if path_seq > seq)
+
+    def handle_request(self, request):
+        """Return the answer to a query received by the daemon."""
+        words = request.split()
+        if not words or words[0] != b'since':
+            return b'error\0'
+        token = self.token()
+        if len(words) < 2:
+            return b'reset %s\0' % (token,)
+        paths = self.changed_since(words[1])
+        if paths is None:
+            return b'reset %s\0' % (token,)
+        return b''.join([b'ok %s\0' % (token,)]
+                        + [path + b'\0' for path in paths])
+
+
+def available():
+    """Return whether fsmonitor daemons can be queried on this platform."""
+    return hasattr(socket, 'AF_UNIX')
+
+
+def socket_path(tree):
+    """Return the path of the daemon socket for tree."""
+    return tree._transport.local_abspath(SOCKET_NAME)
+
+
+def query(path, token=None, timeout=5.0):
+    """Ask the daemon listening on path what changed since token.
+
+    :return: None if no daemon is running, otherwise a tuple with a new token
+        and the paths (relative to the tree root, as bytes) that changed
+        since token. The paths are None if the daemon can not tell, or no
+        token was given.
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.settimeout(timeout)
+        try:
+            s.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        if token is None:
+            s.sendall(b'since\n')
+        else:
+            s.sendall(b'since %s\n' % (token,))
+        chunks = []
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except (socket.timeout, OSError) as e:
+        trace.mutter('fsmonitor query failed: %s', e)
+        return None
+    finally:
+        s.close()
+    fields = b''.join(chunks).split(b'\0')
+    status, _, new_token = fields[0].partition(b' ')
+    if status == b'ok':
+        return new_token, fields[1:-1]
+    if status == b'reset':
+        return new_token, None
+    trace.mutter('unexpected fsmonitor answer: %r', fields[0])
+    return None
+
+
+class FSMonitorDaemon(object):
+    """Watch a working tree with inotify and answer queries about it."""
+
+    def __init__(self, tree, path=None):
+        if path is None:
+            path = socket_path(tree)
+        self._tree = tree
+        self._path = path
+        self.changes = ChangeLog()
+
+    def _make_notifier(self):
+        import pyinotify
+        changes = self.changes
+        tree = self._tree
+
+        class Recorder(pyinotify.ProcessEvent):
+
+            def process_default(self, event):
+                if event.mask & pyinotify.IN_Q_OVERFLOW:
+                    trace.note('fsmonitor: event queue overflowed')
+                    changes.overflow()
+                    return
+                path = tree.relpath(os.path.join(event.path, event.name))
+                changes.record(path.encode('utf-8'))
+
+        wm = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(wm, Recorder())
+        wm.add_watch(
+            tree.basedir,
+            pyinotify.IN_CREATE | pyinotify.IN_CLOSE_WRITE
+            | pyinotify.IN_DELETE | pyinotify.IN_MOVED_TO
+            | pyinotify.IN_MOVED_FROM | pyinotify.IN_ATTRIB
+            | pyinotify.IN_Q_OVERFLOW,
+            rec=True, auto_add=True,
+            exclude_filter=lambda p: tree.is_control_filename(tree.relpath(p)))
+        return wm, notifier
+
+    def serve(self):
+        """Watch the tree and answer queries until interrupted."""
+        wm, notifier = self._make_notifier()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+        listener.bind(self._path)
+        listener.listen(16)
+        try:
+            while True:
+                readable = select.select([wm.get_fd(), listener], [], [])[0]
+                if wm.get_fd() in readable:
+                    notifier.read_events()
+                    notifier.process_events()
+                if listener in readable:
+                    # Queries must see the events that happened before them.
+                    if notifier.check_events(timeout=0):
+                        notifier.read_events()
+                    notifier.process_events()
+                    self._answer(listener.accept()[0])
+        finally:
+            listener.close()
+            try:
+                os.unlink(self._path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            wm.close()
+
+    def _answer(self, conn):
+        try:
+            conn.settimeout(5.0)
+            request = b''
+            while not request.endswith(b'\n'):
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                request += chunk
+            conn.sendall(self.changes.handle_request(request))
+        except OSError as e:
+            trace.mutter('fsmonitor: failed to answer query: %s', e)
+        finally:
+            conn.close()
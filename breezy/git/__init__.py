@@ -249,6 +249,8 @@ plugin_cmds.register_lazy("cmd_git_import", [], __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_object", ["git-objects", "git-cat"],
                           __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_refs", [], __name__ + ".commands")
+plugin_cmds.register_lazy("cmd_git_upgrade_cache", [],
+                          __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_apply", [], __name__ + ".commands")
 plugin_cmds.register_lazy("cmd_git_push_pristine_tar_deltas",
                           ['git-push-pristine-tar', 'git-push-pristine'],
@@ -454,6 +456,7 @@ from ..config import (
     option_registry,
     Option,
     bool_from_store,
+    int_from_store,
     )
 
 option_registry.register(
@@ -464,6 +467,27 @@ Allow fetching of Git packs over HTTP.
 
 This enables support for fetching Git packs over HTTP in Loggerhead.
 '''))
+option_registry.register(
+    Option('git.reachability_bitmaps',
+           default=False, from_unicode=bool_from_store, invalid='warning',
+           help='''\
+Keep reachability bitmaps for the Git objects exported from a repository.
+
+When serving Git clients from a Bazaar repository, the Git objects to send
+for a full clone are recorded in the Git cache, so that later fetches of
+the same revisions don't have to convert every revision again.
+'''))
+option_registry.register(
+    Option('git.sha_map_workers',
+           default=1, from_unicode=int_from_store, invalid='warning',
+           help='''\
+How many threads compute Git blob ids when updating the Git SHA map.
+
+Before the revisions in a Bazaar repository can be served to Git clients or
+pushed to Git repositories, the ids of the Git objects for them are recorded
+in the Git cache.  With more than one, the texts of the files are hashed by
+that many threads while the next ones are read.  0 means one per CPU.
+'''))
 
 
 def test_suite():
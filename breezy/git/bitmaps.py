@@ -0,0 +1,179 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Reachability bitmaps for the git objects exported from a repository.
+
+Working out which git objects to send for a fetch means converting every
+revision that the other side doesn't have.  Much like git's pack bitmaps,
+a reachability bitmap records, for a revision, which git objects can be
+reached from its commit: bit N is set if the Nth object in a list of object
+ids shared by all bitmaps is reachable.  The objects to send for a fetch
+can then be found by combining the bitmaps of the revisions wanted and
+those of the revisions the other side has, without converting anything.
+
+The bitmaps are kept in a single file in the git cache directory, which is
+replaced as a whole when new bitmaps are written.  It consists of:
+
+ * a format line
+ * a line with the mapping and whether the objects were exported lossily
+ * a line with the number of objects and the number of bitmaps
+ * a line per bitmap with its offset, its length and the revision id
+ * the object ids, as 20 byte binary shas
+ * the bitmaps, each compressed with zlib
+"""
+
+import binascii
+import zlib
+
+from dulwich.objects import sha_to_hex
+
+from .. import errors
+from ..transport import NoSuchFile
+
+
+FORMAT_STRING = b'bzr-git reachability bitmaps v1\n'
+
+BITMAPS_NAME = 'bitmaps'
+
+
+class CorruptBitmaps(errors.BzrError):
+
+    _fmt = "Corrupt reachability bitmaps: %(reason)s"
+
+    def __init__(self, reason):
+        errors.BzrError.__init__(self, reason=reason)
+
+
+def bitmap_from_positions(positions):
+    """Create a bitmap with the bits for positions set."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    bits = bytearray((max(positions) >> 3) + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def iter_positions(bitmap):
+    """Iterate over the positions of the bits set in a bitmap."""
+    for index, byte in enumerate(
+            bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, 'little')):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (1 << bit):
+                yield (index << 3) | bit
+
+
+class ReachabilityBitmaps(object):
+    """Reachability bitmaps read from a file."""
+
+    def __init__(self, data):
+        try:
+            header, mapping_line, counts, rest = data.split(b'\n', 3)
+            if header + b'\n' != FORMAT_STRING:
+                raise CorruptBitmaps('unknown format %r' % (header,))
+            self.mapping_name, lossy = mapping_line.split(b' ')
+            self.lossy = {b'lossy': True, b'lossless': False}[lossy]
+            num_objects, num_bitmaps = [int(x) for x in counts.split(b' ')]
+            lines = rest.split(b'\n', num_bitmaps)
+            self._bitmap_locations = {}
+            for line in lines[:num_bitmaps]:
+                offset, length, revid = line.split(b' ', 2)
+                self._bitmap_locations[revid] = (int(offset), int(length))
+            self._objects = lines[num_bitmaps]
+        except (ValueError, KeyError, IndexError):
+            raise CorruptBitmaps('invalid header')
+        if len(self._objects) < num_objects * 20:
+            raise CorruptBitmaps('file too short')
+        self._num_objects = num_objects
+        self._bitmaps = {}
+
+    @classmethod
+    def from_transport(cls, transport):
+        """Read the bitmaps from a git cache directory.
+
+        :return: A ReachabilityBitmaps, or None if there are none.
+        """
+        try:
+            return cls(transport.get_bytes(BITMAPS_NAME))
+        except NoSuchFile:
+            return None
+
+    def __len__(self):
+        return self._num_objects
+
+    def revids(self):
+        """Return the revisions that there are bitmaps for."""
+        return set(self._bitmap_locations)
+
+    def get_bitmap(self, revid):
+        """Return the bitmap for a revision, as an int.
+
+        :raise KeyError: If there is no bitmap for revid
+        """
+        try:
+            return self._bitmaps[revid]
+        except KeyError:
+            pass
+        offset, length = self._bitmap_locations[revid]
+        start = self._num_objects * 20 + offset
+        try:
+            bits = zlib.decompress(self._objects[start:start + length])
+        except zlib.error:
+            raise CorruptBitmaps('invalid bitmap for %r' % (revid,))
+        bitmap = self._bitmaps[revid] = int.from_bytes(bits, 'little')
+        return bitmap
+
+    def iter_object_ids(self):
+        """Iterate over the ids of all objects, in the order of their bits."""
+        for position in range(self._num_objects):
+            yield sha_to_hex(
+                self._objects[position * 20:(position + 1) * 20])
+
+    def iter_objects(self, bitmap):
+        """Iterate over the ids of the objects in a bitmap."""
+        for position in iter_positions(bitmap):
+            if position >= self._num_objects:
+                raise CorruptBitmaps('invalid position %d' % (position,))
+            yield sha_to_hex(
+                self._objects[position * 20:(position + 1) * 20])
+
+
+def write_bitmaps(transport, mapping_name, lossy, objects, bitmaps):
+    """Write reachability bitmaps to a git cache directory.
+
+    :param mapping_name: Name of the mapping the objects were exported with
+    :param lossy: Whether the objects were exported lossily
+    :param objects: List with the ids of the objects, as hex shas
+    :param bitmaps: Dictionary mapping revision ids to their bitmaps
+    """
+    index = []
+    chunks = []
+    offset = 0
+    for revid, bitmap in sorted(bitmaps.items()):
+        chunk = zlib.compress(
+            bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, 'little'))
+        index.append(b'%d %d %s\n' % (offset, len(chunk), revid))
+        chunks.append(chunk)
+        offset += len(chunk)
+    transport.put_bytes(BITMAPS_NAME, b''.join(
+        [FORMAT_STRING,
+         b'%s %s\n' % (mapping_name, b'lossy' if lossy else b'lossless'),
+         b'%d %d\n' % (len(objects), len(bitmaps))] + index +
+        [binascii.unhexlify(b''.join(objects))] +
+        chunks))
@@ -42,6 +42,11 @@ from ..transport import (
     FileExists,
     NoSuchFile,
 )
+from .shamap_table import (
+    ShaMapTable,
+    key_sha,
+    write_table,
+)
 
 
 def get_cache_dir():
@@ -191,6 +196,15 @@ class BzrGitCacheFormat(object):
         :param repository: Repository to open the cache for
         :return: A `BzrGitCache`
         """
+        return cls.from_transport(cls.transport_from_repository(repository))
+
+    @staticmethod
+    def transport_from_repository(repository):
+        """Return the transport of the cache directory for a repository.
+
+        :param repository: Repository to find the cache directory for
+        :return: A `Transport`
+        """
         from ..transport.local import LocalTransport
         repo_transport = getattr(repository, "_transport", None)
         if (repo_transport is not None
@@ -212,7 +226,7 @@ class BzrGitCacheFormat(object):
             transport = None
         if transport is None:
             transport = get_remote_cache_transport(repository)
-        return cls.from_transport(transport)
+        return transport
 
 
 class CacheUpdater(object):
@@ -233,11 +247,15 @@ class CacheUpdater(object):
 
 
 class BzrGitCache(object):
-    """Caching backend."""
+    """Caching backend.
 
-    def __init__(self, idmap, cache_updater_klass):
+    :ivar transport: Transport of the cache directory, if there is one.
+    """
+
+    def __init__(self, idmap, cache_updater_klass, transport=None):
         self.idmap = idmap
         self._cache_updater_klass = cache_updater_klass
+        self.transport = transport
 
     def get_updater(self, rev):
         """Update an object that implements the CacheUpdater interface for
@@ -505,7 +523,9 @@ class SqliteGitShaMap(GitShaMap):
         """List the SHA1s."""
         for table in ("blobs", "commits", "trees"):
             for (sha,) in self.db.execute("select sha1 from %s" % table):
-                yield sha.encode('ascii')
+                if not isinstance(sha, bytes):
+                    sha = sha.encode('ascii')
+                yield sha
 
 
 class TdbCacheUpdater(CacheUpdater):
@@ -754,7 +774,8 @@ class IndexBzrGitCache(BzrGitCache):
 
     def __init__(self, transport=None):
         shamap = IndexGitShaMap(transport.clone('index'))
-        super(IndexBzrGitCache, self).__init__(shamap, IndexCacheUpdater)
+        super(IndexBzrGitCache, self).__init__(
+            shamap, IndexCacheUpdater, transport)
 
 
 class IndexGitCacheFormat(BzrGitCacheFormat):
@@ -782,10 +803,15 @@ class IndexGitShaMap(GitShaMap):
     ("commit", <revid>, "X") -> "<sha1> <tree-id>"
     ("blob", <fileid>, <revid>) -> <sha1>
 
+    Nodes added during a write group are checked against the existing
+    indices and added to the builder in batches of _flush_threshold.
     """
 
+    _flush_threshold = 10000
+
     def __init__(self, transport=None):
         self._name = None
+        self._pending = {}
         if transport is None:
             self._transport = None
             self._index = _mod_index.InMemoryGraphIndex(0, key_elements=3)
@@ -839,10 +865,12 @@ class IndexGitShaMap(GitShaMap):
             raise bzr_errors.BzrError('builder already open')
         self._builder = _mod_btree_index.BTreeBuilder(0, key_elements=3)
         self._name = osutils.sha()
+        self._pending = {}
 
     def commit_write_group(self):
         if self._builder is None:
             raise bzr_errors.BzrError('builder not open')
+        self._flush()
         stream = self._builder.finish()
         name = self._name.hexdigest() + ".rix"
         size = self._transport.put_file(name, stream)
@@ -856,17 +884,36 @@ class IndexGitShaMap(GitShaMap):
             raise bzr_errors.BzrError('builder not open')
         self._builder = None
         self._name = None
+        self._pending = {}
 
     def _add_node(self, key, value):
-        try:
-            self._get_entry(key)
-        except KeyError:
-            self._builder.add_node(key, value)
-            return False
-        else:
-            return True
+        if self._transport is None:
+            try:
+                self._get_entry(key)
+            except KeyError:
+                self._builder.add_node(key, value)
+            return
+        self._pending.setdefault(key, value)
+        if len(self._pending) >= self._flush_threshold:
+            self._flush()
+
+    def _flush(self):
+        """Add the pending nodes that are not in the index yet."""
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = {}
+        for entry in self._index.iter_entries(list(pending)):
+            del pending[entry[1]]
+        for entry in self._builder.iter_entries(list(pending)):
+            del pending[entry[1]]
+        self._builder.add_nodes(pending.items())
 
     def _get_entry(self, key):
+        try:
+            return self._pending[key]
+        except KeyError:
+            pass
         entries = self._index.iter_entries([key])
         try:
             return next(entries)[2]
@@ -880,6 +927,8 @@ class IndexGitShaMap(GitShaMap):
                 raise KeyError
 
     def _iter_entries_prefix(self, prefix):
+        if self._builder is not None:
+            self._flush()
         for entry in self._index.iter_entries_prefix([prefix]):
             yield (entry[1], entry[2])
         if self._builder is not None:
@@ -945,6 +994,274 @@ class IndexGitShaMap(GitShaMap):
             yield key[1]
 
 
+class TableCacheUpdater(CacheUpdater):
+    """Cache updater for sorted table based caches."""
+
+    def __init__(self, cache, rev):
+        self.cache = cache
+        self.revid = rev.revision_id
+        self._commit = None
+
+    def add_object(self, obj, bzr_key_data, path):
+        if isinstance(obj, tuple):
+            (type_name, hexsha) = obj
+        else:
+            type_name = obj.type_name.decode('ascii')
+            hexsha = obj.id
+        if type_name == "commit":
+            self._commit = obj
+            if type(bzr_key_data) is not dict:
+                raise TypeError(bzr_key_data)
+            self.cache.idmap._add_entry(
+                hexsha, "commit", (self.revid, obj.tree, bzr_key_data))
+        elif type_name in ("blob", "tree"):
+            if bzr_key_data is None:
+                return
+            self.cache.idmap._add_entry(hexsha, type_name, bzr_key_data)
+        else:
+            raise AssertionError
+
+    def finish(self):
+        if self._commit is None:
+            raise AssertionError("No commit object added")
+        return self._commit
+
+
+class TableBzrGitCache(BzrGitCache):
+
+    def __init__(self, transport):
+        shamap = TableGitShaMap(transport.clone('tables'))
+        super(TableBzrGitCache, self).__init__(
+            shamap, TableCacheUpdater, transport)
+
+
+class TableGitCacheFormat(BzrGitCacheFormat):
+
+    def get_format_string(self):
+        return b'bzr-git sha map version 1 using sorted tables\n'
+
+    def initialize(self, transport):
+        try:
+            transport.mkdir('tables')
+        except FileExists:
+            pass
+        super(TableGitCacheFormat, self).initialize(transport)
+
+    def open(self, transport):
+        return TableBzrGitCache(transport)
+
+
+class TableGitShaMap(GitShaMap):
+    """SHA map kept in immutable sorted tables (see shamap_table).
+
+    Each write group adds a table with the entries added in it, and once
+    there are more than _max_tables the smallest ones are combined.  Tables
+    are never changed once written, so they can be read without any
+    locking; local ones are mapped into memory rather than read.
+    """
+
+    _max_tables = 10
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._objects = None
+        self._keys = None
+        self._load()
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self._transport.base)
+
+    def _load(self):
+        while True:
+            try:
+                names = sorted(
+                    name[:-4] for name in self._transport.list_dir('.')
+                    if name.endswith('.tbl'))
+            except NoSuchFile:
+                names = []
+            try:
+                self._tables = [
+                    ShaMapTable.from_transport(self._transport, name + '.tbl')
+                    for name in names]
+            except NoSuchFile:
+                # Combined into another table by someone else.
+                continue
+            self._table_names = names
+            return
+
+    def start_write_group(self):
+        if self._objects is not None:
+            raise bzr_errors.BzrError('write group already open')
+        self._objects = {}
+        self._keys = {}
+
+    def commit_write_group(self):
+        if self._objects is None:
+            raise bzr_errors.BzrError('no write group open')
+        objects = [(sha, record) for (sha, records) in self._objects.items()
+                   for record in records]
+        keys = self._keys
+        self._objects = None
+        self._keys = None
+        if not objects and not keys:
+            return
+        self._write_table(objects, keys.items())
+        if len(self._tables) > self._max_tables:
+            self._combine()
+
+    def abort_write_group(self):
+        if self._objects is None:
+            raise bzr_errors.BzrError('no write group open')
+        self._objects = None
+        self._keys = None
+
+    def _write_table(self, objects, keys):
+        name = osutils.rand_chars(20)
+        self._transport.ensure_base()
+        self._transport.put_bytes(name + '.tbl', write_table(objects, keys))
+        self._tables.append(
+            ShaMapTable.from_transport(self._transport, name + '.tbl'))
+        self._table_names.append(name)
+        return name
+
+    def _combine(self):
+        """Combine the smallest tables into one.
+
+        Tables are only combined with tables at most as large as the
+        tables combined so far, so that entries are rewritten a number of
+        times logarithmic in the number of entries.
+        """
+        tables = sorted(zip(self._tables, self._table_names),
+                        key=lambda table: len(table[0]))
+        size = len(tables[0][0]) + len(tables[1][0])
+        count = 2
+        while count < len(tables) and len(tables[count][0]) <= size:
+            size += len(tables[count][0])
+            count += 1
+        objects = []
+        keys = []
+        for table, name in tables[:count]:
+            objects.extend(table.iter_objects())
+            keys.extend(table.iter_keys())
+        self._tables = [table for (table, name) in tables[count:]]
+        self._table_names = [name for (table, name) in tables[count:]]
+        self._write_table(objects, keys)
+        for table, name in tables[:count]:
+            try:
+                self._transport.delete(name + '.tbl')
+            except NoSuchFile:
+                pass
+            except (bzr_errors.TransportNotPossible,
+                    bzr_errors.PermissionDenied) as e:
+                trace.mutter('not deleting %s: %s', name + '.tbl', e)
+
+    def _add_entry(self, hexsha, type_name, type_data):
+        """Add an entry.
+
+        :param type_name: Type of the object: "commit", "blob" or "tree"
+        :param type_data: Data as returned by lookup_git_sha
+        """
+        sha = hex_to_sha(hexsha)
+        if type_name == "commit":
+            (revid, tree_sha, verifiers) = type_data
+            record = (b"commit", revid, tree_sha)
+            try:
+                record += (verifiers["testament3-sha1"],)
+            except KeyError:
+                pass
+            key = (b"commit", revid)
+        else:
+            record = key = (type_name.encode('ascii'),) + tuple(type_data)
+        self._objects.setdefault(sha, set()).add(b"\0".join(record))
+        self._keys[key_sha(key)] = sha
+
+    def _lookup_key(self, key):
+        key_sha1 = key_sha(key)
+        if self._keys is not None:
+            try:
+                return sha_to_hex(self._keys[key_sha1])
+            except KeyError:
+                pass
+        for table in self._tables:
+            sha = table.get_key(key_sha1)
+            if sha is not None:
+                return sha_to_hex(sha)
+        raise KeyError(key)
+
+    def lookup_commit(self, revid):
+        return self._lookup_key((b"commit", revid))
+
+    def lookup_blob_id(self, fileid, revision):
+        return self._lookup_key((b"blob", fileid, revision))
+
+    def lookup_tree_id(self, fileid, revision):
+        return self._lookup_key((b"tree", fileid, revision))
+
+    def _get_records(self, sha):
+        records = []
+        if self._objects is not None:
+            records.extend(self._objects.get(sha, ()))
+        for table in self._tables:
+            for record in table.get_records(sha):
+                if record not in records:
+                    records.append(record)
+        return records
+
+    def lookup_git_sha(self, sha):
+        if len(sha) == 40:
+            sha = hex_to_sha(sha)
+        records = self._get_records(sha)
+        if not records:
+            raise KeyError(sha)
+        for record in records:
+            data = record.split(b"\0")
+            type_name = data[0].decode('ascii')
+            if type_name == "commit":
+                if len(data) > 3:
+                    verifiers = {"testament3-sha1": data[3]}
+                else:
+                    verifiers = {}
+                yield (type_name, (data[1], data[2], verifiers))
+            else:
+                yield (type_name, tuple(data[1:]))
+
+    def missing_revisions(self, revids):
+        missing = set()
+        for revid in revids:
+            try:
+                self.lookup_commit(revid)
+            except KeyError:
+                missing.add(revid)
+        return missing
+
+    def _iter_objects(self):
+        if self._objects is not None:
+            for sha, records in self._objects.items():
+                for record in records:
+                    yield sha, record
+        for table in self._tables:
+            for sha, record in table.iter_objects():
+                yield sha, record
+
+    def revids(self):
+        """List the revision ids known."""
+        seen = set()
+        for sha, record in self._iter_objects():
+            if record.startswith(b"commit\0"):
+                revid = record.split(b"\0", 2)[1]
+                if revid not in seen:
+                    seen.add(revid)
+                    yield revid
+
+    def sha1s(self):
+        """List the SHA1s."""
+        seen = set()
+        for sha, record in self._iter_objects():
+            if sha not in seen:
+                seen.add(sha)
+                yield sha_to_hex(sha)
+
+
 formats = registry.Registry()
 formats.register(TdbGitCacheFormat().get_format_string(),
                  TdbGitCacheFormat())
@@ -952,6 +1269,8 @@ formats.register(SqliteGitCacheFormat().get_format_string(),
                  SqliteGitCacheFormat())
 formats.register(IndexGitCacheFormat().get_format_string(),
                  IndexGitCacheFormat())
+formats.register(TableGitCacheFormat().get_format_string(),
+                 TableGitCacheFormat())
 # In the future, this will become the default:
 formats.register('default', IndexGitCacheFormat())
 
@@ -977,6 +1296,42 @@ def migrate_ancient_formats(repo_transport):
         repo_transport.rename("git.tdb", "git/idmap.tdb")
 
 
+def upgrade_cache(transport):
+    """Convert a cache to the sorted table format.
+
+    The entries of the existing cache are copied into a table, after which
+    the format file is replaced so that the tables are used from then on.
+    The files of the old format are left in place.  Entries added to the
+    old cache while it is being converted are lost; they are recreated
+    when needed.
+
+    :param transport: Transport of the cache directory
+    :return: The converted `BzrGitCache`
+    """
+    format = TableGitCacheFormat()
+    try:
+        format_string = transport.get_bytes('format')
+    except NoSuchFile:
+        format.initialize(transport)
+        return format.open(transport)
+    if format_string == format.get_format_string():
+        return format.open(transport)
+    source = formats.get(format_string).open(transport)
+    target = format.open(transport)
+    target.idmap.start_write_group()
+    try:
+        for sha in source.idmap.sha1s():
+            for type_name, type_data in source.idmap.lookup_git_sha(sha):
+                target.idmap._add_entry(sha, type_name, type_data)
+    except BaseException:
+        target.idmap.abort_write_group()
+        raise
+    else:
+        target.idmap.commit_write_group()
+    format.initialize(transport)
+    return target
+
+
 def remove_readonly_transport_decorator(transport):
     if transport.is_readonly():
         try:
@@ -246,6 +246,41 @@ class cmd_git_refs(Command):
                                 (k.decode('utf-8'), v.decode('utf-8')))
 
 
+class cmd_git_upgrade_cache(Command):
+    """Convert the Git SHA map of a repository to the sorted table format.
+
+    Lookups in the sorted table format are cheaper than in the other
+    formats, which matters for repositories with many Git objects.
+    """
+
+    hidden = True
+
+    takes_args = ["location?"]
+
+    def run(self, location="."):
+        from ..controldir import (
+            ControlDir,
+            )
+        from .cache import (
+            BzrGitCacheFormat,
+            migrate_ancient_formats,
+            upgrade_cache,
+            )
+        from ..errors import ReadOnlyError
+        from ..i18n import gettext
+        controldir, _ = ControlDir.open_containing(location)
+        repo = controldir.find_repository()
+        repo_transport = getattr(repo, "_transport", None)
+        if repo_transport is not None:
+            try:
+                migrate_ancient_formats(repo_transport)
+            except ReadOnlyError:
+                pass
+        with repo.lock_read():
+            upgrade_cache(BzrGitCacheFormat.transport_from_repository(repo))
+        self.outf.write(gettext("Git SHA map converted.\n"))
+
+
 class cmd_git_apply(Command):
     """Apply a series of git-am style patches.
 
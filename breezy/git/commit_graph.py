@@ -0,0 +1,317 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Reading and writing git commit-graph files.
+
+Git can keep the parents, tree and generation number of commits in
+objects/info/commit-graph, a table sorted by commit id (see
+Documentation/gitformat-commit-graph.txt in git).  Looking parents up there
+is much cheaper than inflating and parsing each commit object.
+
+The file only covers the commits that existed when it was written, so
+callers need to fall back to reading the commit objects for the others.
+Chains of split commit-graph files (objects/info/commit-graphs) are not
+supported.
+"""
+
+import mmap
+import struct
+
+from dulwich.objects import (
+    hex_to_sha,
+    sha_to_hex,
+    )
+
+from .. import (
+    errors,
+    osutils,
+    )
+from ..transport import NoSuchFile
+
+
+COMMIT_GRAPH_PATH = 'info/commit-graph'
+
+SIGNATURE = b'CGPH'
+VERSION = 1
+HASH_VERSION_SHA1 = 1
+HASH_LENGTH = 20
+
+CHUNK_OID_FANOUT = b'OIDF'
+CHUNK_OID_LOOKUP = b'OIDL'
+CHUNK_COMMIT_DATA = b'CDAT'
+CHUNK_EXTRA_EDGES = b'EDGE'
+
+PARENT_NONE = 0x70000000
+EDGE_EXTRA = 0x80000000
+EDGE_LAST = 0x80000000
+GENERATION_MAX = (1 << 30) - 1
+
+
+class CorruptCommitGraph(errors.BzrError):
+
+    _fmt = "Corrupt commit-graph file: %(reason)s"
+
+    def __init__(self, reason):
+        errors.BzrError.__init__(self, reason=reason)
+
+
+class CommitGraph(object):
+    """The contents of a commit-graph file.
+
+    Commit ids are given and returned as hex shas.
+    """
+
+    def __init__(self, data):
+        """Create a CommitGraph.
+
+        :param data: The contents of the file, as bytes or an mmap.
+        """
+        self._data = data
+        if len(data) < 8 + 12 + HASH_LENGTH:
+            raise CorruptCommitGraph('file too short')
+        (signature, version, hash_version, num_chunks,
+         num_bases) = struct.unpack_from('>4sBBBB', data, 0)
+        if signature != SIGNATURE:
+            raise CorruptCommitGraph('bad signature %r' % (signature,))
+        if version != VERSION:
+            raise CorruptCommitGraph('unsupported version %d' % (version,))
+        if hash_version != HASH_VERSION_SHA1:
+            raise CorruptCommitGraph(
+                'unsupported hash version %d' % (hash_version,))
+        if num_bases != 0:
+            raise CorruptCommitGraph('split commit-graphs are not supported')
+        chunks = {}
+        table = [struct.unpack_from('>4sQ', data, 8 + 12 * i)
+                 for i in range(num_chunks + 1)]
+        for (chunk_id, offset), (unused_id, end) in zip(table, table[1:]):
+            if not offset <= end <= len(data) - HASH_LENGTH:
+                raise CorruptCommitGraph(
+                    'chunk %r out of bounds' % (chunk_id,))
+            chunks[chunk_id] = (offset, end)
+        for chunk_id in (CHUNK_OID_FANOUT, CHUNK_OID_LOOKUP,
+                         CHUNK_COMMIT_DATA):
+            if chunk_id not in chunks:
+                raise CorruptCommitGraph('missing chunk %r' % (chunk_id,))
+        self._fanout = struct.unpack_from(
+            '>256L', data, chunks[CHUNK_OID_FANOUT][0])
+        self._num_commits = self._fanout[255]
+        self._lookup_offset = chunks[CHUNK_OID_LOOKUP][0]
+        self._data_offset = chunks[CHUNK_COMMIT_DATA][0]
+        if (chunks[CHUNK_OID_LOOKUP][1] - self._lookup_offset
+                != self._num_commits * HASH_LENGTH
+                or chunks[CHUNK_COMMIT_DATA][1] - self._data_offset
+                != self._num_commits * (HASH_LENGTH + 16)):
+            raise CorruptCommitGraph('chunk sizes do not match')
+        self._edges_offset = chunks.get(CHUNK_EXTRA_EDGES, (None,))[0]
+
+    @classmethod
+    def from_transport(cls, transport, path=COMMIT_GRAPH_PATH):
+        """Open the commit-graph file at path on transport.
+
+        Local files are mapped into memory rather than read.
+
+        :return: A CommitGraph, or None if there is no such file.
+        """
+        try:
+            local_path = transport.local_abspath(path)
+        except errors.NotLocalUrl:
+            try:
+                data = transport.get_bytes(path)
+            except NoSuchFile:
+                return None
+        else:
+            try:
+                with open(local_path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+            except ValueError:
+                # An empty file can't be mapped.
+                raise CorruptCommitGraph('file too short')
+        return cls(data)
+
+    def close(self):
+        """Release the file contents."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+
+    def __len__(self):
+        return self._num_commits
+
+    def __contains__(self, sha):
+        return self._position(sha) is not None
+
+    def _position(self, sha):
+        if len(sha) != 40:
+            return None
+        try:
+            binsha = hex_to_sha(sha)
+        except ValueError:
+            return None
+        first = binsha[0]
+        if first == 0:
+            lo = 0
+        else:
+            lo = self._fanout[first - 1]
+        hi = self._fanout[first]
+        data = self._data
+        offset = self._lookup_offset
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * HASH_LENGTH
+            found = data[start:start + HASH_LENGTH]
+            if found < binsha:
+                lo = mid + 1
+            elif found > binsha:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _sha(self, position):
+        if position >= self._num_commits:
+            raise CorruptCommitGraph('invalid commit position %d' % position)
+        start = self._lookup_offset + position * HASH_LENGTH
+        return sha_to_hex(self._data[start:start + HASH_LENGTH])
+
+    def _commit_data(self, sha):
+        position = self._position(sha)
+        if position is None:
+            return None
+        return struct.unpack_from(
+            '>LLQ', self._data,
+            self._data_offset + position * (HASH_LENGTH + 16) + HASH_LENGTH)
+
+    def get_parents(self, sha):
+        """Return the parents of a commit.
+
+        :return: A list of the commit ids of the parents, or None if the
+            commit is not in the file.
+        """
+        commit_data = self._commit_data(sha)
+        if commit_data is None:
+            return None
+        parent1, parent2, unused_generation = commit_data
+        if parent1 == PARENT_NONE:
+            return []
+        parents = [self._sha(parent1)]
+        if parent2 == PARENT_NONE:
+            return parents
+        if not parent2 & EDGE_EXTRA:
+            parents.append(self._sha(parent2))
+            return parents
+        if self._edges_offset is None:
+            raise CorruptCommitGraph('missing chunk %r' % (CHUNK_EXTRA_EDGES,))
+        offset = self._edges_offset + (parent2 & ~EDGE_EXTRA) * 4
+        while True:
+            (edge,) = struct.unpack_from('>L', self._data, offset)
+            parents.append(self._sha(edge & ~EDGE_LAST))
+            if edge & EDGE_LAST:
+                return parents
+            offset += 4
+
+    def get_generation(self, sha):
+        """Return the generation number (topological level) of a commit.
+
+        :return: The generation, or None if the commit is not in the file or
+            the file was written without generation numbers.
+        """
+        commit_data = self._commit_data(sha)
+        if commit_data is None:
+            return None
+        generation = commit_data[2] >> 34
+        if generation == 0:
+            return None
+        return generation
+
+
+def write_commit_graph(f, commits):
+    """Write a commit-graph file.
+
+    :param f: File to write to.
+    :param commits: A dict mapping the id of each commit to a tuple with the
+        id of its tree, the ids of its parents and its commit time.  The
+        parents of every commit must be in the dict too.
+    """
+    shas = sorted(hex_to_sha(sha) for sha in commits)
+    positions = dict((sha_to_hex(binsha), i) for i, binsha in enumerate(shas))
+    generations = {}
+    for sha in commits:
+        if sha in generations:
+            continue
+        pending = [sha]
+        while pending:
+            sha = pending[-1]
+            missing = [parent for parent in commits[sha][1]
+                       if parent not in generations]
+            if missing:
+                for parent in missing:
+                    if parent not in commits:
+                        raise ValueError(
+                            'parent %s of %s is missing' % (parent, sha))
+                pending.extend(missing)
+                continue
+            pending.pop()
+            generations[sha] = min(GENERATION_MAX, 1 + max(
+                [generations[parent] for parent in commits[sha][1]],
+                default=0))
+    fanout = [0] * 256
+    for binsha in shas:
+        fanout[binsha[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    commit_data = []
+    edges = []
+    for binsha in shas:
+        sha = sha_to_hex(binsha)
+        tree, parents, commit_time = commits[sha]
+        parent_positions = [positions[parent] for parent in parents]
+        if not parent_positions:
+            parent1 = parent2 = PARENT_NONE
+        elif len(parent_positions) == 1:
+            parent1 = parent_positions[0]
+            parent2 = PARENT_NONE
+        elif len(parent_positions) == 2:
+            parent1, parent2 = parent_positions
+        else:
+            parent1 = parent_positions[0]
+            parent2 = EDGE_EXTRA | len(edges)
+            edges.extend(parent_positions[1:])
+            edges[-1] |= EDGE_LAST
+        commit_data.append(hex_to_sha(tree) + struct.pack(
+            '>LLQ', parent1, parent2,
+            (generations[sha] << 34) | (commit_time & ((1 << 34) - 1))))
+    chunks = [
+        (CHUNK_OID_FANOUT, struct.pack('>256L', *fanout)),
+        (CHUNK_OID_LOOKUP, b''.join(shas)),
+        (CHUNK_COMMIT_DATA, b''.join(commit_data)),
+        ]
+    if edges:
+        chunks.append((CHUNK_EXTRA_EDGES, struct.pack(
+            '>%dL' % len(edges), *edges)))
+    header = struct.pack('>4sBBBB', SIGNATURE, VERSION, HASH_VERSION_SHA1,
+                         len(chunks), 0)
+    offset = len(header) + 12 * (len(chunks) + 1)
+    table = []
+    for chunk_id, chunk in chunks:
+        table.append(struct.pack('>4sQ', chunk_id, offset))
+        offset += len(chunk)
+    table.append(struct.pack('>4sQ', b'\0\0\0\0', offset))
+    content = b''.join(
+        [header] + table + [chunk for chunk_id, chunk in chunks])
+    f.write(content)
+    f.write(hex_to_sha(osutils.sha_string(content)))
@@ -34,6 +34,7 @@ from dulwich.pack import (
     )
 
 from .. import (
+    config,
     errors,
     lru_cache,
     trace,
@@ -49,6 +50,12 @@ from ..bzr.testament import (
     StrictTestament3,
     )
 
+from .bitmaps import (
+    CorruptBitmaps,
+    ReachabilityBitmaps,
+    bitmap_from_positions,
+    write_bitmaps,
+    )
 from .cache import (
     from_repository as cache_from_repository,
     )
@@ -64,6 +71,9 @@ from .unpeel_map import (
     UnpeelMap,
     )
 
+import collections
+from concurrent import futures
+import os
 import posixpath
 import stat
 
@@ -84,6 +94,15 @@ def get_object_store(repo, mapping=None):
 MAX_TREE_CACHE_SIZE = 50 * 1024 * 1024
 
 
+def _blob_id(chunks):
+    """Return the id of the git blob with the given contents."""
+    length = sum(map(len, chunks))
+    s = osutils.sha(b'blob %d\0' % length)
+    for chunk in chunks:
+        s.update(chunk)
+    return s.hexdigest().encode('ascii')
+
+
 class LRUTreeCache(object):
 
     def __init__(self, repository):
@@ -211,7 +230,8 @@ def directory_to_tree(path, children, lookup_ie_sha1, unusual_modes,
 
 
 def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
-                     dummy_file_name=None, add_cache_entry=None):
+                     dummy_file_name=None, add_cache_entry=None,
+                     blob_ids=None):
     """Iterate over the objects that were introduced in a revision.
 
     :param idmap: id map
@@ -219,6 +239,8 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
     :param unusual_modes: Unusual file modes dictionary
     :param dummy_file_name: File name to use for dummy files
         in empty directories. None to skip empty directories
+    :param blob_ids: Optional dictionary with the ids of the blobs of
+        (file_id, revision) keys; the blobs found in it are not yielded.
     :return: Yields (path, object, ie) entries
     """
     dirty_dirs = set()
@@ -273,6 +295,9 @@ def _tree_to_objects(tree, parent_trees, idmap, unusual_modes,
                         blob = Blob()
                         blob.data = tree.get_file_text(change.path[1])
                         blob_id = blob.id
+            if blob_id is None and blob_ids is not None:
+                blob_id = blob_ids.get(
+                    (change.file_id, tree.get_file_revision(change.path[1])))
             if blob_id is None:
                 new_blobs.append((change.path[1], change.file_id))
             else:
@@ -408,6 +433,10 @@ class PackTupleIterable(object):
 class BazaarObjectStore(BaseObjectStore):
     """A Git-style object store backed onto a Bazaar repository."""
 
+    # Number of revisions whose trees and texts are read at once when
+    # updating the SHA map.
+    _update_batch_size = 100
+
     def __init__(self, repository, mapping=None):
         self.repository = repository
         self._map_updated = False
@@ -456,14 +485,19 @@ class BazaarObjectStore(BaseObjectStore):
             if stop_revision is None:
                 self._map_updated = True
             return
+        revids = list(graph.iter_topo_order(missing_revids))
+        workers = config.LocationStack(self.repository.user_url).get(
+            'git.sha_map_workers')
+        if workers == 0:
+            workers = os.cpu_count() or 1
         self.start_write_group()
         try:
             with ui.ui_factory.nested_progress_bar() as pb:
-                for i, revid in enumerate(graph.iter_topo_order(
-                        missing_revids)):
-                    trace.mutter('processing %r', revid)
-                    pb.update("updating git map", i, len(missing_revids))
-                    self._update_sha_map_revision(revid)
+                for start in range(0, len(revids), self._update_batch_size):
+                    pb.update("updating git map", start, len(revids))
+                    self._update_sha_map_revisions(
+                        revids[start:start + self._update_batch_size],
+                        workers)
             if stop_revision is None:
                 self._map_updated = True
         except BaseException:
@@ -493,12 +527,15 @@ class BazaarObjectStore(BaseObjectStore):
         return self.mapping.export_commit(rev, tree_sha, parent_lookup,
                                           lossy, verifiers)
 
-    def _revision_to_objects(self, rev, tree, lossy, add_cache_entry=None):
+    def _revision_to_objects(self, rev, tree, lossy, add_cache_entry=None,
+                             blob_ids=None):
         """Convert a revision to a set of git objects.
 
         :param rev: Bazaar revision object
         :param tree: Bazaar revision tree
         :param lossy: Whether to not roundtrip all Bazaar revision data
+        :param blob_ids: Optional dictionary with the ids of blobs already
+            known, by (file_id, revision)
         """
         unusual_modes = extract_unusual_modes(rev)
         present_parents = self.repository.has_revisions(rev.parent_ids)
@@ -507,7 +544,7 @@ class BazaarObjectStore(BaseObjectStore):
         root_tree = None
         for path, obj, bzr_key_data in _tree_to_objects(
                 tree, parent_trees, self._cache.idmap, unusual_modes,
-                self.mapping.BZR_DUMMY_FILE, add_cache_entry):
+                self.mapping.BZR_DUMMY_FILE, add_cache_entry, blob_ids):
             if path == "":
                 root_tree = obj
                 root_key_data = bzr_key_data
@@ -547,14 +584,85 @@ class BazaarObjectStore(BaseObjectStore):
     def _get_updater(self, rev):
         return self._cache.get_updater(rev)
 
-    def _update_sha_map_revision(self, revid):
-        rev = self.repository.get_revision(revid)
-        tree = self.tree_cache.revision_tree(rev.revision_id)
+    def _update_sha_map_revisions(self, revids, workers=1):
+        """Add the objects of a batch of revisions to the SHA map.
+
+        The revisions, their trees and the texts they introduce are read in
+        bulk.
+
+        :param revids: Revision ids, parents before children
+        :param workers: Number of threads to compute blob ids in
+        """
+        revs = self.repository.get_revisions(revids)
+        trees = self.tree_cache.revision_trees(revids)
+        blob_ids = self._get_blob_ids(list(zip(revs, trees)), workers)
+        for rev, tree in zip(revs, trees):
+            trace.mutter('processing %r', rev.revision_id)
+            self._update_sha_map_revision(
+                rev.revision_id, rev, tree, blob_ids)
+
+    def _get_blob_ids(self, revs_and_trees, workers=1):
+        """Compute the ids of the blobs for the texts introduced in revisions.
+
+        :param revs_and_trees: List of (revision, tree) tuples
+        :param workers: Number of threads to compute blob ids in
+        :return: Dictionary mapping (file_id, revision) to blob ids
+        """
+        present_parents = self.repository.has_revisions(
+            [rev.parent_ids[0] for rev, tree in revs_and_trees
+             if rev.parent_ids])
+        keys = []
+        for rev, tree in revs_and_trees:
+            try:
+                inv = tree.root_inventory
+            except AttributeError:
+                continue
+            if rev.parent_ids and rev.parent_ids[0] in present_parents:
+                basis_inv = self.tree_cache.revision_tree(
+                    rev.parent_ids[0]).root_inventory
+                entries = (
+                    entry for (old_path, new_path, file_id, entry)
+                    in inv._make_delta(basis_inv) if entry is not None)
+            else:
+                entries = (entry for path, entry in inv.iter_entries())
+            for entry in entries:
+                if (entry.kind == 'file' and
+                        entry.revision == rev.revision_id):
+                    keys.append((entry.file_id, entry.revision))
+        stream = self.repository.iter_files_bytes(
+            (file_id, revision, (file_id, revision))
+            for (file_id, revision) in keys)
+        blob_ids = {}
+        if workers <= 1:
+            for key, chunks in stream:
+                blob_ids[key] = _blob_id(list(chunks))
+            return blob_ids
+        # hashlib releases the GIL for large texts, so they can be hashed
+        # while the next ones are read.  Only a few texts are held in memory
+        # at a time.
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            for key, chunks in stream:
+                pending.append(
+                    (key, executor.submit(_blob_id, list(chunks))))
+                if len(pending) >= workers * 4:
+                    key, future = pending.popleft()
+                    blob_ids[key] = future.result()
+            for key, future in pending:
+                blob_ids[key] = future.result()
+        return blob_ids
+
+    def _update_sha_map_revision(self, revid, rev=None, tree=None,
+                                 blob_ids=None):
+        if rev is None:
+            rev = self.repository.get_revision(revid)
+        if tree is None:
+            tree = self.tree_cache.revision_tree(rev.revision_id)
         updater = self._get_updater(rev)
         # FIXME JRV 2011-12-15: Shouldn't we try both values for lossy ?
         for path, obj in self._revision_to_objects(
                 rev, tree, lossy=(not self.mapping.roundtripping),
-                add_cache_entry=updater.add_object):
+                add_cache_entry=updater.add_object, blob_ids=blob_ids):
             if isinstance(obj, Commit):
                 commit_obj = obj
         commit_obj = updater.finish()
@@ -807,9 +915,23 @@ class BazaarObjectStore(BaseObjectStore):
             except KeyError:
                 pass
 
+        ret = PackTupleIterable(self)
+        if not shallow:
+            object_ids = self._find_objects_by_bitmap(
+                pending, processed, lossy)
+            if object_ids is not None:
+                for object_id in object_ids:
+                    ret.add(object_id, None)
+                return ret
         graph = self.repository.get_graph()
         todo = _find_missing_bzr_revids(graph, pending, processed, shallow)
-        ret = PackTupleIterable(self)
+        if not shallow and self._bitmaps_enabled():
+            # The objects introduced by the revisions converted, together
+            # with the bitmaps of the revisions they build on, make up the
+            # bitmaps of the revisions wanted.
+            introduced = {}
+        else:
+            introduced = None
         with ui.ui_factory.nested_progress_bar() as pb:
             for i, revid in enumerate(graph.iter_topo_order(todo)):
                 pb.update("generating git objects", i, len(todo))
@@ -818,10 +940,130 @@ class BazaarObjectStore(BaseObjectStore):
                 except errors.NoSuchRevision:
                     continue
                 tree = self.tree_cache.revision_tree(revid)
+                if introduced is not None:
+                    revision_objects = introduced[revid] = []
                 for path, obj in self._revision_to_objects(
                         rev, tree, lossy=lossy):
                     ret.add(obj.id, path)
-            return ret
+                    if introduced is not None:
+                        revision_objects.append(obj.id)
+        if introduced is not None:
+            self._write_bitmaps(graph, pending, introduced, lossy)
+        return ret
+
+    def _bitmaps_enabled(self):
+        if self._cache.transport is None:
+            return False
+        return config.LocationStack(self.repository.user_url).get(
+            'git.reachability_bitmaps')
+
+    def _get_bitmaps(self, lossy):
+        """Return the reachability bitmaps of the repository.
+
+        :param lossy: Whether the bitmaps should be for lossily exported
+            objects
+        :return: A ReachabilityBitmaps, or None if there are no usable ones
+        """
+        if self._cache.transport is None:
+            return None
+        try:
+            bitmaps = ReachabilityBitmaps.from_transport(self._cache.transport)
+        except CorruptBitmaps as e:
+            trace.mutter('ignoring reachability bitmaps: %s', e)
+            return None
+        if (bitmaps is None or bitmaps.lossy != lossy or
+                bitmaps.mapping_name != self.mapping.revid_prefix):
+            return None
+        return bitmaps
+
+    def _find_objects_by_bitmap(self, pending, processed, lossy):
+        """Find the objects to send using reachability bitmaps.
+
+        :param pending: Revisions that are wanted
+        :param processed: Revisions that are already present
+        :return: Iterator over the ids of the objects to send, or None if
+            there are no bitmaps for some of the revisions
+        """
+        if not self._bitmaps_enabled():
+            return None
+        bitmaps = self._get_bitmaps(lossy)
+        if bitmaps is None:
+            return None
+        wanted = 0
+        try:
+            for revid in pending:
+                wanted |= bitmaps.get_bitmap(revid)
+            for revid in processed:
+                wanted &= ~bitmaps.get_bitmap(revid)
+        except KeyError:
+            return None
+        except CorruptBitmaps as e:
+            trace.mutter('ignoring reachability bitmaps: %s', e)
+            return None
+        return bitmaps.iter_objects(wanted)
+
+    def _write_bitmaps(self, graph, revids, introduced, lossy):
+        """Write reachability bitmaps.
+
+        The bitmap of a revision is that of the objects introduced by it and
+        its ancestors that were converted, combined with the bitmaps of the
+        revisions those build on.  Revisions that build on a revision without
+        a bitmap don't get one.
+
+        :param revids: Revisions to write bitmaps for
+        :param introduced: Dictionary mapping the revisions converted to the
+            ids of the objects they introduce
+        """
+        old_bitmaps = self._get_bitmaps(lossy)
+        if old_bitmaps is None:
+            positions = {}
+            bitmaps = {}
+        else:
+            # The positions of the objects stay the same, so the existing
+            # bitmaps can be kept as they are.
+            try:
+                positions = {
+                    object_id: i for (i, object_id) in
+                    enumerate(old_bitmaps.iter_object_ids())}
+                bitmaps = {revid: old_bitmaps.get_bitmap(revid)
+                           for revid in old_bitmaps.revids()}
+            except CorruptBitmaps as e:
+                trace.mutter('ignoring reachability bitmaps: %s', e)
+                positions = {}
+                bitmaps = {}
+        parent_map = graph.get_parent_map(introduced)
+        new_bitmaps = {}
+        for revid in revids:
+            if revid not in introduced or revid in bitmaps:
+                continue
+            ancestry = set([revid])
+            boundary = set()
+            pending = [revid]
+            while pending:
+                for parent in parent_map.get(pending.pop(), ()):
+                    if parent in introduced:
+                        if parent not in ancestry:
+                            ancestry.add(parent)
+                            pending.append(parent)
+                    elif parent != NULL_REVISION:
+                        boundary.add(parent)
+            try:
+                bitmap = 0
+                for parent in boundary:
+                    bitmap |= bitmaps[parent]
+            except KeyError:
+                continue
+            new_bitmaps[revid] = bitmap | bitmap_from_positions(
+                positions.setdefault(object_id, len(positions))
+                for key in ancestry for object_id in introduced[key])
+        if not new_bitmaps:
+            return
+        bitmaps.update(new_bitmaps)
+        try:
+            write_bitmaps(self._cache.transport, self.mapping.revid_prefix,
+                          lossy, list(positions), bitmaps)
+        except (errors.TransportNotPossible, errors.PermissionDenied) as e:
+            trace.mutter('not writing reachability bitmaps: %s', e)
 
     def add_thin_pack(self):
         import tempfile
@@ -35,6 +35,11 @@ from ..foreign import (
     ForeignRepository,
     )
 
+from .commit_graph import (
+    CommitGraph,
+    CorruptCommitGraph,
+    write_commit_graph,
+    )
 from .filegraph import (
     GitFileLastChangeScanner,
     GitFileParentProvider,
@@ -227,6 +232,35 @@ class GitRepository(ForeignRepository):
         raise errors.UnsupportedOperation(self.add_signature_text, self)
 
 
+class CommitGraphGenerations(object):
+    """The generations of revisions, from a git commit-graph file.
+
+    Revisions whose commits are not in the file are left out, so Graph
+    falls back to searching without generations for them.
+    """
+
+    def __init__(self, repository):
+        self._repository = repository
+
+    def get_generation_map(self, keys):
+        commit_graph = self._repository._get_commit_graph()
+        result = {}
+        if commit_graph is None:
+            return result
+        for key in keys:
+            try:
+                (hexsha, mapping) = self._repository.lookup_bzr_revision_id(
+                    key)
+            except errors.NoSuchRevision:
+                continue
+            if mapping is None or mapping.experimental:
+                continue
+            generation = commit_graph.get_generation(hexsha)
+            if generation is not None:
+                result[key] = generation
+        return result
+
+
 class LocalGitRepository(GitRepository):
     """Git repository on the file system."""
 
@@ -235,6 +269,76 @@ class LocalGitRepository(GitRepository):
         self._git = gitdir._git
         self._file_change_scanner = GitFileLastChangeScanner(self)
         self._transaction = None
+        self._commit_graph = None
+
+    @only_raises(errors.LockNotHeld, errors.LockBroken)
+    def unlock(self):
+        try:
+            super(LocalGitRepository, self).unlock()
+        finally:
+            if not self.is_locked() and self._commit_graph is not None:
+                if self._commit_graph:
+                    self._commit_graph.close()
+                self._commit_graph = None
+
+    def _get_commit_graph(self):
+        """Return the commit-graph file of the repository.
+
+        While the repository is locked the file is only opened once.
+
+        :return: A CommitGraph, or None if there is no (usable) commit-graph
+            file.
+        """
+        if self._commit_graph is not None:
+            return self._commit_graph or None
+        transport = getattr(self._git.object_store, 'transport', None)
+        if transport is None:
+            return None
+        try:
+            commit_graph = CommitGraph.from_transport(transport)
+        except CorruptCommitGraph as e:
+            trace.mutter('ignoring commit-graph file: %s', e)
+            commit_graph = None
+        if self.is_locked():
+            # False records that there is no commit-graph file.
+            self._commit_graph = commit_graph or False
+        return commit_graph
+
+    def _write_commit_graph(self):
+        """Write a commit-graph file for the commits reachable from refs."""
+        object_store = self._git.object_store
+        transport = getattr(object_store, 'transport', None)
+        if transport is None:
+            return
+        commits = {}
+        pending = []
+        for ref, sha in self._git.get_refs().items():
+            try:
+                obj = object_store.peel_sha(sha)
+            except KeyError:
+                continue
+            if isinstance(obj, Commit):
+                pending.append(obj.id)
+        while pending:
+            sha = pending.pop()
+            if sha in commits:
+                continue
+            try:
+                commit = object_store[sha]
+            except KeyError:
+                trace.mutter(
+                    'not writing commit-graph file: commit %s is missing', sha)
+                return
+            commits[sha] = (commit.tree, commit.parents, commit.commit_time)
+            pending.extend(commit.parents)
+        if self._commit_graph:
+            self._commit_graph.close()
+        self._commit_graph = None
+        if not commits:
+            return
+        f = BytesIO()
+        write_commit_graph(f, commits)
+        transport.put_bytes('info/commit-graph', f.getvalue())
 
     def get_commit_builder(self, branch, parents, config, timestamp=None,
                            timezone=None, committer=None, revprops=None,
@@ -350,7 +454,7 @@ class LocalGitRepository(GitRepository):
             ret.add(revid)
         return list(ret)
 
-    def _get_parents(self, revid, no_alternates=False):
+    def _get_parents(self, revid, no_alternates=False, commit_graph=None):
         if type(revid) != bytes:
             raise ValueError
         try:
@@ -358,6 +462,14 @@ class LocalGitRepository(GitRepository):
         except errors.NoSuchRevision:
             return None
         # FIXME: Honor no_alternates setting
+        if (commit_graph is not None and mapping is not None
+                and not mapping.experimental):
+            # The revision ids of these mappings are derived from the commit
+            # ids alone, so the parent commits don't have to be read.
+            parents = commit_graph.get_parents(hexsha)
+            if parents is not None:
+                return [mapping.revision_id_foreign_to_bzr(p)
+                        for p in parents]
         try:
             commit = self._git.object_store[hexsha]
         except KeyError:
@@ -375,9 +487,11 @@ class LocalGitRepository(GitRepository):
 
     def get_parent_map(self, revids, no_alternates=False):
         parent_map = {}
+        commit_graph = self._get_commit_graph()
         for revision_id in revids:
             parents = self._get_parents(
-                revision_id, no_alternates=no_alternates)
+                revision_id, no_alternates=no_alternates,
+                commit_graph=commit_graph)
             if revision_id == _mod_revision.NULL_REVISION:
                 parent_map[revision_id] = ()
                 continue
@@ -393,12 +507,13 @@ class LocalGitRepository(GitRepository):
         """
         pending = set(revision_ids)
         parent_map = {}
+        commit_graph = self._get_commit_graph()
         while pending:
             this_parent_map = {}
             for revid in pending:
                 if revid == _mod_revision.NULL_REVISION:
                     continue
-                parents = self._get_parents(revid)
+                parents = self._get_parents(revid, commit_graph=commit_graph)
                 if parents is not None:
                     this_parent_map[revid] = parents
             parent_map.update(this_parent_map)
@@ -425,6 +540,14 @@ class LocalGitRepository(GitRepository):
 
     def pack(self, hint=None, clean_obsolete_packs=False):
         self._git.object_store.pack_loose_objects()
+        if self._git.get_config().get_boolean(
+                ("gc", ), "writeCommitGraph", True):
+            self._write_commit_graph()
+
+    def _make_generations_provider(self):
+        if not self.is_locked() or self._get_commit_graph() is None:
+            return None
+        return CommitGraphGenerations(self)
 
     def lookup_foreign_revision_id(self, foreign_revid, mapping=None):
         """Lookup a revision id.
@@ -0,0 +1,238 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Sorted tables of the Git objects exported from Bazaar objects.
+
+A table is an immutable file with two sorted lists of 20 byte keys:
+
+ * objects: the binary sha of each Git object, with the location of a record
+   describing the Bazaar object it was exported from:
+   b"<type>\\0<data1>\\0<data2>[\\0<data3>]", as in TdbGitShaMap.  An object
+   can have several records.
+ * keys: the sha1 of a Bazaar key (see key_sha) with the binary sha of the
+   Git object exported for it.
+
+Each list is preceded by a fanout table with the number of keys whose first
+byte is less than or equal to each byte value, as in git pack indices, so a
+lookup is a binary search among the keys with the same first byte.  The
+records follow the lists.
+"""
+
+import mmap
+import struct
+
+from .. import (
+    errors,
+    osutils,
+    )
+from ..transport import NoSuchFile
+
+
+FORMAT_STRING = b'bzr-git sha map table v1\n'
+
+_COUNTS = struct.Struct('>LL')
+_FANOUT = struct.Struct('>256L')
+_LOCATION = struct.Struct('>QL')
+
+
+class CorruptShaMapTable(errors.BzrError):
+
+    _fmt = "Corrupt git SHA map table: %(reason)s"
+
+    def __init__(self, reason):
+        errors.BzrError.__init__(self, reason=reason)
+
+
+def key_sha(key):
+    """Return the sha under which a Bazaar key is kept.
+
+    :param key: Tuple of a type ("commit", "blob" or "tree", as bytes) and
+        the revision id, or the file id and revision for blobs and trees
+    """
+    return osutils.sha(b'\0'.join(key)).digest()
+
+
+def _lower_bound(data, fanout, offset, sha):
+    """Find the first position of sha in a sorted list of keys.
+
+    :return: Tuple with the position of the first key not less than sha and
+        the position after the last key with the same first byte
+    """
+    first = sha[0]
+    if first == 0:
+        lo = 0
+    else:
+        lo = fanout[first - 1]
+    end = hi = fanout[first]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = offset + mid * 20
+        if data[start:start + 20] < sha:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo, end
+
+
+class ShaMapTable(object):
+    """A table read from a file."""
+
+    def __init__(self, data):
+        """Create a ShaMapTable.
+
+        :param data: The contents of the file, as bytes or an mmap.
+        """
+        self._data = data
+        if data[:len(FORMAT_STRING)] != FORMAT_STRING:
+            raise CorruptShaMapTable('unknown format')
+        offset = len(FORMAT_STRING)
+        try:
+            self._num_objects, self._num_keys = _COUNTS.unpack_from(
+                data, offset)
+            offset += _COUNTS.size
+            self._object_fanout = _FANOUT.unpack_from(data, offset)
+            offset += _FANOUT.size
+            self._object_offset = offset
+            offset += self._num_objects * (20 + _LOCATION.size)
+            self._key_fanout = _FANOUT.unpack_from(data, offset)
+            offset += _FANOUT.size
+        except struct.error:
+            raise CorruptShaMapTable('file too short')
+        self._key_offset = offset
+        offset += self._num_keys * 40
+        self._records_offset = offset
+        if offset > len(data):
+            raise CorruptShaMapTable('file too short')
+        if (self._object_fanout[255] != self._num_objects or
+                self._key_fanout[255] != self._num_keys):
+            raise CorruptShaMapTable('fanout does not match counts')
+
+    @classmethod
+    def from_transport(cls, transport, path):
+        """Open the table at path on transport.
+
+        Local files are mapped into memory rather than read.
+
+        :raise NoSuchFile: If there is no such file
+        """
+        try:
+            local_path = transport.local_abspath(path)
+        except errors.NotLocalUrl:
+            data = transport.get_bytes(path)
+        else:
+            try:
+                with open(local_path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                raise NoSuchFile(path)
+            except ValueError:
+                # An empty file can't be mapped.
+                raise CorruptShaMapTable('file too short')
+        return cls(data)
+
+    def __len__(self):
+        return self._num_objects
+
+    def _record(self, position):
+        (offset, length) = _LOCATION.unpack_from(
+            self._data, self._object_offset + self._num_objects * 20 +
+            position * _LOCATION.size)
+        start = self._records_offset + offset
+        if start + length > len(self._data):
+            raise CorruptShaMapTable('record out of bounds')
+        return self._data[start:start + length]
+
+    def get_records(self, sha):
+        """Return the records for a Git object.
+
+        :param sha: Binary sha of the object
+        :return: A list of records, empty if the object is not in the table
+        """
+        position, end = _lower_bound(
+            self._data, self._object_fanout, self._object_offset, sha)
+        records = []
+        data = self._data
+        while position < end:
+            start = self._object_offset + position * 20
+            if data[start:start + 20] != sha:
+                break
+            records.append(self._record(position))
+            position += 1
+        return records
+
+    def get_key(self, sha):
+        """Return the Git object for a Bazaar key.
+
+        :param sha: The sha of the key, as returned by key_sha
+        :return: Binary sha of the object, or None if the key is not in the
+            table
+        """
+        position, end = _lower_bound(
+            self._data, self._key_fanout, self._key_offset, sha)
+        start = self._key_offset + position * 20
+        if position == end or self._data[start:start + 20] != sha:
+            return None
+        start = self._key_offset + self._num_keys * 20 + position * 20
+        return self._data[start:start + 20]
+
+    def iter_objects(self):
+        """Iterate over the (sha, record) tuples in the table."""
+        data = self._data
+        for position in range(self._num_objects):
+            start = self._object_offset + position * 20
+            yield data[start:start + 20], self._record(position)
+
+    def iter_keys(self):
+        """Iterate over the (key sha, sha) tuples in the table."""
+        data = self._data
+        keys_offset = self._key_offset
+        values_offset = keys_offset + self._num_keys * 20
+        for position in range(self._num_keys):
+            start = position * 20
+            yield (data[keys_offset + start:keys_offset + start + 20],
+                   data[values_offset + start:values_offset + start + 20])
+
+
+def _fanout(shas):
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[sha[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    return _FANOUT.pack(*fanout)
+
+
+def write_table(objects, keys):
+    """Create the contents of a table.
+
+    :param objects: Iterable over (sha, record) tuples for Git objects
+    :param keys: Iterable over (key sha, sha) tuples for Bazaar keys
+    :return: The contents of the table, as bytes
+    """
+    objects = sorted(set(objects))
+    keys = sorted(dict(keys).items())
+    locations = []
+    offset = 0
+    for sha, record in objects:
+        locations.append(_LOCATION.pack(offset, len(record)))
+        offset += len(record)
+    return b''.join(
+        [FORMAT_STRING, _COUNTS.pack(len(objects), len(keys)),
+         _fanout(sha for sha, record in objects)] +
+        [sha for sha, record in objects] + locations +
+        [_fanout(key for key, sha in keys)] +
+        [key for key, sha in keys] + [sha for key, sha in keys] +
+        [record for sha, record in objects])
@@ -209,10 +209,12 @@ def load_tests(loader, basic_tests, pattern):
         return suite
 
     testmod_names = [
+        'test_bitmaps',
         'test_blackbox',
         'test_builder',
         'test_branch',
         'test_cache',
+        'test_commit_graph',
         'test_dir',
         'test_fetch',
         'test_git_remote_helper',
@@ -227,6 +229,7 @@ def load_tests(loader, basic_tests, pattern):
         'test_revspec',
         'test_roundtrip',
         'test_server',
+        'test_shamap_table',
         'test_transform',
         'test_transportgit',
         'test_tree',
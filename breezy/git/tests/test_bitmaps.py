@@ -0,0 +1,90 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for reachability bitmaps."""
+
+from ...tests import (
+    TestCase,
+    TestCaseWithMemoryTransport,
+    )
+from ..bitmaps import (
+    CorruptBitmaps,
+    ReachabilityBitmaps,
+    bitmap_from_positions,
+    iter_positions,
+    write_bitmaps,
+    )
+
+
+class BitmapTests(TestCase):
+
+    def test_from_positions(self):
+        self.assertEqual(0, bitmap_from_positions([]))
+        self.assertEqual(0b100101, bitmap_from_positions([0, 2, 5, 2]))
+        self.assertEqual(1 << 100, bitmap_from_positions([100]))
+
+    def test_iter_positions(self):
+        self.assertEqual([], list(iter_positions(0)))
+        self.assertEqual([0, 2, 5, 100],
+                         list(iter_positions(0b100101 | (1 << 100))))
+
+
+class ReachabilityBitmapsTests(TestCaseWithMemoryTransport):
+
+    objects = [b'%040d' % i for i in range(10)]
+
+    def write_bitmaps(self, lossy=False):
+        transport = self.get_transport()
+        write_bitmaps(transport, b'git-v1', lossy, self.objects, {
+            b'rev1': bitmap_from_positions([0, 1]),
+            b'rev2': bitmap_from_positions([0, 1, 2, 9]),
+            b'rev with spaces': 0,
+            })
+        return transport
+
+    def test_roundtrip(self):
+        bitmaps = ReachabilityBitmaps.from_transport(self.write_bitmaps())
+        self.assertEqual(b'git-v1', bitmaps.mapping_name)
+        self.assertFalse(bitmaps.lossy)
+        self.assertEqual(10, len(bitmaps))
+        self.assertEqual({b'rev1', b'rev2', b'rev with spaces'},
+                         bitmaps.revids())
+        self.assertEqual(0b11, bitmaps.get_bitmap(b'rev1'))
+        self.assertEqual(0, bitmaps.get_bitmap(b'rev with spaces'))
+        self.assertRaises(KeyError, bitmaps.get_bitmap, b'rev3')
+        self.assertEqual(
+            [self.objects[2], self.objects[9]],
+            list(bitmaps.iter_objects(
+                bitmaps.get_bitmap(b'rev2') & ~bitmaps.get_bitmap(b'rev1'))))
+        self.assertEqual(self.objects, list(bitmaps.iter_object_ids()))
+
+    def test_lossy(self):
+        bitmaps = ReachabilityBitmaps.from_transport(
+            self.write_bitmaps(lossy=True))
+        self.assertTrue(bitmaps.lossy)
+
+    def test_absent(self):
+        self.assertIs(None,
+                      ReachabilityBitmaps.from_transport(self.get_transport()))
+
+    def test_corrupt(self):
+        self.assertRaises(CorruptBitmaps, ReachabilityBitmaps, b'')
+        self.assertRaises(CorruptBitmaps, ReachabilityBitmaps,
+                          b'bzr-git reachability bitmaps v2\n\n\n')
+        data = self.write_bitmaps().get_bytes('bitmaps')
+        self.assertRaises(CorruptBitmaps, ReachabilityBitmaps, data[:100])
+        self.assertRaises(CorruptBitmaps, ReachabilityBitmaps(
+            data[:-5]).get_bitmap, b'rev2')
@@ -675,6 +675,25 @@ class GitObjectsTests(ExternalBase):
         self.run_simple(format='2a')
 
 
+class GitUpgradeCacheTests(ExternalBase):
+
+    def test_upgrade_cache(self):
+        tree = self.make_branch_and_tree('.', format='2a')
+        self.build_tree(['a/', 'a/foo'])
+        tree.add(['a'])
+        tree.commit('add a')
+        before, error = self.run_bzr('git-objects')
+        output, error = self.run_bzr('git-upgrade-cache')
+        self.assertEqual('Git SHA map converted.\n', output)
+        self.assertEqual('', error)
+        self.assertEqual(
+            b'bzr-git sha map version 1 using sorted tables\n',
+            tree.branch.repository._transport.get_bytes('git/format'))
+        after, error = self.run_bzr('git-objects')
+        self.assertEqual(sorted(before.splitlines()),
+                         sorted(after.splitlines()))
+
+
 class GitApplyTests(ExternalBase):
 
     def test_apply(self):
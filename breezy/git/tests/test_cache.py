@@ -39,11 +39,17 @@ from ...transport import (
     )
 
 from ..cache import (
+    BzrGitCacheFormat,
     DictBzrGitCache,
     IndexBzrGitCache,
     IndexGitCacheFormat,
     SqliteBzrGitCache,
+    SqliteGitCacheFormat,
+    TableBzrGitCache,
+    TableGitCacheFormat,
+    TableGitShaMap,
     TdbBzrGitCache,
+    upgrade_cache,
     )
 
 
@@ -172,3 +178,152 @@ class IndexGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
         IndexGitCacheFormat().initialize(transport)
         self.cache = IndexBzrGitCache(transport)
         self.map = self.cache.idmap
+
+    def test_pending_nodes(self):
+        self.map._flush_threshold = 2
+        self.map.start_write_group()
+        updater = self.cache.get_updater(Revision(b"myrevid"))
+        b = Blob()
+        b.data = b"TEH BLOB"
+        updater.add_object(b, (b"myfileid", b"myrevid"), None)
+        # Not flushed yet, but visible.
+        self.assertEqual(b.id,
+                         self.map.lookup_blob_id(b"myfileid", b"myrevid"))
+        updater.add_object(("blob", b.id), (b"myfileid", b"myrevid"), None)
+        updater.add_object(self._get_test_commit(), {
+                           "testament3-sha1": b"Test"}, None)
+        updater.finish()
+        self.map.commit_write_group()
+        self.assertEqual({}, self.map._pending)
+        self.assertEqual(
+            [("blob", (b"myfileid", b"myrevid"))],
+            list(self.map.lookup_git_sha(b.id)))
+        self.assertEqual([b"myrevid"], list(self.map.revids()))
+
+
+class TableGitShaMapTests(TestCaseInTempDir, TestGitShaMap):
+
+    def setUp(self):
+        TestCaseInTempDir.setUp(self)
+        self.transport = get_transport(self.test_dir)
+        TableGitCacheFormat().initialize(self.transport)
+        self.cache = TableBzrGitCache(self.transport)
+        self.map = self.cache.idmap
+
+    def add_revision(self, cache, revid, blob_data):
+        cache.idmap.start_write_group()
+        updater = cache.get_updater(Revision(revid))
+        c = self._get_test_commit()
+        c.message = revid
+        updater.add_object(c, {"testament3-sha1": b"testament"}, None)
+        b = Blob()
+        b.data = blob_data
+        updater.add_object(b, (b"myfileid", revid), None)
+        updater.finish()
+        cache.idmap.commit_write_group()
+        return c, b
+
+    def test_reopen(self):
+        c, b = self.add_revision(self.cache, b"myrevid", b"TEH BLOB")
+        idmap = TableBzrGitCache(self.transport).idmap
+        self.assertEqual(c.id, idmap.lookup_commit(b"myrevid"))
+        self.assertEqual(b.id, idmap.lookup_blob_id(b"myfileid", b"myrevid"))
+        self.assertEqual({c.id, b.id}, set(idmap.sha1s()))
+
+    def test_pending_entries(self):
+        self.map.start_write_group()
+        updater = self.cache.get_updater(Revision(b"myrevid"))
+        b = Blob()
+        b.data = b"TEH BLOB"
+        updater.add_object(b, (b"myfileid", b"myrevid"), None)
+        self.assertEqual(b.id,
+                         self.map.lookup_blob_id(b"myfileid", b"myrevid"))
+        self.assertEqual([("blob", (b"myfileid", b"myrevid"))],
+                         list(self.map.lookup_git_sha(b.id)))
+        self.map.abort_write_group()
+        self.assertRaises(KeyError, self.map.lookup_blob_id,
+                          b"myfileid", b"myrevid")
+        self.assertEqual([], self.transport.list_dir('tables'))
+
+    def test_same_blob(self):
+        self.add_revision(self.cache, b"rev1", b"TEH BLOB")
+        c, b = self.add_revision(self.cache, b"rev2", b"TEH BLOB")
+        self.assertEqual(
+            [("blob", (b"myfileid", b"rev1")),
+             ("blob", (b"myfileid", b"rev2"))],
+            sorted(self.map.lookup_git_sha(b.id)))
+
+    def test_combine(self):
+        self.map._max_tables = 2
+        shas = set()
+        for i in range(4):
+            shas.update(
+                obj.id for obj in self.add_revision(
+                    self.cache, b"rev%d" % i, b"blob %d" % i))
+            self.assertLessEqual(len(self.map._tables), 2)
+        self.assertEqual(
+            len(self.map._tables), len(self.transport.list_dir('tables')))
+        self.assertEqual(shas, set(self.map.sha1s()))
+        self.assertEqual({b"rev0", b"rev1", b"rev2", b"rev3"},
+                         set(self.map.revids()))
+
+
+class UpgradeCacheTests(TestCaseInTempDir):
+
+    def make_commit(self):
+        c = Commit()
+        c.committer = c.author = b"Jelmer <jelmer@samba.org>"
+        c.commit_time = c.author_time = 0
+        c.commit_timezone = c.author_timezone = 0
+        c.message = b"Teh foo bar"
+        c.tree = b"cc9462f7f8263ef5adfbeff2fb936bb36b504cba"
+        return c
+
+    def fill_cache(self, cache):
+        cache.idmap.start_write_group()
+        updater = cache.get_updater(Revision(b"myrevid"))
+        c = self.make_commit()
+        updater.add_object(c, {"testament3-sha1": b"testament"}, None)
+        b = Blob()
+        b.data = b"TEH BLOB"
+        updater.add_object(b, (b"myfileid", b"myrevid"), None)
+        t = Tree()
+        t.add(b"somename", stat.S_IFREG, b.id)
+        updater.add_object(t, (b"rootid", b"myrevid"), b"")
+        updater.finish()
+        cache.idmap.commit_write_group()
+        return c, b, t
+
+    def assertUpgraded(self, transport, c, b, t):
+        cache = upgrade_cache(transport)
+        self.assertIsInstance(cache, TableBzrGitCache)
+        self.assertEqual(TableGitCacheFormat().get_format_string(),
+                         transport.get_bytes('format'))
+        idmap = BzrGitCacheFormat.from_transport(transport).idmap
+        self.assertIsInstance(idmap, TableGitShaMap)
+        self.assertEqual(c.id, idmap.lookup_commit(b"myrevid"))
+        self.assertEqual(
+            [("commit", (b"myrevid", c.tree,
+                         {"testament3-sha1": b"testament"}))],
+            list(idmap.lookup_git_sha(c.id)))
+        self.assertEqual(b.id, idmap.lookup_blob_id(b"myfileid", b"myrevid"))
+        self.assertEqual([("tree", (b"rootid", b"myrevid"))],
+                         list(idmap.lookup_git_sha(t.id)))
+
+    def test_from_index(self):
+        transport = get_transport(self.test_dir)
+        IndexGitCacheFormat().initialize(transport)
+        c, b, t = self.fill_cache(IndexBzrGitCache(transport))
+        self.assertUpgraded(transport, c, b, t)
+
+    def test_from_sqlite(self):
+        transport = get_transport(self.test_dir)
+        SqliteGitCacheFormat().initialize(transport)
+        c, b, t = self.fill_cache(SqliteGitCacheFormat().open(transport))
+        self.assertUpgraded(transport, c, b, t)
+
+    def test_no_cache(self):
+        transport = get_transport(self.test_dir)
+        self.assertIsInstance(upgrade_cache(transport), TableBzrGitCache)
+        self.assertEqual(TableGitCacheFormat().get_format_string(),
+                         transport.get_bytes('format'))
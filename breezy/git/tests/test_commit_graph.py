@@ -0,0 +1,252 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for reading and writing git commit-graph files."""
+
+from io import BytesIO
+import os
+import subprocess
+
+from dulwich.objects import (
+    Commit,
+    Tree,
+    )
+from dulwich.repo import Repo as GitRepo
+
+from ... import revision as _mod_revision
+from ...repository import Repository
+from ...tests import (
+    TestCase,
+    TestCaseInTempDir,
+    )
+from ...tests.features import ExecutableFeature
+from ..commit_graph import (
+    CommitGraph,
+    CorruptCommitGraph,
+    write_commit_graph,
+    )
+from ..mapping import default_mapping
+
+
+def fake_sha(name):
+    return (name * 40)[:40]
+
+
+TREE = fake_sha(b'e')
+
+# a - b - d - f
+#  \     /   /
+#   c --+   /
+#    \     /
+#     +---e
+commits = {
+    fake_sha(b'a'): (TREE, [], 1000),
+    fake_sha(b'b'): (TREE, [fake_sha(b'a')], 1001),
+    fake_sha(b'c'): (TREE, [fake_sha(b'a')], 1002),
+    fake_sha(b'd'): (TREE, [fake_sha(b'b'), fake_sha(b'c')], 1003),
+    fake_sha(b'e'): (TREE, [fake_sha(b'c')], 1004),
+    fake_sha(b'f'): (TREE, [fake_sha(b'd'), fake_sha(b'c'), fake_sha(b'e')],
+                     1005),
+    }
+
+
+def make_commit_graph(commits):
+    f = BytesIO()
+    write_commit_graph(f, commits)
+    return CommitGraph(f.getvalue())
+
+
+class TestCommitGraph(TestCase):
+
+    def test_get_parents(self):
+        graph = make_commit_graph(commits)
+        self.assertEqual(6, len(graph))
+        for sha, (tree, parents, commit_time) in commits.items():
+            self.assertEqual(parents, graph.get_parents(sha))
+
+    def test_get_generation(self):
+        graph = make_commit_graph(commits)
+        self.assertEqual(
+            {b'a': 1, b'b': 2, b'c': 2, b'd': 3, b'e': 3, b'f': 4},
+            dict((name, graph.get_generation(fake_sha(name)))
+                 for name in [b'a', b'b', b'c', b'd', b'e', b'f']))
+
+    def test_absent(self):
+        graph = make_commit_graph(commits)
+        self.assertIs(None, graph.get_parents(fake_sha(b'1')))
+        self.assertIs(None, graph.get_generation(fake_sha(b'1')))
+        self.assertIs(None, graph.get_parents(b'not-a-sha'))
+        self.assertIn(fake_sha(b'a'), graph)
+        self.assertNotIn(fake_sha(b'1'), graph)
+
+    def test_missing_parent(self):
+        self.assertRaises(ValueError, write_commit_graph, BytesIO(),
+                          {fake_sha(b'b'): (TREE, [fake_sha(b'a')], 1000)})
+
+    def test_corrupt(self):
+        f = BytesIO()
+        write_commit_graph(f, commits)
+        data = f.getvalue()
+        self.assertRaises(CorruptCommitGraph, CommitGraph, b'')
+        self.assertRaises(CorruptCommitGraph, CommitGraph, b'XXXX' + data[4:])
+        self.assertRaises(CorruptCommitGraph, CommitGraph, data[:100])
+
+
+class TestGitCommitGraph(TestCaseInTempDir):
+
+    _test_needs_features = [ExecutableFeature('git')]
+
+    def setUp(self):
+        super(TestGitCommitGraph, self).setUp()
+        self.git_repo = GitRepo.init('.')
+        self.addCleanup(self.git_repo.close)
+        self.shas = {}
+        self.commit(b'a', [])
+        self.commit(b'b', [b'a'])
+        self.commit(b'c', [b'a'])
+        self.commit(b'd', [b'b', b'c'])
+        self.commit(b'e', [b'c'])
+        self.commit(b'f', [b'd', b'c', b'e'])
+        self.git_repo.refs[b'refs/heads/master'] = self.shas[b'f']
+
+    def commit(self, name, parents):
+        tree = Tree()
+        self.git_repo.object_store.add_object(tree)
+        commit = Commit()
+        commit.tree = tree.id
+        commit.parents = [self.shas[parent] for parent in parents]
+        commit.author = commit.committer = b'Joe Foo <joe@foo.com>'
+        commit.author_time = commit.commit_time = 1000 + len(self.shas)
+        commit.author_timezone = commit.commit_timezone = 0
+        commit.message = name
+        self.git_repo.object_store.add_object(commit)
+        self.shas[name] = commit.id
+
+    def run_git(self, *args):
+        subprocess.check_output(('git',) + args, stderr=subprocess.STDOUT)
+
+    def test_read_git_commit_graph(self):
+        self.run_git('commit-graph', 'write', '--reachable')
+        with open('.git/objects/info/commit-graph', 'rb') as f:
+            graph = CommitGraph(f.read())
+        self.assertEqual(6, len(graph))
+        for name in self.shas:
+            commit = self.git_repo[self.shas[name]]
+            self.assertEqual(commit.parents, graph.get_parents(commit.id))
+        self.assertEqual(1, graph.get_generation(self.shas[b'a']))
+        self.assertEqual(4, graph.get_generation(self.shas[b'f']))
+
+    def test_git_verifies_written_commit_graph(self):
+        repo = Repository.open('.')
+        repo.pack()
+        self.assertPathExists('.git/objects/info/commit-graph')
+        self.run_git('commit-graph', 'verify')
+
+
+class TestLocalGitRepositoryCommitGraph(TestCaseInTempDir):
+
+    def setUp(self):
+        super(TestLocalGitRepositoryCommitGraph, self).setUp()
+        self.git_repo = GitRepo.init('.')
+        self.addCleanup(self.git_repo.close)
+        self.shas = []
+        for i in range(3):
+            self.commit()
+
+    def commit(self):
+        self.shas.append(self.git_repo.do_commit(
+            message=b'message %d' % len(self.shas),
+            committer=b'Joe Foo <joe@foo.com>'))
+        return default_mapping.revision_id_foreign_to_bzr(self.shas[-1])
+
+    def revid(self, i):
+        return default_mapping.revision_id_foreign_to_bzr(self.shas[i])
+
+    def test_pack_writes_commit_graph(self):
+        repo = Repository.open('.')
+        repo.pack()
+        with open('.git/objects/info/commit-graph', 'rb') as f:
+            graph = CommitGraph(f.read())
+        self.assertEqual(3, len(graph))
+        self.assertEqual([self.shas[1]], graph.get_parents(self.shas[2]))
+
+    def test_pack_honours_config(self):
+        config = self.git_repo.get_config()
+        config.set(('gc', ), 'writeCommitGraph', False)
+        config.write_to_path()
+        repo = Repository.open('.')
+        repo.pack()
+        self.assertPathDoesNotExist('.git/objects/info/commit-graph')
+
+    def test_get_parent_map(self):
+        repo = Repository.open('.')
+        repo.pack()
+        new_revid = self.commit()
+        with repo.lock_read():
+            self.assertIsNot(None, repo._get_commit_graph())
+            # Commits that aren't in the commit-graph are read instead.
+            self.assertEqual(
+                {self.revid(0): (_mod_revision.NULL_REVISION,),
+                 self.revid(2): (self.revid(1),),
+                 new_revid: (self.revid(2),)},
+                repo.get_parent_map(
+                    [self.revid(0), self.revid(2), new_revid, b'git-v1:' +
+                     fake_sha(b'1')]))
+            self.assertEqual(
+                [self.revid(1), self.revid(0)],
+                list(repo.get_known_graph_ancestry(
+                    [self.revid(1)]).topo_sort())[::-1])
+
+    def test_parents_from_commit_graph(self):
+        repo = Repository.open('.')
+        commits = {
+            self.shas[2]: (self.git_repo[self.shas[2]].tree, [], 0)}
+        f = BytesIO()
+        write_commit_graph(f, commits)
+        with open('.git/objects/info/commit-graph', 'wb') as g:
+            g.write(f.getvalue())
+        # The parents recorded in the commit-graph are used rather than
+        # those of the commit.
+        self.assertEqual({self.revid(2): (_mod_revision.NULL_REVISION,)},
+                         repo.get_parent_map([self.revid(2)]))
+
+    def test_corrupt_commit_graph_ignored(self):
+        repo = Repository.open('.')
+        os.makedirs('.git/objects/info', exist_ok=True)
+        with open('.git/objects/info/commit-graph', 'wb') as f:
+            f.write(b'garbage')
+        self.assertIs(None, repo._get_commit_graph())
+        self.assertEqual({self.revid(2): (self.revid(1),)},
+                         repo.get_parent_map([self.revid(2)]))
+
+    def test_generations(self):
+        repo = Repository.open('.')
+        self.assertIs(None, repo._make_generations_provider())
+        with repo.lock_read():
+            self.assertIs(None, repo._make_generations_provider())
+        repo.pack()
+        new_revid = self.commit()
+        with repo.lock_read():
+            graph = repo.get_graph()
+            self.assertEqual(
+                {self.revid(0): 1, self.revid(2): 3},
+                graph._generations.get_generation_map(
+                    [self.revid(0), self.revid(2), new_revid,
+                     _mod_revision.NULL_REVISION]))
+            self.assertEqual({new_revid},
+                             graph.heads([self.revid(1), new_revid]))
+            self.assertTrue(graph.is_ancestor(self.revid(0), self.revid(2)))
+            self.assertFalse(graph.is_ancestor(self.revid(2), self.revid(0)))
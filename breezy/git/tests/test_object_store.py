@@ -25,6 +25,7 @@ from dulwich.objects import (
     Tree,
     )
 
+from ... import config
 from ...branchbuilder import (
     BranchBuilder,
     )
@@ -54,6 +55,7 @@ from ..object_store import (
     directory_to_tree,
     _check_expected_sha,
     _find_missing_bzr_revids,
+    _blob_id,
     _tree_to_objects,
     )
 
@@ -235,6 +237,161 @@ class BazaarObjectStoreTests(TestCaseWithTransport):
         self.assertTrue(b.id in self.store)
 
 
+
+class BazaarObjectStoreBitmapTests(TestCaseWithTransport):
+
+    def setUp(self):
+        super(BazaarObjectStoreBitmapTests, self).setUp()
+        self.branch = self.make_branch(".")
+        bb = BranchBuilder(branch=self.branch)
+        bb.start_series()
+        self.revid1 = bb.build_snapshot(None, [
+            ('add', ('', None, 'directory', None)),
+            ('add', ('foo', b'foo-id', 'file', b'foo\n')),
+            ])
+        self.revid2 = bb.build_snapshot(None, [
+            ('add', ('bar', b'bar-id', 'file', b'bar\n')),
+            ])
+        self.revid3 = bb.build_snapshot(None, [
+            ('modify', ('foo', b'new foo\n')),
+            ])
+        bb.finish_series()
+        self.store = BazaarObjectStore(self.branch.repository)
+        self.store.lock_read()
+        self.addCleanup(self.store.unlock)
+        self.shas = [self.store._lookup_revision_sha1(revid) for revid in
+                     (self.revid1, self.revid2, self.revid3)]
+
+    def enable_bitmaps(self):
+        config.GlobalStack().set('git.reachability_bitmaps', True)
+
+    def generate(self, have, want):
+        return set(self.store.generate_pack_contents(
+            have, want, lossy=True).objects)
+
+    def test_not_enabled(self):
+        self.generate([], [self.shas[2]])
+        self.assertFalse(self.store._cache.transport.has('bitmaps'))
+
+    def test_full(self):
+        self.enable_bitmaps()
+        objects = self.generate([], [self.shas[2]])
+        self.assertEqual(9, len(objects))
+        bitmaps = self.store._get_bitmaps(True)
+        self.assertEqual({self.revid3}, bitmaps.revids())
+        self.assertEqual(objects, set(bitmaps.iter_objects(
+            bitmaps.get_bitmap(self.revid3))))
+        # Once there are bitmaps, revisions are no longer converted.
+        self.overrideAttr(self.store, '_revision_to_objects', None)
+        self.assertEqual(objects, self.generate([], [self.shas[2]]))
+        self.assertIs(None, self.store._get_bitmaps(False))
+
+    def test_incremental(self):
+        self.enable_bitmaps()
+        self.generate([], [self.shas[0]])
+        expected = self.generate([self.shas[0]], [self.shas[2]])
+        # The bitmap of revid3 is that of revid1 plus the objects the
+        # revisions since introduce.
+        bitmaps = self.store._get_bitmaps(True)
+        self.assertEqual({self.revid1, self.revid3}, bitmaps.revids())
+        self.overrideAttr(self.store, '_revision_to_objects', None)
+        self.assertEqual(expected,
+                         self.generate([self.shas[0]], [self.shas[2]]))
+        self.assertEqual(9, len(self.generate([], [self.shas[2]])))
+
+    def test_no_bitmap(self):
+        self.generate([], [self.shas[0]])
+        self.enable_bitmaps()
+        # No bitmap for revid1, so its objects are found as before and
+        # there is no bitmap for revid2 either.
+        self.assertEqual(3, len(self.generate([self.shas[0]], [self.shas[1]])))
+        self.assertFalse(self.store._cache.transport.has('bitmaps'))
+
+    def test_disabled_not_read(self):
+        self.enable_bitmaps()
+        self.generate([], [self.shas[2]])
+        config.GlobalStack().set('git.reachability_bitmaps', False)
+
+        def get_bitmaps(lossy):
+            raise AssertionError('bitmaps read')
+        self.overrideAttr(self.store, '_get_bitmaps', get_bitmaps)
+        self.assertEqual(9, len(self.generate([], [self.shas[2]])))
+
+
+class BlobIdTests(TestCase):
+
+    def test_blob_id(self):
+        self.assertEqual(Blob.from_string(b'foo\nbar\n').id,
+                         _blob_id([b'foo\n', b'bar\n']))
+        self.assertEqual(Blob().id, _blob_id([]))
+
+
+class BazaarObjectStoreUpdateShaMapTests(TestCaseWithTransport):
+
+    def make_store(self, path):
+        branch = self.make_branch(path)
+        bb = BranchBuilder(branch=branch)
+        bb.start_series()
+        bb.build_snapshot(None, [
+            ('add', ('', b'root-id', 'directory', None)),
+            ('add', ('foo', b'foo-id', 'file', b'foo\n')),
+            ], timestamp=1000, revision_id=b'rev1')
+        bb.build_snapshot([b'rev1'], [
+            ('add', ('bar', b'bar-id', 'file', b'bar\n')),
+            ], timestamp=1001, revision_id=b'rev2')
+        bb.build_snapshot([b'rev1'], [
+            ('modify', ('foo', b'other foo\n')),
+            ], timestamp=1002, revision_id=b'rev3')
+        bb.build_snapshot([b'rev2', b'rev3'], [
+            ('modify', ('foo', b'merged foo\n')),
+            ('add', ('dir', b'dir-id', 'directory', None)),
+            ('add', ('dir/baz', b'baz-id', 'file', b'baz\n')),
+            ], timestamp=1003, revision_id=b'rev4')
+        bb.finish_series()
+        store = BazaarObjectStore(branch.repository)
+        store.lock_read()
+        self.addCleanup(store.unlock)
+        return store
+
+    def get_sha_map(self, store):
+        store._update_sha_map()
+        idmap = store._cache.idmap
+        return dict((sha, list(idmap.lookup_git_sha(sha)))
+                    for sha in idmap.sha1s())
+
+    def test_batches(self):
+        store = self.make_store('a')
+        store._update_batch_size = 1
+        expected = self.get_sha_map(store)
+        store = self.make_store('b')
+        store._update_batch_size = 3
+        self.assertEqual(expected, self.get_sha_map(store))
+        self.assertEqual(
+            Blob.from_string(b'merged foo\n').id,
+            store._cache.idmap.lookup_blob_id(b'foo-id', b'rev4'))
+
+    def test_workers(self):
+        store = self.make_store('a')
+        expected = self.get_sha_map(store)
+        store = self.make_store('b')
+        config.GlobalStack().set('git.sha_map_workers', 2)
+        self.assertEqual(expected, self.get_sha_map(store))
+
+    def test_get_blob_ids(self):
+        store = self.make_store('a')
+        revids = [b'rev1', b'rev2', b'rev3', b'rev4']
+        revs = store.repository.get_revisions(revids)
+        trees = store.tree_cache.revision_trees(revids)
+        for workers in (1, 2):
+            self.assertEqual({
+                (b'foo-id', b'rev1'): Blob.from_string(b'foo\n').id,
+                (b'bar-id', b'rev2'): Blob.from_string(b'bar\n').id,
+                (b'foo-id', b'rev3'): Blob.from_string(b'other foo\n').id,
+                (b'foo-id', b'rev4'): Blob.from_string(b'merged foo\n').id,
+                (b'baz-id', b'rev4'): Blob.from_string(b'baz\n').id,
+                }, store._get_blob_ids(list(zip(revs, trees)), workers))
+
+
 class TreeToObjectsTests(TestCaseWithTransport):
 
     def setUp(self):
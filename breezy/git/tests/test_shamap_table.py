@@ -0,0 +1,108 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for the sorted tables of the Git SHA map."""
+
+from ...tests import (
+    TestCase,
+    TestCaseWithTransport,
+    )
+from ...transport import NoSuchFile
+from ..shamap_table import (
+    CorruptShaMapTable,
+    ShaMapTable,
+    key_sha,
+    write_table,
+    )
+
+
+def fake_sha(byte):
+    return bytes([byte]) * 20
+
+
+objects = [
+    (fake_sha(1), b'blob\0file-a\0rev-1'),
+    (fake_sha(1), b'blob\0file-b\0rev-2'),
+    (fake_sha(0x80), b'tree\0root\0rev-1'),
+    (fake_sha(0xff), b'commit\0rev-1\0' + b'1' * 40),
+    ]
+
+keys = [
+    (key_sha((b'blob', b'file-a', b'rev-1')), fake_sha(1)),
+    (key_sha((b'blob', b'file-b', b'rev-2')), fake_sha(1)),
+    (key_sha((b'tree', b'root', b'rev-1')), fake_sha(0x80)),
+    (key_sha((b'commit', b'rev-1')), fake_sha(0xff)),
+    ]
+
+
+class TestShaMapTable(TestCase):
+
+    def test_get_records(self):
+        table = ShaMapTable(write_table(reversed(objects), keys))
+        self.assertEqual(4, len(table))
+        self.assertEqual([b'blob\0file-a\0rev-1', b'blob\0file-b\0rev-2'],
+                         table.get_records(fake_sha(1)))
+        self.assertEqual([b'tree\0root\0rev-1'],
+                         table.get_records(fake_sha(0x80)))
+        self.assertEqual([b'commit\0rev-1\0' + b'1' * 40],
+                         table.get_records(fake_sha(0xff)))
+        self.assertEqual([], table.get_records(fake_sha(0)))
+        self.assertEqual([], table.get_records(fake_sha(2)))
+
+    def test_get_key(self):
+        table = ShaMapTable(write_table(objects, keys))
+        for key, sha in keys:
+            self.assertEqual(sha, table.get_key(key))
+        self.assertIs(None, table.get_key(key_sha((b'commit', b'rev-2'))))
+
+    def test_duplicates(self):
+        table = ShaMapTable(write_table(objects + objects, keys + keys))
+        self.assertEqual(sorted(objects), list(table.iter_objects()))
+        self.assertEqual(sorted(keys), list(table.iter_keys()))
+
+    def test_empty(self):
+        table = ShaMapTable(write_table([], []))
+        self.assertEqual(0, len(table))
+        self.assertEqual([], table.get_records(fake_sha(1)))
+        self.assertIs(None, table.get_key(fake_sha(1)))
+
+    def test_corrupt(self):
+        data = write_table(objects, keys)
+        self.assertRaises(CorruptShaMapTable, ShaMapTable, b'')
+        self.assertRaises(CorruptShaMapTable, ShaMapTable, b'X' + data[1:])
+        self.assertRaises(CorruptShaMapTable, ShaMapTable, data[:100])
+        self.assertRaises(CorruptShaMapTable, ShaMapTable, data[:1200])
+
+
+class TestShaMapTableFromTransport(TestCaseWithTransport):
+
+    def test_local(self):
+        t = self.get_transport()
+        t.put_bytes('foo.tbl', write_table(objects, keys))
+        table = ShaMapTable.from_transport(t, 'foo.tbl')
+        self.assertEqual(sorted(keys), list(table.iter_keys()))
+
+    def test_remote(self):
+        t = self.get_readonly_transport()
+        self.get_transport().put_bytes('foo.tbl', write_table(objects, keys))
+        table = ShaMapTable.from_transport(t, 'foo.tbl')
+        self.assertEqual(sorted(keys), list(table.iter_keys()))
+
+    def test_missing(self):
+        self.assertRaises(NoSuchFile, ShaMapTable.from_transport,
+                          self.get_transport(), 'foo.tbl')
+        self.assertRaises(NoSuchFile, ShaMapTable.from_transport,
+                          self.get_readonly_transport(), 'foo.tbl')
@@ -239,7 +239,7 @@ class Graph(object):
     specialize it for other repository types.
     """
 
-    def __init__(self, parents_provider):
+    def __init__(self, parents_provider, generations=None):
         """Construct a Graph that uses several graphs as its input
 
         This should not normally be invoked directly, because there may be
@@ -249,12 +249,18 @@ class Graph(object):
         :param parents_provider: An object providing a get_parent_map call
             conforming to the behavior of
             StackedParentsProvider.get_parent_map.
+        :param generations: An optional object providing a
+            get_generation_map call, which returns a dict mapping the keys it
+            knows the generation of to that generation.  A generation must be
+            greater than the generations of all ancestors of the key in the
+            graph of parents_provider.  See breezy.bzr.generations.
         """
         if getattr(parents_provider, 'get_parents', None) is not None:
             self.get_parents = parents_provider.get_parents
         if getattr(parents_provider, 'get_parent_map', None) is not None:
             self.get_parent_map = parents_provider.get_parent_map
         self._parents_provider = parents_provider
+        self._generations = generations
 
     def __repr__(self):
         return 'Graph(%r)' % self._parents_provider
@@ -833,6 +839,10 @@ class Graph(object):
                 return {revision.NULL_REVISION}
         if len(candidate_heads) < 2:
             return candidate_heads
+        if self._generations is not None:
+            heads = self._heads_by_generation(candidate_heads)
+            if heads is not None:
+                return heads
         searchers = dict((c, self._make_breadth_first_searcher([c]))
                          for c in candidate_heads)
         active_searchers = dict(searchers)
@@ -899,6 +909,43 @@ class Graph(object):
             common_walker.start_searching(new_common)
         return candidate_heads
 
+    def _heads_by_generation(self, candidate_heads):
+        """Find the heads among candidate_heads using their generations.
+
+        A key can only be reached from keys with higher generations, so the
+        ancestries of the candidates are only searched down to the lowest
+        generation among them.
+
+        :return: The heads, or None if the generation of a key that needs
+            searching is not known.
+        """
+        get_generation_map = self._generations.get_generation_map
+        generations = get_generation_map(candidate_heads)
+        if len(generations) != len(candidate_heads):
+            return None
+        lowest = min(generations.values())
+        heads = set(candidate_heads)
+        seen = set(candidate_heads)
+        pending = [key for key, generation in generations.items()
+                   if generation > lowest]
+        while pending:
+            parent_map = self.get_parent_map(pending)
+            if len(parent_map) != len(pending):
+                return None
+            parents = set()
+            for key_parents in parent_map.values():
+                parents.update(key_parents)
+            heads.difference_update(parents)
+            parents.difference_update(seen)
+            parents.discard(revision.NULL_REVISION)
+            seen.update(parents)
+            generations = get_generation_map(parents)
+            if len(generations) != len(parents):
+                return None
+            pending = [key for key, generation in generations.items()
+                       if generation > lowest]
+        return heads
+
     def find_merge_order(self, tip_revision_id, lca_revision_ids):
         """Find the order that each revision was merged into tip.
 
@@ -1061,6 +1108,14 @@ class Graph(object):
         smallest number of parent lookups to determine the ancestral
         relationship between N revisions.
         """
+        if (self._generations is not None
+                and candidate_ancestor != candidate_descendant):
+            generations = self._generations.get_generation_map(
+                [candidate_ancestor, candidate_descendant])
+            if (len(generations) == 2
+                    and generations[candidate_ancestor]
+                    >= generations[candidate_descendant]):
+                return False
         return {candidate_descendant} == self.heads(
             [candidate_ancestor, candidate_descendant])
 
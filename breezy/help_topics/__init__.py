@@ -609,6 +609,8 @@ known_env_variables = [
      "Control whether SIGQUIT behaves normally or invokes a breakin debugger."),
     ("BRZ_TEXTUI_INPUT",
      "Force console input mode for prompts to line-based (instead of char-based)."),
+    ("BRZ_CMDSERVER",
+     "Socket of a 'brz cmd-server' to run commands in, rather than starting up."),
     ]
 
 
@@ -22,17 +22,30 @@ from . import (
     )
 
 
-def iter_log_revisions(revisions, revision_source, verbose, rev_tag_dict=None):
+def iter_log_revisions(revisions, revision_source, verbose, rev_tag_dict=None,
+                       batch_size=100):
+    """Iterate over LogRevision objects for revisions.
+
+    The revisions (and their deltas, if verbose) are fetched batch_size at a
+    time, which for a remote repository is one round trip per batch rather
+    than one per revision.
+    """
     if rev_tag_dict is None:
         rev_tag_dict = {}
-    for revno, rev_id, merge_depth in revisions:
-        rev = revision_source.get_revision(rev_id)
-        if verbose:
-            delta = revision_source.get_revision_delta(rev_id)
-        else:
-            delta = None
-        yield log.LogRevision(rev, revno, merge_depth, delta=delta,
-                              tags=rev_tag_dict.get(rev_id))
+    revisions = list(revisions)
+    for start in range(0, len(revisions), batch_size):
+        batch = revisions[start:start + batch_size]
+        with revision_source.lock_read():
+            revs = revision_source.get_revisions(
+                [rev_id for revno, rev_id, merge_depth in batch])
+            if verbose:
+                deltas = list(revision_source.get_revision_deltas(revs))
+            else:
+                deltas = [None] * len(revs)
+        for (revno, rev_id, merge_depth), rev, delta in zip(
+                batch, revs, deltas):
+            yield log.LogRevision(rev, revno, merge_depth, delta=delta,
+                                  tags=rev_tag_dict.get(rev_id))
 
 
 def find_unmerged(local_branch, remote_branch, restrict='all',
@@ -25,6 +25,7 @@ from typing import Dict, List
 
 from .lazy_import import lazy_import
 lazy_import(globals(), """
+from concurrent import futures
 from datetime import datetime
 import getpass
 import locale
@@ -1863,6 +1864,98 @@ class UnicodeDirReader(DirReader):
         return sorted(dirblock)
 
 
+class _ScandirUTF8DirReader(DirReader):
+    """A dir reader for utf8 file systems that can be used from threads.
+
+    Unlike the compiled UTF8DirReader it does not change the current
+    directory, and the lstat calls it makes do not hold the GIL.
+    """
+
+    def top_prefix_to_starting_dir(self, top, prefix=""):
+        """See DirReader.top_prefix_to_starting_dir."""
+        return (safe_utf8(prefix), None, None, None, safe_utf8(top))
+
+    def read_dir(self, prefix, top):
+        """See DirReader.read_dir."""
+        if prefix:
+            relprefix = prefix + b'/'
+        else:
+            relprefix = b''
+        top_slash = top + b'/'
+        dirblock = []
+        append = dirblock.append
+        for entry in scandir(top):
+            name = entry.name
+            statvalue = entry.stat(follow_symlinks=False)
+            kind = file_kind_from_stat_mode(statvalue.st_mode)
+            append((relprefix + name, name, kind, statvalue, top_slash + name))
+        return dirblock
+
+
+def _walkdirs_utf8_concurrent(top, prefix="", workers=4, fs_enc=None):
+    """Walk a tree like _walkdirs_utf8, reading directories in threads.
+
+    The directories below each directory yielded start being read by the
+    worker threads as soon as the caller asks for the next one, up to a
+    window of workers * 4 directories ahead of the walk.  This helps when
+    each lstat has a high latency, as on network file systems.
+
+    The directories are yielded in the same order as by _walkdirs_utf8, and
+    as with it the caller can remove directories from the dirblock yielded
+    so that they are not walked.
+    """
+    if fs_enc is None:
+        fs_enc = sys.getfilesystemencoding()
+    if sys.platform != "win32" and fs_enc in ('utf-8', 'ascii'):
+        reader = _ScandirUTF8DirReader()
+    else:
+        reader = UnicodeDirReader()
+    read_dir = reader.read_dir
+
+    def read_sorted_dir(relroot, top):
+        return sorted(read_dir(relroot, top))
+
+    window = workers * 4
+    executor = futures.ThreadPoolExecutor(workers)
+    pending = []
+    try:
+        relroot, _, _, _, top = reader.top_prefix_to_starting_dir(top, prefix)
+        # Each pending item is [relroot, top, future or None], the next
+        # directory to yield is pending[-1][-1].
+        pending = [[[relroot, top, None]]]
+        _directory = _directory_kind
+        while pending:
+            # Start reading the next directories of the walk.
+            ahead = 0
+            for items in reversed(pending):
+                for item in reversed(items):
+                    if item[2] is None:
+                        item[2] = executor.submit(
+                            read_sorted_dir, item[0], item[1])
+                    ahead += 1
+                    if ahead >= window:
+                        break
+                if ahead >= window:
+                    break
+            relroot, top, future = pending[-1].pop()
+            if not pending[-1]:
+                pending.pop()
+            dirblock = future.result()
+            yield (relroot, top), dirblock
+            next = [[d[0], d[4], None]
+                    for d in reversed(dirblock) if d[2] == _directory]
+            if next:
+                pending.append(next)
+    finally:
+        # Directories read ahead are not needed when the walk is abandoned.
+        # (ThreadPoolExecutor.shutdown only cancels them from Python 3.9.)
+        for items in pending:
+            for item in items:
+                if item[2] is not None:
+                    item[2].cancel()
+        executor.shutdown(wait=False)
+
+
 def copy_tree(from_path, to_path, handlers={}):
     """Copy all of the entries in from_path into to_path.
 
@@ -102,6 +102,108 @@ def load_plugins(path=None, state=None, warn_load_problems=True):
                 trace.warning('%s', error)
 
 
+def plugin_index_key(path=None):
+    """Return what an index of the plugins loaded from path is valid for.
+
+    This is the version of breezy, the names of the disabled plugins and, for
+    each plugin that can be loaded from path, its name, location and the most
+    recent modification time of its top level modules.  Finding these only
+    needs listing the plugin directories rather than importing the plugins.
+
+    Args:
+      path: The list of paths to search for plugins.  By default,
+        it is populated from the __path__ of the breezy.plugins package.
+
+    Returns:
+      A JSON serialisable list, or None if the plugins can not be known
+      without loading them (as is the case for entrypoint plugins).
+    """
+    if (None, 'entrypoints') in _env_plugin_path():
+        return None
+    if path is None:
+        from breezy.plugins import __path__ as path
+    plugins = []
+    for name, plugin_path in _iter_possible_plugins(path):
+        if (os.path.basename(plugin_path) == name
+                and _get_package_init(plugin_path) is not None):
+            filenames = [
+                f for f in os.listdir(plugin_path)
+                if f.endswith((".py", COMPILED_EXT))]
+        else:
+            filenames = [name + ".py", name + COMPILED_EXT]
+        mtimes = [os.stat(plugin_path).st_mtime]
+        for filename in filenames:
+            try:
+                mtimes.append(
+                    os.stat(osutils.pathjoin(plugin_path, filename)).st_mtime)
+            except FileNotFoundError:
+                pass
+        plugins.append([name, plugin_path, max(mtimes)])
+    return [breezy.version_string, sorted(_env_disable_plugins()), plugins]
+
+
+def plugin_index_path():
+    """Return the path of the plugin index file."""
+    from .bedding import cache_dir
+    return osutils.pathjoin(cache_dir(), 'plugin-index')
+
+
+def read_plugin_index(key):
+    """Read the index of what the plugins do, as written by save_plugin_index.
+
+    Args:
+      key: What the index should be valid for, see plugin_index_key.
+
+    Returns:
+      A dictionary with the index, or None if there is no index for key.
+    """
+    if key is None:
+        return None
+    import json
+    try:
+        with open(plugin_index_path(), 'r') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        trace.mutter('ignoring plugin index: %s', e)
+        return None
+    if not isinstance(index, dict) or index.get('key') != key:
+        trace.mutter('ignoring plugin index for other plugins')
+        return None
+    return index
+
+
+def save_plugin_index(key, commands, command_hooks):
+    """Save an index of what the plugins do.
+
+    This lets commands that do not need any plugin run without loading
+    them, as long as the plugins do not change.
+
+    Args:
+      key: What the index is valid for, see plugin_index_key.
+      commands: A dictionary mapping the names and aliases of the commands
+        provided by plugins to the name of the plugin providing them.
+      command_hooks: Whether plugins installed command hooks, and so need to
+        be loaded to run any command.
+    """
+    import json
+    from . import atomicfile
+    try:
+        f = atomicfile.AtomicFile(plugin_index_path(), 'wb')
+        try:
+            f.write(json.dumps({
+                'key': key,
+                'commands': commands,
+                'command_hooks': command_hooks,
+                }).encode('utf-8'))
+            f.commit()
+        finally:
+            f.close()
+    except OSError as e:
+        trace.mutter('failed to save plugin index: %s', e)
+
+
 def _load_plugins_from_entrypoints(state):
     try:
         from importlib.metadata import entry_points
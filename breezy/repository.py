@@ -1120,6 +1120,13 @@ class Repository(controldir.ControlComponent, _RelockDebugMixin):
         return graph.CallableToParentsProviderAdapter(
             self._get_parent_map_no_fallbacks)
 
+    def _make_generations_provider(self):
+        """Return an object providing the generations of revisions, or None.
+
+        See the generations parameter of Graph.
+        """
+        return None
+
     def get_known_graph_ancestry(self, revision_ids):
         """Return the known graph for a set of revision ids and their ancestors.
         """
@@ -1136,7 +1143,12 @@ class Repository(controldir.ControlComponent, _RelockDebugMixin):
                 not self.has_same_location(other_repository)):
             parents_provider = graph.StackedParentsProvider(
                 [parents_provider, other_repository._make_parents_provider()])
-        return graph.Graph(parents_provider)
+            # The generations of this repository's revisions don't take
+            # the other repository's revisions into account.
+            generations = None
+        else:
+            generations = self._make_generations_provider()
+        return graph.Graph(parents_provider, generations)
 
     def set_make_working_trees(self, new_value):
         """Set the policy flag for making working trees when creating branches.
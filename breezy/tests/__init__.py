@@ -4005,6 +4005,7 @@ def _test_suite_testmod_names():
         'breezy.tests.test_chunk_writer',
         'breezy.tests.test_clean_tree',
         'breezy.tests.test_cmdline',
+        'breezy.tests.test_cmdserver',
         'breezy.tests.test_commands',
         'breezy.tests.test_commit',
         'breezy.tests.test_commit_merge',
@@ -4036,6 +4037,7 @@ def _test_suite_testmod_names():
         'breezy.tests.test_filter_tree',
         'breezy.tests.test_foreign',
         'breezy.tests.test_forge',
+        'breezy.tests.test_fsmonitor',
         'breezy.tests.test_generate_docs',
         'breezy.tests.test_globbing',
         'breezy.tests.test_gpg',
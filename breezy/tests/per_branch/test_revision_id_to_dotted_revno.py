@@ -38,3 +38,11 @@ class TestRevisionIdToDottedRevno(TestCaseWithBranch):
             revmap['1.1.1']))
         self.assertRaises(errors.NoSuchRevision,
                           the_branch.revision_id_to_dotted_revno, b'rev-1.0.2')
+
+    def test_lookup_dotted_revnos(self):
+        tree, revmap = self.create_tree_with_merge()
+        self.assertEqual(
+            {revmap['1']: (1,), revmap['3']: (3,),
+             revmap['1.1.1']: (1, 1, 1)},
+            tree.branch.revision_ids_to_dotted_revnos(
+                [revmap['1'], revmap['3'], revmap['1.1.1'], b'rev-1.0.2']))
@@ -0,0 +1,160 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for breezy.cmdserver."""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from .. import cmdserver
+from . import (
+    TestCaseWithTransport,
+    TestSkipped,
+    )
+
+
+class FakeServer(object):
+    """Answer command server requests in a thread.
+
+    The socket is in a new temporary directory, as the paths of the test
+    directories are too long for unix sockets.
+    """
+
+    def __init__(self, test):
+        self._dir = tempfile.mkdtemp()
+        test.addCleanup(shutil.rmtree, self._dir)
+        self.path = os.path.join(self._dir, 'cmdserver.sock')
+        self.server = cmdserver.CommandServer(self.path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(4)
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.start()
+        test.addCleanup(self.stop)
+
+    def _serve(self):
+        listener = self._listener
+        while True:
+            conn = listener.accept()[0]
+            if self._listener is None:
+                conn.close()
+                return
+            try:
+                self.server._answer(conn)
+            finally:
+                conn.close()
+
+    def stop(self):
+        listener = self._listener
+        if listener is None:
+            return
+        self._listener = None
+        # Wake up the thread.
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.path)
+        s.close()
+        self._thread.join()
+        listener.close()
+
+
+class TestCommandServer(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestCommandServer, self).setUp()
+        if not cmdserver.available():
+            raise TestSkipped('unix sockets are not available')
+
+    def run_with_files(self, run, stdin=b''):
+        """Call run with the descriptors of files for the standard streams.
+
+        :return: The result of run, and the output and errors written.
+        """
+        with open('stdin', 'wb') as f:
+            f.write(stdin)
+        with open('stdin', 'rb') as stdin_file, \
+                open('stdout', 'wb+') as stdout_file, \
+                open('stderr', 'wb+') as stderr_file:
+            result = run([stdin_file.fileno(), stdout_file.fileno(),
+                          stderr_file.fileno()])
+            stdout_file.seek(0)
+            stderr_file.seek(0)
+            return result, stdout_file.read(), stderr_file.read()
+
+    def run_client(self, path, argv, stdin=b''):
+        return self.run_with_files(
+            lambda fds: cmdserver.run_client(path, argv, fds), stdin)
+
+    def test_no_server(self):
+        self.assertIs(None, cmdserver.run_client(
+            '/nonexistent/cmdserver.sock', ['rocks']))
+
+    def test_unavailable(self):
+        server = FakeServer(self)
+        self.overrideAttr(cmdserver, 'available', lambda: False)
+        self.assertIs(None, cmdserver.run_client(server.path, ['rocks']))
+        self.run_bzr_error(['needs unix sockets'], ['cmd-server',
+                           '--socket', server.path])
+
+    def test_pass_fds(self):
+        a, b = socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        r, w = os.pipe()
+        self.addCleanup(os.close, r)
+        self.addCleanup(os.close, w)
+        self.assertEqual(5, cmdserver._send_fds(a, b'hello', [r, w]))
+        data, fds = cmdserver._recv_fds(b, 1024, 3)
+        for fd in fds:
+            self.addCleanup(os.close, fd)
+        self.assertEqual(b'hello', data)
+        self.assertEqual(2, len(fds))
+        os.write(fds[1], b'x')
+        self.assertEqual(b'x', os.read(r, 1))
+
+    def test_run(self):
+        tree = self.make_branch_and_tree('tree')
+        tree.commit('one')
+        server = FakeServer(self)
+        self.assertEqual((0, b'1\n', b''), self.run_client(
+            server.path, ['revno', 'tree'], b'input'))
+        tree.commit('two')
+        self.assertEqual((0, b'2\n', b''), self.run_client(
+            server.path, ['revno', 'tree']))
+        # The command runs in the directory of the client.
+        os.chdir('tree')
+        self.assertEqual((0, b'2\n', b''), self.run_client(
+            server.path, ['revno']))
+
+    def test_error(self):
+        server = FakeServer(self)
+        status, out, err = self.run_client(server.path, ['no-such-command'])
+        self.assertEqual(3, status)
+        self.assertEqual(b'', out)
+        self.assertContainsRe(err, b'unknown command "no-such-command"')
+
+    def test_run_command_environment(self):
+        self.overrideEnv('BRZ_EMAIL', 'Server <server@example.com>')
+        server = cmdserver.CommandServer('unused')
+        env = dict(os.environ, BRZ_EMAIL='Client <client@example.com>')
+        self.assertEqual(
+            (0, b'Client <client@example.com>\n', b''),
+            self.run_with_files(lambda fds: server.run_command(
+                ['whoami'], self.test_dir, env, fds)))
+        self.assertEqual('Server <server@example.com>',
+                         os.environ['BRZ_EMAIL'])
@@ -18,12 +18,16 @@ import errno
 import inspect
 import sys
 
+import breezy
 from .. import (
     builtins,
     commands,
     config,
+    debug,
     errors,
     option,
+    osutils,
+    plugin,
     tests,
     trace,
     )
@@ -157,6 +161,70 @@ class TestGetAlias(tests.TestCase):
                          commands.get_alias("iam", config=my_config))
 
 
+class TestPluginIndex(tests.TestCaseInTempDir):
+
+    def setUp(self):
+        super(TestPluginIndex, self).setUp()
+        self.overrideEnv('XDG_CACHE_HOME', osutils.pathjoin(
+            self.test_dir, 'cache'))
+        self.index = {'commands': {'fast-import': 'fastimport'},
+                      'command_hooks': False}
+
+    def test_command_needs_plugins(self):
+        self.assertFalse(commands._command_needs_plugins(
+            ['rocks'], False, self.index))
+        self.assertFalse(commands._command_needs_plugins(
+            ['--version'], False, self.index))
+        self.assertTrue(commands._command_needs_plugins(
+            ['status'], False, self.index))
+        self.assertTrue(commands._command_needs_plugins(
+            ['fast-import'], False, self.index))
+        self.assertTrue(commands._command_needs_plugins(
+            ['unknown'], False, self.index))
+        self.assertTrue(commands._command_needs_plugins(
+            [], False, self.index))
+
+    def test_plugin_replaces_command(self):
+        self.index['commands']['rocks'] = 'rolling'
+        self.assertTrue(commands._command_needs_plugins(
+            ['rocks'], False, self.index))
+
+    def test_plugin_command_hooks(self):
+        self.index['command_hooks'] = True
+        self.assertTrue(commands._command_needs_plugins(
+            ['rocks'], False, self.index))
+
+    def test_alias(self):
+        config.GlobalConfig().set_alias('st', 'status')
+        config.GlobalConfig().set_alias('r', 'rocks')
+        self.assertTrue(commands._command_needs_plugins(
+            ['st'], False, self.index))
+        self.assertFalse(commands._command_needs_plugins(
+            ['r'], False, self.index))
+        self.assertTrue(commands._command_needs_plugins(
+            ['r'], True, self.index))
+
+    def test_load_plugins_for_command(self):
+        loaded = []
+
+        def load_plugins(warn_load_problems=True):
+            loaded.append(warn_load_problems)
+        self.overrideAttr(plugin, 'load_plugins', load_plugins)
+        self.overrideAttr(breezy.get_global_state(), 'plugins', None)
+        # The first time the plugins are loaded to build the index.
+        commands._load_plugins_for_command(['rocks'], False, True)
+        self.assertEqual([True], loaded)
+        self.assertIsNot(None, plugin.read_plugin_index(
+            plugin.plugin_index_key()))
+        commands._load_plugins_for_command(['rocks'], False, True)
+        self.assertEqual([True], loaded)
+        commands._load_plugins_for_command(['status'], False, False)
+        self.assertEqual([True, False], loaded)
+        self.overrideAttr(debug, 'debug_flags', {'no_plugin_index'})
+        commands._load_plugins_for_command(['rocks'], False, True)
+        self.assertEqual([True, False, True], loaded)
+
+
 class TestSeeAlso(tests.TestCase):
     """Tests for the see also functional of Command."""
 
@@ -825,7 +825,7 @@ create_signatures=when-possible
         repository = tree.branch.repository
         # simulate network failure
 
-        def raise_(self, arg, arg2, arg3=None, arg4=None):
+        def raise_(self, arg, arg2, arg3=None, arg4=None, **kwargs):
             raise _mod_transport.NoSuchFile('foo')
         repository.add_inventory = raise_
         repository.add_inventory_by_delta = raise_
@@ -0,0 +1,128 @@
+# Copyright (C) 2026 Breezy Developers
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for breezy.fsmonitor."""
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from .. import fsmonitor
+from . import TestCase
+
+
+class FakeDaemon(object):
+    """Answer fsmonitor queries from a ChangeLog, without watching a tree.
+
+    The socket is in a new temporary directory, as the paths of the test
+    directories are too long for unix sockets.
+    """
+
+    def __init__(self, test):
+        self._dir = tempfile.mkdtemp()
+        test.addCleanup(shutil.rmtree, self._dir)
+        self.path = os.path.join(self._dir, fsmonitor.SOCKET_NAME)
+        self._daemon = fsmonitor.FSMonitorDaemon(None, self.path)
+        self.changes = self._daemon.changes
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(4)
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.start()
+        test.addCleanup(self.stop)
+
+    def _serve(self):
+        while True:
+            conn = self._listener.accept()[0]
+            if self._listener is None:
+                conn.close()
+                return
+            self._daemon._answer(conn)
+
+    def stop(self):
+        listener = self._listener
+        if listener is None:
+            return
+        self._listener = None
+        # Wake up the thread.
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.path)
+        s.close()
+        self._thread.join()
+        listener.close()
+
+
+class TestChangeLog(TestCase):
+
+    def test_changed_since(self):
+        changes = fsmonitor.ChangeLog(b'instance')
+        token = changes.token()
+        self.assertEqual(b'instance:0', token)
+        changes.record(b'a')
+        changes.record(b'b/c')
+        self.assertEqual([b'a', b'b/c'], changes.changed_since(token))
+        token = changes.token()
+        self.assertEqual([], changes.changed_since(token))
+        changes.record(b'a')
+        self.assertEqual([b'a'], changes.changed_since(token))
+
+    def test_unknown_token(self):
+        changes = fsmonitor.ChangeLog(b'instance')
+        changes.record(b'a')
+        self.assertIs(None, changes.changed_since(b'other:0'))
+        self.assertIs(None, changes.changed_since(b'instance:5'))
+        self.assertIs(None, changes.changed_since(b'garbage'))
+
+    def test_overflow(self):
+        changes = fsmonitor.ChangeLog(b'instance')
+        token = changes.token()
+        changes.record(b'a')
+        changes.overflow()
+        self.assertIs(None, changes.changed_since(token))
+        token = changes.token()
+        changes.record(b'b')
+        self.assertEqual([b'b'], changes.changed_since(token))
+
+    def test_handle_request(self):
+        changes = fsmonitor.ChangeLog(b'instance')
+        self.assertEqual(b'reset instance:0\0',
+                         changes.handle_request(b'since\n'))
+        changes.record(b'a')
+        self.assertEqual(b'ok instance:1\0a\0',
+                         changes.handle_request(b'since instance:0\n'))
+        self.assertEqual(b'reset instance:1\0',
+                         changes.handle_request(b'since other:0\n'))
+        self.assertEqual(b'error\0', changes.handle_request(b'what\n'))
+
+
+class TestQuery(TestCase):
+
+    def test_no_daemon(self):
+        self.assertIs(None, fsmonitor.query('/nonexistent/fsmonitor.sock'))
+
+    def test_query(self):
+        daemon = FakeDaemon(self)
+        token, paths = fsmonitor.query(daemon.path)
+        self.assertIs(None, paths)
+        daemon.changes.record(b'a')
+        daemon.changes.record(b'dir/b')
+        self.assertEqual((daemon.changes.token(), [b'a', b'dir/b']),
+                         fsmonitor.query(daemon.path, token))
+        daemon.changes.overflow()
+        self.assertEqual((daemon.changes.token(), None),
+                         fsmonitor.query(daemon.path, token))
@@ -1253,6 +1253,67 @@ class TestGraph(TestCaseWithMemoryTransport):
             state)
 
 
+class DictGenerationsProvider(object):
+    """Provide the generations of the keys of a dict of parents."""
+
+    def __init__(self, ancestors):
+        known_graph = _mod_graph.KnownGraph(ancestors)
+        self.generations = dict(
+            (key, known_graph._nodes[key].gdfo) for key in ancestors)
+
+    def get_generation_map(self, keys):
+        return dict((key, self.generations[key]) for key in keys
+                    if key in self.generations)
+
+
+class TestGraphWithGenerations(TestGraph):
+    """Run the Graph tests with the generations of the revisions known."""
+
+    def make_graph(self, ancestors):
+        return _mod_graph.Graph(_mod_graph.DictParentsProvider(ancestors),
+                                DictGenerationsProvider(ancestors))
+
+    def make_breaking_graph(self, ancestors, break_on):
+        """Make a Graph that fails the test if it asks for a node's parents."""
+        parents_provider = _mod_graph.DictParentsProvider(ancestors)
+
+        class BreakingParentsProvider(object):
+
+            def get_parent_map(provider, keys):
+                bad_keys = set(keys).intersection(break_on)
+                if bad_keys:
+                    self.fail('key(s) %s was accessed' % (sorted(bad_keys),))
+                return parents_provider.get_parent_map(keys)
+        return _mod_graph.Graph(BreakingParentsProvider(),
+                                DictGenerationsProvider(ancestors))
+
+    def test_heads_stops_at_lowest_generation(self):
+        # Without generations, heads searches from rev10 all the way down to
+        # rev1 to find that rev10 and other are both heads.
+        ancestors = {b'rev1': [NULL_REVISION], b'other': [b'rev1']}
+        for i in range(2, 11):
+            ancestors[b'rev%d' % i] = [b'rev%d' % (i - 1)]
+        graph = self.make_breaking_graph(ancestors, [b'rev2', b'rev1'])
+        self.assertEqual({b'rev10', b'other'},
+                         graph.heads([b'rev10', b'other']))
+        self.assertEqual({b'rev10'}, graph.heads([b'rev10', b'rev3']))
+
+    def test_is_ancestor_by_generation(self):
+        ancestors = {b'rev1': [NULL_REVISION], b'rev2': [b'rev1'],
+                     b'rev3': [b'rev2']}
+        graph = self.make_breaking_graph(ancestors, ancestors)
+        self.assertFalse(graph.is_ancestor(b'rev3', b'rev1'))
+        self.assertFalse(graph.is_ancestor(b'rev3', b'rev2'))
+
+    def test_heads_unknown_generation(self):
+        # Ghosts have no generation, so heads searches the way it does
+        # without generations when it reaches one.
+        graph = self.make_graph(with_ghost)
+        plain_graph = TestGraph.make_graph(self, with_ghost)
+        for keys in [[b'a', b'c'], [b'c', b'g'], [b'd', b'g'], [b'a', b'g']]:
+            self.assertEqual(plain_graph.heads(keys), graph.heads(keys))
+
+
 class TestFindUniqueAncestors(TestGraphBase):
 
     def assertFindUniqueAncestors(self, graph, expected, node, common):
@@ -101,6 +101,19 @@ class TestMissing(TestCaseWithTransport):
                           ('4', b'c-4'), ('5', b'c-5'), ],
                          [(r.revno, r.rev.revision_id) for r in results])
 
+        # The revisions are fetched in batches.
+        calls = []
+        repo = child_tree.branch.repository
+        self.overrideAttr(
+            repo, 'get_revisions',
+            lambda revision_ids: calls.append(revision_ids) or
+            type(repo).get_revisions(repo, revision_ids))
+        self.assertEqual(
+            [b'c-2', b'c-3', b'c-4', b'c-5'],
+            [r.rev.revision_id for r in iter_log_revisions(
+                child_extra, repo, verbose=False, batch_size=3)])
+        self.assertEqual([[b'c-2', b'c-3', b'c-4'], [b'c-5']], calls)
+
         delta0 = r0.delta
         self.assertNotEqual(None, delta0)
         self.assertEqual([('b', 'file')], [(c.path[1], c.kind[1]) for c in delta0.added])
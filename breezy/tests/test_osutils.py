@@ -1217,6 +1217,47 @@ class TestWalkDirs(tests.TestCaseInTempDir):
             result.append(dirblock)
         self.assertExpectedBlocks(expected_dirblocks[1:], result)
 
+    def test__walkdirs_utf8_concurrent(self):
+        self.build_tree(['.bzr/', '.bzr/file', '0file', '1dir/',
+                         '1dir/0file', '1dir/1dir/', '1dir/1dir/0file',
+                         '2dir/', '2dir/0file', '3file'])
+
+        def walk(dir_iterator):
+            result = []
+            for dirdetail, dirblock in dir_iterator:
+                if len(dirblock) and dirblock[0][1] == b'.bzr':
+                    # directories removed from the dirblock are not walked
+                    del dirblock[0]
+                result.append((dirdetail[0], [
+                    (entry[0], entry[1], entry[2], entry[3].st_ino,
+                     entry[4]) for entry in dirblock]))
+            return result
+        expected = walk(osutils._walkdirs_utf8(b'.'))
+        self.assertEqual(
+            [b'', b'1dir', b'1dir/1dir', b'2dir'],
+            [dirdetail for dirdetail, dirblock in expected])
+        self.assertEqual(
+            expected,
+            walk(osutils._walkdirs_utf8_concurrent(b'.', workers=2)))
+        # with a prefix
+        self.assertEqual(
+            expected[1:3],
+            walk(osutils._walkdirs_utf8_concurrent(
+                b'./1dir', b'1dir', workers=2)))
+
+    def test__walkdirs_utf8_concurrent_abandoned(self):
+        self.build_tree(['%ddir/' % i for i in range(10)])
+        walker = osutils._walkdirs_utf8_concurrent(b'.', workers=2)
+        dirdetail, dirblock = next(walker)
+        self.assertEqual(b'', dirdetail[0])
+        # Closing the walk cancels the directories being read ahead.
+        walker.close()
+
+    def test__walkdirs_utf8_concurrent_missing(self):
+        self.assertRaises(
+            FileNotFoundError, list,
+            osutils._walkdirs_utf8_concurrent(b'missing', workers=2))
+
     def _filter_out_stat(self, result):
         """Filter out the stat value from the walkdirs result"""
         for dirdetail, dirblock in result:
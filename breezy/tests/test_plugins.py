@@ -923,6 +923,66 @@ good 0.1.0
 """, ''.join(plugin.describe_plugins(state=self)))
 
 
+class TestPluginIndex(BaseTestPlugins):
+
+    def setUp(self):
+        super(TestPluginIndex, self).setUp()
+        self.overrideEnv('XDG_CACHE_HOME', osutils.pathjoin(
+            self.test_dir, 'cache'))
+        self.create_plugin('one')
+        self.create_plugin_package('two')
+        self.paths = self.update_module_paths(['.'])
+
+    def test_key(self):
+        key = plugin.plugin_index_key(self.paths)
+        self.assertEqual([breezy.version_string, []], key[:2])
+        self.assertEqual(['one', 'two'], [p[0] for p in key[2]])
+        self.assertEqual(key, plugin.plugin_index_key(self.paths))
+        # Changing any module of a plugin package changes the key.
+        with open('two/commands.py', 'w') as f:
+            f.write('\n')
+        mtime = key[2][1][2] + 10
+        os.utime('two/commands.py', (mtime, mtime))
+        self.assertNotEqual(key, plugin.plugin_index_key(self.paths))
+
+    def test_key_plugin_moved(self):
+        key = plugin.plugin_index_key(self.paths)
+        os.mkdir('other')
+        os.rename('one.py', 'other/one.py')
+        paths = self.update_module_paths(['other', '.'])
+        self.assertNotEqual(key, plugin.plugin_index_key(paths))
+        self.assertEqual(['one', 'two'],
+                         [p[0] for p in plugin.plugin_index_key(paths)[2]])
+
+    def test_key_disabled_plugins(self):
+        key = plugin.plugin_index_key(self.paths)
+        self.overrideEnv('BRZ_DISABLE_PLUGINS', 'two')
+        self.assertNotEqual(key, plugin.plugin_index_key(self.paths))
+
+    def test_key_entrypoints(self):
+        self.overrideEnv('BRZ_PLUGIN_PATH', '+entrypoints')
+        self.assertIs(None, plugin.plugin_index_key(self.paths))
+
+    def test_save_and_read(self):
+        key = plugin.plugin_index_key(self.paths)
+        self.assertIs(None, plugin.read_plugin_index(key))
+        plugin.save_plugin_index(key, {'cmd': 'one'}, False)
+        index = plugin.read_plugin_index(key)
+        self.assertEqual({'cmd': 'one'}, index['commands'])
+        self.assertFalse(index['command_hooks'])
+        self.assertIs(None, plugin.read_plugin_index(None))
+        # A new plugin makes the index out of date.
+        self.create_plugin('three')
+        self.assertIs(None, plugin.read_plugin_index(
+            plugin.plugin_index_key(self.paths)))
+
+    def test_read_damaged(self):
+        with open(plugin.plugin_index_path(), 'w') as f:
+            f.write('{"key":')
+        self.assertIs(None, plugin.read_plugin_index(
+            plugin.plugin_index_key(self.paths)))
+
+
 class DummyPlugin(object):
     """Plugin."""
 
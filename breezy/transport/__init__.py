@@ -1780,4 +1780,8 @@ register_lazy_transport('ssh:', 'breezy.transport.remote',
 transport_server_registry = registry.Registry()
 transport_server_registry.register_lazy('bzr', 'breezy.bzr.smart.server',
                                         'serve_bzr', help="The Bazaar smart server protocol over TCP. (default port: 4155)")
+transport_server_registry.register_lazy(
+    'bzr-asyncio', 'breezy.bzr.smart.aio', 'serve_bzr_asyncio',
+    help="The Bazaar smart server protocol over TCP, with all clients served "
+         "from a single asyncio event loop. (default port: 4155)")
 transport_server_registry.default_key = 'bzr'
@@ -673,7 +673,10 @@ def _wrap_in_stream(stream, encoding=None, errors='replace'):
         encoded_stream.encoding = encoding
         return encoded_stream
     else:
-        return io.open(fileno, encoding=encoding, errors=errors, mode='r', buffering=1)
+        # The descriptor belongs to stream, so don't close it along with the
+        # wrapper.
+        return io.open(fileno, encoding=encoding, errors=errors, mode='r',
+                       buffering=1, closefd=False)
 
 
 def _wrap_out_stream(stream, encoding=None, errors='replace'):
@@ -0,0 +1,1008 @@
+#!/usr/bin/env python3
+"""Time core operations on a synthetic repository.
+
+Builds a branch with a working tree with --files files spread over
+directories and --revisions revisions, each changing --changes files, and
+then times each benchmark --repeat times.  The fixture is built with
+BranchBuilder and kept in --dir (if given) so that it can be reused between
+runs and across commits.
+
+The results can be written as JSON with --output and compared against an
+earlier run with --compare; any benchmark that got slower by more than
+--threshold is reported and makes the script exit with status 1.
+
+    python3 tools/benchmark.py --dir /tmp/bench --output new.json \\
+        --compare old.json
+
+New benchmarks are added with the benchmark decorator: the decorated
+function is given the Fixture, does any (untimed) setup, and returns the
+callable to time.  Anything that has to be undone once it has been timed
+can be registered with Fixture.add_cleanup, and other figures than the time
+taken (such as memory use) can be reported with Fixture.record.
+"""
+
+import functools
+import gc
+import io
+import json
+import optparse
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import breezy
+from breezy import (
+    annotate,
+    branch as _mod_branch,
+    branchbuilder,
+    commit,
+    controldir,
+    diff,
+    graph as _mod_graph,
+    log,
+    osutils,
+    status,
+    trace,
+    transport,
+    workingtree,
+    )
+from breezy.bzr import (
+    btree_index,
+    dirstate,
+    generations,
+    )
+from breezy.bzr.smart import (
+    client as _mod_client,
+    medium,
+    )
+from breezy.bzr.transform import build_tree
+from breezy.revision import NULL_REVISION
+
+
+COMMITTER = 'Benchmark <benchmark@example.com>'
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a benchmark under name."""
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+def file_path(i):
+    return 'dir-%d/file-%d' % (i // 100, i)
+
+
+def file_content(i, revno):
+    return b''.join(b'line %d of file %d, changed in revision %d\n'
+                    % (line, i, revno if line % 10 == revno % 10 else 0)
+                    for line in range(50))
+
+
+class Fixture(object):
+    """A branch with a working tree and some history to run benchmarks on."""
+
+    def __init__(self, path, files, revisions, changes):
+        self.path = path
+        self.files = files
+        self.revisions = revisions
+        self.changes = changes
+        self.tree_path = osutils.pathjoin(path, 'tree')
+        self.scratch_path = osutils.pathjoin(path, 'scratch')
+        self.commits = 0
+        self._cleanups = []
+        self._records = {}
+        self._merge_history = None
+
+    def build(self):
+        """Build the branch and its working tree, unless they exist."""
+        if os.path.isdir(self.tree_path):
+            return
+        begin = osutils.perf_counter()
+        build_path = self.tree_path + '.tmp'
+        if os.path.exists(build_path):
+            shutil.rmtree(build_path)
+        builder = branchbuilder.BranchBuilder(
+            transport.get_transport_from_path(build_path))
+        builder.start_series()
+        actions = [('add', ('', b'root-id', 'directory', None))]
+        for i in range(0, self.files, 100):
+            actions.append(('add', ('dir-%d' % (i // 100,), None,
+                                    'directory', None)))
+        for i in range(self.files):
+            actions.append(
+                ('add', (file_path(i), None, 'file', file_content(i, 0))))
+        builder.build_snapshot(None, actions, timestamp=0, timezone=0,
+                               committer=COMMITTER)
+        rand = random.Random(self.files)
+        for revno in range(1, self.revisions):
+            actions = [
+                ('modify', (file_path(i), file_content(i, revno)))
+                for i in rand.sample(range(self.files),
+                                     min(self.changes, self.files))]
+            builder.build_snapshot(None, actions, timestamp=revno,
+                                   timezone=0, committer=COMMITTER)
+        builder.finish_series()
+        builder.get_branch().controldir.create_workingtree()
+        os.rename(build_path, self.tree_path)
+        print('Built %d files, %d revisions in %.3fs' % (
+            self.files, self.revisions, osutils.perf_counter() - begin))
+
+    def open_branch(self):
+        return _mod_branch.Branch.open(self.tree_path)
+
+    def open_tree(self):
+        return workingtree.WorkingTree.open(self.tree_path)
+
+    def add_cleanup(self, func, *args):
+        """Call func(*args) once the benchmark has been timed."""
+        self._cleanups.append((func, args))
+
+    def cleanup(self):
+        """Run the cleanups added since the last call, newest first."""
+        while self._cleanups:
+            func, args = self._cleanups.pop()
+            func(*args)
+
+    def record(self, name, value):
+        """Report value as the figure name of the benchmark being run."""
+        self._records[name] = value
+
+    def pop_records(self):
+        """Return the figures recorded since the last call."""
+        records = self._records
+        self._records = {}
+        return records
+
+    def scratch_dir(self):
+        """Return an empty directory for a benchmark to write to."""
+        if os.path.exists(self.scratch_path):
+            shutil.rmtree(self.scratch_path)
+        os.mkdir(self.scratch_path)
+        return self.scratch_path
+
+    def merge_history(self):
+        """Return a big history with many merges, without a repository.
+
+        There are a thousand mainline revisions for every revision of the
+        fixture.  Every 10 revisions a feature branch of 5 revisions, started
+        a thousand revisions earlier, is merged.
+
+        :return: A tuple with the parent map, the mainline tip and the tips
+            of 50 of the feature branches.
+        """
+        if self._merge_history is None:
+            parent_map = {}
+            branch_tips = []
+            previous = NULL_REVISION
+            for i in range(self.revisions * 1000):
+                key = b'main-%d' % (i,)
+                parents = (previous,)
+                if i % 10 == 0 and i > 1000:
+                    branch_parent = b'main-%d' % (i - 1000,)
+                    for j in range(5):
+                        branch_key = b'branch-%d-%d' % (i, j)
+                        parent_map[branch_key] = (branch_parent,)
+                        branch_parent = branch_key
+                    parents = (previous, branch_parent)
+                    branch_tips.append(branch_parent)
+                parent_map[key] = parents
+                previous = key
+            step = max(1, len(branch_tips) // 50)
+            self._merge_history = (
+                parent_map, previous, branch_tips[::step][:50])
+        return self._merge_history
+
+    def most_changed_path(self):
+        """Return the path of the file with the most history."""
+        tree = self.open_tree()
+        with tree.lock_read():
+            repo = tree.branch.repository
+            file_ids = [tree.path2id(file_path(i)) for i in range(self.files)]
+            counts = {}
+            for file_id, revision_id in repo.texts.keys():
+                counts[file_id] = counts.get(file_id, 0) + 1
+        i = max(range(self.files), key=lambda i: counts.get(file_ids[i], 0))
+        return file_path(i)
+
+
+@benchmark('status')
+def bench_status(fixture):
+    tree = fixture.open_tree()
+    # Make the tree look modified, so status has to hash the files.
+    for i in range(0, fixture.files, 10):
+        os.utime(osutils.pathjoin(fixture.tree_path, file_path(i)))
+
+    def run():
+        status.show_tree_status(tree, to_file=io.StringIO())
+    return run
+
+
+@benchmark('commit')
+def bench_commit(fixture):
+    """Commit fixture.changes changed files.
+
+    Run with different --files to see how the time taken grows with the
+    size of the tree.
+    """
+    tree = fixture.open_tree()
+    fixture.commits += 1
+    if fixture.commits == 1:
+        # The dirstate does not record the hashes of files changed in the
+        # last few seconds, which the files of the copied fixture are, so
+        # wait and let it record them; otherwise the commits would hash
+        # every file in the tree.
+        time.sleep(4)
+        with tree.lock_write():
+            tree.has_changes()
+    revno = fixture.revisions + fixture.commits
+    for i in random.Random(revno).sample(range(fixture.files),
+                                         min(fixture.changes, fixture.files)):
+        with open(osutils.pathjoin(fixture.tree_path, file_path(i)),
+                  'wb') as f:
+            f.write(file_content(i, revno))
+
+    def run():
+        tree.commit('benchmark commit %d' % (revno,), committer=COMMITTER,
+                    reporter=commit.NullCommitReporter())
+    return run
+
+
+@benchmark('log')
+def bench_log(fixture):
+    b = fixture.open_branch()
+
+    def run():
+        log.show_log(b, log.LongLogFormatter(to_file=io.StringIO()),
+                     verbose=True)
+    return run
+
+
+@benchmark('annotate')
+def bench_annotate(fixture):
+    path = fixture.most_changed_path()
+    tree = fixture.open_tree()
+
+    def run():
+        with tree.lock_read():
+            annotate.annotate_file_tree(tree, path, io.StringIO())
+    return run
+
+
+@benchmark('diff')
+def bench_diff(fixture):
+    b = fixture.open_branch()
+    old_revision_id = b.get_rev_id(1)
+    new_revision_id = b.last_revision()
+
+    def run():
+        with b.lock_read():
+            old_tree = b.repository.revision_tree(old_revision_id)
+            new_tree = b.repository.revision_tree(new_revision_id)
+            diff.show_diff_trees(old_tree, new_tree, io.BytesIO())
+    return run
+
+
+@benchmark('branch')
+def bench_branch(fixture):
+    b = fixture.open_branch()
+    target = osutils.pathjoin(fixture.scratch_dir(), 'branch')
+
+    def run():
+        b.controldir.sprout(target)
+    return run
+
+
+@benchmark('pack')
+def bench_pack(fixture):
+    target = osutils.pathjoin(fixture.scratch_dir(), 'tree')
+    shutil.copytree(fixture.tree_path, target, symlinks=True)
+    b = _mod_branch.Branch.open(target)
+
+    def run():
+        b.repository.pack()
+    return run
+
+
+@benchmark('dirstate_load')
+def bench_dirstate_load(fixture):
+    path = osutils.pathjoin(fixture.tree_path, '.bzr', 'checkout', 'dirstate')
+
+    def run():
+        state = dirstate.DirState.on_file(path)
+        state.lock_read()
+        try:
+            state._read_dirblocks_if_needed()
+        finally:
+            state.unlock()
+    return run
+
+
+def _parent_details(fixture, rand, revision_ids, i):
+    """Return the details of file i in the working tree and each parent."""
+    sha1 = osutils.sha_string(b'%d' % (i,))
+    size = 1000 + i % 5000
+    details = [(b'f', sha1, size, False, dirstate.pack_stat(os.stat('.')))]
+    revision_id = revision_ids[0]
+    for parent in range(1, len(revision_ids)):
+        if rand.random() < float(fixture.changes) / fixture.files:
+            sha1 = osutils.sha_string(b'%d-%d' % (i, parent))
+            size += 1
+            revision_id = revision_ids[parent]
+        details.append((b'f', sha1, size, False, revision_id))
+    return details
+
+
+def _write_parents_dirstate(fixture, path, parents):
+    """Write a dirstate with parent trees for the files of the fixture.
+
+    fixture.changes of the files differ between each parent tree and the
+    next.
+    """
+    rand = random.Random(fixture.files)
+    revision_ids = [b'revision-%d-%s' % (i, osutils.sha_string(b'%d' % (i,)))
+                    for i in range(parents + 1)]
+    root_details = [(b'd', b'', 0, False, dirstate.DirState.NULLSTAT)]
+    root_details.extend((b'd', b'', 0, False, revision_ids[0])
+                        for parent in range(parents))
+    dirblocks = [(b'', [((b'', b'', b'TREE_ROOT'), root_details)]), (b'', [])]
+    for d in range(0, fixture.files, 100):
+        dirname = b'dir-%d' % (d // 100,)
+        dirblocks[1][1].append(
+            ((b'', dirname, dirname + b'-id'), root_details))
+        entries = []
+        for i in range(d, min(fixture.files, d + 100)):
+            basename = b'file-%d' % (i,)
+            entries.append(((dirname, basename, basename + b'-id'),
+                            _parent_details(fixture, rand, revision_ids, i)))
+        dirblocks.append((dirname, entries))
+    state = dirstate.DirState.initialize(path)
+    try:
+        state._parents = revision_ids[1:]
+        state._ghosts = []
+        state._dirblocks = dirblocks
+        state._mark_modified(header_modified=True)
+        state.save()
+    finally:
+        state.unlock()
+
+
+def _copy_parent_details(dirblocks):
+    """Give every entry its own copy of each parent detail and field."""
+    for dirname, entries in dirblocks:
+        for entry in entries:
+            trees = entry[1]
+            for i in range(1, len(trees)):
+                minikind, fingerprint, size, executable, info = trees[i]
+                trees[i] = type(trees[i])(
+                    minikind, bytes(bytearray(fingerprint)), int(str(size)),
+                    executable, bytes(bytearray(info)))
+
+
+@benchmark('dirstate_load_parents')
+def bench_dirstate_load_parents(fixture, parents=3):
+    """Read the dirblocks of a dirstate with several parent trees.
+
+    The memory held by the dirblocks is recorded, along with what it would
+    be if each entry had its own copy of the parent details, as it did
+    before _read_dirblocks shared identical ones.
+    """
+    path = osutils.pathjoin(fixture.path, 'dirstate-%d' % (parents,))
+    if not os.path.exists(path):
+        _write_parents_dirstate(fixture, path, parents)
+    state = dirstate.DirState.on_file(path)
+    state.lock_read()
+    try:
+        state._read_header_if_needed()
+        gc.collect()
+        tracemalloc.start()
+        dirstate._read_dirblocks(state)
+        gc.collect()
+        fixture.record('shared (KiB)',
+                       tracemalloc.get_traced_memory()[0] // 1024)
+        _copy_parent_details(state._dirblocks)
+        gc.collect()
+        fixture.record('copied (KiB)',
+                       tracemalloc.get_traced_memory()[0] // 1024)
+        tracemalloc.stop()
+    finally:
+        state.unlock()
+
+    def run():
+        state = dirstate.DirState.on_file(path)
+        state.lock_read()
+        try:
+            state._read_dirblocks_if_needed()
+        finally:
+            state.unlock()
+    return run
+
+
+@benchmark('get_record_stream')
+def bench_get_record_stream(fixture):
+    repo = fixture.open_branch().repository
+
+    def run():
+        with repo.lock_read():
+            keys = repo.texts.keys()
+            for record in repo.texts.get_record_stream(
+                    keys, 'unordered', True):
+                record.get_bytes_as('fulltext')
+    return run
+
+
+def _open_btree_index(fixture, name, add_nodes, key_elements,
+                      reference_lists):
+    """Build a B+Tree index in the fixture directory, unless it exists.
+
+    :param add_nodes: Called with the BTreeBuilder to add the nodes.
+    :return: A tuple with the transport of the fixture directory and the size
+        of the index.
+    """
+    path = osutils.pathjoin(fixture.path, name)
+    if not os.path.exists(path):
+        builder = btree_index.BTreeBuilder(
+            key_elements=key_elements, reference_lists=reference_lists)
+        add_nodes(builder)
+        with open(path + '.tmp', 'wb') as f:
+            osutils.pumpfile(builder.finish(), f)
+        os.rename(path + '.tmp', path)
+    return (transport.get_transport_from_path(fixture.path),
+            os.path.getsize(path))
+
+
+def _sha_key(i):
+    return (osutils.sha_string(b'%d' % (i,)),)
+
+
+def _add_sha_keys(count, builder):
+    for i in range(count):
+        builder.add_node(_sha_key(i), b'%d %d' % (i, i * 10))
+
+
+def _bench_btree_index(use_mmap, fixture, lookups=20000):
+    """Look up random keys in a large local index.
+
+    The index has a key for every file in every revision of the fixture.  The
+    keys are looked up one at a time (the bisect pattern used by most
+    callers) and then in a single batch, each with a new index, and the
+    time taken by each is recorded.
+    """
+    count = fixture.files * fixture.revisions
+    t, size = _open_btree_index(
+        fixture, 'sha-keys.bix', functools.partial(_add_sha_keys, count),
+        1, 0)
+    keys = [_sha_key(i) for i in
+            random.Random(0).sample(range(count), min(lookups, count))]
+    fixture.add_cleanup(
+        setattr, btree_index, '_use_mmap', btree_index._use_mmap)
+    btree_index._use_mmap = use_mmap
+
+    def run():
+        index = btree_index.BTreeGraphIndex(t, 'sha-keys.bix', size)
+        begin = osutils.perf_counter()
+        for key in keys:
+            for entry in index.iter_entries([key]):
+                pass
+        fixture.record('one at a time (s)', osutils.perf_counter() - begin)
+        index = btree_index.BTreeGraphIndex(t, 'sha-keys.bix', size)
+        begin = osutils.perf_counter()
+        found = len(list(index.iter_entries(keys)))
+        fixture.record('batched (s)', osutils.perf_counter() - begin)
+        if found != len(keys):
+            raise AssertionError('found %d of %d keys' % (found, len(keys)))
+    return run
+
+
+benchmark('btree_index_readv')(functools.partial(_bench_btree_index, False))
+benchmark('btree_index_mmap')(functools.partial(_bench_btree_index, True))
+
+
+def _text_key(fixture, i):
+    return (b'file-%d' % (i % fixture.files,),
+            b'rev-%s' % (osutils.sha_string(b'%d' % (i,)),))
+
+
+def _add_text_keys(fixture, count, builder):
+    previous = {}
+    for i in range(count):
+        key = _text_key(fixture, i)
+        parent = previous.get(key[0])
+        refs = ([parent],) if parent is not None else ([],)
+        builder.add_node(key, b'%d %d 0 0' % (i * 100, 100), refs)
+        previous[key[0]] = key
+
+
+def _bench_btree_leaf(leaf_factory, fixture):
+    """Look up every key of a fully cached text index.
+
+    The index is like the text index of the fixture, with a key for every
+    file in every revision, and is opened with unlimited_cache=True using
+    leaf_factory for its leaf nodes.  The memory held by the cached nodes
+    and the time taken to load them are recorded; both are measured with
+    tracemalloc running, which slows the loading down.
+    """
+    count = fixture.files * fixture.revisions
+    t, size = _open_btree_index(
+        fixture, 'text-keys.bix',
+        functools.partial(_add_text_keys, fixture, count), 2, 1)
+    keys = [_text_key(fixture, i) for i in range(count)]
+    random.Random(0).shuffle(keys)
+    gc.collect()
+    tracemalloc.start()
+    index = btree_index.BTreeGraphIndex(
+        t, 'text-keys.bix', size, unlimited_cache=True)
+    index._leaf_factory = leaf_factory
+    begin = osutils.perf_counter()
+    found = len(list(index.iter_entries(keys)))
+    fixture.record('load (s)', osutils.perf_counter() - begin)
+    gc.collect()
+    fixture.record('cached (KiB)', tracemalloc.get_traced_memory()[0] // 1024)
+    tracemalloc.stop()
+    if found != len(keys):
+        raise AssertionError('found %d of %d keys' % (found, len(keys)))
+
+    def run():
+        for key in keys:
+            for entry in index.iter_entries([key]):
+                pass
+    return run
+
+
+benchmark('btree_leaf')(
+    functools.partial(_bench_btree_leaf, btree_index._LeafNode))
+benchmark('btree_leaf_compact')(
+    functools.partial(_bench_btree_leaf, btree_index._CompactLeafNode))
+
+
+def _build_tree(fixture, workers):
+    basis = fixture.open_tree().basis_tree()
+    target = controldir.ControlDir.create_standalone_workingtree(
+        osutils.pathjoin(fixture.scratch_dir(), 'tree'),
+        controldir.format_registry.make_controldir('default'))
+    target.get_config_stack().set('bzr.workingtree.build_workers', workers)
+
+    def run():
+        build_tree(basis, target)
+    return run
+
+
+@benchmark('build_tree')
+def bench_build_tree(fixture):
+    return _build_tree(fixture, 1)
+
+
+@benchmark('build_tree_workers')
+def bench_build_tree_workers(fixture):
+    return _build_tree(fixture, 4)
+
+
+def _graph_heads(graph, tip, branch_tips):
+    def run():
+        for branch_tip in branch_tips:
+            graph.heads([tip, branch_tip])
+            graph.is_ancestor(tip, branch_tip)
+    return run
+
+
+def _generation_index(parent_map):
+    return generations.GenerationIndex(
+        transport.get_transport_from_url('memory:///'),
+        _mod_graph.DictParentsProvider(parent_map))
+
+
+@benchmark('graph_heads')
+def bench_graph_heads(fixture):
+    parent_map, tip, branch_tips = fixture.merge_history()
+    return _graph_heads(
+        _mod_graph.Graph(_mod_graph.DictParentsProvider(parent_map)),
+        tip, branch_tips)
+
+
+@benchmark('graph_heads_generations')
+def bench_graph_heads_generations(fixture):
+    parent_map, tip, branch_tips = fixture.merge_history()
+    index = _generation_index(parent_map)
+    index.add_revisions(parent_map)
+    return _graph_heads(
+        _mod_graph.Graph(_mod_graph.DictParentsProvider(parent_map), index),
+        tip, branch_tips)
+
+
+@benchmark('add_generations')
+def bench_add_generations(fixture):
+    parent_map = fixture.merge_history()[0]
+    index = _generation_index(parent_map)
+
+    def run():
+        index.add_revisions(parent_map)
+    return run
+
+
+def _git_cache_format(name):
+    from breezy.git import cache
+    return {
+        'sqlite': cache.SqliteGitCacheFormat,
+        'index': cache.IndexGitCacheFormat,
+        'table': cache.TableGitCacheFormat,
+        }[name]()
+
+
+def _iter_git_sha_map_revisions(fixture):
+    """Iterate over the revisions to add to Git SHA maps.
+
+    There are as many revisions as the fixture has, each with a blob for
+    every file of the fixture.
+
+    :return: Iterator over (revision id, [(blob sha, (file id, revision
+        id)), ...]) tuples.
+    """
+    for i in range(fixture.revisions):
+        revid = b'rev-%d' % (i,)
+        yield revid, [
+            (osutils.sha_string(b'%d %d' % (i, j)),
+             (b'file-%d' % (j,), revid))
+            for j in range(fixture.files)]
+
+
+def _fill_git_sha_map(fixture, bzrgitcache):
+    from dulwich.objects import (
+        Blob,
+        Commit,
+        )
+    from breezy.revision import Revision
+    for revid, blobs in _iter_git_sha_map_revisions(fixture):
+        c = Commit()
+        c.committer = c.author = COMMITTER.encode('utf-8')
+        c.commit_time = c.author_time = 0
+        c.commit_timezone = c.author_timezone = 0
+        c.message = revid
+        c.tree = Blob().id
+        bzrgitcache.idmap.start_write_group()
+        updater = bzrgitcache.get_updater(Revision(revid))
+        updater.add_object(c, {'testament3-sha1': b'0' * 40}, None)
+        for sha, key in blobs:
+            updater.add_object(('blob', sha), key, None)
+        updater.finish()
+        bzrgitcache.idmap.commit_write_group()
+
+
+def _bench_git_sha_map_fill(format_name, fixture):
+    format = _git_cache_format(format_name)
+    # The sqlite format keeps connections open by path, so fill a new
+    # directory each time.
+    path = tempfile.mkdtemp(dir=fixture.path)
+    fixture.add_cleanup(shutil.rmtree, path)
+    t = transport.get_transport_from_path(path)
+    format.initialize(t)
+    bzrgitcache = format.open(t)
+
+    def run():
+        _fill_git_sha_map(fixture, bzrgitcache)
+    return run
+
+
+def _bench_git_sha_map_lookup(format_name, fixture):
+    format = _git_cache_format(format_name)
+    path = osutils.pathjoin(fixture.path, 'git-sha-map-' + format_name)
+    t = transport.get_transport_from_path(path)
+    if not os.path.isdir(path):
+        os.mkdir(path)
+        format.initialize(t)
+        _fill_git_sha_map(fixture, format.open(t))
+    blobs = []
+    for revid, revision_blobs in _iter_git_sha_map_revisions(fixture):
+        blobs.extend(revision_blobs)
+    queries = random.Random(0).sample(blobs, min(10000, len(blobs)))
+    revids = [b'rev-%d' % (i,) for i in range(fixture.revisions)]
+    # Open it again, so that nothing is cached from filling it.
+    idmap = format.open(t).idmap
+
+    def run():
+        for sha, key in queries:
+            list(idmap.lookup_git_sha(sha))
+            idmap.lookup_blob_id(*key)
+        idmap.missing_revisions(revids)
+    return run
+
+
+for _format_name in ['sqlite', 'index', 'table']:
+    benchmark('git_sha_map_fill_' + _format_name)(
+        functools.partial(_bench_git_sha_map_fill, _format_name))
+    benchmark('git_sha_map_lookup_' + _format_name)(
+        functools.partial(_bench_git_sha_map_lookup, _format_name))
+
+
+def _run_brz(env, args):
+    proc = subprocess.run(
+        [sys.executable, '-m', 'breezy'] + args, env=env, cwd=env['HOME'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if proc.returncode != 0:
+        raise AssertionError('brz %s failed: %s' % (
+            ' '.join(args), proc.stderr))
+    return proc.stderr
+
+
+# The lines of profile_imports.log_stack_info are "cum local name @ file:line",
+# with one '+' before the name per level of nesting, and times in
+# milliseconds.  Regular expression compiles are logged as quoted patterns.
+_import_line = re.compile(r'^\s*([\d.]+)\s+([\d.]+) (\+*)(.*?)\s+@ (.*)$')
+
+
+def _count_imports(output):
+    """Return the number of imports logged and the time they took."""
+    count = 0
+    total = 0.0
+    for line in output.splitlines():
+        m = _import_line.match(line)
+        if m is None or m.group(4).strip().startswith("'"):
+            continue
+        count += 1
+        if not m.group(3):
+            total += float(m.group(1)) / 1000
+    return count, total
+
+
+def _bench_startup(args, flags, fixture, repeat=10):
+    """Run a trivial brz command in a new process, repeat times."""
+    home = fixture.scratch_dir()
+    env = dict(os.environ, HOME=home, BRZ_HOME=home,
+               XDG_CACHE_HOME=osutils.pathjoin(home, 'cache'),
+               PYTHONPATH=os.pathsep.join([TOP] + sys.path))
+    # Build the plugin index.
+    _run_brz(env, args)
+    count, total = _count_imports(
+        _run_brz(env, flags + ['--profile-imports'] + args))
+    fixture.record('imports', count)
+    fixture.record('import time (s)', total)
+
+    def run():
+        for i in range(repeat):
+            _run_brz(env, flags + args)
+    return run
+
+
+for _name, _args in [('version', ['--version', '--short']),
+                     ('rocks', ['rocks'])]:
+    benchmark('startup_' + _name)(
+        functools.partial(_bench_startup, _args, []))
+    benchmark('startup_%s_no_index' % (_name,))(
+        functools.partial(_bench_startup, _args, ['-Dno_plugin_index']))
+
+
+def _stop_server(proc):
+    proc.terminate()
+    proc.wait()
+    proc.stderr.close()
+
+
+def _rss_kib(pid):
+    """Return the resident set size of a process in KiB, or None.
+
+    This reads /proc, so it is only known on Linux.
+    """
+    try:
+        with open('/proc/%d/status' % (pid,)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _record_rss(fixture, name, pid):
+    rss = _rss_kib(pid)
+    if rss is not None:
+        fixture.record(name, rss)
+
+
+def _bench_smart_server(protocol, fixture, idle=500, clients=8,
+                        requests=250):
+    """Fetch files from 'brz serve' while many idle clients are connected.
+
+    The resident set size of the server is recorded once it is listening,
+    with the idle clients connected and after the requests, along with
+    the memory used per idle client.
+    """
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'breezy', 'serve', '--protocol', protocol,
+         '--listen', '127.0.0.1', '--port', '0',
+         '--directory', fixture.tree_path],
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    fixture.add_cleanup(_stop_server, proc)
+    # The port is given in the note 'listening on port: <port>'.
+    line = proc.stderr.readline()
+    port = int(line.rsplit(b':', 1)[1])
+    base_rss = _rss_kib(proc.pid)
+    for i in range(idle):
+        sock = socket.create_connection(('127.0.0.1', port))
+        fixture.add_cleanup(sock.close)
+        # Make sure the server has picked up the connection.
+        sock.sendall(b'hello\n')
+        sock.recv(5)
+    idle_rss = _rss_kib(proc.pid)
+    if base_rss is not None and idle_rss is not None:
+        fixture.record('rss (KiB)', base_rss)
+        fixture.record('rss idle (KiB)', idle_rss)
+        fixture.record('rss per idle (KiB)', (idle_rss - base_rss) / idle)
+    # Cleanups run newest first, so this is before the server is stopped.
+    fixture.add_cleanup(_record_rss, fixture, 'rss busy (KiB)', proc.pid)
+    paths = [file_path(i).encode('utf-8') for i in range(fixture.files)]
+
+    def work(i):
+        client_medium = medium.SmartTCPClientMedium(
+            '127.0.0.1', port, 'bzr://127.0.0.1:%d/' % (port,))
+        smart_client = _mod_client._SmartClient(client_medium)
+        try:
+            for j in range(requests):
+                response, handler = smart_client.call_expecting_body(
+                    b'get', paths[(i * requests + j) % len(paths)])
+                handler.read_body_bytes()
+        finally:
+            client_medium.disconnect()
+
+    def run():
+        threads = [threading.Thread(target=work, args=(i,))
+                   for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return run
+
+
+benchmark('smart_server')(functools.partial(_bench_smart_server, 'bzr'))
+benchmark('smart_server_asyncio')(
+    functools.partial(_bench_smart_server, 'bzr-asyncio'))
+
+
+def run_benchmarks(fixture, names, repeat):
+    results = {}
+    for name, func in BENCHMARKS:
+        if names and name not in names:
+            continue
+        times = []
+        records = {}
+        for i in range(repeat):
+            try:
+                run = func(fixture)
+                begin = osutils.perf_counter()
+                run()
+                times.append(osutils.perf_counter() - begin)
+            finally:
+                fixture.cleanup()
+            for key, value in fixture.pop_records().items():
+                records.setdefault(key, []).append(value)
+        times.sort()
+        results[name] = {
+            'min': times[0],
+            'median': times[len(times) // 2],
+            'times': times,
+            }
+        print('%-26s min %8.3fs  median %8.3fs' % (
+            name, times[0], times[len(times) // 2]))
+        if records:
+            results[name]['records'] = {}
+            for key, values in sorted(records.items()):
+                values.sort()
+                median = values[len(values) // 2]
+                results[name]['records'][key] = median
+                print('    %-22s median %10g' % (key, median))
+    return results
+
+
+def compare(old, new, threshold):
+    """Print the change of each benchmark and return the regressed ones."""
+    regressions = []
+    for name, result in sorted(new['results'].items()):
+        try:
+            old_min = old['results'][name]['min']
+        except KeyError:
+            continue
+        ratio = result['min'] / old_min
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            marker = ' REGRESSION'
+        else:
+            marker = ''
+        print('%-26s %8.3fs -> %8.3fs (%+.1f%%)%s' % (
+            name, old_min, result['min'], (ratio - 1) * 100, marker))
+    return regressions
+
+
+def main(argv):
+    p = optparse.OptionParser(usage='%prog [options] [benchmark...]')
+    p.add_option('--files', default=1000, type=int,
+                 help='Number of files in the tree.')
+    p.add_option('--revisions', default=100, type=int,
+                 help='Number of revisions in the history.')
+    p.add_option('--changes', default=20, type=int,
+                 help='Number of files changed by each revision.')
+    p.add_option('--repeat', default=3, type=int,
+                 help='Number of times to run each benchmark.')
+    p.add_option('--dir', default=None,
+                 help='Directory to keep the fixtures in between runs.')
+    p.add_option('--output', default=None,
+                 help='Write the results as JSON to this file.')
+    p.add_option('--compare', default=None,
+                 help='Compare with the results in this JSON file.')
+    p.add_option('--threshold', default=0.1, type=float,
+                 help='Relative slow down reported as a regression.')
+    p.add_option('--list', default=False, action='store_true',
+                 help='List the benchmarks and exit.')
+    opts, args = p.parse_args(argv)
+    if opts.list:
+        for name, func in BENCHMARKS:
+            print(name)
+        return 0
+    unknown = set(args).difference(name for name, func in BENCHMARKS)
+    if unknown:
+        p.error('unknown benchmarks: %s' % (', '.join(sorted(unknown)),))
+    trace.enable_default_logging()
+    parameters = {
+        'files': opts.files,
+        'revisions': opts.revisions,
+        'changes': opts.changes,
+        }
+    if opts.dir:
+        base = opts.dir
+    else:
+        base = tempfile.mkdtemp(prefix='brz-benchmark-')
+    try:
+        fixture_path = osutils.pathjoin(
+            base, 'f%(files)d-r%(revisions)d-c%(changes)d' % parameters)
+        if not os.path.isdir(fixture_path):
+            os.makedirs(fixture_path)
+        fixture = Fixture(fixture_path, **parameters)
+        fixture.build()
+        # Benchmarks like commit change the fixture, so run on a copy.
+        work_path = osutils.pathjoin(base, 'work')
+        if os.path.exists(work_path):
+            shutil.rmtree(work_path)
+        shutil.copytree(fixture_path, work_path, symlinks=True)
+        work = Fixture(work_path, **parameters)
+        results = {
+            'breezy': breezy.version_string,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': parameters,
+            'repeat': opts.repeat,
+            'results': run_benchmarks(work, args, opts.repeat),
+            }
+        shutil.rmtree(work_path)
+    finally:
+        if not opts.dir:
+            shutil.rmtree(base)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if opts.compare:
+        with open(opts.compare) as f:
+            old = json.load(f)
+        if old.get('parameters') != parameters:
+            print('warning: %s was run with different parameters: %r'
+                  % (opts.compare, old.get('parameters')))
+        if compare(old, results, opts.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))